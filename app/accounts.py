@@ -0,0 +1,305 @@
+import asyncio
+import dataclasses
+import logging
+import secrets
+import time
+from typing import Optional
+
+from app.ai.claude import ClaudeClient
+from app.config import Settings
+from app.imap.aio import AsyncIMAPClient, AsyncIMAPPool, ConnectionBudget
+from app.imap.cache import HeaderCache
+from app.imap.idle import MailWatcher
+from app.imap.message_cache import MessageCache
+from app.imap.search_cache import SearchCache
+from app.jobs import BatchJobRunner
+from app.prefetch import ActivityTracker, PrefetchWorker
+from app.smtp.outbox import OutboxSender
+from app.smtp.pool import SMTPPool
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps for idle accounts and the memory cap
+SWEEP_INTERVAL = 30.0
+# An account used this recently is never evicted for memory
+EVICT_GRACE = 10.0
+# Rough per-object costs for Account.memory(), on top of MessageCache.nbytes
+CONNECTION_BYTES = 256 * 1024
+SEARCH_ENTRY_BYTES = 16 * 1024
+
+
+class Account:
+    """One mailbox: its own IMAP and SMTP pools, message and search caches,
+    mail watcher and prefetch worker, built from a per-account copy of
+    Settings. The SQLite caches are shared and keyed by account already;
+    passing a SharedMessageCache as `message_cache` shares parsed messages
+    too.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        header_cache: HeaderCache,
+        claude: ClaudeClient,
+        activity: ActivityTracker,
+        budget: ConnectionBudget,
+        message_cache: Optional[MessageCache] = None,
+        client_class: type[AsyncIMAPClient] = AsyncIMAPClient,
+    ):
+        self.settings = settings
+        self.imap_pool = AsyncIMAPPool(
+            host=settings.imap_host,
+            port=settings.imap_port,
+            user=settings.imap_user,
+            password=settings.imap_password,
+            max_size=settings.imap_pool_size,
+            max_inflight=settings.imap_max_inflight,
+            checkout_timeout=settings.imap_checkout_timeout,
+            fetch_chunk_size=settings.imap_fetch_chunk_size,
+            client_class=client_class,
+            budget=budget,
+        )
+        self.smtp_pool = SMTPPool(
+            host=settings.smtp_host,
+            port=settings.smtp_port,
+            user=settings.smtp_user,
+            password=settings.smtp_password,
+            max_size=settings.smtp_pool_size,
+            idle_timeout=settings.smtp_idle_timeout,
+        )
+        if message_cache is None:
+            message_cache = MessageCache(max_entries=settings.message_cache_size)
+        self.message_cache = message_cache
+        self.search_cache = SearchCache(max_entries=settings.search_cache_size)
+        self.mail_watcher = MailWatcher(
+            self.imap_pool,
+            header_cache,
+            folders=settings.idle_folders,
+            idle_timeout=settings.idle_timeout,
+            poll_interval=settings.idle_poll_interval,
+            search_cache=self.search_cache,
+        )
+        self.prefetch = PrefetchWorker(
+            self.imap_pool, header_cache, self.message_cache, claude, settings, activity
+        )
+        self.last_used = time.monotonic()
+
+    @property
+    def key(self) -> str:
+        return self.imap_pool.account
+
+    @property
+    def smtp_account(self) -> str:
+        """Key of the account's outbox messages."""
+        return self.smtp_pool.account
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    async def open(self) -> None:
+        """Log in; raises if the server refuses."""
+        await self.imap_pool.connect()
+        if self.settings.prefetch_enabled:
+            self.prefetch.start()
+        if self.settings.idle_enabled:
+            self.mail_watcher.start()
+
+    async def close(self) -> None:
+        await self.mail_watcher.stop()
+        await self.prefetch.stop()
+        await self.imap_pool.close()
+        await asyncio.to_thread(self.smtp_pool.close)
+
+    def memory(self) -> int:
+        """Estimated bytes held: cached messages, connections and search results."""
+        return (
+            self.message_cache.nbytes
+            + CONNECTION_BYTES * self.imap_pool.stats()["size"]
+            + SEARCH_ENTRY_BYTES * self.search_cache.stats()["size"]
+        )
+
+
+class AccountRegistry:
+    """Logged-in accounts, looked up by session token.
+
+    login() checks the credentials and returns a token (kept in a cookie
+    or sent as a Bearer header); sessions for the same user@host share one
+    Account. All accounts draw IMAP connections from one ConnectionBudget
+    of `imap_max_connections`, shared fairly between the accounts using
+    it. A sweeper closes accounts idle for `account_idle_timeout` seconds
+    and, while the estimated memory of open accounts is over
+    `accounts_memory_mb`, the least recently used idle ones. Closed
+    accounts keep their sessions and reopen on the next request.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        header_cache: HeaderCache,
+        claude: ClaudeClient,
+        activity: ActivityTracker,
+        jobs: BatchJobRunner,
+        outbox: OutboxSender,
+        message_cache: Optional[MessageCache] = None,
+        client_class: type[AsyncIMAPClient] = AsyncIMAPClient,
+    ):
+        self._settings = settings
+        self._header_cache = header_cache
+        self._claude = claude
+        self._activity = activity
+        self._jobs = jobs
+        self._outbox = outbox
+        self._message_cache = message_cache
+        self._client_class = client_class
+        self._budget = ConnectionBudget(settings.imap_max_connections)
+        self._idle_timeout = settings.account_idle_timeout
+        self._memory_cap = settings.accounts_memory_mb * 1024 * 1024
+        # user@host -> per-account Settings, for every account with a session
+        self._credentials: dict[str, Settings] = {}
+        self._open: dict[str, Account] = {}
+        self._sessions: dict[str, str] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._opened = 0
+        self._evicted = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for key in list(self._open):
+            await self._close(key)
+
+    def account_settings(self, **credentials) -> Settings:
+        """A copy of the app settings with this account's servers and logins."""
+        return dataclasses.replace(self._settings, **credentials)
+
+    async def login(self, settings: Settings) -> tuple[str, Account]:
+        """Open (or reuse) the account and start a session for it. A second
+        login with different credentials replaces the open account."""
+        key = f"{settings.imap_user}@{settings.imap_host}"
+        async with self._lock(key):
+            account = self._open.get(key)
+            if account is None or self._credentials.get(key) != settings:
+                fresh = await self._connect(settings)
+                if account is not None:
+                    await self._close(key)
+                self._open[key] = account = fresh
+            self._credentials[key] = settings
+        token = secrets.token_urlsafe(32)
+        self._sessions[token] = key
+        account.touch()
+        self._outbox.attach(account.smtp_pool)
+        return token, account
+
+    async def logout(self, token: str) -> None:
+        key = self._sessions.pop(token, None)
+        if key is not None and key not in self._sessions.values():
+            async with self._lock(key):
+                self._credentials.pop(key, None)
+                await self._close(key)
+
+    async def get(self, token: Optional[str]) -> Optional[Account]:
+        """The session's account, reopened if it was evicted; None for an
+        unknown token. Raises if reopening fails."""
+        key = self._sessions.get(token) if token else None
+        if key is None:
+            return None
+        account = self._open.get(key)
+        if account is None:
+            async with self._lock(key):
+                account = self._open.get(key)
+                if account is None:
+                    account = self._open[key] = await self._connect(self._credentials[key])
+                    self._outbox.attach(account.smtp_pool)
+        account.touch()
+        return account
+
+    def peek(self, token: Optional[str]) -> Optional[Account]:
+        """The session's account if it is open, without touching or reopening it."""
+        key = self._sessions.get(token) if token else None
+        return self._open.get(key) if key is not None else None
+
+    def _lock(self, key: str) -> asyncio.Lock:
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    async def _connect(self, settings: Settings) -> Account:
+        account = Account(
+            settings, self._header_cache, self._claude, self._activity, self._budget,
+            message_cache=self._message_cache, client_class=self._client_class,
+        )
+        try:
+            await account.open()
+        except Exception:
+            await account.close()
+            raise
+        self._opened += 1
+        return account
+
+    async def _close(self, key: str) -> None:
+        account = self._open.pop(key, None)
+        if account is not None:
+            self._outbox.detach(account.smtp_pool)
+            await account.close()
+
+    def busy(self, account: Account) -> bool:
+        """Whether closing `account` would interrupt something."""
+        return bool(
+            account.imap_pool.users
+            or account.smtp_pool.stats()["in_use"]
+            or account.mail_watcher.subscribers
+            or self._outbox.pending(account.smtp_account)
+            or self._jobs.preparing(account.key)
+        )
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Account sweep failed: %s", e)
+
+    async def sweep(self) -> int:
+        """Close idle accounts, then least recently used ones while over
+        the memory cap. Returns how many were closed."""
+        now = time.monotonic()
+        idle = sorted(
+            (a for a in self._open.values() if now - a.last_used > EVICT_GRACE and not self.busy(a)),
+            key=lambda a: a.last_used,
+        )
+        memory = sum(a.memory() for a in self._open.values())
+        closed = 0
+        for account in idle:
+            if now - account.last_used <= self._idle_timeout and memory <= self._memory_cap:
+                continue
+            async with self._lock(account.key):
+                if self._open.get(account.key) is not account:
+                    continue
+                memory -= account.memory()
+                await self._close(account.key)
+            closed += 1
+        self._evicted += closed
+        return closed
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "accounts": len(self._credentials),
+            "open": len(self._open),
+            "opened": self._opened,
+            "evicted": self._evicted,
+            "memory_bytes": sum(a.memory() for a in self._open.values()),
+            "memory_cap_bytes": self._memory_cap,
+            "imap_budget": self._budget.stats(),
+        }
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+from app.ai.claude import ClaudeClient
+from app.ai.email_tools import categorize_chunk
+from app.ai.preprocess import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = (
+    "Action Required",
+    "FYI",
+    "Marketing",
+    "Personal",
+    "Finance",
+    "Social",
+    "Spam",
+)
+
+# Rough output cost per email: {"uid": "12345", "category": "Action Required"},
+OUTPUT_TOKENS_PER_EMAIL = 20
+MAX_OUTPUT_TOKENS = 4096
+MAX_CHUNK_EMAILS = (MAX_OUTPUT_TOKENS - 256) // OUTPUT_TOKENS_PER_EMAIL
+
+
+def chunk_emails(emails: list[dict], chunk_tokens: int) -> list[list[dict]]:
+    """Split header dicts into chunks whose prompt lines fit `chunk_tokens`.
+
+    Chunks are also capped at MAX_CHUNK_EMAILS so the JSON reply always
+    fits in MAX_OUTPUT_TOKENS.
+    """
+    chunks: list[list[dict]] = []
+    current: list[dict] = []
+    used = 0
+    for e in emails:
+        cost = estimate_tokens(f'- UID {e["uid"]}: From {e["sender"]} | Subject: {e["subject"]}')
+        if current and (used + cost > chunk_tokens or len(current) >= MAX_CHUNK_EMAILS):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(e)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def categorize_stream(
+    emails: list[dict],
+    claude: ClaudeClient,
+    concurrency: int = 4,
+    chunk_tokens: int = 2000,
+) -> AsyncIterator[list[dict]]:
+    """Categorize header dicts, yielding each chunk's results as it finishes.
+
+    Chunks run on at most `concurrency` worker threads. Each reply is
+    checked against its chunk: unknown UIDs are dropped, categories outside
+    CATEGORIES become "Unknown", and emails the reply skipped (or a reply
+    that isn't JSON) are retried once in smaller chunks before being
+    reported as "Unknown". Every input email appears exactly once in the
+    output, with its subject filled in from the headers.
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def _run(chunk: list[dict]) -> list[dict]:
+        async with semaphore:
+            return await _categorize_validated(chunk, claude, retries=1)
+
+    tasks = [asyncio.create_task(_run(chunk)) for chunk in chunk_emails(emails, chunk_tokens)]
+    try:
+        for done in asyncio.as_completed(tasks):
+            yield await done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def chunk_max_tokens(chunk: list[dict]) -> int:
+    return min(MAX_OUTPUT_TOKENS, 256 + OUTPUT_TOKENS_PER_EMAIL * len(chunk))
+
+
+def validate_categories(chunk: list[dict], reply: Optional[list]) -> dict[str, str]:
+    """uid -> category from a parsed reply, keeping only UIDs of the chunk;
+    categories outside CATEGORIES become "Unknown"."""
+    uids = {str(e["uid"]) for e in chunk}
+    results = {}
+    for item in reply or []:
+        if not isinstance(item, dict):
+            continue
+        uid = str(item.get("uid", "")).strip()
+        if uid in uids and uid not in results:
+            category = str(item.get("category", "")).strip()
+            results[uid] = category if category in CATEGORIES else "Unknown"
+    return results
+
+
+async def _categorize_validated(chunk: list[dict], claude: ClaudeClient, retries: int) -> list[dict]:
+    by_uid = {str(e["uid"]): e for e in chunk}
+    try:
+        reply = await asyncio.to_thread(categorize_chunk, chunk, claude, chunk_max_tokens(chunk))
+    except Exception as e:
+        logger.warning("Categorize chunk of %d failed: %s", len(chunk), e)
+        reply = None
+
+    results = validate_categories(chunk, reply)
+    missing = [e for uid, e in by_uid.items() if uid not in results]
+    if missing and retries > 0:
+        # Sequential, so a retry stays within the worker slot this chunk holds
+        half = max(len(missing) // 2, 1)
+        for i in range(0, len(missing), half):
+            for r in await _categorize_validated(missing[i : i + half], claude, retries - 1):
+                results[r["uid"]] = r["category"]
+
+    return [
+        {
+            "uid": uid,
+            "subject": e.get("subject", ""),
+            "category": results.get(uid, "Unknown"),
+        }
+        for uid, e in by_uid.items()
+    ]
@@ -1,40 +1,273 @@
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, Optional, Union
+
 import anthropic
 from app.config import Settings
+from app.ai.response_cache import ResponseCache, response_key
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+@dataclass
+class TokenUsage:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
 
 
 class ClaudeClient:
-    def __init__(self, settings: Settings):
+    """Wrapper around the Anthropic SDK.
+
+    With `claude_prompt_cache` on, requests carry prompt-caching
+    breakpoints after the tool definitions, the system prompt and the last
+    message, so repeated system prompts and the growing history of a
+    tool-use loop are read from Anthropic's cache instead of reprocessed.
+    Prefixes shorter than the model's minimum cacheable length are simply
+    not cached. Token usage, including cache reads and writes, is counted
+    per endpoint.
+    """
+
+    def __init__(self, settings: Settings, cache: Optional[ResponseCache] = None):
         self._api_key = settings.anthropic_api_key
         self._model = settings.claude_model
+        self._prompt_cache = settings.claude_prompt_cache
         self._client = None
+        self._async_client = None
+        self._cache = cache
+        self._usage: dict[str, TokenUsage] = {}
+        # complete() runs on worker threads, so usage is counted under a lock
+        self._usage_lock = threading.Lock()
 
     def _get_client(self) -> anthropic.Anthropic:
         if self._client is None:
             self._client = anthropic.Anthropic(api_key=self._api_key)
         return self._client
 
-    def complete(self, system: str, user: str, max_tokens: int = 2048) -> str:
+    def _get_async_client(self) -> anthropic.AsyncAnthropic:
+        if self._async_client is None:
+            self._async_client = anthropic.AsyncAnthropic(api_key=self._api_key)
+        return self._async_client
+
+    def _cache_for(self, endpoint: Optional[str]) -> Optional[ResponseCache]:
+        return self._cache if self._cache and self._cache.enabled_for(endpoint) else None
+
+    def _system(self, system: str) -> Union[str, list[dict]]:
+        if not self._prompt_cache:
+            return system
+        return [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+
+    def _tools(self, tools: list[dict]) -> list[dict]:
+        if not self._prompt_cache or not tools:
+            return tools
+        return tools[:-1] + [{**tools[-1], "cache_control": CACHE_CONTROL}]
+
+    def _messages(self, messages: list[dict]) -> list[dict]:
+        """Mark the end of the conversation so the next turn, which only
+        appends to it, reads everything up to here from the cache."""
+        if not self._prompt_cache or not messages:
+            return messages
+        last = messages[-1]
+        content = last["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        else:
+            content = [b if isinstance(b, dict) else b.model_dump() for b in content]
+        content[-1] = {**content[-1], "cache_control": CACHE_CONTROL}
+        return messages[:-1] + [{**last, "content": content}]
+
+    def _record_usage(self, endpoint: Optional[str], usage) -> None:
+        if usage is None:
+            return
+        with self._usage_lock:
+            stats = self._usage.setdefault(endpoint or "other", TokenUsage())
+            stats.calls += 1
+            for field in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+                setattr(stats, field, getattr(stats, field) + (getattr(usage, field, 0) or 0))
+        logger.debug(
+            "Claude %s: %s input, %s cache read, %s cache write, %s output tokens",
+            endpoint or "other", usage.input_tokens, getattr(usage, "cache_read_input_tokens", 0),
+            getattr(usage, "cache_creation_input_tokens", 0), usage.output_tokens,
+        )
+
+    def usage(self) -> dict:
+        with self._usage_lock:
+            endpoints = {name: asdict(u) for name, u in self._usage.items()}
+        read = sum(u["cache_read_input_tokens"] for u in endpoints.values())
+        written = sum(u["cache_creation_input_tokens"] for u in endpoints.values())
+        uncached = sum(u["input_tokens"] for u in endpoints.values())
+        total = read + written + uncached
+        return {
+            "prompt_cache": self._prompt_cache,
+            "cache_read_ratio": read / total if total else 0.0,
+            "endpoints": endpoints,
+        }
+
+    def complete(
+        self,
+        system: str,
+        user: str,
+        max_tokens: int = 2048,
+        endpoint: Optional[str] = None,
+        ref: Optional[str] = None,
+    ) -> str:
+        """Single-turn completion.
+
+        Calls that name an `endpoint` go through the response cache (unless
+        that endpoint is disabled). `ref` additionally registers the result
+        under a caller-chosen identity so cached() can find it without the
+        user message.
+        """
+        cache = self._cache_for(endpoint)
+        key = self.cache_key(system, user, max_tokens)
+        if cache is not None:
+            text = cache.get(key, endpoint)
+            if text is not None:
+                return text
+
         client = self._get_client()
         response = client.messages.create(
             model=self._model,
             max_tokens=max_tokens,
-            system=system,
+            system=self._system(system),
             messages=[{"role": "user", "content": user}],
         )
-        return response.content[0].text
+        self._record_usage(endpoint, response.usage)
+        text = response.content[0].text
+        self.store(key, endpoint, text, system, max_tokens, ref)
+        return text
+
+    async def stream(
+        self,
+        system: str,
+        user: str,
+        max_tokens: int = 2048,
+        endpoint: Optional[str] = None,
+        ref: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Like complete(), but yields text deltas as Claude produces them.
+
+        A cache hit is yielded as a single delta; a completed stream is
+        stored exactly as complete() would store it.
+        """
+        cache = self._cache_for(endpoint)
+        key = self.cache_key(system, user, max_tokens)
+        if cache is not None:
+            text = cache.get(key, endpoint)
+            if text is not None:
+                yield text
+                return
+
+        client = self._get_async_client()
+        parts = []
+        async with client.messages.stream(
+            model=self._model,
+            max_tokens=max_tokens,
+            system=self._system(system),
+            messages=[{"role": "user", "content": user}],
+        ) as stream:
+            async for text in stream.text_stream:
+                parts.append(text)
+                yield text
+            self._record_usage(endpoint, (await stream.get_final_message()).usage)
+        self.store(key, endpoint, "".join(parts), system, max_tokens, ref)
+
+    def cache_key(self, system: str, user: str, max_tokens: int) -> str:
+        return response_key(self._model, system, user, max_tokens)
+
+    def store(
+        self,
+        key: str,
+        endpoint: str,
+        text: str,
+        system: str,
+        max_tokens: int,
+        ref: Optional[str] = None,
+    ) -> None:
+        """Store a completion under cache_key() (and `ref`), as complete() does
+        with its own results; used for results that arrive by other routes."""
+        cache = self._cache_for(endpoint)
+        if cache is None:
+            return
+        ref_key = response_key(self._model, system, max_tokens, ref) if ref else None
+        cache.put(key, endpoint, text, ref_key=ref_key)
 
-    def complete_with_tools(
+    def cached(self, system: str, max_tokens: int, endpoint: str, ref: str) -> Optional[str]:
+        """A cached completion previously stored by complete(..., ref=ref), if any."""
+        if not self._cache or not self._cache.enabled_for(endpoint):
+            return None
+        return self._cache.get_ref(response_key(self._model, system, max_tokens, ref), endpoint)
+
+    def cached_category(self, system: str, ref: str) -> Optional[str]:
+        """A message category stored by store_category() under `ref`."""
+        cache = self._cache_for("categorize")
+        if cache is None:
+            return None
+        return cache.get_category(response_key(self._model, system, ref))
+
+    def store_category(self, system: str, ref: str, category: str) -> None:
+        cache = self._cache_for("categorize")
+        if cache is not None:
+            cache.put_category(response_key(self._model, system, ref), category)
+
+    async def stream_with_tools(
         self,
         system: str,
         messages: list,
         tools: list,
         max_tokens: int = 2048,
-    ) -> anthropic.types.Message:
-        client = self._get_client()
-        return client.messages.create(
+        endpoint: str = "search_agent",
+    ) -> AsyncIterator[Union[str, anthropic.types.Message]]:
+        """Yield text deltas as they arrive, then the complete Message last."""
+        client = self._get_async_client()
+        async with client.messages.stream(
             model=self._model,
             max_tokens=max_tokens,
-            system=system,
-            messages=messages,
-            tools=tools,
-        )
+            system=self._system(system),
+            messages=self._messages(messages),
+            tools=self._tools(tools),
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            message = await stream.get_final_message()
+        self._record_usage(endpoint, message.usage)
+        yield message
+
+    # -- Message Batches -------------------------------------------------
+
+    def batch_request(self, custom_id: str, system: str, user: str, max_tokens: int) -> dict:
+        """One entry of a Message Batch, built like a complete() call."""
+        return {
+            "custom_id": custom_id,
+            "params": {
+                "model": self._model,
+                "max_tokens": max_tokens,
+                "system": self._system(system),
+                "messages": [{"role": "user", "content": user}],
+            },
+        }
+
+    async def create_batch(self, requests: list[dict]):
+        return await self._get_async_client().messages.batches.create(requests=requests)
+
+    async def retrieve_batch(self, batch_id: str):
+        return await self._get_async_client().messages.batches.retrieve(batch_id)
+
+    async def cancel_batch(self, batch_id: str):
+        return await self._get_async_client().messages.batches.cancel(batch_id)
+
+    async def batch_results(self, batch_id: str, endpoint: str) -> AsyncIterator[tuple[str, Optional[str]]]:
+        """(custom_id, text) for each request of an ended batch; text is None
+        for requests that errored, expired or were canceled."""
+        async for entry in await self._get_async_client().messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                yield entry.custom_id, None
+                continue
+            message = entry.result.message
+            self._record_usage(endpoint, message.usage)
+            yield entry.custom_id, message.content[0].text
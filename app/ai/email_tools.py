@@ -1,4 +1,5 @@
 import json
+from typing import AsyncIterator, Optional
 
 from app.ai.claude import ClaudeClient
 from app.ai.prompts import (
@@ -7,73 +8,160 @@ from app.ai.prompts import (
     CATEGORIZE_SYSTEM,
     ACTION_ITEMS_SYSTEM,
 )
+from app.ai.preprocess import prepare_body
 from app.imap.parser import ParsedEmail
 
+# Body tokens each endpoint sends, after HTML, quoted history and
+# signatures are stripped. Action items often sit at the end of a message.
+BODY_TOKENS = {"summarize": 750, "draft_reply": 750, "action_items": 1000}
 
-def summarize_email(email: ParsedEmail, claude: ClaudeClient) -> str:
-    body = email.body_plain or email.body_html or "(empty)"
-    user_msg = (
+
+def summarize_email(email: ParsedEmail, claude: ClaudeClient, ref: Optional[str] = None) -> str:
+    return claude.complete(
+        SUMMARIZE_SYSTEM, _summarize_prompt(email), max_tokens=512, endpoint="summarize", ref=ref
+    )
+
+
+def summarize_email_stream(
+    email: ParsedEmail, claude: ClaudeClient, ref: Optional[str] = None
+) -> AsyncIterator[str]:
+    return claude.stream(
+        SUMMARIZE_SYSTEM, _summarize_prompt(email), max_tokens=512, endpoint="summarize", ref=ref
+    )
+
+
+def _summarize_prompt(email: ParsedEmail) -> str:
+    return (
         f"From: {email.sender}\n"
         f"Subject: {email.subject}\n"
         f"Date: {email.date}\n\n"
-        f"{body[:3000]}"
+        f"{prepare_body(email, BODY_TOKENS['summarize'])}"
+    )
+
+
+def cached_summary(ref: str, claude: ClaudeClient) -> Optional[str]:
+    return claude.cached(SUMMARIZE_SYSTEM, 512, "summarize", ref)
+
+
+def summarize_batch_request(custom_id: str, email: ParsedEmail, claude: ClaudeClient) -> tuple[dict, str]:
+    """A Message Batch entry equivalent to summarize_email, plus the cache
+    key its result belongs under."""
+    user = _summarize_prompt(email)
+    return (
+        claude.batch_request(custom_id, SUMMARIZE_SYSTEM, user, 512),
+        claude.cache_key(SUMMARIZE_SYSTEM, user, 512),
     )
-    return claude.complete(SUMMARIZE_SYSTEM, user_msg, max_tokens=512)
+
+
+def store_summary(key: str, ref: Optional[str], summary: str, claude: ClaudeClient) -> None:
+    claude.store(key, "summarize", summary, SUMMARIZE_SYSTEM, 512, ref)
 
 
 def draft_reply(
     email: ParsedEmail, instruction: str, claude: ClaudeClient
 ) -> dict:
-    body = email.body_plain or email.body_html or "(empty)"
-    user_msg = (
+    draft_text = claude.complete(
+        DRAFT_REPLY_SYSTEM, _draft_prompt(email, instruction), max_tokens=1024, endpoint="draft_reply"
+    )
+    return {"draft": draft_text, "subject": reply_subject(email)}
+
+
+def draft_reply_stream(
+    email: ParsedEmail, instruction: str, claude: ClaudeClient
+) -> AsyncIterator[str]:
+    return claude.stream(
+        DRAFT_REPLY_SYSTEM, _draft_prompt(email, instruction), max_tokens=1024, endpoint="draft_reply"
+    )
+
+
+def reply_subject(email: ParsedEmail) -> str:
+    subject = email.subject
+    if not subject.lower().startswith("re:"):
+        subject = f"Re: {subject}"
+    return subject
+
+
+def _draft_prompt(email: ParsedEmail, instruction: str) -> str:
+    return (
         f"Original email:\n"
         f"From: {email.sender}\n"
         f"Subject: {email.subject}\n"
         f"Date: {email.date}\n\n"
-        f"{body[:3000]}\n\n"
+        f"{prepare_body(email, BODY_TOKENS['draft_reply'])}\n\n"
         f"---\n"
         f"User's instruction for the reply: {instruction}"
     )
-    draft_text = claude.complete(DRAFT_REPLY_SYSTEM, user_msg, max_tokens=1024)
 
-    subject = email.subject
-    if not subject.lower().startswith("re:"):
-        subject = f"Re: {subject}"
 
-    return {"draft": draft_text, "subject": subject}
+def categorize_chunk(
+    emails: list[dict], claude: ClaudeClient, max_tokens: int = 1024
+) -> Optional[list[dict]]:
+    """One Claude call for a list of header dicts; None if the reply isn't a JSON array."""
+    response = claude.complete(
+        CATEGORIZE_SYSTEM, _categorize_prompt(emails), max_tokens=max_tokens, endpoint="categorize"
+    )
+    return parse_json_array(response)
+
+
+def categorize_batch_request(
+    custom_id: str, emails: list[dict], claude: ClaudeClient, max_tokens: int = 1024
+) -> dict:
+    """A Message Batch entry equivalent to categorize_chunk."""
+    return claude.batch_request(custom_id, CATEGORIZE_SYSTEM, _categorize_prompt(emails), max_tokens)
 
 
-def categorize_emails(
-    emails: list[dict], claude: ClaudeClient
-) -> list[dict]:
+def _categorize_prompt(emails: list[dict]) -> str:
     email_list = "\n".join(
         f'- UID {e["uid"]}: From {e["sender"]} | Subject: {e["subject"]}'
         for e in emails
     )
-    user_msg = f"Categorize these emails:\n\n{email_list}"
-    response = claude.complete(CATEGORIZE_SYSTEM, user_msg, max_tokens=1024)
+    return f"Categorize these emails:\n\n{email_list}"
+
 
+def cached_category(ref: str, claude: ClaudeClient) -> Optional[str]:
+    return claude.cached_category(CATEGORIZE_SYSTEM, ref)
+
+
+def store_category(ref: str, category: str, claude: ClaudeClient) -> None:
+    claude.store_category(CATEGORIZE_SYSTEM, ref, category)
+
+
+def parse_json_array(response: str) -> Optional[list]:
+    # Claude might wrap it in markdown code blocks or add a sentence around it
+    text = response.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0].strip()
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end < start:
+        return None
     try:
-        # Try to parse JSON from the response
-        # Claude might wrap it in markdown code blocks
-        text = response.strip()
-        if text.startswith("```"):
-            text = text.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-        results = json.loads(text)
-        return results
-    except (json.JSONDecodeError, IndexError):
-        return [{"uid": "?", "category": "Error parsing AI response"}]
-
-
-def extract_action_items(email: ParsedEmail, claude: ClaudeClient) -> list[str]:
-    body = email.body_plain or email.body_html or "(empty)"
+        results = json.loads(text[start : end + 1])
+    except json.JSONDecodeError:
+        return None
+    return results if isinstance(results, list) else None
+
+
+def extract_action_items(
+    email: ParsedEmail, claude: ClaudeClient, ref: Optional[str] = None
+) -> list[str]:
     user_msg = (
         f"From: {email.sender}\n"
         f"Subject: {email.subject}\n"
         f"Date: {email.date}\n\n"
-        f"{body[:3000]}"
+        f"{prepare_body(email, BODY_TOKENS['action_items'])}"
     )
-    response = claude.complete(ACTION_ITEMS_SYSTEM, user_msg, max_tokens=512)
+    response = claude.complete(
+        ACTION_ITEMS_SYSTEM, user_msg, max_tokens=512, endpoint="action_items", ref=ref
+    )
+    return _split_items(response)
+
+
+def cached_action_items(ref: str, claude: ClaudeClient) -> Optional[list[str]]:
+    response = claude.cached(ACTION_ITEMS_SYSTEM, 512, "action_items", ref)
+    return _split_items(response) if response is not None else None
+
+
+def _split_items(response: str) -> list[str]:
     # Split into list items
     items = []
     for line in response.split("\n"):
@@ -0,0 +1,203 @@
+import re
+from html.parser import HTMLParser
+
+from app.imap.parser import ParsedEmail
+
+# Elements whose text never reaches the reader
+SKIP_TAGS = {"head", "style", "script", "title", "template", "noscript", "svg"}
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "div", "dl", "dt", "dd", "footer",
+    "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav",
+    "ol", "p", "pre", "section", "table", "tr", "ul",
+}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "wbr"}
+HIDDEN_RE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden|max-height\s*:\s*0", re.IGNORECASE)
+
+# First line of a quoted reply chain ("On <date>, <name> wrote:" may wrap
+# onto a second line, so it is matched against two joined lines)
+ATTRIBUTION_RE = re.compile(
+    r"^(On\b.{0,300}\bwrote|Le\b.{0,300}\ba écrit|Am\b.{0,300}\bschrieb|El\b.{0,300}\bescribió)\s*:\s*$",
+    re.IGNORECASE,
+)
+ORIGINAL_RE = re.compile(r"^-{2,}\s*(Original Message|Reply message|Ursprüngliche Nachricht)\s*-{2,}\s*$", re.IGNORECASE)
+OUTLOOK_FROM_RE = re.compile(r"^\*?(From|De|Von)\s*:\*?\s+\S")
+OUTLOOK_NEXT_RE = re.compile(r"^\*?(Sent|Date|Envoyé|Gesendet|To)\s*:", re.IGNORECASE)
+SIGNATURE_RE = re.compile(
+    r"^(--\s*|Sent from my \w+.*|Sent from (Mail|Outlook) for .*|Get Outlook for .*)$", re.IGNORECASE
+)
+SPACES_RE = re.compile(r"[ \t\u00a0\u200b\u200c\u200d\u2007\u202f\ufeff]+")
+RULE_RE = re.compile(r"^[\s\-_=*~.]{8,}$")
+
+# Signatures are only looked for this many lines from the end
+SIGNATURE_LINES = 15
+TRUNCATED = "\n[...]"
+
+
+def estimate_tokens(text: str) -> int:
+    """About four characters per token for English mail text."""
+    return len(text) // 4 + 1
+
+
+class _TextExtractor(HTMLParser):
+    """Visible text of an HTML body. Paragraph-level elements become line
+    breaks, list items get a "- " bullet and text inside <blockquote> is
+    prefixed with "> " so strip_quoted() treats it like a plain-text quote."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: list[str] = []
+        self._skip: list[str] = []
+        self._quote = 0
+        self._pre = 0
+        self._line_start = True
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip:
+            if tag not in VOID_TAGS:
+                self._skip.append(tag)
+            return
+        style = dict(attrs).get("style") or ""
+        if tag in SKIP_TAGS or (tag not in VOID_TAGS and HIDDEN_RE.search(style)):
+            self._skip.append(tag)
+            return
+        if tag == "br":
+            self._newline()
+        elif tag in BLOCK_TAGS:
+            self._newline()
+            if tag == "blockquote":
+                self._quote += 1
+            elif tag == "pre":
+                self._pre += 1
+            elif tag == "li":
+                self._write("- ")
+        elif tag in ("td", "th"):
+            self._write(" ")
+
+    def handle_endtag(self, tag):
+        if self._skip:
+            # Tolerate unclosed children: pop back to the matching start tag
+            if tag in self._skip:
+                while self._skip.pop() != tag:
+                    pass
+            return
+        if tag in BLOCK_TAGS:
+            if tag == "blockquote":
+                self._quote = max(self._quote - 1, 0)
+            elif tag == "pre":
+                self._pre = max(self._pre - 1, 0)
+            self._newline()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._pre:
+            for i, line in enumerate(data.split("\n")):
+                if i:
+                    self._newline()
+                self._write(line)
+        else:
+            self._write(SPACES_RE.sub(" ", data.replace("\n", " ")))
+
+    def _write(self, text: str) -> None:
+        if not text or (self._line_start and not text.strip()):
+            return
+        if self._line_start:
+            self._parts.append("> " * self._quote)
+            text = text.lstrip()
+            self._line_start = False
+        self._parts.append(text)
+
+    def _newline(self) -> None:
+        self._parts.append("\n")
+        self._line_start = True
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+
+def html_to_text(html: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def strip_quoted(text: str) -> str:
+    """Drop quoted reply history: ">" lines, and everything after an
+    "On ... wrote:" attribution, an "-----Original Message-----" line or an
+    Outlook "From:/Sent:" header block. Forwarded messages are kept. Text
+    that is nothing but a quote is returned unchanged."""
+    lines = text.split("\n")
+    kept: list[str] = []
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if kept and any(l.strip() for l in kept):
+            two_lines = f"{stripped} {lines[i + 1].strip()}" if i + 1 < len(lines) else stripped
+            if (
+                ATTRIBUTION_RE.match(stripped)
+                or ATTRIBUTION_RE.match(two_lines)
+                or ORIGINAL_RE.match(stripped)
+                or (OUTLOOK_FROM_RE.match(stripped) and _outlook_header(lines, i))
+            ):
+                break
+        if stripped.startswith(">"):
+            continue
+        kept.append(line)
+    result = "\n".join(kept)
+    return result if result.strip() else text
+
+
+def _outlook_header(lines: list[str], i: int) -> bool:
+    return any(OUTLOOK_NEXT_RE.match(line.strip()) for line in lines[i + 1 : i + 4])
+
+
+def strip_signature(text: str) -> str:
+    """Cut at the first signature marker ("-- ", "Sent from my iPhone", ...)
+    among the last SIGNATURE_LINES lines that has message text above it."""
+    lines = text.rstrip().split("\n")
+    for i in range(max(len(lines) - SIGNATURE_LINES, 1), len(lines)):
+        if SIGNATURE_RE.match(lines[i].strip()) and any(l.strip() for l in lines[:i]):
+            return "\n".join(lines[:i])
+    return text
+
+
+def collapse_whitespace(text: str) -> str:
+    """Single spaces within lines, no separator rules, at most one blank line in a row."""
+    out: list[str] = []
+    for line in text.split("\n"):
+        line = SPACES_RE.sub(" ", line).strip()
+        if RULE_RE.match(line):
+            line = ""
+        if line or (out and out[-1]):
+            out.append(line)
+    return "\n".join(out).strip()
+
+
+def fit_tokens(text: str, max_tokens: int) -> str:
+    """Truncate to about `max_tokens`, preferring a paragraph, line or
+    sentence boundary in the last quarter of the allowance."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(max_tokens * 4 - len(TRUNCATED), 0)
+    cut = text[:limit]
+    for boundary in ("\n\n", "\n", ". "):
+        pos = cut.rfind(boundary)
+        if pos >= limit * 3 // 4:
+            cut = cut[: pos + (1 if boundary == ". " else 0)]
+            break
+    return cut.rstrip() + TRUNCATED
+
+
+def clean_body(email: ParsedEmail) -> str:
+    """Readable text of the new part of a message, before any budget."""
+    text = email.body_plain
+    if not text.strip() and email.body_html:
+        text = html_to_text(email.body_html)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return collapse_whitespace(strip_signature(strip_quoted(text)))
+
+
+def prepare_body(email: ParsedEmail, max_tokens: int) -> str:
+    """Message body for a prompt: HTML converted to text, quoted history and
+    signature removed, whitespace collapsed, fitted to `max_tokens`."""
+    return fit_tokens(clean_body(email), max_tokens) or "(empty)"
@@ -0,0 +1,365 @@
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+from app.imap.search import SearchCriteria, build_imap_search
+
+
+# Words that carry no search meaning in "show me all my unread emails ..."
+FILLER = {
+    "a", "all", "an", "and", "any", "are", "emails", "email", "find", "for", "get",
+    "got", "i", "list", "look", "mail", "mails", "me", "message", "messages", "my",
+    "please", "received", "search", "show", "some", "that", "the", "were", "which",
+}
+
+# Words that start a phrase, so never a sender/subject value
+KEYWORDS = {
+    "about", "after", "before", "body", "by", "containing", "from", "in",
+    "last", "mentioning", "on", "past", "regarding", "since", "subject", "this",
+    "titled", "to", "today", "with", "yesterday",
+}
+
+FLAG_WORDS = {
+    "unread": ("unseen", True),
+    "unseen": ("unseen", True),
+    "new": ("unseen", True),
+    "read": ("unseen", False),
+    "seen": ("unseen", False),
+    "flagged": ("flagged", True),
+    "starred": ("flagged", True),
+    "unflagged": ("flagged", False),
+    "unstarred": ("flagged", False),
+}
+
+# Folder roles and the names servers commonly give them
+FOLDER_ALIASES = {
+    "inbox": ("INBOX",),
+    "sent": ("Sent", "Sent Items", "Sent Mail", "Sent Messages"),
+    "drafts": ("Drafts", "Draft"),
+    "trash": ("Trash", "Deleted Items", "Deleted Messages", "Bin"),
+    "spam": ("Spam", "Junk", "Junk Email", "Junk E-mail"),
+    "junk": ("Junk", "Spam", "Junk Email", "Junk E-mail"),
+    "archive": ("Archive", "Archives", "All Mail"),
+}
+
+MONTHS = {
+    name: i + 1
+    for i, names in enumerate((
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+        ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+        ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"),
+        ("december", "dec"),
+    ))
+    for name in names
+}
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+UNITS = {"day": 1, "days": 1, "week": 7, "weeks": 7, "month": 30, "months": 30, "year": 365, "years": 365}
+
+TOKEN_RE = re.compile(r'(\w+):"([^"]*)"|"([^"]*)"|(\S+)')
+
+
+@dataclass
+class ParsedQuery:
+    criteria: SearchCriteria
+    folder: Optional[str] = None   # a FOLDER_ALIASES role or a folder name as typed
+
+    @property
+    def imap_query(self) -> str:
+        return build_imap_search(self.criteria)
+
+
+@dataclass
+class _Token:
+    text: str            # lowercased, trailing punctuation stripped
+    raw: str             # as typed
+    quoted: bool = False
+
+    @property
+    def is_value(self) -> bool:
+        """Usable as a sender/subject/etc. value rather than a keyword."""
+        return self.quoted or (
+            self.text not in FILLER and self.text not in KEYWORDS and self.text not in FLAG_WORDS
+        )
+
+
+def parse_query(query: str, today: Optional[date] = None) -> Optional[ParsedQuery]:
+    """Map a common natural-language search to SearchCriteria without an LLM.
+
+    Understands senders ("from alice", "from:bob@x.com"), recipients ("to
+    bob@x.com", "to:bob"), subject keywords ("about invoice", 'subject "Q3 plan"'), body words
+    ("containing refund"), read/unread and flagged/starred, folders ("in
+    sent", "in:archive") and dates ("yesterday", "last week", "past 3 days",
+    "since 2025-01-15", "in march", "before friday").
+
+    Returns None unless every word of the query was understood and it asks
+    for something, so anything ambiguous goes to the agent instead.
+    """
+    today = today or date.today()
+    tokens = _tokenize(query)
+    criteria = SearchCriteria()
+    folder = None
+    matched = False
+    i = 0
+
+    while i < len(tokens):
+        tok = tokens[i]
+        word = tok.text
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+
+        if tok.quoted:
+            if criteria.subject:
+                return None
+            criteria.subject = tok.raw
+            i += 1
+        elif ":" in word and not word.endswith(":"):
+            key, _, value = tok.raw.partition(":")
+            if not _apply_operator(criteria, key.lower(), value, today):
+                if key.lower() != "in":
+                    return None
+                folder = value
+            i += 1
+        elif word in FILLER:
+            i += 1
+            continue
+        elif word in FLAG_WORDS:
+            field, value = FLAG_WORDS[word]
+            setattr(criteria, field, value)
+            i += 1
+        elif word in ("from", "by") and nxt is not None and nxt.is_value:
+            criteria.from_addr = nxt.raw
+            i += 2
+        elif word == "sent" and nxt is not None and nxt.text in ("by", "from") and i + 2 < len(tokens) and tokens[i + 2].is_value:
+            criteria.from_addr = tokens[i + 2].raw
+            i += 3
+        elif word == "to" and nxt is not None and nxt.is_value and "@" in nxt.text:
+            # Only an address: "to do list" is not a recipient
+            criteria.to_addr = nxt.raw
+            i += 2
+        elif word in ("about", "regarding", "titled", "subject") and nxt is not None and nxt.is_value:
+            criteria.subject = nxt.raw
+            i += 2
+        elif word == "with" and nxt is not None and nxt.text == "subject" and i + 2 < len(tokens) and tokens[i + 2].is_value:
+            criteria.subject = tokens[i + 2].raw
+            i += 3
+        elif word in ("containing", "mentioning") and nxt is not None and nxt.is_value:
+            criteria.body = nxt.raw
+            i += 2
+        elif word in ("since", "after", "before", "on"):
+            span = _parse_date(tokens, i + 1, today)
+            if span is None:
+                return None
+            start, end, used = span
+            if word == "on" and not (end - start == timedelta(days=1) if end else start == today):
+                # "on may" or "on this week" names a range, not a day
+                return None
+            if word == "since":
+                criteria.since = _imap_date(start)
+            elif word == "after":
+                criteria.since = _imap_date(end or start + timedelta(days=1))
+            elif word == "before":
+                criteria.before = _imap_date(start)
+            else:
+                criteria.since = _imap_date(start)
+                criteria.before = _imap_date(end or start + timedelta(days=1))
+            i += 1 + used
+        elif word == "in" and nxt is not None:
+            span = _parse_date(tokens, i + 1, today)
+            if span is not None:
+                start, end, used = span
+                criteria.since = _imap_date(start)
+                if end is not None and end <= today:
+                    criteria.before = _imap_date(end)
+                i += 1 + used
+            else:
+                name, used = _parse_folder(tokens, i + 1)
+                if name is None:
+                    return None
+                folder = name
+                i += 1 + used
+        else:
+            span = _parse_date(tokens, i, today)
+            if span is None:
+                return None
+            start, end, used = span
+            criteria.since = _imap_date(start)
+            if end is not None and end <= today:
+                criteria.before = _imap_date(end)
+            i += used
+        matched = True
+
+    if not matched:
+        return None
+    return ParsedQuery(criteria=criteria, folder=folder)
+
+
+def resolve_folder(name: str, folders: list[str]) -> Optional[str]:
+    """Find the server folder for a role ("sent") or a name as typed."""
+    candidates = [name.lower()] + [a.lower() for a in FOLDER_ALIASES.get(name.lower(), ())]
+    for candidate in candidates:
+        for folder in folders:
+            leaf = re.split(r"[/.]", folder)[-1]
+            if folder.lower() == candidate or leaf.lower() == candidate:
+                return folder
+    return None
+
+
+def _tokenize(query: str) -> list[_Token]:
+    tokens = []
+    for m in TOKEN_RE.finditer(query):
+        if m.group(1) is not None:
+            raw = f"{m.group(1)}:{m.group(2)}"
+            tokens.append(_Token(text=raw.lower(), raw=raw))
+        elif m.group(3) is not None:
+            if m.group(3).strip():
+                tokens.append(_Token(text=m.group(3).lower(), raw=m.group(3), quoted=True))
+        else:
+            raw = m.group(4).rstrip(",.?!;")
+            if raw:
+                tokens.append(_Token(text=raw.lower(), raw=raw))
+    return tokens
+
+
+def _apply_operator(criteria: SearchCriteria, key: str, value: str, today: date) -> bool:
+    """Gmail-style key:value terms. Returns False for unknown keys."""
+    if key == "from":
+        criteria.from_addr = value
+    elif key == "to":
+        criteria.to_addr = value
+    elif key == "subject":
+        criteria.subject = value
+    elif key == "body":
+        criteria.body = value
+    elif key == "is" and value.lower() in FLAG_WORDS:
+        field, flag = FLAG_WORDS[value.lower()]
+        setattr(criteria, field, flag)
+    elif key in ("after", "since", "before"):
+        day = _parse_day(value.lower(), today)
+        if day is None:
+            return False
+        if key == "before":
+            criteria.before = _imap_date(day)
+        else:
+            criteria.since = _imap_date(day + timedelta(days=1) if key == "after" else day)
+    elif key == "newer_than" and re.fullmatch(r"\d+[dwmy]", value.lower()):
+        days = int(value[:-1]) * {"d": 1, "w": 7, "m": 30, "y": 365}[value[-1].lower()]
+        criteria.since = _imap_date(today - timedelta(days=days))
+    else:
+        return False
+    return True
+
+
+def _parse_date(tokens: list[_Token], i: int, today: date) -> Optional[tuple[date, Optional[date], int]]:
+    """A date phrase at tokens[i:] as (start, exclusive end or None, tokens used)."""
+    words = [t.text for t in tokens[i : i + 3]]
+    if not words:
+        return None
+    first = words[0]
+    second = words[1] if len(words) > 1 else None
+
+    if first == "today":
+        return today, None, 1
+    if first == "yesterday":
+        return today - timedelta(days=1), today, 1
+    if first in WEEKDAYS:
+        back = (today.weekday() - WEEKDAYS.index(first)) % 7
+        day = today - timedelta(days=back)
+        return day, day + timedelta(days=1), 1
+
+    if first == "past" and second in UNITS:
+        return today - timedelta(days=UNITS[second]), None, 2
+    if first in ("this", "last") and second in ("week", "month", "year"):
+        start = _period_start(second, today)
+        if first == "this":
+            return start, None, 2
+        if second == "week":
+            return start - timedelta(days=7), start, 2
+        if second == "month":
+            return _add_months(start, -1), start, 2
+        return start.replace(year=start.year - 1), start, 2
+
+    # last/past N days|weeks|months, or "in the last 3 days"
+    offset = 1 if first == "the" else 0
+    if len(words) > offset and words[offset] in ("last", "past"):
+        rest = [t.text for t in tokens[i + offset + 1 : i + offset + 3]]
+        if len(rest) == 2 and rest[0].isdigit() and rest[1] in UNITS:
+            return today - timedelta(days=int(rest[0]) * UNITS[rest[1]]), None, offset + 3
+
+    if first in MONTHS:
+        month = MONTHS[first]
+        if second is not None and second.isdigit() and len(second) == 4:
+            year, used = int(second), 2
+        elif second is not None and second.isdigit() and 1 <= int(second) <= 31:
+            year = today.year if (month, int(second)) <= (today.month, today.day) else today.year - 1
+            try:
+                day = date(year, month, int(second))
+            except ValueError:
+                return None
+            return day, day + timedelta(days=1), 2
+        else:
+            year = today.year if month <= today.month else today.year - 1
+            used = 1
+        start = date(year, month, 1)
+        return start, _add_months(start, 1), used
+
+    day = _parse_day(first, today)
+    if day is not None:
+        return day, day + timedelta(days=1), 1
+    return None
+
+
+def _parse_day(text: str, today: date) -> Optional[date]:
+    """ISO (2025-01-15), IMAP (15-Jan-2025) or slash (2025/01/15) dates."""
+    m = re.fullmatch(r"(\d{4})[-/](\d{1,2})[-/](\d{1,2})", text)
+    try:
+        if m:
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        m = re.fullmatch(r"(\d{1,2})-([a-z]{3})-(\d{4})", text)
+        if m and m.group(2) in MONTHS:
+            return date(int(m.group(3)), MONTHS[m.group(2)], int(m.group(1)))
+    except ValueError:
+        return None
+    if text == "today":
+        return today
+    if text == "yesterday":
+        return today - timedelta(days=1)
+    return None
+
+
+def _parse_folder(tokens: list[_Token], i: int) -> tuple[Optional[str], int]:
+    """'sent', 'the sent folder', 'my archive', 'folder Receipts' after "in"."""
+    used = 0
+    while i + used < len(tokens) and tokens[i + used].text in ("the", "my"):
+        used += 1
+    if i + used >= len(tokens):
+        return None, 0
+    tok = tokens[i + used]
+    if tok.text in ("folder", "mailbox") and i + used + 1 < len(tokens):
+        return tokens[i + used + 1].raw, used + 2
+    following = tokens[i + used + 1].text if i + used + 1 < len(tokens) else None
+    if following in ("folder", "mailbox"):
+        return tok.raw, used + 2
+    if tok.text in FOLDER_ALIASES:
+        return tok.text, used + 1
+    return None, 0
+
+
+def _period_start(unit: str, today: date) -> date:
+    """First day of the current week (Monday), month or year."""
+    if unit == "week":
+        return today - timedelta(days=today.weekday())
+    if unit == "month":
+        return today.replace(day=1)
+    return today.replace(month=1, day=1)
+
+
+def _add_months(day: date, months: int) -> date:
+    """First of the month `months` away from `day`'s month."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _imap_date(day: date) -> str:
+    return day.strftime("%d-%b-%Y")
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from app.imap.cache import open_cache_db
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS claude_responses (
+    key TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS claude_responses_lru ON claude_responses (last_used);
+
+CREATE TABLE IF NOT EXISTS claude_response_refs (
+    ref_key TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS message_categories (
+    ref_key TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class EndpointStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+
+def response_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Persistent LRU/TTL cache of Claude completions.
+
+    Entries are keyed by a hash of (model, system prompt, user message,
+    max_tokens), so any change to the prompt or the message content is a
+    miss. Callers can also register a ref for an entry (e.g. a message's
+    account/folder/UIDVALIDITY/UID) and look it up later without rebuilding
+    the prompt, which skips the IMAP fetch entirely. Per-message categories,
+    which are split out of multi-message categorize replies, are kept in
+    their own table under a ref. Endpoints listed in `disabled` bypass the
+    cache.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 5000,
+        ttl: float = 7 * 24 * 3600,
+        disabled: tuple[str, ...] = (),
+    ):
+        self._db = open_cache_db(path, SCHEMA)
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._disabled = set(disabled)
+        self._stats: dict[str, EndpointStats] = {}
+        self._evictions = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def enabled_for(self, endpoint: Optional[str]) -> bool:
+        return endpoint is not None and endpoint not in self._disabled and self._max_entries > 0
+
+    def get(self, key: str, endpoint: str, count_miss: bool = True) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, created_at FROM claude_responses WHERE key = ?", (key,)
+            ).fetchone()
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+            if row is None or (self._ttl and now - row[1] > self._ttl):
+                if count_miss:
+                    stats.misses += 1
+                return None
+            with self._db:
+                self._db.execute(
+                    "UPDATE claude_responses SET last_used = ? WHERE key = ?", (now, key)
+                )
+            stats.hits += 1
+        return row[0]
+
+    def get_ref(self, ref_key: str, endpoint: str) -> Optional[str]:
+        """Look up a response by ref. Only hits are counted; a miss here falls
+        through to a normal get() that counts it."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key FROM claude_response_refs WHERE ref_key = ?", (ref_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return self.get(row[0], endpoint, count_miss=False)
+
+    def put(self, key: str, endpoint: str, response: str, ref_key: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO claude_responses "
+                "(key, endpoint, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, response, now, now),
+            )
+            if ref_key is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO claude_response_refs (ref_key, key) VALUES (?, ?)",
+                    (ref_key, key),
+                )
+            self._stats.setdefault(endpoint, EndpointStats()).stores += 1
+            self._evict(now)
+
+    def get_category(self, ref_key: str) -> Optional[str]:
+        """A stored message category. Like get_ref(), only hits are counted."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT category, created_at FROM message_categories WHERE ref_key = ?", (ref_key,)
+            ).fetchone()
+            if row is None or (self._ttl and time.time() - row[1] > self._ttl):
+                return None
+            self._stats.setdefault("categorize", EndpointStats()).hits += 1
+        return row[0]
+
+    def put_category(self, ref_key: str, category: str) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO message_categories (ref_key, category, created_at) VALUES (?, ?, ?)",
+                (ref_key, category, now),
+            )
+            self._stats.setdefault("categorize", EndpointStats()).stores += 1
+            if self._ttl:
+                self._db.execute("DELETE FROM message_categories WHERE created_at < ?", (now - self._ttl,))
+            count = self._db.execute("SELECT COUNT(*) FROM message_categories").fetchone()[0]
+            if count > self._max_entries:
+                excess = count - self._max_entries + self._max_entries // 10
+                self._db.execute(
+                    "DELETE FROM message_categories WHERE ref_key IN "
+                    "(SELECT ref_key FROM message_categories ORDER BY created_at LIMIT ?)",
+                    (excess,),
+                )
+
+    def _evict(self, now: float) -> None:
+        removed = 0
+        if self._ttl:
+            removed += self._db.execute(
+                "DELETE FROM claude_responses WHERE created_at < ?", (now - self._ttl,)
+            ).rowcount
+        count = self._db.execute("SELECT COUNT(*) FROM claude_responses").fetchone()[0]
+        if count > self._max_entries:
+            # Trim a tenth below the cap so eviction doesn't run on every insert
+            excess = count - self._max_entries + self._max_entries // 10
+            removed += self._db.execute(
+                "DELETE FROM claude_responses WHERE key IN "
+                "(SELECT key FROM claude_responses ORDER BY last_used LIMIT ?)",
+                (excess,),
+            ).rowcount
+        if removed:
+            self._evictions += removed
+            self._db.execute(
+                "DELETE FROM claude_response_refs WHERE key NOT IN (SELECT key FROM claude_responses)"
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM claude_responses").fetchone()[0]
+            categories = self._db.execute("SELECT COUNT(*) FROM message_categories").fetchone()[0]
+            endpoints = {name: asdict(s) for name, s in self._stats.items()}
+        hits = sum(s["hits"] for s in endpoints.values())
+        misses = sum(s["misses"] for s in endpoints.values())
+        return {
+            "entries": entries,
+            "categories": categories,
+            "max_entries": self._max_entries,
+            "ttl": self._ttl,
+            "evictions": self._evictions,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "disabled": sorted(self._disabled),
+            "endpoints": endpoints,
+        }
@@ -1,11 +1,20 @@
+import asyncio
 from datetime import date
+from typing import AsyncIterator, Optional
 
 from app.ai.claude import ClaudeClient
 from app.ai.prompts import SEARCH_SYSTEM
-from app.imap.client import IMAPClient
-from app.imap.search import SearchCriteria, build_imap_search
+from app.ai.query_parser import ParsedQuery, parse_query, resolve_folder
+from app.imap.aio import AsyncIMAPPool
+from app.imap.cache import HeaderCache
+from app.imap.index import MessageIndex, SearchResult, search_folder
+from app.imap.search_cache import SearchCache
+from app.imap.search import SearchCriteria
 
 
+# Claude turns per query; each may run several searches at once
+MAX_TURNS = 5
+
 SEARCH_TOOL = {
     "name": "imap_search",
     "description": "Search the user's email inbox using IMAP criteria. Returns matching email summaries.",
@@ -46,12 +55,79 @@ SEARCH_TOOL = {
 }
 
 
-def run_search_agent(
+async def run_search_agent(
     query: str,
-    imap: IMAPClient,
+    pool: AsyncIMAPPool,
     claude: ClaudeClient,
     folder: str = "INBOX",
+    cache: Optional[HeaderCache] = None,
+    index: Optional[MessageIndex] = None,
+    max_lag: int = 500,
+    sync_interval: float = 0,
+    fast_path: bool = True,
+    search_cache: Optional[SearchCache] = None,
 ) -> dict:
+    async for event, data in search_agent_events(
+        query, pool, claude, folder, cache, index, max_lag, sync_interval, fast_path, search_cache
+    ):
+        if event == "done":
+            return data
+
+
+async def search_agent_events(
+    query: str,
+    pool: AsyncIMAPPool,
+    claude: ClaudeClient,
+    folder: str = "INBOX",
+    cache: Optional[HeaderCache] = None,
+    index: Optional[MessageIndex] = None,
+    max_lag: int = 500,
+    sync_interval: float = 0,
+    fast_path: bool = True,
+    search_cache: Optional[SearchCache] = None,
+) -> AsyncIterator[tuple[str, dict]]:
+    """Run the search loop, yielding (event, data) pairs as it goes.
+
+    With `fast_path`, a query parse_query fully understands is run as one
+    IMAP search without calling Claude. Otherwise every imap_search call
+    in a turn runs concurrently, and their results go back to Claude
+    together in one message.
+
+    - ("search", {"id", "criteria"}) for each IMAP search Claude asks for
+    - ("results", {"id", "imap_query", "total", "count", "source"}) as each finishes
+    - ("token", {"text"}) for each text delta from Claude; text from a
+      turn that ends in another search is preamble, not the summary
+    - ("done", {"summary", "emails", "imap_query", "source", "path",
+      "search_cache", "folder"}) last, where path is "parser" or "agent",
+      search_cache counts this query's hits and misses in `search_cache`
+      and folder is the folder searched, which a parsed "in sent" changes
+    """
+    parsed = parse_query(query) if fast_path else None
+    if parsed is not None:
+        target = folder
+        if parsed.folder is not None:
+            async with pool.connection() as imap:
+                target = resolve_folder(parsed.folder, await imap.list_folders())
+        if target is None:
+            # Still the parser's answer: the agent can't search another
+            # folder either, and callers skip the API key check for parsed
+            # queries
+            yield "done", {
+                "summary": f'No folder matches "{parsed.folder}"; nothing was searched.',
+                "emails": [],
+                "imap_query": parsed.imap_query,
+                "source": "server",
+                "path": "parser",
+                "search_cache": {"hits": 0, "misses": 0},
+                "folder": folder,
+            }
+            return
+        async for item in _parsed_search(
+            parsed, pool, target, cache, index, max_lag, sync_interval, search_cache
+        ):
+            yield item
+        return
+
     today = date.today().strftime("%d-%b-%Y")
     system = SEARCH_SYSTEM.format(today=today)
     messages = [{"role": "user", "content": query}]
@@ -59,77 +135,197 @@ def run_search_agent(
 
     matched_emails = []
     imap_query = ""
+    source = "server"
+    # UID -> number of the search that first listed it to Claude
+    shown: dict[str, int] = {}
+    searches = 0
+    cache_use = {"hits": 0, "misses": 0}
 
-    for _ in range(5):
-        response = claude.complete_with_tools(
-            system=system,
-            messages=messages,
-            tools=tools,
-        )
-
-        # Find tool_use blocks
-        tool_use_block = None
-        for block in response.content:
-            if block.type == "tool_use":
-                tool_use_block = block
-                break
+    for _ in range(MAX_TURNS):
+        response = None
+        async for item in claude.stream_with_tools(system=system, messages=messages, tools=tools):
+            if isinstance(item, str):
+                yield "token", {"text": item}
+            else:
+                response = item
 
-        if tool_use_block is None:
+        calls = [block for block in response.content if block.type == "tool_use"]
+        if not calls:
             # Claude returned a final text response
             text = ""
             for block in response.content:
                 if hasattr(block, "text"):
                     text += block.text
-            return {
+            yield "done", {
                 "summary": text,
                 "emails": matched_emails,
                 "imap_query": imap_query,
+                "source": source,
+                "path": "agent",
+                "search_cache": cache_use,
+                "folder": folder,
             }
+            return
 
-        # Execute the IMAP search
-        params = tool_use_block.input
-        criteria = SearchCriteria(
-            from_addr=params.get("from_addr"),
-            to_addr=params.get("to_addr"),
-            subject=params.get("subject"),
-            body=params.get("body"),
-            since=params.get("since"),
-            before=params.get("before"),
-            unseen=params.get("unseen"),
-        )
-        imap_query = build_imap_search(criteria)
-        uids = imap.search(imap_query, folder=folder)
-        headers = imap.fetch_headers(uids, limit=20)
-        matched_emails = headers
-
-        # Format results for Claude
-        if headers:
-            result_text = f"Found {len(headers)} emails:\n\n"
-            for h in headers:
-                read_status = "Read" if h["is_read"] else "Unread"
-                result_text += (
-                    f"- UID {h['uid']} | {h['sender']} | "
-                    f"{h['subject']} | {h['date']} | {read_status}\n"
+        # Run every search of this turn at once; the pool pipelines them
+        # over its connections
+        async def _search(call) -> tuple[str, SearchResult]:
+            async with pool.connection(folder) as imap:
+                result = await search_folder(
+                    imap, cache, index, _criteria(call.input), folder=folder, limit=20,
+                    max_lag=max_lag, sync_interval=sync_interval, search_cache=search_cache,
                 )
-        else:
-            result_text = "No emails found matching those criteria."
+            return call.id, result
 
-        # Feed results back to Claude
-        messages.append({"role": "assistant", "content": response.content})
-        messages.append({
-            "role": "user",
-            "content": [
-                {
-                    "type": "tool_result",
-                    "tool_use_id": tool_use_block.id,
-                    "content": result_text,
+        tasks = [asyncio.create_task(_search(call)) for call in calls]
+        try:
+            for call in calls:
+                yield "search", {"id": call.id, "criteria": {k: v for k, v in vars(_criteria(call.input)).items() if v}}
+            for done in asyncio.as_completed(tasks):
+                call_id, result = await done
+                yield "results", {
+                    "id": call_id,
+                    "imap_query": result.imap_query,
+                    "total": result.total,
+                    "count": len(result.headers),
+                    "source": result.source,
                 }
-            ],
-        })
+        finally:
+            for task in tasks:
+                task.cancel()
+        results = [task.result()[1] for task in tasks]
+        for name, count in _cache_use(results, search_cache).items():
+            cache_use[name] += count
+
+        matched_emails = _merge_headers(results)
+        imap_query = " ; ".join(dict.fromkeys(r.imap_query for r in results))
+        sources = {r.source for r in results}
+        source = sources.pop() if len(sources) == 1 else "mixed"
+
+        # Feed all results back to Claude in one message
+        tool_results = []
+        for call, result in zip(calls, results):
+            searches += 1
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": call.id,
+                "content": _format_result(result, searches, shown),
+            })
+        messages.append({"role": "assistant", "content": response.content})
+        messages.append({"role": "user", "content": tool_results})
 
     # Fell through max iterations
-    return {
+    yield "done", {
         "summary": "Search completed but did not produce a final summary.",
         "emails": matched_emails,
         "imap_query": imap_query,
+        "source": source,
+        "path": "agent",
+        "search_cache": cache_use,
+        "folder": folder,
     }
+
+
+async def _parsed_search(
+    parsed: ParsedQuery,
+    pool: AsyncIMAPPool,
+    folder: str,
+    cache: Optional[HeaderCache],
+    index: Optional[MessageIndex],
+    max_lag: int,
+    sync_interval: float,
+    search_cache: Optional[SearchCache],
+) -> AsyncIterator[tuple[str, dict]]:
+    """The fast path: one search straight from the parsed criteria."""
+    criteria = parsed.criteria
+    yield "search", {"id": "parser", "criteria": {k: v for k, v in vars(criteria).items() if v is not None}}
+    async with pool.connection(folder) as imap:
+        result = await search_folder(
+            imap, cache, index, criteria, folder=folder, limit=20,
+            max_lag=max_lag, sync_interval=sync_interval, search_cache=search_cache,
+        )
+    yield "results", {
+        "id": "parser",
+        "imap_query": result.imap_query,
+        "total": result.total,
+        "count": len(result.headers),
+        "source": result.source,
+    }
+
+    summary = f"Found {result.total} emails in {folder} matching {result.imap_query}"
+    if result.total > len(result.headers):
+        summary += f"; showing the {'newest' if result.source == 'server' else 'most relevant'} {len(result.headers)}"
+    yield "done", {
+        "summary": summary + ".",
+        "emails": result.headers,
+        "imap_query": result.imap_query,
+        "source": result.source,
+        "path": "parser",
+        "search_cache": _cache_use([result], search_cache),
+        "folder": folder,
+    }
+
+
+def _criteria(params: dict) -> SearchCriteria:
+    return SearchCriteria(
+        from_addr=params.get("from_addr"),
+        to_addr=params.get("to_addr"),
+        subject=params.get("subject"),
+        body=params.get("body"),
+        since=params.get("since"),
+        before=params.get("before"),
+        unseen=params.get("unseen"),
+    )
+
+
+def _cache_use(results: list[SearchResult], search_cache: Optional[SearchCache]) -> dict:
+    """Search cache hits and misses among server searches (index searches skip it)."""
+    use = {"hits": 0, "misses": 0}
+    if search_cache is not None:
+        for result in results:
+            if result.source == "server":
+                use["hits" if result.cached else "misses"] += 1
+    return use
+
+
+def _merge_headers(results: list[SearchResult]) -> list[dict]:
+    """Union of the headers of one turn's searches, each UID once, in the
+    order the searches were asked for."""
+    merged: dict[str, dict] = {}
+    for result in results:
+        for h in result.headers:
+            merged.setdefault(str(h["uid"]), h)
+    return list(merged.values())
+
+
+def _format_result(result: SearchResult, number: int, shown: dict[str, int]) -> str:
+    """Describe one search's hits for Claude.
+
+    Emails an earlier search already listed are referred back to by
+    search number instead of being repeated.
+    """
+    headers = result.headers
+    if not headers:
+        return f"Search #{number}: no emails found matching those criteria."
+
+    text = f"Search #{number}: found {result.total} emails"
+    if result.source == "server":
+        if result.total > len(headers):
+            text += f" (showing the newest {len(headers)})"
+    elif result.total > len(headers):
+        text += f" (showing the {len(headers)} most relevant)"
+    else:
+        text += " (most relevant first)"
+    text += ":\n\n"
+    for h in headers:
+        uid = str(h["uid"])
+        if uid in shown:
+            text += f"- UID {uid} | see search #{shown[uid]}\n"
+            continue
+        shown[uid] = number
+        read_status = "Read" if h["is_read"] else "Unread"
+        text += (
+            f"- UID {uid} | {h['sender']} | "
+            f"{h['subject']} | {h['date']} | {read_status}\n"
+        )
+    return text
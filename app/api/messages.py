@@ -0,0 +1,32 @@
+from typing import Optional
+
+from fastapi import Request
+
+from app.accounts import Account
+from app.imap.message_cache import message_key
+from app.imap.parser import ParsedEmail
+
+
+def message_ref(request: Request, account: Account, folder: str, uid: str) -> Optional[str]:
+    """message_key() for the message and response caches, or None if the
+    folder's UIDVALIDITY isn't known yet."""
+    state = request.app.state.header_cache.folder_state(account.key, folder)
+    if state is None:
+        return None
+    return message_key(account.key, folder, state.uidvalidity, uid)
+
+
+async def load_message(
+    request: Request, account: Account, folder: str, uid: str, ref: Optional[str] = None
+) -> ParsedEmail:
+    """Fetch and parse a message, or reuse the copy another request already loaded."""
+    pool = account.imap_pool
+
+    async def _fetch():
+        async with pool.connection(folder) as imap:
+            return await imap.fetch_message(uid, folder=folder)
+
+    ref = ref or message_ref(request, account, folder, uid)
+    if ref is None:
+        return await _fetch()
+    return await account.message_cache.get(ref, _fetch)
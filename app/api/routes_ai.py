@@ -1,100 +1,214 @@
+import asyncio
+import json
+from typing import AsyncIterator
+
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from app.models.schemas import (
     SummarizeRequest, SummarizeResponse,
     DraftReplyRequest, DraftReplyResponse,
     CategorizeRequest, CategorizeResponse, CategoryResult,
     ActionItemsRequest, ActionItemsResponse,
 )
-from app.imap.parser import parse_email
+from app.accounts import Account
+from app.api.messages import message_ref, load_message
+from app.api.session import current_account
+from app.api.sse import sse_response
+from app.ai.categorize import categorize_stream
 from app.ai.email_tools import (
     summarize_email,
+    summarize_email_stream,
+    cached_summary,
     draft_reply,
-    categorize_emails,
+    draft_reply_stream,
+    reply_subject,
     extract_action_items,
+    cached_action_items,
+    cached_category,
+    store_category,
 )
 
 router = APIRouter(prefix="/api", tags=["ai"])
 
 
-def _require_connected(request: Request):
-    if not request.app.state.imap.is_connected:
-        raise HTTPException(status_code=400, detail="Not connected to email server")
+async def _require_connected(request: Request):
+    account = await current_account(request, "Not connected to email server")
     if not request.app.state.claude._api_key:
         raise HTTPException(status_code=400, detail="Anthropic API key not configured")
+    return account
 
 
 @router.post("/summarize", response_model=SummarizeResponse)
-def summarize(req: SummarizeRequest, request: Request):
-    _require_connected(request)
-    imap = request.app.state.imap
+async def summarize(req: SummarizeRequest, request: Request):
+    account = await _require_connected(request)
     claude = request.app.state.claude
 
     try:
-        msg = imap.fetch_full(req.uid)
-        flags = imap.fetch_flags(req.uid)
-        parsed = parse_email(req.uid, msg, flags)
-        summary = summarize_email(parsed, claude)
+        ref = message_ref(request, account, req.folder, req.uid)
+        if ref is not None:
+            summary = cached_summary(ref, claude)
+            if summary is not None:
+                return SummarizeResponse(summary=summary)
+        parsed = await load_message(request, account, req.folder, req.uid, ref)
+        summary = await asyncio.to_thread(summarize_email, parsed, claude, ref)
         return SummarizeResponse(summary=summary)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/summarize/stream")
+async def summarize_sse(req: SummarizeRequest, request: Request):
+    """Summary as Server-Sent Events: "token" deltas, then "done" with the full text."""
+    account = await _require_connected(request)
+    claude = request.app.state.claude
+
+    async def _events():
+        ref = message_ref(request, account, req.folder, req.uid)
+        summary = cached_summary(ref, claude) if ref is not None else None
+        if summary is None:
+            parsed = await load_message(request, account, req.folder, req.uid, ref)
+            parts = []
+            async for text in summarize_email_stream(parsed, claude, ref):
+                parts.append(text)
+                yield "token", {"text": text}
+            summary = "".join(parts)
+        else:
+            yield "token", {"text": summary}
+        yield "done", {"summary": summary}
+
+    return sse_response(_events())
+
+
 @router.post("/draft-reply", response_model=DraftReplyResponse)
-def draft_reply_endpoint(req: DraftReplyRequest, request: Request):
-    _require_connected(request)
-    imap = request.app.state.imap
+async def draft_reply_endpoint(req: DraftReplyRequest, request: Request):
+    account = await _require_connected(request)
     claude = request.app.state.claude
 
     try:
-        msg = imap.fetch_full(req.uid)
-        flags = imap.fetch_flags(req.uid)
-        parsed = parse_email(req.uid, msg, flags)
-        result = draft_reply(parsed, req.instruction, claude)
+        parsed = await load_message(request, account, req.folder, req.uid)
+        result = await asyncio.to_thread(draft_reply, parsed, req.instruction, claude)
         return DraftReplyResponse(**result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/categorize", response_model=CategorizeResponse)
-def categorize(req: CategorizeRequest, request: Request):
-    _require_connected(request)
-    imap = request.app.state.imap
+@router.post("/draft-reply/stream")
+async def draft_reply_sse(req: DraftReplyRequest, request: Request):
+    """Draft as Server-Sent Events: "subject", "token" deltas, then "done"."""
+    account = await _require_connected(request)
     claude = request.app.state.claude
 
+    async def _events():
+        parsed = await load_message(request, account, req.folder, req.uid)
+        subject = reply_subject(parsed)
+        yield "subject", {"subject": subject}
+        parts = []
+        async for text in draft_reply_stream(parsed, req.instruction, claude):
+            parts.append(text)
+            yield "token", {"text": text}
+        yield "done", {"draft": "".join(parts), "subject": subject}
+
+    return sse_response(_events())
+
+
+@router.post("/categorize", response_model=CategorizeResponse)
+async def categorize(req: CategorizeRequest, request: Request):
+    account = await _require_connected(request)
+
     try:
-        # Fetch headers for the requested UIDs
-        email_summaries = []
-        for uid in req.uids:
-            headers = imap.fetch_headers([uid.encode()], limit=1)
-            if headers:
-                email_summaries.append(headers[0])
-
-        results = categorize_emails(email_summaries, claude)
-        return CategorizeResponse(
-            results=[
-                CategoryResult(
-                    uid=r.get("uid", ""),
-                    subject=r.get("subject", ""),
-                    category=r.get("category", "Unknown"),
-                )
-                for r in results
-            ]
-        )
+        email_summaries = await _load_headers(request, account, req.uids, req.folder)
+        results = []
+        async for chunk in _categorize(request, account, email_summaries, req.folder):
+            results.extend(chunk)
+        order = {uid: i for i, uid in enumerate(req.uids)}
+        results.sort(key=lambda r: order.get(r["uid"], len(order)))
+        return CategorizeResponse(results=[CategoryResult(**r) for r in results])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/categorize/stream")
+async def categorize_ndjson(req: CategorizeRequest, request: Request):
+    """Same as /categorize, but streams one NDJSON line per finished chunk."""
+    account = await _require_connected(request)
+
+    try:
+        email_summaries = await _load_headers(request, account, req.uids, req.folder)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def _lines():
+        completed = 0
+        async for chunk in _categorize(request, account, email_summaries, req.folder):
+            completed += len(chunk)
+            yield json.dumps({
+                "results": chunk, "completed": completed, "total": len(email_summaries),
+            }) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
+async def _categorize(
+    request: Request, account: Account, headers: list[dict], folder: str
+) -> AsyncIterator[list[dict]]:
+    """categorize_stream for the emails without a stored category.
+
+    Stored categories (from earlier calls or a batch job) come first as one
+    chunk; new results are stored per message as they arrive.
+    """
+    claude = request.app.state.claude
+    settings = request.app.state.settings
+    refs = {h["uid"]: message_ref(request, account, folder, h["uid"]) for h in headers}
+    known, todo = [], []
+    for h in headers:
+        ref = refs[h["uid"]]
+        category = cached_category(ref, claude) if ref is not None else None
+        if category is None:
+            todo.append(h)
+        else:
+            known.append({"uid": h["uid"], "subject": h.get("subject", ""), "category": category})
+    if known:
+        yield known
+
+    async for chunk in categorize_stream(
+        todo, claude,
+        concurrency=settings.categorize_concurrency,
+        chunk_tokens=settings.categorize_chunk_tokens,
+    ):
+        for r in chunk:
+            ref = refs.get(r["uid"])
+            if ref is not None and r["category"] != "Unknown":
+                store_category(ref, r["category"], claude)
+        yield chunk
+
+
+async def _load_headers(request: Request, account: Account, uids: list[str], folder: str) -> list[dict]:
+    """Headers for `uids`, from the header cache where possible, else one batched fetch."""
+    pool = account.imap_pool
+    cache = request.app.state.header_cache
+    wanted = [int(u) for u in uids if u.strip().isdigit()]
+    headers = {h["uid"]: h for h in cache.get_headers(pool.account, folder, wanted)}
+    missing = [u for u in wanted if str(u) not in headers]
+    if missing:
+        async with pool.connection(folder) as imap:
+            fetched = await imap.fetch_headers(sorted(missing), limit=len(missing), folder=folder)
+        headers.update((h["uid"], h) for h in fetched)
+    return [headers[str(u)] for u in wanted if str(u) in headers]
+
+
 @router.post("/action-items", response_model=ActionItemsResponse)
-def action_items(req: ActionItemsRequest, request: Request):
-    _require_connected(request)
-    imap = request.app.state.imap
+async def action_items(req: ActionItemsRequest, request: Request):
+    account = await _require_connected(request)
     claude = request.app.state.claude
 
     try:
-        msg = imap.fetch_full(req.uid)
-        flags = imap.fetch_flags(req.uid)
-        parsed = parse_email(req.uid, msg, flags)
-        items = extract_action_items(parsed, claude)
+        ref = message_ref(request, account, req.folder, req.uid)
+        if ref is not None:
+            items = cached_action_items(ref, claude)
+            if items is not None:
+                return ActionItemsResponse(items=items)
+        parsed = await load_message(request, account, req.folder, req.uid, ref)
+        items = await asyncio.to_thread(extract_action_items, parsed, claude, ref)
         return ActionItemsResponse(items=items)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
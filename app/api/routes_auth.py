@@ -1,36 +1,56 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, Response, HTTPException
 from app.models.schemas import ConnectRequest, StatusResponse
+from app.api.session import SESSION_COOKIE, session_token
 
 router = APIRouter(prefix="/api", tags=["auth"])
 
 
 @router.post("/connect")
-def connect(req: ConnectRequest, request: Request):
-    imap = request.app.state.imap
-    settings = request.app.state.settings
-
-    # Reconfigure IMAP client with new credentials
-    imap.reconfigure(req.imap_host, req.imap_port, req.imap_user, req.imap_password)
-
-    # Update SMTP settings in memory
-    settings.smtp_host = req.smtp_host or req.imap_host.replace("imap", "smtp")
-    settings.smtp_port = req.smtp_port
-    settings.smtp_user = req.smtp_user or req.imap_user
-    settings.smtp_password = req.smtp_password or req.imap_password
+async def connect(req: ConnectRequest, request: Request, response: Response):
+    """Log in and start a session. The token is set as a cookie and also
+    returned, for clients that send it as a Bearer header instead."""
+    registry = request.app.state.accounts
+    settings = registry.account_settings(
+        imap_host=req.imap_host,
+        imap_port=req.imap_port,
+        imap_user=req.imap_user,
+        imap_password=req.imap_password,
+        smtp_host=req.smtp_host or req.imap_host.replace("imap", "smtp"),
+        smtp_port=req.smtp_port,
+        smtp_user=req.smtp_user or req.imap_user,
+        smtp_password=req.smtp_password or req.imap_password,
+    )
 
     try:
-        imap.connect()
+        token, _ = await registry.login(settings)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Connection failed: {e}")
 
-    return {"status": "connected", "user": req.imap_user}
+    # Leaving the old session, if this browser had one
+    old = session_token(request)
+    if old and old != token:
+        await registry.logout(old)
+
+    response.set_cookie(SESSION_COOKIE, token, httponly=True, samesite="strict")
+    return {"status": "connected", "user": req.imap_user, "token": token}
+
+
+@router.post("/disconnect")
+async def disconnect(request: Request, response: Response):
+    token = session_token(request)
+    if token:
+        await request.app.state.accounts.logout(token)
+    response.delete_cookie(SESSION_COOKIE)
+    return {"status": "disconnected"}
 
 
 @router.get("/status", response_model=StatusResponse)
-def status(request: Request):
-    imap = request.app.state.imap
-    connected = imap.is_connected
+async def status(request: Request):
+    try:
+        account = await request.app.state.accounts.get(session_token(request))
+    except Exception:
+        account = None
     return StatusResponse(
-        connected=connected,
-        user=imap._user if connected else "",
+        connected=account is not None,
+        user=account.imap_pool.user if account is not None else "",
     )
@@ -1,35 +1,106 @@
+import asyncio
+import calendar
+from datetime import date
+from urllib.parse import quote
+from typing import Literal, Optional
+
 from fastapi import APIRouter, Request, HTTPException, Query
-from app.models.schemas import InboxResponse, EmailSummary, EmailDetail, FoldersResponse
-from app.imap.parser import parse_email
+from fastapi.responses import StreamingResponse
+from app.models.schemas import (
+    InboxResponse, EmailSummary, EmailDetail, FoldersResponse, ThreadMessage, ThreadResponse,
+)
+from app.api.messages import load_message
+from app.api.session import current_account
+from app.api.sse import sse_response
+from app.imap.bodystructure import decode_stream
+from app.imap.cache import _date_ts
+from app.imap.index import INDEX_BATCH_SIZE, index_folder
+from app.imap.sync import sync_folder
+from app.imap.threads import thread_folder
 
 router = APIRouter(prefix="/api", tags=["inbox"])
 
+# Seconds between keep-alive events on /api/events, so proxies don't drop it
+EVENTS_KEEPALIVE = 15
+
 
 @router.get("/folders", response_model=FoldersResponse)
-def list_folders(request: Request):
-    imap = request.app.state.imap
-    if not imap.is_connected:
-        raise HTTPException(status_code=400, detail="Not connected")
+async def list_folders(request: Request):
+    pool = (await current_account(request)).imap_pool
     try:
-        folders = imap.list_folders()
+        async with pool.connection() as imap:
+            folders = await imap.list_folders()
         return FoldersResponse(folders=folders)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/inbox", response_model=InboxResponse)
-def get_inbox(
+async def get_inbox(
     request: Request,
     folder: str = Query("INBOX"),
     limit: int = Query(50, ge=1, le=200),
+    sort: Literal["uid", "date"] = Query("uid"),
+    before_uid: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = Query(None),
+    unread: bool = Query(False),
+    sender: Optional[str] = Query(None),
+    since: Optional[date] = Query(None),
+    before: Optional[date] = Query(None),
 ):
-    imap = request.app.state.imap
-    if not imap.is_connected:
-        raise HTTPException(status_code=400, detail="Not connected")
+    """A page of the folder, newest first. `unread`, `sender` (substring of
+    From) and `since`/`before` (UTC dates, before exclusive) filter it;
+    filtered pages are always served from the synced cache."""
+    account = await current_account(request)
+    pool = account.imap_pool
+    cache = request.app.state.header_cache
+    settings = request.app.state.settings
+    filters = dict(
+        unread=unread,
+        sender=sender or None,
+        since=calendar.timegm(since.timetuple()) if since else None,
+        before=calendar.timegm(before.timetuple()) if before else None,
+    )
+    filtered = any(filters.values())
+
+    before_date = None
+    if cursor:
+        try:
+            before_uid, before_date = _parse_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
     try:
-        uids = imap.search("ALL", folder=folder)
-        headers = imap.fetch_headers(uids, limit=limit)
+        state = cache.folder_state(pool.account, folder)
+        cold = state is None or not state.synced_at
+        # SORT pages by offset, not by date, so only the first date-sorted
+        # page can come from the server; later ones wait for the sync.
+        if cold and not filtered and (sort == "uid" or before_uid is None):
+            # Cold cache: serve this page straight from the server and fill the
+            # cache in the background instead of blocking on a full first sync.
+            headers, total = await _server_page(pool, account.search_cache, folder, limit, before_uid, sort)
+            _start_background_sync(request.app, account, folder)
+        else:
+            async with pool.connection(folder) as imap:
+                await sync_folder(imap, cache, folder, max_age=settings.cache_sync_interval)
+            _start_background_index(request.app, account, folder)
+            _start_background_threading(request.app, account, folder)
+            # Compact in-memory columns: only the page's rows become dicts
+            headers, total = await asyncio.to_thread(
+                request.app.state.header_store.page,
+                pool.account, folder, limit=limit + 1,
+                before_uid=before_uid, sort=sort, before_date=before_date, **filters,
+            )
+
+        next_cursor = None
+        if len(headers) > limit:
+            headers = headers[:limit]
+            last = headers[-1]
+            if sort == "date" and "date_ts" in last:
+                next_cursor = f"{last['date_ts']}:{last['uid']}"
+            else:
+                next_cursor = last["uid"]
+
         emails = [
             EmailSummary(
                 uid=h["uid"],
@@ -40,22 +111,145 @@ def get_inbox(
             )
             for h in headers
         ]
-        return InboxResponse(folder=folder, total=len(uids), emails=emails)
+        return InboxResponse(folder=folder, total=total, emails=emails, next_cursor=next_cursor)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _parse_cursor(cursor: str) -> tuple[int, Optional[tuple[int, int]]]:
+    """Cursors are "<uid>" for UID order and "<date_ts>:<uid>" for date order."""
+    if ":" in cursor:
+        date_ts, uid = (int(p) for p in cursor.split(":", 1))
+        return uid, (date_ts, uid)
+    return int(cursor), None
+
+
+async def _server_page(
+    pool, search_cache, folder: str, limit: int, before_uid: Optional[int], sort: str = "uid"
+) -> tuple[list[dict], int]:
+    """One page from the server: ESEARCH PARTIAL in UID order, ESORT
+    (REVERSE DATE) in date order. Date-sorted rows carry date_ts, so the
+    next page's cursor continues from the cache once it is synced."""
+    if sort == "date":
+        before_uid = None
+    async with pool.connection(folder) as imap:
+        async def _search():
+            # One extra UID tells us whether there is a next page
+            page = await imap.search_page(
+                "ALL", folder=folder, limit=limit + 1, before_uid=before_uid, sort=sort
+            )
+            headers = await imap.fetch_headers(page.uids, limit=limit + 1, folder=folder)
+            if sort == "date":
+                for h in headers:
+                    h["date_ts"] = _date_ts(h["date"])
+            return headers, page.total
+
+        result, _ = await search_cache.get_or_search(
+            imap, folder, "ALL", _search, variant=f"sort={sort} limit={limit + 1} before={before_uid}"
+        )
+    return result
+
+
+def _start_once(app, kind: str, account, folder: str, run) -> None:
+    """Run `run()` in the background unless `kind` work is already running
+    for the folder. A second task would only hold a pool connection while
+    it waits for the first one's folder lock."""
+    tasks = app.state.background_tasks
+    key = (kind, account.imap_pool.account, folder)
+    if key in tasks:
+        return
+    task = asyncio.create_task(run())
+    tasks[key] = task
+    task.add_done_callback(lambda _: tasks.pop(key, None))
+
+
+def _start_background_sync(app, account, folder: str) -> None:
+    async def _run():
+        async with account.imap_pool.connection(folder) as imap:
+            await sync_folder(
+                imap, app.state.header_cache, folder,
+                max_age=app.state.settings.cache_sync_interval,
+            )
+        _start_background_index(app, account, folder)
+        _start_background_threading(app, account, folder)
+
+    _start_once(app, "sync", account, folder, _run)
+
+
+def _start_background_index(app, account, folder: str) -> None:
+    """Index newly synced messages for local search, one batch per pool checkout."""
+    pool = account.imap_pool
+    index = app.state.message_index
+    if not index.unindexed_uids(pool.account, folder, limit=1):
+        return
+
+    async def _run():
+        while True:
+            async with pool.connection(folder) as imap:
+                indexed = await index_folder(
+                    imap, app.state.header_cache, index, folder, max_messages=INDEX_BATCH_SIZE
+                )
+            if not indexed:
+                return
+
+    _start_once(app, "index", account, folder, _run)
+
+
+def _start_background_threading(app, account, folder: str) -> None:
+    """Link newly synced messages into the thread index."""
+    pool = account.imap_pool
+    threads = app.state.thread_index
+    if not threads.unthreaded_uids(pool.account, folder, limit=1):
+        return
+
+    async def _run():
+        async with pool.connection(folder) as imap:
+            await thread_folder(imap, app.state.header_cache, threads, folder)
+
+    _start_once(app, "threads", account, folder, _run)
+
+
+@router.get("/thread/{uid}", response_model=ThreadResponse)
+async def get_thread(uid: int, request: Request, folder: str = Query("INBOX")):
+    """The conversation containing a message, oldest first, from the thread index."""
+    pool = (await current_account(request)).imap_pool
+    cache = request.app.state.header_cache
+    threads = request.app.state.thread_index
+
+    try:
+        async with pool.connection(folder) as imap:
+            await sync_folder(imap, cache, folder, max_age=request.app.state.settings.cache_sync_interval)
+            await thread_folder(imap, cache, threads, folder)
+        found = threads.conversation(pool.account, folder, uid)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if found is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    thread_id, members = found
+    headers = {int(h["uid"]): h for h in cache.get_headers(pool.account, folder, [m["uid"] for m in members])}
+    messages = [
+        ThreadMessage(
+            uid=str(m["uid"]),
+            subject=headers[m["uid"]]["subject"],
+            sender=headers[m["uid"]]["sender"],
+            date=headers[m["uid"]]["date"],
+            is_read=headers[m["uid"]]["is_read"],
+            parent_uid=str(m["parent_uid"]) if m["parent_uid"] is not None else None,
+            depth=m["depth"],
+        )
+        for m in members
+        if m["uid"] in headers
+    ]
+    return ThreadResponse(folder=folder, thread_id=thread_id, messages=messages)
 
 
 @router.get("/email/{uid}", response_model=EmailDetail)
-def get_email(uid: str, request: Request, folder: str = Query("INBOX")):
-    imap = request.app.state.imap
-    if not imap.is_connected:
-        raise HTTPException(status_code=400, detail="Not connected")
+async def get_email(uid: str, request: Request, folder: str = Query("INBOX")):
+    account = await current_account(request)
 
     try:
-        imap.select_folder(folder)
-        msg = imap.fetch_full(uid)
-        flags = imap.fetch_flags(uid)
-        parsed = parse_email(uid, msg, flags)
+        parsed = await load_message(request, account, folder, uid)
         return EmailDetail(
             uid=parsed.uid,
             subject=parsed.subject,
@@ -69,3 +263,56 @@ def get_email(uid: str, request: Request, folder: str = Query("INBOX")):
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/email/{uid}/attachments/{part}")
+async def download_attachment(uid: str, part: str, request: Request, folder: str = Query("INBOX")):
+    """Stream one attachment, decoded, without holding the whole message in memory."""
+    pool = (await current_account(request)).imap_pool
+
+    try:
+        async with pool.connection(folder) as imap:
+            _, structure, _ = await imap.fetch_structure(uid, folder=folder)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    attachment = next((p for p in structure.walk() if p.section == part), None)
+    if attachment is None:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    async def _body():
+        async with pool.connection(folder) as imap:
+            chunks = imap.stream_part(uid, part, folder=folder)
+            async for data in decode_stream(chunks, attachment.encoding):
+                yield data
+
+    return StreamingResponse(
+        _body(),
+        media_type=attachment.content_type,
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(attachment.filename)}"},
+    )
+
+
+@router.get("/events")
+async def mail_events(request: Request):
+    """Push new mail, flag changes and expunges as Server-Sent Events.
+
+    Each change in a watched folder is one "mail" event shaped like
+    MailWatcher's events; "ping" is sent when nothing happened for
+    EVENTS_KEEPALIVE seconds.
+    """
+    watcher = (await current_account(request)).mail_watcher
+
+    async def _events():
+        queue = watcher.subscribe()
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield "ping", {}
+                    continue
+                yield "mail", event
+        finally:
+            watcher.unsubscribe(queue)
+
+    return sse_response(_events())
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Request, HTTPException
+from app.models.schemas import JobRequest, JobResponse, JobsResponse
+from app.api.session import current_account
+from app.jobs import JOB_KINDS
+
+router = APIRouter(prefix="/api", tags=["jobs"])
+
+
+@router.post("/jobs", response_model=JobResponse)
+async def start_job(req: JobRequest, request: Request):
+    """Summarize or categorize a folder in the background via the Message Batches API."""
+    account = await current_account(request, "Not connected to email server")
+    if not request.app.state.claude._api_key:
+        raise HTTPException(status_code=400, detail="Anthropic API key not configured")
+    if req.kind not in JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(JOB_KINDS)}")
+
+    try:
+        job = await request.app.state.jobs.start(
+            account.imap_pool, account.message_cache, req.kind, req.folder, req.uids
+        )
+        return JobResponse(**job)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs", response_model=JobsResponse)
+async def list_jobs(request: Request):
+    account = await current_account(request)
+    return JobsResponse(jobs=[JobResponse(**job) for job in request.app.state.jobs.jobs(account.key)])
+
+
+async def _own_job(request: Request, job_id: str) -> dict:
+    """The job, if it belongs to the request's account; 404 otherwise."""
+    account = await current_account(request)
+    job = request.app.state.jobs.get(job_id)
+    if job is None or job["account"] != account.key:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, request: Request):
+    return JobResponse(**await _own_job(request, job_id))
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: str, request: Request):
+    """Cancel a job. Results that finished before the cancel are still stored."""
+    await _own_job(request, job_id)
+    try:
+        job = await request.app.state.jobs.cancel(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job)
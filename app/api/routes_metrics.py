@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Request, HTTPException
+
+from app.api.session import session_token
+from app.imap.headers import cache_stats as header_decode_stats
+
+router = APIRouter(prefix="/api", tags=["metrics"])
+
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    """Process-wide metrics, plus the pools and caches of the request's
+    account if it is open (metrics never reopen an evicted account).
+    Behind a broker, its metrics plus this worker's caches."""
+    state = request.app.state
+    if state.broker is not None:
+        return await _worker_metrics(request)
+    data = {
+        "accounts": state.accounts.stats(),
+        "outbox": state.outbox.stats(),
+        "batch_jobs": state.jobs.stats(),
+        "header_store": state.header_store.stats(),
+        "header_decode": header_decode_stats(),
+        "claude_cache": state.response_cache.stats(),
+        "claude_usage": state.claude.usage(),
+    }
+    account = state.accounts.peek(session_token(request))
+    if account is not None:
+        data.update(
+            imap_pool=account.imap_pool.stats(),
+            smtp_pool=account.smtp_pool.stats(),
+            message_cache=account.message_cache.stats(),
+            search_cache=account.search_cache.stats(),
+            prefetch=account.prefetch.stats(),
+            mail_watcher=account.mail_watcher.stats(),
+        )
+    return data
+
+
+async def _worker_metrics(request: Request) -> dict:
+    state = request.app.state
+    try:
+        data = await state.broker.call("metrics", token=session_token(request))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Broker unavailable: {e}")
+    data.update(
+        broker_rpc=state.broker.stats(),
+        message_cache=state.accounts.message_cache.stats(),
+        search_cache=state.accounts.search_cache.stats(),
+        header_store=state.header_store.stats(),
+        header_decode=header_decode_stats(),
+        claude_cache=state.response_cache.stats(),
+        claude_usage=state.claude.usage(),
+    )
+    return data
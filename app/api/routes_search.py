@@ -1,37 +1,89 @@
 from fastapi import APIRouter, Request, HTTPException
-from app.models.schemas import SearchRequest, SearchResponse, EmailSummary
-from app.ai.search_agent import run_search_agent
+from fastapi.encoders import jsonable_encoder
+from app.models.schemas import SearchRequest, SearchResponse, SearchHit
+from app.ai.query_parser import parse_query
+from app.ai.search_agent import run_search_agent, search_agent_events
+from app.api.session import current_account
+from app.api.sse import sse_response
 
 router = APIRouter(prefix="/api", tags=["search"])
 
 
-@router.post("/search", response_model=SearchResponse)
-def search_emails(req: SearchRequest, request: Request):
-    imap = request.app.state.imap
-    claude = request.app.state.claude
+async def _require_ready(request: Request, query: str):
+    account = await current_account(request, "Not connected to email server")
+    # Queries the parser understands never reach Claude
+    if request.app.state.settings.search_fast_path and parse_query(query) is not None:
+        return account
+    if not request.app.state.claude._api_key:
+        raise HTTPException(status_code=400, detail="Anthropic API key not configured")
+    return account
 
-    if not imap.is_connected:
-        raise HTTPException(status_code=400, detail="Not connected to email server")
 
-    if not claude._api_key:
-        raise HTTPException(status_code=400, detail="Anthropic API key not configured")
+def _agent_args(request: Request, account) -> dict:
+    settings = request.app.state.settings
+    return {
+        "cache": request.app.state.header_cache,
+        "index": request.app.state.message_index,
+        "max_lag": settings.search_index_max_lag,
+        "sync_interval": settings.cache_sync_interval,
+        "fast_path": settings.search_fast_path,
+        "search_cache": account.search_cache,
+    }
 
-    try:
-        result = run_search_agent(req.query, imap, claude)
-        emails = [
-            EmailSummary(
-                uid=e["uid"],
-                subject=e["subject"],
-                sender=e["sender"],
-                date=e["date"],
-                is_read=e.get("is_read", False),
-            )
-            for e in result["emails"]
-        ]
-        return SearchResponse(
-            summary=result["summary"],
-            emails=emails,
-            imap_query=result["imap_query"],
+
+def _search_response(result: dict) -> SearchResponse:
+    emails = [
+        SearchHit(
+            uid=e["uid"],
+            subject=e["subject"],
+            sender=e["sender"],
+            date=e["date"],
+            is_read=e.get("is_read", False),
+            source=e.get("source", "server"),
+            score=e.get("score"),
         )
+        for e in result["emails"]
+    ]
+    return SearchResponse(
+        summary=result["summary"],
+        emails=emails,
+        imap_query=result["imap_query"],
+        source=result["source"],
+        path=result.get("path", "agent"),
+        search_cache=result.get("search_cache"),
+        folder=result["folder"],
+    )
+
+
+@router.post("/search", response_model=SearchResponse)
+async def search_emails(req: SearchRequest, request: Request):
+    account = await _require_ready(request, req.query)
+    pool = account.imap_pool
+    claude = request.app.state.claude
+
+    try:
+        result = await run_search_agent(req.query, pool, claude, req.folder, **_agent_args(request, account))
+        return _search_response(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/search/stream")
+async def search_emails_sse(req: SearchRequest, request: Request):
+    """Agent search as Server-Sent Events.
+
+    Emits "search" and "results" for every IMAP query that runs,
+    "token" for Claude's text as it streams, and "done" with the same
+    body /api/search returns.
+    """
+    account = await _require_ready(request, req.query)
+    pool = account.imap_pool
+    claude = request.app.state.claude
+
+    async def _events():
+        async for event, data in search_agent_events(req.query, pool, claude, req.folder, **_agent_args(request, account)):
+            if event == "done":
+                data = jsonable_encoder(_search_response(data))
+            yield event, data
+
+    return sse_response(_events())
@@ -1,29 +1,55 @@
 from fastapi import APIRouter, Request, HTTPException
-from app.models.schemas import SendRequest, SendResponse
-from app.smtp.client import SMTPClient
+from app.models.schemas import (
+    SendRequest, SendResponse, BulkSendRequest, OutboxMessage, OutboxResponse,
+)
+from app.api.session import current_account
+from app.smtp.client import build_message
 
 router = APIRouter(prefix="/api", tags=["send"])
 
 
-@router.post("/send", response_model=SendResponse)
-def send_email(req: SendRequest, request: Request):
-    settings = request.app.state.settings
+async def _queue(request: Request, reqs: list[SendRequest]) -> list[dict]:
+    account = await current_account(request)
+    settings = account.settings
     if not settings.smtp_host or not settings.smtp_user:
         raise HTTPException(status_code=400, detail="SMTP not configured")
 
     try:
-        smtp = SMTPClient(
-            host=settings.smtp_host,
-            port=settings.smtp_port,
-            user=settings.smtp_user,
-            password=settings.smtp_password,
-        )
-        smtp.send(
-            to=req.to,
-            subject=req.subject,
-            body=req.body,
-            in_reply_to=req.in_reply_to,
-        )
-        return SendResponse(success=True, message="Email sent successfully")
+        messages = [
+            build_message(settings.smtp_user, req.to, req.subject, req.body, req.in_reply_to)
+            for req in reqs
+        ]
+        return request.app.state.outbox.enqueue(account.smtp_account, messages)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to send: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue: {e}")
+
+
+@router.post("/send", response_model=SendResponse)
+async def send_email(req: SendRequest, request: Request):
+    """Queue a message; the outbox sender delivers it in the background."""
+    queued = (await _queue(request, [req]))[0]
+    return SendResponse(success=True, message="Email queued for sending", id=queued["id"])
+
+
+@router.post("/send/bulk", response_model=OutboxResponse)
+async def send_bulk(req: BulkSendRequest, request: Request):
+    """Queue many messages at once; they go out over the pooled sessions."""
+    if not req.messages:
+        raise HTTPException(status_code=400, detail="No messages to send")
+    return OutboxResponse(messages=[OutboxMessage(**m) for m in await _queue(request, req.messages)])
+
+
+@router.get("/outbox", response_model=OutboxResponse)
+async def list_outbox(request: Request):
+    account = await current_account(request)
+    messages = request.app.state.outbox.messages(account.smtp_account)
+    return OutboxResponse(messages=[OutboxMessage(**m) for m in messages])
+
+
+@router.get("/outbox/{message_id}", response_model=OutboxMessage)
+async def get_outbox_message(message_id: str, request: Request):
+    account = await current_account(request)
+    message = request.app.state.outbox.get(message_id)
+    if message is None or message["account"] != account.smtp_account:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return OutboxMessage(**message)
@@ -0,0 +1,27 @@
+from typing import Optional
+
+from fastapi import Request, HTTPException
+
+from app.accounts import Account
+
+SESSION_COOKIE = "session"
+
+
+def session_token(request: Request) -> Optional[str]:
+    """The session token from an "Authorization: Bearer" header or the cookie."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token.strip()
+    return request.cookies.get(SESSION_COOKIE)
+
+
+async def current_account(request: Request, detail: str = "Not connected") -> Account:
+    """The request's account; 400 with `detail` without a session, 503 if
+    an evicted account can't be reopened."""
+    try:
+        account = await request.app.state.accounts.get(session_token(request))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Reconnecting failed: {e}")
+    if account is None:
+        raise HTTPException(status_code=400, detail=detail)
+    return account
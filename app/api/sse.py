@@ -0,0 +1,33 @@
+import json
+import logging
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events: AsyncIterator[tuple[str, dict]]) -> StreamingResponse:
+    """Stream (event, data) pairs as Server-Sent Events.
+
+    Once the response has started the status code can no longer change, so
+    an exception mid-stream is sent as a final "error" event instead.
+    """
+
+    async def _body():
+        try:
+            async for event, data in events:
+                yield sse_event(event, data)
+        except Exception as e:
+            logger.warning("SSE stream failed: %s", e)
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        _body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,26 @@
+"""Run the connection broker for stateless API workers.
+
+    BROKER_SOCKET=data/broker.sock python -m app.broker
+    BROKER_SOCKET=data/broker.sock uvicorn app.main:app --workers 4
+"""
+
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+from app.broker.server import serve
+from app.config import Settings
+
+
+def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    settings = Settings.from_env()
+    if not settings.broker_socket:
+        raise SystemExit("Set BROKER_SOCKET to the socket path the workers will use")
+    asyncio.run(serve(settings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import asyncio
+import dataclasses
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app.broker.rpc import RPCClient
+from app.broker.server import IMAP_METHODS
+from app.config import Settings
+from app.imap.message_cache import MessageCache
+from app.imap.search_cache import SearchCache
+from app.jobs import JobStore
+from app.smtp.outbox import OutboxStore
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteIMAPClient:
+    """Stands in for an AsyncIMAPClient checked out of the broker's pool:
+    each method is one RPC, run by the broker on a pooled connection."""
+
+    def __init__(
+        self,
+        rpc: RPCClient,
+        token: str,
+        account: str,
+        capabilities: frozenset[str],
+        folder: Optional[str],
+        fetch_chunk_size: int = 200,
+    ):
+        self._rpc = rpc
+        self._token = token
+        self._folder = folder
+        self.account = account
+        self.capabilities = capabilities
+        self.fetch_chunk_size = fetch_chunk_size
+
+    def has_capability(self, name: str) -> bool:
+        return name.upper() in self.capabilities
+
+    def __getattr__(self, method: str):
+        if method not in IMAP_METHODS:
+            raise AttributeError(method)
+
+        async def _call(*args, **kwargs):
+            return await self._rpc.call(
+                "imap", token=self._token, command=method, folder=self._folder, args=list(args), kwargs=kwargs
+            )
+
+        return _call
+
+    async def stream_part(self, uid: str, section: str, folder: str = "INBOX") -> AsyncIterator[bytes]:
+        async for data in self._rpc.stream("stream_part", token=self._token, uid=uid, part=section, folder=folder):
+            yield data
+
+
+class BrokerIMAPPool:
+    """The worker's view of an account's AsyncIMAPPool in the broker."""
+
+    is_connected = True
+
+    def __init__(self, rpc: RPCClient, token: str, info: dict):
+        self._rpc = rpc
+        self.token = token
+        self.account = info["key"]
+        self.user = info["settings"]["imap_user"]
+        self.capabilities = frozenset(info["capabilities"])
+        self.fetch_chunk_size = info["settings"]["imap_fetch_chunk_size"]
+
+    @asynccontextmanager
+    async def connection(self, folder: Optional[str] = None) -> AsyncIterator[RemoteIMAPClient]:
+        yield RemoteIMAPClient(
+            self._rpc, self.token, self.account, self.capabilities, folder, self.fetch_chunk_size
+        )
+
+
+class RemoteWatcher:
+    """MailWatcher subscriptions relayed from the broker."""
+
+    def __init__(self, rpc: RPCClient, token: str):
+        self._rpc = rpc
+        self._token = token
+        self._streams: dict[asyncio.Queue, asyncio.Task] = {}
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._streams[queue] = asyncio.create_task(self._relay(queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        task = self._streams.pop(queue, None)
+        if task is not None:
+            task.cancel()
+
+    async def _relay(self, queue: asyncio.Queue) -> None:
+        try:
+            async for event in self._rpc.stream("events", token=self._token):
+                queue.put_nowait(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Mail events from broker stopped: %s", e)
+
+
+class RemoteAccount:
+    """A worker's handle on an account the broker holds open. Parsed
+    messages come from the shared SQLite cache, searches from the
+    worker's own SearchCache (validated with STATUS, like any other)."""
+
+    def __init__(
+        self,
+        rpc: RPCClient,
+        token: str,
+        info: dict,
+        settings: Settings,
+        message_cache: MessageCache,
+        search_cache: SearchCache,
+    ):
+        self.key = info["key"]
+        self.smtp_account = info["smtp_account"]
+        self.settings = dataclasses.replace(settings, **info["settings"])
+        self.imap_pool = BrokerIMAPPool(rpc, token, info)
+        self.message_cache = message_cache
+        self.search_cache = search_cache
+        self.mail_watcher = RemoteWatcher(rpc, token)
+
+
+class BrokerAccounts:
+    """AccountRegistry's interface for a stateless worker: sessions live
+    in the broker, so every request asks it for the session's account
+    (reopening it there if it was evicted)."""
+
+    def __init__(self, settings: Settings, rpc: RPCClient, message_cache: MessageCache, search_cache: SearchCache):
+        self._settings = settings
+        self._rpc = rpc
+        # Shared by every account this worker serves
+        self.message_cache = message_cache
+        self.search_cache = search_cache
+
+    def account_settings(self, **credentials) -> dict:
+        return credentials
+
+    def _account(self, token: str, info: dict) -> RemoteAccount:
+        return RemoteAccount(self._rpc, token, info, self._settings, self.message_cache, self.search_cache)
+
+    async def login(self, credentials: dict) -> tuple[str, RemoteAccount]:
+        info = await self._rpc.call("login", credentials=credentials)
+        return info["token"], self._account(info["token"], info)
+
+    async def logout(self, token: str) -> None:
+        await self._rpc.call("logout", token=token)
+
+    async def get(self, token: Optional[str]) -> Optional[RemoteAccount]:
+        if not token:
+            return None
+        info = await self._rpc.call("session", token=token)
+        return self._account(token, info) if info is not None else None
+
+
+class RemoteJobs:
+    """BatchJobRunner's interface for a worker: jobs run in the broker,
+    reads go straight to the shared JobStore."""
+
+    def __init__(self, store: JobStore, rpc: RPCClient):
+        self._store = store
+        self._rpc = rpc
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._store.get(job_id)
+
+    def jobs(self, account: str) -> list[dict]:
+        return self._store.recent(account)
+
+    async def start(
+        self,
+        pool: BrokerIMAPPool,
+        messages: MessageCache,
+        kind: str,
+        folder: str = "INBOX",
+        uids: Optional[list[str]] = None,
+    ) -> dict:
+        return await self._rpc.call("jobs_start", token=pool.token, kind=kind, folder=folder, uids=uids)
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        return await self._rpc.call("jobs_cancel", job_id=job_id)
+
+
+class RemoteOutbox:
+    """OutboxSender's interface for a worker: messages are queued in the
+    shared OutboxStore and the broker's sender is woken to send them."""
+
+    def __init__(self, store: OutboxStore, rpc: RPCClient):
+        self._store = store
+        self._rpc = rpc
+
+    def enqueue(self, account: str, messages: list) -> list[dict]:
+        ids = self._store.add(account, messages)
+        self._rpc.notify("outbox_wake")
+        return [self._store.get(id_) for id_ in ids]
+
+    def get(self, message_id: str) -> Optional[dict]:
+        return self._store.get(message_id)
+
+    def messages(self, account: str) -> list[dict]:
+        return self._store.recent(account)
+
+    def pending(self, account: str) -> int:
+        return self._store.pending(account)
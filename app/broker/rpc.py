@@ -0,0 +1,298 @@
+import asyncio
+import base64
+import dataclasses
+import inspect
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from app.imap.bodystructure import BodyPart
+from app.imap.parser import ParsedEmail
+from app.imap.protocol import FetchedMessage, FolderStatus, SearchPage
+
+logger = logging.getLogger(__name__)
+
+# Longest line either side accepts; a streamed attachment piece is ~1.4 MB
+MAX_LINE = 64 * 1024 * 1024
+
+# Dataclasses that may cross the wire, by name
+DATACLASSES = {cls.__name__: cls for cls in (BodyPart, FetchedMessage, FolderStatus, ParsedEmail, SearchPage)}
+
+
+class RPCError(Exception):
+    """An error raised by the broker while handling a call."""
+
+
+def encode(value: Any) -> Any:
+    """JSON-ready form of IMAP results: bytes, tuples, dicts with
+    non-string keys and the DATACLASSES are tagged so decode() can
+    rebuild them."""
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, tuple):
+        return {"__tuple__": [encode(v) for v in value]}
+    if isinstance(value, (list, set, frozenset)):
+        return [encode(v) for v in value]
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        name = type(value).__name__
+        if DATACLASSES.get(name) is not type(value):
+            raise TypeError(f"Cannot send {name} over RPC")
+        fields = {f.name: encode(getattr(value, f.name)) for f in dataclasses.fields(value)}
+        return {"__dataclass__": name, "fields": fields}
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith("__") for k in value):
+            return {k: encode(v) for k, v in value.items()}
+        return {"__items__": [[encode(k), encode(v)] for k, v in value.items()]}
+    return value
+
+
+def decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    if "__tuple__" in value:
+        return tuple(decode(v) for v in value["__tuple__"])
+    if "__items__" in value:
+        return {decode(k): decode(v) for k, v in value["__items__"]}
+    if "__dataclass__" in value:
+        cls = DATACLASSES[value["__dataclass__"]]
+        return cls(**{k: decode(v) for k, v in value["fields"].items()})
+    return {k: decode(v) for k, v in value.items()}
+
+
+def _line(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+class RPCServer:
+    """JSON-lines RPC over a Unix socket.
+
+    Each line from a client is a call, {"id", "method", "params"}, run as
+    its own task so one connection carries many calls at once. Replies are
+    {"id", "result"} or {"id", "error"}. Handlers that are async
+    generators stream instead: one {"id", "item"} per value, then
+    {"id", "end": true}; the client stops a stream with {"id", "cancel": true}.
+    """
+
+    def __init__(self, path: str, handlers: dict[str, Callable[..., Any]]):
+        self._path = path
+        self._handlers = handlers
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._connections = 0
+        self._calls = 0
+        self._errors = 0
+
+    async def start(self) -> None:
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        self._server = await asyncio.start_unix_server(self._serve, self._path, limit=MAX_LINE)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Closing the connections ends their _serve() loops
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections += 1
+        self._writers.add(writer)
+        tasks: dict[int, asyncio.Task] = {}
+        drain_lock = asyncio.Lock()
+
+        async def _send(message: dict) -> None:
+            writer.write(_line(message))
+            async with drain_lock:
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                if request.get("cancel"):
+                    task = tasks.get(request["id"])
+                    if task is not None:
+                        task.cancel()
+                    continue
+                task = asyncio.create_task(self._call(request, _send))
+                tasks[request["id"]] = task
+                task.add_done_callback(lambda _, id_=request["id"]: tasks.pop(id_, None))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning("Broker client connection failed: %s", e)
+        finally:
+            self._connections -= 1
+            self._writers.discard(writer)
+            for task in list(tasks.values()):
+                task.cancel()
+            writer.close()
+
+    async def _call(self, request: dict, send: Callable[[dict], Awaitable[None]]) -> None:
+        id_ = request["id"]
+        self._calls += 1
+        try:
+            handler = self._handlers.get(request["method"])
+            if handler is None:
+                raise RPCError(f"Unknown method: {request['method']}")
+            params = decode(request.get("params", {}))
+            if inspect.isasyncgenfunction(handler):
+                async for item in handler(**params):
+                    await send({"id": id_, "item": encode(item)})
+                await send({"id": id_, "end": True})
+            else:
+                await send({"id": id_, "result": encode(await handler(**params))})
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self._errors += 1
+            try:
+                await send({"id": id_, "error": str(e) or type(e).__name__})
+            except ConnectionError:
+                pass
+
+    def stats(self) -> dict:
+        return {"connections": self._connections, "calls": self._calls, "errors": self._errors}
+
+
+class RPCClient:
+    """One multiplexed connection to an RPCServer, opened on first use and
+    reopened after it drops. Calls in flight when it drops fail with
+    ConnectionError."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._ids = itertools.count(1)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._drain_lock = asyncio.Lock()
+        self._pending: dict[int, asyncio.Queue] = {}
+        self._notify_tasks: set[asyncio.Task] = set()
+        self._connects = 0
+        self._calls = 0
+        self._errors = 0
+        self._timed = 0
+        self._call_time_total = 0.0
+
+    async def _connection(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                reader, self._writer = await asyncio.open_unix_connection(self._path, limit=MAX_LINE)
+                self._read_task = asyncio.create_task(self._read_loop(reader, self._writer))
+                self._connects += 1
+            return self._writer
+
+    async def close(self) -> None:
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending(ConnectionError("Broker connection closed"))
+
+    def _fail_pending(self, error: Exception) -> None:
+        pending, self._pending = self._pending, {}
+        for queue in pending.values():
+            queue.put_nowait({"exception": error})
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                queue = self._pending.get(message["id"])
+                if queue is not None:
+                    queue.put_nowait(message)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning("Broker connection failed: %s", e)
+        finally:
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+                self._fail_pending(ConnectionError("Broker connection lost"))
+
+    async def _send(self, message: dict) -> None:
+        writer = await self._connection()
+        writer.write(_line(message))
+        async with self._drain_lock:
+            await writer.drain()
+
+    @staticmethod
+    def _check(message: dict) -> None:
+        if "exception" in message:
+            raise message["exception"]
+        if "error" in message:
+            raise RPCError(message["error"])
+
+    async def call(self, method: str, **params) -> Any:
+        id_ = next(self._ids)
+        queue = self._pending[id_] = asyncio.Queue()
+        start = time.monotonic()
+        self._calls += 1
+        try:
+            await self._send({"id": id_, "method": method, "params": encode(params)})
+            message = await queue.get()
+            self._check(message)
+            return decode(message.get("result"))
+        except Exception:
+            self._errors += 1
+            raise
+        finally:
+            self._pending.pop(id_, None)
+            self._timed += 1
+            self._call_time_total += time.monotonic() - start
+
+    async def stream(self, method: str, **params) -> AsyncIterator[Any]:
+        id_ = next(self._ids)
+        queue = self._pending[id_] = asyncio.Queue()
+        self._calls += 1
+        done = False
+        try:
+            await self._send({"id": id_, "method": method, "params": encode(params)})
+            while True:
+                message = await queue.get()
+                self._check(message)
+                if message.get("end"):
+                    done = True
+                    return
+                yield decode(message["item"])
+        finally:
+            self._pending.pop(id_, None)
+            if not done and self._writer is not None and not self._writer.is_closing():
+                self._writer.write(_line({"id": id_, "cancel": True}))
+
+    def notify(self, method: str, **params) -> None:
+        """Call without waiting for (or caring about) the answer."""
+        task = asyncio.ensure_future(self.call(method, **params))
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_done)
+
+    def _notify_done(self, task: asyncio.Task) -> None:
+        self._notify_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Broker notification failed: %s", task.exception())
+
+    def stats(self) -> dict:
+        return {
+            "connects": self._connects,
+            "calls": self._calls,
+            "errors": self._errors,
+            "in_flight": len(self._pending),
+            "call_time_avg": self._call_time_total / self._timed if self._timed else 0.0,
+        }
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import signal
+from typing import AsyncIterator, Optional
+
+from app.accounts import Account, AccountRegistry
+from app.ai.claude import ClaudeClient
+from app.ai.response_cache import ResponseCache
+from app.broker.rpc import RPCServer
+from app.config import Settings
+from app.imap.aio import AsyncIMAPClient
+from app.imap.cache import HeaderCache
+from app.imap.message_cache import SharedMessageCache
+from app.jobs import JobStore, BatchJobRunner
+from app.prefetch import ActivityTracker
+from app.smtp.outbox import OutboxStore, OutboxSender
+
+logger = logging.getLogger(__name__)
+
+# AsyncIMAPClient methods workers may call; everything they return is
+# encodable by app.broker.rpc
+IMAP_METHODS = frozenset({
+    "list_folders", "search", "thread_references", "search_page", "fetch_headers",
+    "folder_status", "fetch_header_range", "fetch_flag_changes", "fetch_raw",
+    "fetch_structure", "fetch_sections", "fetch_message", "fetch_items", "fetch_partial",
+})
+CREDENTIAL_FIELDS = (
+    "imap_host", "imap_port", "imap_user", "imap_password",
+    "smtp_host", "smtp_port", "smtp_user", "smtp_password",
+)
+
+
+def account_info(account: Account) -> dict:
+    """What a worker needs to serve a request for `account` (no passwords)."""
+    settings = account.settings
+    return {
+        "key": account.key,
+        "smtp_account": account.smtp_account,
+        "capabilities": sorted(account.imap_pool.capabilities),
+        "settings": {
+            "imap_host": settings.imap_host,
+            "imap_port": settings.imap_port,
+            "imap_user": settings.imap_user,
+            "imap_fetch_chunk_size": settings.imap_fetch_chunk_size,
+            "smtp_host": settings.smtp_host,
+            "smtp_port": settings.smtp_port,
+            "smtp_user": settings.smtp_user,
+        },
+    }
+
+
+class Broker:
+    """Owns everything stateful so API workers don't have to: the account
+    registry with its IMAP and SMTP pools, mail watchers and prefetch, the
+    outbox sender and batch job polling. Workers reach it through the
+    RPC methods below; calls that use IMAP count as user activity, so
+    prefetch still backs off while workers serve requests.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        registry: AccountRegistry,
+        jobs: BatchJobRunner,
+        outbox: OutboxSender,
+        activity: ActivityTracker,
+    ):
+        self._settings = settings
+        self._registry = registry
+        self._jobs = jobs
+        self._outbox = outbox
+        self._activity = activity
+        self._server = RPCServer(settings.broker_socket, {
+            "login": self.login,
+            "logout": self.logout,
+            "session": self.session,
+            "imap": self.imap,
+            "stream_part": self.stream_part,
+            "events": self.events,
+            "jobs_start": self.jobs_start,
+            "jobs_cancel": self.jobs_cancel,
+            "outbox_wake": self.outbox_wake,
+            "metrics": self.metrics,
+        })
+
+    async def start(self) -> None:
+        if self._settings.anthropic_api_key:
+            self._jobs.resume()
+        self._outbox.start()
+        self._registry.start()
+        await self._server.start()
+        logger.info("Broker listening on %s", self._settings.broker_socket)
+
+    async def stop(self) -> None:
+        await self._server.stop()
+        await self._outbox.stop()
+        await self._jobs.stop()
+        await self._registry.stop()
+
+    async def _account(self, token: str) -> Account:
+        account = await self._registry.get(token)
+        if account is None:
+            raise LookupError("Unknown session")
+        return account
+
+    async def login(self, credentials: dict) -> dict:
+        unknown = set(credentials) - set(CREDENTIAL_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        token, account = await self._registry.login(self._registry.account_settings(**credentials))
+        return {"token": token, **account_info(account)}
+
+    async def logout(self, token: str) -> None:
+        await self._registry.logout(token)
+
+    async def session(self, token: str) -> Optional[dict]:
+        account = await self._registry.get(token)
+        return account_info(account) if account is not None else None
+
+    async def imap(self, token: str, command: str, folder: Optional[str], args: list, kwargs: dict):
+        """Run one AsyncIMAPClient method on a pooled connection."""
+        if command not in IMAP_METHODS:
+            raise ValueError(f"Method not allowed: {command}")
+        account = await self._account(token)
+        self._activity.begin()
+        try:
+            async with account.imap_pool.connection(folder) as imap:
+                return await getattr(imap, command)(*args, **kwargs)
+        finally:
+            self._activity.end()
+
+    async def stream_part(self, token: str, uid: str, part: str, folder: str) -> AsyncIterator[bytes]:
+        account = await self._account(token)
+        self._activity.begin()
+        try:
+            async with account.imap_pool.connection(folder) as imap:
+                async for data in imap.stream_part(uid, part, folder=folder):
+                    yield data
+        finally:
+            self._activity.end()
+
+    async def events(self, token: str) -> AsyncIterator[dict]:
+        """The account's MailWatcher events until the worker cancels."""
+        watcher = (await self._account(token)).mail_watcher
+        queue = watcher.subscribe()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            watcher.unsubscribe(queue)
+
+    async def jobs_start(self, token: str, kind: str, folder: str, uids: Optional[list[str]]) -> dict:
+        account = await self._account(token)
+        return await self._jobs.start(account.imap_pool, account.message_cache, kind, folder, uids)
+
+    async def jobs_cancel(self, job_id: str) -> Optional[dict]:
+        return await self._jobs.cancel(job_id)
+
+    async def outbox_wake(self) -> None:
+        self._outbox.wake()
+
+    async def metrics(self, token: Optional[str] = None) -> dict:
+        data = {
+            "accounts": self._registry.stats(),
+            "outbox": self._outbox.stats(),
+            "batch_jobs": self._jobs.stats(),
+            "broker": self._server.stats(),
+        }
+        account = self._registry.peek(token)
+        if account is not None:
+            data.update(
+                imap_pool=account.imap_pool.stats(),
+                smtp_pool=account.smtp_pool.stats(),
+                prefetch=account.prefetch.stats(),
+                mail_watcher=account.mail_watcher.stats(),
+            )
+        return data
+
+
+async def serve(settings: Settings, client_class: type[AsyncIMAPClient] = AsyncIMAPClient) -> None:
+    """Run a broker on `settings.broker_socket` until SIGINT or SIGTERM."""
+    header_cache = HeaderCache(settings.cache_path)
+    response_cache = ResponseCache(
+        settings.cache_path,
+        max_entries=settings.claude_cache_max_entries,
+        ttl=settings.claude_cache_ttl,
+        disabled=settings.claude_cache_disabled,
+    )
+    claude = ClaudeClient(settings, cache=response_cache)
+    messages = SharedMessageCache(settings.cache_path, max_entries=settings.message_cache_size)
+    activity = ActivityTracker(quiet_period=settings.prefetch_quiet_period)
+    job_store = JobStore(settings.cache_path)
+    jobs = BatchJobRunner(header_cache, claude, job_store, settings)
+    outbox_store = OutboxStore(settings.cache_path)
+    outbox = OutboxSender(outbox_store, settings)
+    registry = AccountRegistry(
+        settings, header_cache, claude, activity, jobs, outbox,
+        message_cache=messages, client_class=client_class,
+    )
+    broker = Broker(settings, registry, jobs, outbox, activity)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await broker.start()
+    try:
+        await stopping.wait()
+    finally:
+        await broker.stop()
+        outbox_store.close()
+        job_store.close()
+        messages.close()
+        response_cache.close()
+        header_cache.close()
@@ -8,15 +8,60 @@ class Settings:
     imap_port: int = 993
     imap_user: str = ""
     imap_password: str = ""
+    imap_fetch_chunk_size: int = 200
+    imap_pool_size: int = 4
+    imap_max_inflight: int = 8
+    imap_checkout_timeout: float = 30.0
+    imap_max_connections: int = 32
+    accounts_memory_mb: int = 256
+    account_idle_timeout: float = 1800.0
+    broker_socket: str = ""
 
     smtp_host: str = ""
     smtp_port: int = 587
     smtp_user: str = ""
     smtp_password: str = ""
+    smtp_pool_size: int = 2
+    smtp_idle_timeout: float = 240.0
+    outbox_batch_size: int = 20
+    outbox_max_attempts: int = 8
+    outbox_retry_base: float = 30.0
+    outbox_retry_max: float = 3600.0
 
     anthropic_api_key: str = ""
     claude_model: str = "claude-sonnet-4-20250514"
 
+    cache_path: str = "data/cache.db"
+    cache_sync_interval: float = 10.0
+    search_index_max_lag: int = 500
+    search_fast_path: bool = True
+    message_cache_size: int = 128
+    search_cache_size: int = 256
+    header_store_folders: int = 16
+
+    claude_cache_max_entries: int = 5000
+    claude_cache_ttl: float = 7 * 24 * 3600
+    claude_cache_disabled: tuple[str, ...] = ()
+    claude_prompt_cache: bool = True
+    categorize_concurrency: int = 4
+    categorize_chunk_tokens: int = 2000
+    batch_poll_interval: float = 60.0
+    batch_max_messages: int = 1000
+
+    prefetch_enabled: bool = True
+    prefetch_folders: tuple[str, ...] = ("INBOX",)
+    prefetch_count: int = 20
+    prefetch_interval: float = 60.0
+    prefetch_concurrency: int = 2
+    prefetch_ai: bool = False
+    prefetch_token_budget: int = 50000
+    prefetch_quiet_period: float = 2.0
+
+    idle_enabled: bool = True
+    idle_folders: tuple[str, ...] = ("INBOX",)
+    idle_timeout: float = 25 * 60
+    idle_poll_interval: float = 30.0
+
     @classmethod
     def from_env(cls) -> "Settings":
         return cls(
@@ -24,10 +69,67 @@ class Settings:
             imap_port=int(os.environ.get("IMAP_PORT", "993")),
             imap_user=os.environ.get("IMAP_USER", ""),
             imap_password=os.environ.get("IMAP_PASSWORD", ""),
+            imap_fetch_chunk_size=int(os.environ.get("IMAP_FETCH_CHUNK_SIZE", "200")),
+            imap_pool_size=int(os.environ.get("IMAP_POOL_SIZE", "4")),
+            imap_max_inflight=int(os.environ.get("IMAP_MAX_INFLIGHT", "8")),
+            imap_checkout_timeout=float(os.environ.get("IMAP_CHECKOUT_TIMEOUT", "30")),
+            imap_max_connections=int(os.environ.get("IMAP_MAX_CONNECTIONS", "32")),
+            accounts_memory_mb=int(os.environ.get("ACCOUNTS_MEMORY_MB", "256")),
+            account_idle_timeout=float(os.environ.get("ACCOUNT_IDLE_TIMEOUT", "1800")),
+            broker_socket=os.environ.get("BROKER_SOCKET", ""),
             smtp_host=os.environ.get("SMTP_HOST", ""),
             smtp_port=int(os.environ.get("SMTP_PORT", "587")),
             smtp_user=os.environ.get("SMTP_USER", ""),
             smtp_password=os.environ.get("SMTP_PASSWORD", ""),
+            smtp_pool_size=int(os.environ.get("SMTP_POOL_SIZE", "2")),
+            smtp_idle_timeout=float(os.environ.get("SMTP_IDLE_TIMEOUT", "240")),
+            outbox_batch_size=int(os.environ.get("OUTBOX_BATCH_SIZE", "20")),
+            outbox_max_attempts=int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8")),
+            outbox_retry_base=float(os.environ.get("OUTBOX_RETRY_BASE", "30")),
+            outbox_retry_max=float(os.environ.get("OUTBOX_RETRY_MAX", "3600")),
             anthropic_api_key=os.environ.get("ANTHROPIC_API_KEY", ""),
             claude_model=os.environ.get("CLAUDE_MODEL", "claude-sonnet-4-20250514"),
+            cache_path=os.environ.get("CACHE_PATH", "data/cache.db"),
+            cache_sync_interval=float(os.environ.get("CACHE_SYNC_INTERVAL", "10")),
+            search_index_max_lag=int(os.environ.get("SEARCH_INDEX_MAX_LAG", "500")),
+            search_fast_path=_flag(os.environ.get("SEARCH_FAST_PATH", "true")),
+            message_cache_size=int(os.environ.get("MESSAGE_CACHE_SIZE", "128")),
+            search_cache_size=int(os.environ.get("SEARCH_CACHE_SIZE", "256")),
+            header_store_folders=int(os.environ.get("HEADER_STORE_FOLDERS", "16")),
+            claude_cache_max_entries=int(os.environ.get("CLAUDE_CACHE_MAX_ENTRIES", "5000")),
+            claude_cache_ttl=float(os.environ.get("CLAUDE_CACHE_TTL", str(7 * 24 * 3600))),
+            claude_cache_disabled=tuple(
+                name.strip()
+                for name in os.environ.get("CLAUDE_CACHE_DISABLED", "").split(",")
+                if name.strip()
+            ),
+            claude_prompt_cache=_flag(os.environ.get("CLAUDE_PROMPT_CACHE", "true")),
+            categorize_concurrency=int(os.environ.get("CATEGORIZE_CONCURRENCY", "4")),
+            categorize_chunk_tokens=int(os.environ.get("CATEGORIZE_CHUNK_TOKENS", "2000")),
+            batch_poll_interval=float(os.environ.get("BATCH_POLL_INTERVAL", "60")),
+            batch_max_messages=int(os.environ.get("BATCH_MAX_MESSAGES", "1000")),
+            prefetch_enabled=_flag(os.environ.get("PREFETCH_ENABLED", "true")),
+            prefetch_folders=tuple(
+                name.strip()
+                for name in os.environ.get("PREFETCH_FOLDERS", "INBOX").split(",")
+                if name.strip()
+            ),
+            prefetch_count=int(os.environ.get("PREFETCH_COUNT", "20")),
+            prefetch_interval=float(os.environ.get("PREFETCH_INTERVAL", "60")),
+            prefetch_concurrency=int(os.environ.get("PREFETCH_CONCURRENCY", "2")),
+            prefetch_ai=_flag(os.environ.get("PREFETCH_AI", "false")),
+            prefetch_token_budget=int(os.environ.get("PREFETCH_TOKEN_BUDGET", "50000")),
+            prefetch_quiet_period=float(os.environ.get("PREFETCH_QUIET_PERIOD", "2")),
+            idle_enabled=_flag(os.environ.get("IDLE_ENABLED", "true")),
+            idle_folders=tuple(
+                name.strip()
+                for name in os.environ.get("IDLE_FOLDERS", "INBOX").split(",")
+                if name.strip()
+            ),
+            idle_timeout=float(os.environ.get("IDLE_TIMEOUT", str(25 * 60))),
+            idle_poll_interval=float(os.environ.get("IDLE_POLL_INTERVAL", "30")),
         )
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,1057 @@
+import asyncio
+import itertools
+import logging
+import re
+import ssl
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, asdict
+from typing import AsyncIterator, Optional
+
+from app.imap.bodystructure import BodyPart, parse_bodystructure, select_parts
+from app.imap.parser import ParsedEmail, parse_structured_email
+from app.imap.pool import PoolStats, PoolTimeout
+from app.imap.protocol import (
+    HEADER_ITEMS,
+    HEADER_ITEMS_MODSEQ,
+    STRUCTURE_ITEMS,
+    MESSAGE_ITEMS,
+    STREAM_CHUNK_SIZE,
+    IDLE_TIMEOUT,
+    FetchedMessage,
+    FolderStatus,
+    SearchPage,
+    uid_set_chunks,
+    quote_mailbox,
+    quote_string,
+    parse_header_fetch,
+    parse_flag_fetch,
+    parse_message_fetch,
+    parse_status,
+    parse_list,
+    parse_vanished,
+    parse_esearch,
+    parse_thread,
+    parse_fetch_items,
+)
+
+logger = logging.getLogger(__name__)
+
+_LITERAL_RE = re.compile(rb"\{(\d+)\}$")
+_UNTAGGED_STATUS_RE = re.compile(rb"^\* (\d+) ([A-Z-]+)(?: (.*))?$")
+_UNTAGGED_RE = re.compile(rb"^\* ([A-Z-]+)(?: (.*))?$")
+_RESP_CODE_RE = re.compile(rb"^\[([A-Z-]+)(?: ([^\]]*))?\]")
+
+# Longest response line the reader accepts. A plain SEARCH answers on one
+# line, about 7 bytes per UID, well past asyncio's 64 KiB default
+MAX_LINE_LENGTH = 16 * 2 ** 20
+
+
+class IMAPError(Exception):
+    """The server answered a command with NO or BAD."""
+
+
+class IMAPAbort(IMAPError):
+    """The connection is gone; the command may or may not have run."""
+
+
+@dataclass
+class _Pending:
+    name: str
+    future: asyncio.Future
+    untagged: dict[str, list] = field(default_factory=dict)
+    # Set on a "+" continuation, and on each untagged response (IDLE)
+    continuation: Optional[asyncio.Future] = None
+    wakeup: Optional[asyncio.Event] = None
+
+
+class AsyncIMAPClient:
+    """asyncio counterpart of IMAPClient with command tagging and pipelining.
+
+    Commands are written as soon as they are issued and matched to their
+    tagged completion by tag, so several can be in flight on one connection.
+    Untagged responses are attributed to the oldest command still in flight,
+    which matches how servers answer pipelined commands in practice.
+
+    Folder-scoped commands pass through a gate: any number of commands for
+    the selected folder may run together, while a command for a different
+    folder waits for them to drain before issuing SELECT.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        fetch_chunk_size: int = 200,
+    ):
+        self._host = host
+        self._port = port
+        self._user = user
+        self._password = password
+        self._fetch_chunk_size = fetch_chunk_size
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._tags = itertools.count(1)
+        self._pending: dict[str, _Pending] = {}
+        self._drain_lock = asyncio.Lock()
+        self._connect_lock = asyncio.Lock()
+        self._folder_cond = asyncio.Condition()
+        self._folder_users = 0
+        self._generation = 0
+        self._selected_folder: Optional[str] = None
+        self._last_activity: float = 0
+        self._capabilities: set[str] = set()
+        # Untagged responses that arrived with no command in flight (e.g. EXISTS)
+        self.unsolicited: list[tuple[str, bytes]] = []
+
+    async def _open_connection(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_connection(
+            self._host, self._port, ssl=ssl.create_default_context(), limit=MAX_LINE_LENGTH
+        )
+
+    async def connect(self) -> None:
+        """Establish a fresh IMAP connection and login."""
+        await self._close_quiet()
+        self._reader, self._writer = await self._open_connection()
+        greeting = await self._reader.readline()
+        if not greeting.startswith(b"* OK"):
+            raise IMAPAbort(f"Unexpected greeting: {greeting!r}")
+        self._generation += 1
+        self._read_task = asyncio.create_task(self._read_loop())
+        await self._command("LOGIN", quote_string(self._user), quote_string(self._password))
+        self._selected_folder = None
+        await self._load_capabilities()
+        self._last_activity = time.time()
+        logger.info("IMAP (async) connected to %s as %s", self._host, self._user)
+
+    async def disconnect(self) -> None:
+        await self._close_quiet()
+
+    async def _close_quiet(self) -> None:
+        if self._writer is None:
+            return
+        writer, self._writer = self._writer, None
+        try:
+            if not writer.is_closing():
+                writer.write(f"A{next(self._tags)} LOGOUT\r\n".encode())
+            writer.close()
+            await asyncio.wait_for(writer.wait_closed(), timeout=2)
+        except Exception:
+            pass
+        if self._read_task:
+            self._read_task.cancel()
+            self._read_task = None
+        self._fail_pending(IMAPAbort("Connection closed"))
+        self._selected_folder = None
+
+    def reconfigure(self, host: str, port: int, user: str, password: str) -> None:
+        self._host = host
+        self._port = port
+        self._user = user
+        self._password = password
+
+    async def _load_capabilities(self) -> None:
+        _, untagged = await self._command("CAPABILITY")
+        caps = b" ".join(untagged.get("CAPABILITY", [])).decode().upper().split()
+        self._capabilities = set(caps)
+        for extension in ("QRESYNC", "CONDSTORE"):
+            if extension in self._capabilities and "ENABLE" in self._capabilities:
+                try:
+                    await self._command("ENABLE", extension)
+                except IMAPError as e:
+                    logger.warning("ENABLE %s failed: %s", extension, e)
+                    self._capabilities.discard(extension)
+                    continue
+                break
+
+    def has_capability(self, name: str) -> bool:
+        return name.upper() in self._capabilities
+
+    @property
+    def capabilities(self) -> frozenset[str]:
+        return frozenset(self._capabilities)
+
+    @property
+    def fetch_chunk_size(self) -> int:
+        return self._fetch_chunk_size
+
+    @property
+    def account(self) -> str:
+        return f"{self._user}@{self._host}"
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def is_connected(self) -> bool:
+        return (
+            self._writer is not None
+            and not self._writer.is_closing()
+            and self._read_task is not None
+            and not self._read_task.done()
+        )
+
+    async def check_health(self) -> None:
+        """Reconnect if the socket is gone or stale, mirroring IMAPClient.is_connected.
+
+        Trusts a connection used in the last 5 minutes, NOOPs one idle longer
+        than that, and reconnects after 8 minutes of silence.
+        """
+        if not self.is_connected:
+            await self.connect()
+            return
+        idle = time.time() - self._last_activity
+        if idle > 480:
+            logger.info("Connection stale (>8 min idle), reconnecting...")
+            await self.connect()
+        elif idle > 300:
+            try:
+                await self._command("NOOP")
+            except IMAPError:
+                await self.connect()
+
+    # -- wire protocol ---------------------------------------------------
+
+    async def _read_response(self) -> list:
+        """Read one response line plus any literals, in imaplib's item shape."""
+        line = await self._reader.readline()
+        if not line:
+            raise IMAPAbort("Connection closed by server")
+        line = line.rstrip(b"\r\n")
+        items = []
+        while True:
+            match = _LITERAL_RE.search(line)
+            if not match:
+                items.append(line)
+                return items
+            literal = await self._reader.readexactly(int(match.group(1)))
+            items.append((line, literal))
+            line = (await self._reader.readline()).rstrip(b"\r\n")
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                items = await self._read_response()
+                first = items[0][0] if isinstance(items[0], tuple) else items[0]
+                if first.startswith(b"* "):
+                    self._dispatch_untagged(first, items)
+                elif first.startswith(b"+"):
+                    for pending in self._pending.values():
+                        if pending.continuation is not None and not pending.continuation.done():
+                            pending.continuation.set_result(first)
+                            break
+                else:
+                    tag, _, rest = first.partition(b" ")
+                    status, _, text = rest.partition(b" ")
+                    pending = self._pending.pop(tag.decode(), None)
+                    if pending and not pending.future.done():
+                        pending.future.set_result((status.decode(), text, pending.untagged))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail_pending(e if isinstance(e, IMAPAbort) else IMAPAbort(str(e)))
+
+    def _dispatch_untagged(self, first: bytes, items: list) -> None:
+        match = _UNTAGGED_STATUS_RE.match(first)
+        if match:
+            typ = match.group(2).decode()
+            head = match.group(1) + (b" " + match.group(3) if match.group(3) else b"")
+        else:
+            match = _UNTAGGED_RE.match(first)
+            if not match:
+                return
+            typ = match.group(1).decode()
+            head = match.group(2) or b""
+        # Fold bracketed response codes like "OK [UIDVALIDITY 5]" under their own name
+        if typ in ("OK", "NO", "BAD"):
+            code = _RESP_CODE_RE.match(head)
+            if code:
+                typ, head = code.group(1).decode(), code.group(2) or b""
+        if isinstance(items[0], tuple):
+            data = [(head, items[0][1])] + items[1:]
+        else:
+            data = [head]
+        target = next(iter(self._pending.values()), None)
+        if target is None:
+            self.unsolicited.extend((typ, d) for d in data if isinstance(d, bytes))
+            return
+        target.untagged.setdefault(typ, []).extend(data)
+        if target.wakeup is not None:
+            target.wakeup.set()
+
+    def _fail_pending(self, error: Exception) -> None:
+        pending, self._pending = self._pending, {}
+        for p in pending.values():
+            if not p.future.done():
+                p.future.set_exception(error)
+
+    async def _command(self, name: str, *args: str) -> tuple[bytes, dict[str, list]]:
+        """Send a tagged command and wait for its completion.
+
+        Returns (completion text, untagged responses by type). Raises
+        IMAPError on NO/BAD and IMAPAbort if the connection drops.
+        """
+        if not self.is_connected:
+            raise IMAPAbort("Not connected")
+        tag = f"A{next(self._tags)}"
+        future = asyncio.get_running_loop().create_future()
+        # Registering and writing without an await in between keeps tag order
+        # identical to wire order, which untagged attribution relies on.
+        self._pending[tag] = _Pending(name, future)
+        self._writer.write(" ".join((tag, name) + args).encode() + b"\r\n")
+        async with self._drain_lock:
+            await self._writer.drain()
+        status, text, untagged = await future
+        self._last_activity = time.time()
+        if status != "OK":
+            raise IMAPError(f"{name} failed: {status} {text.decode(errors='replace')}")
+        return text, untagged
+
+    async def _retry(self, operation):
+        """Run an operation with one automatic reconnect-and-retry on connection loss."""
+        generation = self._generation
+        try:
+            return await operation()
+        except (IMAPAbort, OSError, asyncio.IncompleteReadError) as e:
+            logger.warning("IMAP operation failed (%s), reconnecting...", e)
+            async with self._connect_lock:
+                # Only the first of several concurrent failures reconnects
+                if self._generation == generation:
+                    await self.connect()
+            return await operation()
+
+    @asynccontextmanager
+    async def _in_folder(self, folder: str) -> AsyncIterator[None]:
+        async with self._folder_cond:
+            while self._selected_folder != folder and self._folder_users:
+                await self._folder_cond.wait()
+            if self._selected_folder != folder:
+                # A failed SELECT leaves no mailbox selected (RFC 3501 6.3.1)
+                self._selected_folder = None
+                await self._command("SELECT", quote_mailbox(folder))
+                self._selected_folder = folder
+            self._folder_users += 1
+        try:
+            yield
+        finally:
+            async with self._folder_cond:
+                self._folder_users -= 1
+                self._folder_cond.notify_all()
+
+    async def idle(self, folder: str, timeout: float = IDLE_TIMEOUT) -> dict[str, list]:
+        """Select `folder` and IDLE until the server reports a change or
+        `timeout` seconds pass, then end the IDLE with DONE.
+
+        Returns the untagged responses received (EXISTS, EXPUNGE, FETCH,
+        VANISHED, ...) by type, including any that arrived unsolicited
+        since the last command. Keep `timeout` under the 29 minutes after
+        which servers may drop an idling client (RFC 2177).
+        """
+        if not self.has_capability("IDLE"):
+            raise IMAPError("Server does not support IDLE")
+        async with self._in_folder(folder):
+            loop = asyncio.get_running_loop()
+            tag = f"A{next(self._tags)}"
+            pending = _Pending(
+                "IDLE", loop.create_future(),
+                continuation=loop.create_future(), wakeup=asyncio.Event(),
+            )
+            # If we are cancelled mid-IDLE nobody awaits the completion; don't
+            # let a later connection failure be logged as unretrieved
+            pending.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            for typ, data in self.unsolicited:
+                pending.untagged.setdefault(typ, []).append(data)
+                pending.wakeup.set()
+            self.unsolicited = []
+            self._pending[tag] = pending
+            self._writer.write(f"{tag} IDLE\r\n".encode())
+            async with self._drain_lock:
+                await self._writer.drain()
+            await asyncio.wait(
+                (pending.continuation, pending.future), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not pending.future.done():
+                try:
+                    await asyncio.wait_for(pending.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    if self.is_connected:
+                        self._writer.write(b"DONE\r\n")
+                        async with self._drain_lock:
+                            await self._writer.drain()
+            status, text, untagged = await pending.future
+        self._last_activity = time.time()
+        if status != "OK":
+            raise IMAPError(f"IDLE failed: {status} {text.decode(errors='replace')}")
+        return untagged
+
+    async def fetch_seq_flags(self, seqs: list[int], folder: str = "INBOX") -> list[dict]:
+        """UID and FLAGS for message sequence numbers, e.g. from a UID-less
+        unsolicited FETCH. Only meaningful while the folder stays selected."""
+        if not seqs:
+            return []
+        async with self._in_folder(folder):
+            _, untagged = await self._command(
+                "FETCH", ",".join(str(n) for n in sorted(set(seqs))), "(UID FLAGS)"
+            )
+        return parse_flag_fetch(untagged.get("FETCH", []))
+
+    async def noop(self, folder: str) -> dict[str, list]:
+        """NOOP in `folder`: the polling fallback for servers without IDLE.
+
+        Returns the untagged responses it collected, like idle().
+        """
+        async with self._in_folder(folder):
+            _, untagged = await self._command("NOOP")
+        for typ, data in self.unsolicited:
+            untagged.setdefault(typ, []).append(data)
+        self.unsolicited = []
+        return untagged
+
+    # -- IMAPClient surface ----------------------------------------------
+
+    async def list_folders(self) -> list[str]:
+        async def _do():
+            _, untagged = await self._command("LIST", '""', '"*"')
+            return parse_list(untagged.get("LIST", []))
+
+        return await self._retry(_do)
+
+    async def select_folder(self, folder: str = "INBOX") -> int:
+        async def _do():
+            async with self._folder_cond:
+                while self._selected_folder != folder and self._folder_users:
+                    await self._folder_cond.wait()
+                self._selected_folder = None
+                _, untagged = await self._command("SELECT", quote_mailbox(folder))
+                self._selected_folder = folder
+            exists = untagged.get("EXISTS", [b"0"])
+            return int(exists[-1])
+
+        return await self._retry(_do)
+
+    async def search(self, criteria: str, folder: str = "INBOX") -> list[bytes]:
+        """UID SEARCH; with ESEARCH the result comes back as a compressed UID set."""
+        esearch = self.has_capability("ESEARCH")
+
+        async def _do():
+            async with self._in_folder(folder):
+                if esearch:
+                    _, untagged = await self._command("UID SEARCH", "RETURN (ALL)", criteria)
+                    return parse_esearch(untagged.get("ESEARCH", []))["uids"]
+                _, untagged = await self._command("UID SEARCH", criteria)
+            return b" ".join(untagged.get("SEARCH", [])).split()
+
+        return await self._retry(_do)
+
+    async def thread_references(self, criteria: str = "ALL", folder: str = "INBOX") -> list[list[int]]:
+        """UID THREAD REFERENCES (RFC 5256): UIDs grouped by conversation."""
+
+        async def _do():
+            async with self._in_folder(folder):
+                _, untagged = await self._command("UID THREAD", "REFERENCES", "UTF-8", criteria)
+            return parse_thread(untagged.get("THREAD", []))
+
+        return await self._retry(_do)
+
+    async def search_page(
+        self,
+        criteria: str = "ALL",
+        folder: str = "INBOX",
+        limit: int = 50,
+        before_uid: Optional[int] = None,
+        sort: str = "uid",
+        offset: int = 0,
+    ) -> SearchPage:
+        """Return the total match count and one page of UIDs, newest last.
+
+        Uses ESEARCH ``RETURN (COUNT MIN MAX PARTIAL -1:-n)`` (RFC 9394 PARTIAL)
+        for UID order and ESORT ``RETURN (COUNT PARTIAL m:n)`` for date order,
+        so the server never sends the full UID list. `before_uid` pages by UID;
+        date-sorted pages use `offset`. Falls back to plain SEARCH/SORT and
+        slicing when the extensions are missing; without SORT, date order
+        degrades to UID (arrival) order.
+        """
+        if before_uid is not None and before_uid <= 1:
+            return SearchPage(total=0, uids=[])
+        page_criteria = criteria if before_uid is None else f"UID 1:{before_uid - 1} {criteria}"
+
+        async def _do():
+            async with self._in_folder(folder):
+                if sort == "date" and self.has_capability("SORT"):
+                    return await self._sort_page(criteria, limit, offset)
+                if offset:
+                    _, untagged = await self._command("UID SEARCH", page_criteria)
+                    uids = b" ".join(untagged.get("SEARCH", [])).split()
+                    return SearchPage(total=len(uids), uids=uids[: len(uids) - offset][-limit:])
+                return await self._search_page(criteria, page_criteria, limit, before_uid)
+
+        return await self._retry(_do)
+
+    async def _search_page(
+        self, criteria: str, page_criteria: str, limit: int, before_uid: Optional[int]
+    ) -> SearchPage:
+        if not self.has_capability("ESEARCH"):
+            _, untagged = await self._command("UID SEARCH", page_criteria)
+            uids = b" ".join(untagged.get("SEARCH", [])).split()
+            matches = uids
+            if before_uid is not None:
+                _, untagged = await self._command("UID SEARCH", criteria)
+                matches = b" ".join(untagged.get("SEARCH", [])).split()
+            return SearchPage(
+                total=len(matches),
+                uids=uids[-limit:],
+                min_uid=int(matches[0]) if matches else 0,
+                max_uid=int(matches[-1]) if matches else 0,
+            )
+
+        page_return = f"PARTIAL -1:-{limit}" if self.has_capability("PARTIAL") else "ALL"
+        if before_uid is None:
+            _, untagged = await self._command(
+                "UID SEARCH", f"RETURN (COUNT MIN MAX {page_return})", criteria
+            )
+            result = counts = parse_esearch(untagged.get("ESEARCH", []))
+        else:
+            # Pipelined: the total over all matches and the page below the cursor
+            (_, count_resp), (_, page_resp) = await asyncio.gather(
+                self._command("UID SEARCH", "RETURN (COUNT MIN MAX)", criteria),
+                self._command("UID SEARCH", f"RETURN ({page_return})", page_criteria),
+            )
+            counts = parse_esearch(count_resp.get("ESEARCH", []))
+            result = parse_esearch(page_resp.get("ESEARCH", []))
+        return SearchPage(
+            total=counts.get("count", 0),
+            uids=result["uids"][-limit:],
+            min_uid=counts.get("min", 0),
+            max_uid=counts.get("max", 0),
+        )
+
+    async def _sort_page(self, criteria: str, limit: int, offset: int) -> SearchPage:
+        if self.has_capability("ESORT"):
+            _, untagged = await self._command(
+                "UID SORT",
+                f"RETURN (COUNT MIN MAX PARTIAL {offset + 1}:{offset + limit})",
+                "(REVERSE DATE)", "UTF-8", criteria,
+            )
+            result = parse_esearch(untagged.get("ESEARCH", []))
+            newest_first = result["uids"]
+            total = result.get("count", 0)
+        else:
+            _, untagged = await self._command("UID SORT", "(REVERSE DATE)", "UTF-8", criteria)
+            everything = b" ".join(untagged.get("SORT", [])).split()
+            newest_first = everything[offset:offset + limit]
+            total = len(everything)
+            result = {}
+        return SearchPage(
+            total=total,
+            uids=list(reversed(newest_first)),
+            min_uid=result.get("min", 0),
+            max_uid=result.get("max", 0),
+        )
+
+    async def fetch_headers(
+        self, uids: list[bytes], limit: int = 50, folder: str = "INBOX"
+    ) -> list[dict]:
+        """Fetch headers for the newest `limit` UIDs, newest first.
+
+        All chunks are pipelined on the connection at once.
+        """
+        uids_to_fetch = uids[-limit:]
+        if not uids_to_fetch:
+            return []
+
+        async def _do():
+            async with self._in_folder(folder):
+                responses = await asyncio.gather(*(
+                    self._command("UID FETCH", uid_set, HEADER_ITEMS)
+                    for uid_set in uid_set_chunks(uids_to_fetch, self._fetch_chunk_size)
+                ))
+            by_uid = {}
+            for _, untagged in responses:
+                for row in parse_header_fetch(untagged.get("FETCH", [])):
+                    by_uid[row["uid"]] = row
+            results = []
+            for uid in reversed(uids_to_fetch):
+                key = uid.decode() if isinstance(uid, bytes) else str(uid)
+                if key in by_uid:
+                    results.append(by_uid[key])
+            return results
+
+        return await self._retry(_do)
+
+    async def folder_status(self, folder: str = "INBOX") -> FolderStatus:
+        items = "(MESSAGES UIDNEXT UIDVALIDITY"
+        if self.has_capability("CONDSTORE"):
+            items += " HIGHESTMODSEQ"
+        items += ")"
+
+        async def _do():
+            _, untagged = await self._command("STATUS", quote_mailbox(folder), items)
+            return parse_status(untagged.get("STATUS", []))
+
+        return await self._retry(_do)
+
+    async def fetch_header_range(self, uid_set: str, folder: str = "INBOX") -> list[dict]:
+        items = HEADER_ITEMS_MODSEQ if self.has_capability("CONDSTORE") else HEADER_ITEMS
+
+        async def _do():
+            async with self._in_folder(folder):
+                _, untagged = await self._command("UID FETCH", uid_set, items)
+            return parse_header_fetch(untagged.get("FETCH", []))
+
+        return await self._retry(_do)
+
+    async def fetch_flag_changes(
+        self,
+        uid_set: str,
+        folder: str = "INBOX",
+        changed_since: Optional[int] = None,
+    ) -> tuple[list[dict], list[int]]:
+        items = "(UID FLAGS MODSEQ)" if self.has_capability("CONDSTORE") else "(UID FLAGS)"
+        modifiers = ()
+        if changed_since is not None and self.has_capability("CONDSTORE"):
+            modifier = f"CHANGEDSINCE {changed_since}"
+            if self.has_capability("QRESYNC"):
+                modifier += " VANISHED"
+            modifiers = (f"({modifier})",)
+
+        async def _do():
+            async with self._in_folder(folder):
+                _, untagged = await self._command("UID FETCH", uid_set, items, *modifiers)
+            return (
+                parse_flag_fetch(untagged.get("FETCH", [])),
+                parse_vanished(untagged.get("VANISHED", [])),
+            )
+
+        return await self._retry(_do)
+
+    async def fetch_raw(self, uid: str, folder: str = "INBOX") -> FetchedMessage:
+        """Download a whole message with its flags, INTERNALDATE and size in one round-trip.
+
+        Uses BODY.PEEK[], so unlike a plain RFC822 fetch it leaves \\Seen alone.
+        """
+        uid = uid.decode() if isinstance(uid, bytes) else uid
+
+        async def _do():
+            async with self._in_folder(folder):
+                _, untagged = await self._command("UID FETCH", uid, MESSAGE_ITEMS)
+            fetched = parse_message_fetch(untagged.get("FETCH", []), uid)
+            if fetched is None:
+                raise IMAPError(f"Message {uid} not found")
+            return fetched
+
+        return await self._retry(_do)
+
+    async def fetch_structure(self, uid: str, folder: str = "INBOX") -> tuple[bytes, BodyPart, list[str]]:
+        """Fetch the header block, BODYSTRUCTURE and flags of one message, but no body."""
+        uid = uid.decode() if isinstance(uid, bytes) else uid
+
+        async def _do():
+            async with self._in_folder(folder):
+                _, untagged = await self._command("UID FETCH", uid, STRUCTURE_ITEMS)
+            item = _find_fetch_item(untagged, uid)
+            if item is None or not isinstance(item.get("BODYSTRUCTURE"), list):
+                raise IMAPError(f"Message {uid} not found")
+            flags = [f.decode() for f in item.get("FLAGS") or [] if isinstance(f, bytes)]
+            return item.get("BODY[HEADER]") or b"", parse_bodystructure(item["BODYSTRUCTURE"]), flags
+
+        return await self._retry(_do)
+
+    async def fetch_sections(self, uid: str, sections: list[str], folder: str = "INBOX") -> dict[str, bytes]:
+        """Fetch raw (transfer-encoded) body parts by section number in one command."""
+        uid = uid.decode() if isinstance(uid, bytes) else uid
+        if not sections:
+            return {}
+        items = "(" + " ".join(f"BODY.PEEK[{s}]" for s in sections) + ")"
+
+        async def _do():
+            async with self._in_folder(folder):
+                _, untagged = await self._command("UID FETCH", uid, items)
+            item = _find_fetch_item(untagged, uid) or {}
+            return {s: item.get(f"BODY[{s}]") or b"" for s in sections}
+
+        return await self._retry(_do)
+
+    async def fetch_message(self, uid: str, folder: str = "INBOX") -> ParsedEmail:
+        """Fetch and parse a message for display without downloading attachments.
+
+        Two round-trips: structure + headers + flags, then only the text
+        parts parse_structured_email will use.
+        """
+        uid = uid.decode() if isinstance(uid, bytes) else uid
+        header, structure, flags = await self.fetch_structure(uid, folder=folder)
+        plain, html, _ = select_parts(structure)
+        sections = await self.fetch_sections(
+            uid, [p.section for p in (plain, html) if p is not None], folder=folder
+        )
+        return parse_structured_email(uid, header, structure, sections, flags)
+
+    async def fetch_items(self, uids: list, items: str, folder: str = "INBOX") -> dict[int, dict]:
+        """Run one FETCH over many UIDs and return parse_fetch_items() dicts by UID.
+
+        Like fetch_headers, large UID lists are split into chunks that are
+        pipelined together.
+        """
+        if not uids:
+            return {}
+        wanted = {int(u) for u in uids}
+
+        async def _do():
+            async with self._in_folder(folder):
+                responses = await asyncio.gather(*(
+                    self._command("UID FETCH", uid_set, items)
+                    for uid_set in uid_set_chunks(uids, self._fetch_chunk_size)
+                ))
+            by_uid = {}
+            for _, untagged in responses:
+                for item in parse_fetch_items(untagged.get("FETCH", [])):
+                    uid = item.get("UID")
+                    if isinstance(uid, bytes) and int(uid) in wanted:
+                        by_uid[int(uid)] = item
+            return by_uid
+
+        return await self._retry(_do)
+
+    async def fetch_partial(
+        self, uid: str, section: str, offset: int, length: int, folder: str = "INBOX"
+    ) -> bytes:
+        """Fetch `length` raw bytes of one body part starting at `offset`."""
+        uid = uid.decode() if isinstance(uid, bytes) else uid
+
+        async def _do():
+            async with self._in_folder(folder):
+                _, untagged = await self._command(
+                    "UID FETCH", uid, f"(BODY.PEEK[{section}]<{offset}.{length}>)"
+                )
+            item = _find_fetch_item(untagged, uid)
+            if item is None:
+                raise IMAPError(f"Message {uid} not found")
+            prefix = f"BODY[{section}]"
+            return next((v for k, v in item.items() if k.startswith(prefix) and v), b"")
+
+        return await self._retry(_do)
+
+    async def stream_part(
+        self,
+        uid: str,
+        section: str,
+        folder: str = "INBOX",
+        chunk_size: int = STREAM_CHUNK_SIZE,
+    ) -> AsyncIterator[bytes]:
+        """Yield one body part's raw bytes `chunk_size` at a time.
+
+        The next chunk is requested while the caller consumes the current
+        one, so a download costs about one round-trip per chunk but never
+        buffers more than two chunks.
+        """
+        uid = uid.decode() if isinstance(uid, bytes) else uid
+        offset = 0
+        pending = asyncio.ensure_future(self.fetch_partial(uid, section, 0, chunk_size, folder))
+        try:
+            while True:
+                data = await pending
+                offset += len(data)
+                more = len(data) == chunk_size
+                if more:
+                    pending = asyncio.ensure_future(
+                        self.fetch_partial(uid, section, offset, chunk_size, folder)
+                    )
+                if data:
+                    yield data
+                if not more:
+                    return
+        finally:
+            if not pending.done():
+                pending.cancel()
+
+
+def _find_fetch_item(untagged: dict, uid: str) -> Optional[dict]:
+    # Skip unsolicited FETCH responses (flag updates) for other messages
+    for item in parse_fetch_items(untagged.get("FETCH", [])):
+        if item.get("UID") == uid.encode():
+            return item
+    return None
+
+
+class ConnectionBudget:
+    """Caps IMAP connections across every account's AsyncIMAPPool and
+    shares them fairly.
+
+    A pool may open another connection while the total is under
+    `max_connections` and it holds less than its fair share: the cap
+    divided by the pools with requests in flight. A pool's first
+    connection is always granted, so a new account never waits behind
+    busy ones; the total may then exceed the cap. At the cap, pools above
+    their share close connections as they go idle (should_shed), leaving
+    room for the others.
+    """
+
+    def __init__(self, max_connections: int):
+        self._max = max(max_connections, 1)
+        self._held: dict[int, int] = {}
+        self._pools: dict[int, "AsyncIMAPPool"] = {}
+        self._denied = 0
+
+    @property
+    def total(self) -> int:
+        return sum(self._held.values())
+
+    def _share(self, pool: Optional["AsyncIMAPPool"] = None) -> int:
+        """The cap split between the pools with requests in flight, counting `pool`."""
+        busy = {id(p) for p in self._pools.values() if p.users > 0}
+        if pool is not None:
+            busy.add(id(pool))
+        return max(1, self._max // max(len(busy), 1))
+
+    def acquire(self, pool: "AsyncIMAPPool", force: bool = False) -> bool:
+        held = self._held.get(id(pool), 0)
+        if not force and held > 0 and (self.total >= self._max or held >= self._share(pool)):
+            self._denied += 1
+            return False
+        self._held[id(pool)] = held + 1
+        self._pools[id(pool)] = pool
+        return True
+
+    def release(self, pool: "AsyncIMAPPool", count: int = 1) -> None:
+        held = self._held.get(id(pool), 0) - count
+        if held > 0:
+            self._held[id(pool)] = held
+        else:
+            self._held.pop(id(pool), None)
+            self._pools.pop(id(pool), None)
+
+    def should_shed(self, pool: "AsyncIMAPPool") -> bool:
+        """True if `pool` should close an idle connection to make room."""
+        held = self._held.get(id(pool), 0)
+        return held > 1 and self.total >= self._max and held > self._share(pool)
+
+    def stats(self) -> dict:
+        return {
+            "max_connections": self._max,
+            "connections": self.total,
+            "fair_share": self._share(),
+            "denied": self._denied,
+            "by_account": {self._pools[k].account: n for k, n in self._held.items()},
+        }
+
+
+class AsyncIMAPPool:
+    """Bounded set of shared AsyncIMAPClient connections.
+
+    Unlike IMAPPool, a connection is not handed out exclusively: up to
+    `max_inflight` requests pipeline over the same connection. Requests are
+    routed to a connection that already has their folder selected, then to
+    an idle one, then to a new one while under `max_size` (and, with a
+    shared ConnectionBudget, while the budget grants it).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        max_size: int = 4,
+        max_inflight: int = 8,
+        checkout_timeout: float = 30.0,
+        fetch_chunk_size: int = 200,
+        client_class: type[AsyncIMAPClient] = AsyncIMAPClient,
+        budget: Optional[ConnectionBudget] = None,
+    ):
+        self._host = host
+        self._port = port
+        self._user = user
+        self._password = password
+        self._max_size = max_size
+        self._max_inflight = max_inflight
+        self._checkout_timeout = checkout_timeout
+        self._fetch_chunk_size = fetch_chunk_size
+        self._client_class = client_class
+        self._budget = budget
+
+        self._cond = asyncio.Condition()
+        self._clients: list[AsyncIMAPClient] = []
+        self._users: dict[int, int] = {}
+        self._opening = 0
+        self._connected = False
+        self._stats = PoolStats()
+
+    @property
+    def user(self) -> str:
+        return self._user
+
+    @property
+    def account(self) -> str:
+        return f"{self._user}@{self._host}"
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @property
+    def users(self) -> int:
+        """Requests currently holding a connection."""
+        return sum(self._users.values())
+
+    @property
+    def capabilities(self) -> frozenset[str]:
+        """The server's capabilities, as seen by a connected client."""
+        for client in self._clients:
+            if client.capabilities:
+                return client.capabilities
+        return frozenset()
+
+    def _new_client(self) -> AsyncIMAPClient:
+        return self._client_class(
+            host=self._host,
+            port=self._port,
+            user=self._user,
+            password=self._password,
+            fetch_chunk_size=self._fetch_chunk_size,
+        )
+
+    def dedicated_client(self) -> AsyncIMAPClient:
+        """A new, unconnected client with the pool's settings that the pool
+        does not track, for long-lived uses such as IDLE."""
+        return self._new_client()
+
+    async def connect(self) -> None:
+        """Open one connection to validate credentials and keep it in the pool."""
+        client = self._new_client()
+        await client.connect()
+        async with self._cond:
+            if self._budget is not None:
+                # Counted even above the cap: the pool needs one to exist
+                self._budget.acquire(self, force=True)
+            self._clients.append(client)
+            self._users[id(client)] = 0
+            self._stats.created += 1
+            self._connected = True
+            self._cond.notify_all()
+
+    async def reconfigure(self, host: str, port: int, user: str, password: str) -> None:
+        async with self._cond:
+            self._host, self._port, self._user, self._password = host, port, user, password
+            self._connected = False
+            clients, self._clients = self._clients, []
+            self._users = {}
+            if self._budget is not None:
+                self._budget.release(self, len(clients))
+            self._cond.notify_all()
+        for client in clients:
+            await client.disconnect()
+
+    async def close(self) -> None:
+        await self.reconfigure(self._host, self._port, self._user, self._password)
+
+    async def _acquire(self, folder: Optional[str]) -> AsyncIMAPClient:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        waited = False
+        async with self._cond:
+            while True:
+                client, create = self._pick(folder)
+                if client is not None or create:
+                    break
+                if not waited:
+                    self._stats.exhausted += 1
+                    waited = True
+                remaining = self._checkout_timeout - (loop.time() - start)
+                if remaining <= 0:
+                    self._stats.timeouts += 1
+                    raise PoolTimeout(f"No IMAP connection available after {self._checkout_timeout:.0f}s")
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            if create:
+                self._opening += 1
+            else:
+                self._users[id(client)] += 1
+            self._stats.checkouts += 1
+            if waited:
+                self._stats.record_wait(loop.time() - start)
+
+        if create:
+            client = self._new_client()
+            try:
+                await client.connect()
+            except Exception:
+                async with self._cond:
+                    self._opening -= 1
+                    if self._budget is not None:
+                        self._budget.release(self)
+                    self._cond.notify_all()
+                raise
+            async with self._cond:
+                self._opening -= 1
+                self._clients.append(client)
+                self._users[id(client)] = 1
+                self._stats.created += 1
+        elif self._users.get(id(client)) == 1:
+            # Sole user: safe to NOOP or reconnect without disturbing anyone
+            await client.check_health()
+        return client
+
+    def _pick(self, folder: Optional[str]) -> tuple[Optional[AsyncIMAPClient], bool]:
+        available = [c for c in self._clients if self._users[id(c)] < self._max_inflight]
+        if folder is not None:
+            same = [c for c in available if c._selected_folder == folder]
+            if same:
+                self._stats.affinity_hits += 1
+                return min(same, key=lambda c: self._users[id(c)]), False
+        idle = [c for c in available if self._users[id(c)] == 0]
+        if idle:
+            return idle[0], False
+        if len(self._clients) + self._opening < self._max_size and (
+            self._budget is None or self._budget.acquire(self)
+        ):
+            return None, True
+        if available:
+            return min(available, key=lambda c: self._users[id(c)]), False
+        return None, False
+
+    async def _release(self, client: AsyncIMAPClient) -> None:
+        shed = False
+        async with self._cond:
+            if id(client) in self._users:
+                self._users[id(client)] -= 1
+                if (
+                    self._users[id(client)] == 0
+                    and self._budget is not None
+                    and self._budget.should_shed(self)
+                ):
+                    # Over our share of the shared budget: give this one back
+                    self._clients.remove(client)
+                    del self._users[id(client)]
+                    self._budget.release(self)
+                    shed = True
+            self._cond.notify_all()
+        if shed:
+            await client.disconnect()
+
+    @asynccontextmanager
+    async def connection(self, folder: Optional[str] = None) -> AsyncIterator[AsyncIMAPClient]:
+        client = await self._acquire(folder)
+        try:
+            yield client
+        finally:
+            await self._release(client)
+
+    def stats(self) -> dict:
+        data = asdict(self._stats)
+        data.update(
+            size=len(self._clients),
+            max_size=self._max_size,
+            max_inflight=self._max_inflight,
+            in_flight=sum(c.in_flight for c in self._clients),
+            users=sum(self._users.values()),
+            idle=sum(1 for c in self._clients if self._users.get(id(c)) == 0),
+            wait_time_avg=(self._stats.wait_time_total / self._stats.waits) if self._stats.waits else 0.0,
+        )
+        return data
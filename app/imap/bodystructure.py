@@ -0,0 +1,231 @@
+"""BODYSTRUCTURE parsing and part decoding.
+
+Lets callers decide which MIME parts of a message they need before
+downloading any of them: the structure gives every part's section number,
+type, transfer encoding and encoded size, so attachments never have to be
+fetched just to be listed.
+"""
+
+import base64
+import binascii
+import email.header
+import quopri
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, Optional
+
+
+@dataclass
+class BodyPart:
+    section: str
+    content_type: str
+    params: dict[str, str] = field(default_factory=dict)
+    encoding: str = "7bit"
+    size: int = 0
+    disposition: str = ""
+    disposition_params: dict[str, str] = field(default_factory=dict)
+    children: list["BodyPart"] = field(default_factory=list)
+
+    @property
+    def is_multipart(self) -> bool:
+        return self.content_type.startswith("multipart/")
+
+    @property
+    def is_attachment(self) -> bool:
+        return self.disposition == "attachment"
+
+    @property
+    def charset(self) -> str:
+        return self.params.get("charset") or "utf-8"
+
+    @property
+    def filename(self) -> str:
+        name = self.disposition_params.get("filename") or self.params.get("name") or ""
+        return _decode_param(name) or "untitled"
+
+    @property
+    def decoded_size(self) -> int:
+        """Payload size after transfer decoding, estimated from the encoded size.
+
+        base64 lines are 76 characters plus CRLF and carry 57 bytes each.
+        """
+        if self.encoding == "base64":
+            return self.size * 57 // 78
+        return self.size
+
+    def walk(self) -> Iterator["BodyPart"]:
+        """Leaf parts in document order (same order as email.message.walk())."""
+        if self.children:
+            for child in self.children:
+                yield from child.walk()
+        else:
+            yield self
+
+
+def parse_bodystructure(value: list, section: str = "") -> BodyPart:
+    """Build a BodyPart tree from a parsed BODYSTRUCTURE list.
+
+    Section numbers follow RFC 3501 §6.4.5: children of a multipart are
+    numbered 1, 2, ... below their parent, and a non-multipart message body
+    is section "1".
+    """
+    if value and isinstance(value[0], list):
+        children = []
+        i = 0
+        while i < len(value) and isinstance(value[i], list):
+            child_section = f"{section}.{i + 1}" if section else str(i + 1)
+            children.append(parse_bodystructure(value[i], child_section))
+            i += 1
+        subtype = _text(value[i]) if i < len(value) else "mixed"
+        part = BodyPart(section=section or "", content_type=f"multipart/{subtype}", children=children)
+        # Extension data: (params) (disposition) ...
+        if i + 2 < len(value):
+            part.disposition, part.disposition_params = _disposition(value[i + 2])
+        return part
+
+    content_type = f"{_text(value[0])}/{_text(value[1])}"
+    part = BodyPart(
+        section=section or "1",
+        content_type=content_type,
+        params=_params(value[2]),
+        encoding=_text(value[5]) or "7bit",
+        size=_int(value[6]),
+    )
+
+    # Type-specific fields sit between the basic fields and the extension
+    # data: text/* adds a line count, message/rfc822 adds envelope, body and
+    # line count.
+    ext = 7
+    nested = None
+    if content_type.startswith("text/"):
+        ext = 8
+    elif content_type == "message/rfc822" and len(value) > 9:
+        ext = 10
+        nested = value[8]
+    # value[ext] is the body MD5, value[ext + 1] the disposition
+    if ext + 1 < len(value):
+        part.disposition, part.disposition_params = _disposition(value[ext + 1])
+
+    if isinstance(nested, list) and nested and not part.is_attachment:
+        # An embedded message's parts are numbered below it; a single-part
+        # embedded body is <section>.1
+        if isinstance(nested[0], list):
+            part.children = parse_bodystructure(nested, part.section).children
+        else:
+            part.children = [parse_bodystructure(nested, f"{part.section}.1")]
+    return part
+
+
+def select_parts(root: BodyPart) -> tuple[Optional[BodyPart], Optional[BodyPart], list[BodyPart]]:
+    """Pick (first text/plain, first text/html, attachments) the way parse_email does."""
+    plain = html = None
+    attachments = []
+    for part in root.walk():
+        if part.is_attachment:
+            attachments.append(part)
+        elif part.content_type == "text/plain" and plain is None:
+            plain = part
+        elif part.content_type == "text/html" and html is None:
+            html = part
+    return plain, html, attachments
+
+
+def decode_part(part: BodyPart, payload: bytes) -> str:
+    return decode_transfer(payload, part.encoding).decode(part.charset, errors="replace")
+
+
+def decode_transfer(payload: bytes, encoding: str) -> bytes:
+    encoding = encoding.lower()
+    if encoding == "base64":
+        return _b64decode(_base64_alphabet(payload))
+    if encoding == "quoted-printable":
+        return quopri.decodestring(payload)
+    return payload
+
+
+async def decode_stream(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    """Transfer-decode a part incrementally as its raw chunks arrive.
+
+    base64 is decoded in whole 4-character groups and quoted-printable in
+    whole lines; the remainder is carried into the next chunk.
+    """
+    encoding = encoding.lower()
+    pending = b""
+    async for chunk in chunks:
+        if encoding == "base64":
+            pending += _base64_alphabet(chunk)
+            cut = len(pending) - len(pending) % 4
+            ready, pending = pending[:cut], pending[cut:]
+            if ready:
+                yield _b64decode(ready)
+        elif encoding == "quoted-printable":
+            pending += chunk
+            cut = pending.rfind(b"\n") + 1
+            ready, pending = pending[:cut], pending[cut:]
+            if ready:
+                yield quopri.decodestring(ready)
+        else:
+            yield chunk
+    if pending:
+        if encoding == "base64":
+            yield _b64decode(pending)
+        else:
+            yield quopri.decodestring(pending)
+
+
+def _b64decode(data: bytes) -> bytes:
+    """Lenient base64 decode: tolerate missing padding and a stray trailing character."""
+    data = data.rstrip(b"=")
+    if len(data) % 4 == 1:
+        data = data[:-1]
+    try:
+        return base64.b64decode(data + b"=" * (-len(data) % 4))
+    except binascii.Error:
+        return b""
+
+
+_BASE64_CHARS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+_NON_BASE64 = bytes(b for b in range(256) if b not in _BASE64_CHARS)
+
+
+def _base64_alphabet(data: bytes) -> bytes:
+    return data.translate(None, _NON_BASE64)
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace").lower()
+    return ""
+
+
+def _int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _params(value) -> dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    params = {}
+    for i in range(0, len(value) - 1, 2):
+        if isinstance(value[i], bytes) and isinstance(value[i + 1], bytes):
+            params[_text(value[i])] = value[i + 1].decode("utf-8", errors="replace")
+    return params
+
+
+def _disposition(value) -> tuple[str, dict[str, str]]:
+    if not isinstance(value, list) or not value:
+        return "", {}
+    return _text(value[0]), _params(value[1] if len(value) > 1 else None)
+
+
+def _decode_param(value: str) -> str:
+    # Servers pass RFC 2047 encoded filenames through untouched
+    if "=?" not in value:
+        return value
+    parts = email.header.decode_header(value)
+    return "".join(
+        p.decode(charset or "utf-8", errors="replace") if isinstance(p, bytes) else p
+        for p, charset in parts
+    )
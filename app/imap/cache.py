@@ -0,0 +1,267 @@
+import email.utils
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    uidnext INTEGER NOT NULL DEFAULT 0,
+    highestmodseq INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (account, folder)
+);
+
+CREATE TABLE IF NOT EXISTS headers (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    date TEXT NOT NULL,
+    date_ts INTEGER NOT NULL DEFAULT 0,
+    flags TEXT NOT NULL DEFAULT '',
+    modseq INTEGER,
+    PRIMARY KEY (account, folder, uid)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS headers_by_date ON headers (account, folder, date_ts, uid);
+"""
+
+
+def open_cache_db(path: str, schema: str) -> sqlite3.Connection:
+    """A connection to the cache database at `path` with `schema` applied.
+
+    Every store (headers, index, threads, Claude responses, jobs, outbox,
+    shared messages) keeps its tables in the same file, each through its
+    own connection guarded by its own lock. WAL lets them, and other
+    processes, read while one writes.
+    """
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(schema)
+    return db
+
+
+@dataclass
+class FolderState:
+    uidvalidity: int
+    uidnext: int = 0
+    highestmodseq: int = 0
+    synced_at: float = 0
+
+
+class HeaderCache:
+    """On-disk cache of envelope fields and flags, per account and folder.
+
+    Rows are only meaningful for the UIDVALIDITY recorded in `folders`;
+    callers reset a folder when the server reports a different one.
+    """
+
+    def __init__(self, path: str):
+        self._db = open_cache_db(path, SCHEMA)
+        self._lock = threading.Lock()
+        self._listeners: list[Callable[[str, str, str, object], None]] = []
+
+    def add_listener(self, listener: Callable[[str, str, str, object], None]) -> None:
+        """Call listener(account, folder, change, data) after each write:
+        "upsert" with (uid, subject, sender, date, date_ts, flags) rows,
+        "flags" with (uid, flags) pairs, "delete" with UIDs, "state" with
+        the saved FolderState and "reset" with None."""
+        self._listeners.append(listener)
+
+    def _notify(self, account: str, folder: str, change: str, data) -> None:
+        for listener in self._listeners:
+            listener(account, folder, change, data)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def folder_state(self, account: str, folder: str) -> Optional[FolderState]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uidvalidity, uidnext, highestmodseq, synced_at FROM folders "
+                "WHERE account = ? AND folder = ?",
+                (account, folder),
+            ).fetchone()
+        return FolderState(*row) if row else None
+
+    def reset_folder(self, account: str, folder: str, uidvalidity: int) -> FolderState:
+        """Drop everything cached for a folder and start over under a new UIDVALIDITY."""
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM headers WHERE account = ? AND folder = ?", (account, folder)
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO folders (account, folder, uidvalidity) VALUES (?, ?, ?)",
+                (account, folder, uidvalidity),
+            )
+        self._notify(account, folder, "reset", None)
+        return FolderState(uidvalidity=uidvalidity)
+
+    def save_folder_state(self, account: str, folder: str, state: FolderState) -> None:
+        saved = FolderState(
+            state.uidvalidity, state.uidnext, state.highestmodseq, state.synced_at or time.time()
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO folders "
+                "(account, folder, uidvalidity, uidnext, highestmodseq, synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (account, folder, saved.uidvalidity, saved.uidnext, saved.highestmodseq, saved.synced_at),
+            )
+        self._notify(account, folder, "state", saved)
+
+    def upsert_headers(self, account: str, folder: str, rows: list[dict]) -> None:
+        values = [
+            (int(r["uid"]), r["subject"], r["sender"], r["date"], _date_ts(r["date"]), " ".join(r.get("flags", [])))
+            for r in rows
+        ]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO headers "
+                "(account, folder, uid, subject, sender, date, date_ts, flags, modseq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(account, folder, *v, r.get("modseq")) for v, r in zip(values, rows)],
+            )
+        self._notify(account, folder, "upsert", values)
+
+    def update_flags(self, account: str, folder: str, rows: list[dict]) -> None:
+        values = [(int(r["uid"]), " ".join(r["flags"])) for r in rows]
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE headers SET flags = ?, modseq = COALESCE(?, modseq) "
+                "WHERE account = ? AND folder = ? AND uid = ?",
+                [(flags, r.get("modseq"), account, folder, uid) for (uid, flags), r in zip(values, rows)],
+            )
+        self._notify(account, folder, "flags", values)
+
+    def delete_uids(self, account: str, folder: str, uids: list[int]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM headers WHERE account = ? AND folder = ? AND uid = ?",
+                [(account, folder, uid) for uid in uids],
+            )
+        self._notify(account, folder, "delete", [int(uid) for uid in uids])
+
+    def uids(self, account: str, folder: str, max_uid: Optional[int] = None) -> list[int]:
+        sql = "SELECT uid FROM headers WHERE account = ? AND folder = ?"
+        params = [account, folder]
+        if max_uid is not None:
+            sql += " AND uid <= ?"
+            params.append(max_uid)
+        with self._lock:
+            return [r[0] for r in self._db.execute(sql + " ORDER BY uid", params)]
+
+    def max_uid(self, account: str, folder: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MAX(uid) FROM headers WHERE account = ? AND folder = ?",
+                (account, folder),
+            ).fetchone()
+        return row[0] or 0
+
+    def count(self, account: str, folder: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM headers WHERE account = ? AND folder = ?",
+                (account, folder),
+            ).fetchone()
+        return row[0]
+
+    def list_headers(
+        self,
+        account: str,
+        folder: str,
+        limit: int = 50,
+        before_uid: Optional[int] = None,
+        sort: str = "uid",
+        before_date: Optional[tuple[int, int]] = None,
+    ) -> list[dict]:
+        """Newest-first header rows, shaped like IMAPClient.fetch_headers output.
+
+        Keyset pagination: `before_uid` continues a UID-ordered listing,
+        `before_date` = (date_ts, uid) of the last row seen continues a
+        date-ordered one. Both are index range scans, so deep pages cost the
+        same as the first.
+        """
+        sql = (
+            "SELECT uid, subject, sender, date, flags, modseq, date_ts FROM headers "
+            "WHERE account = ? AND folder = ?"
+        )
+        params: list = [account, folder]
+        if sort == "date":
+            if before_date is not None:
+                sql += " AND (date_ts < ? OR (date_ts = ? AND uid < ?))"
+                params += [before_date[0], before_date[0], before_date[1]]
+            sql += " ORDER BY date_ts DESC, uid DESC"
+        else:
+            if before_uid is not None:
+                sql += " AND uid < ?"
+                params.append(before_uid)
+            sql += " ORDER BY uid DESC"
+        with self._lock:
+            rows = self._db.execute(sql + " LIMIT ?", params + [limit]).fetchall()
+        return [_row_to_header(r) for r in rows]
+
+    def iter_rows(self, account: str, folder: str, chunk_size: int = 5000) -> Iterator[list[tuple]]:
+        """Every (uid, subject, sender, date, date_ts, flags) row of the
+        folder in UID order, `chunk_size` at a time."""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT uid, subject, sender, date, date_ts, flags FROM headers "
+                    "WHERE account = ? AND folder = ? AND uid > ? ORDER BY uid LIMIT ?",
+                    (account, folder, last, chunk_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+    def get_headers(self, account: str, folder: str, uids: list[int]) -> list[dict]:
+        rows = []
+        with self._lock:
+            for i in range(0, len(uids), 500):
+                chunk = uids[i : i + 500]
+                rows += self._db.execute(
+                    "SELECT uid, subject, sender, date, flags, modseq, date_ts FROM headers "
+                    f"WHERE account = ? AND folder = ? AND uid IN ({','.join('?' * len(chunk))})",
+                    [account, folder, *chunk],
+                ).fetchall()
+        return [_row_to_header(r) for r in rows]
+
+
+def _row_to_header(row: tuple) -> dict:
+    uid, subject, sender, date, flags, modseq, date_ts = row
+    flag_list = flags.split() if flags else []
+    return {
+        "uid": str(uid),
+        "subject": subject,
+        "sender": sender,
+        "date": date,
+        "is_read": "\\Seen" in flag_list,
+        "flags": flag_list,
+        "modseq": modseq,
+        "date_ts": date_ts,
+    }
+
+
+def _date_ts(value: str) -> int:
+    if not value:
+        return 0
+    try:
+        return int(email.utils.parsedate_to_datetime(value).timestamp())
+    except Exception:
+        return 0
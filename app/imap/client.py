@@ -1,32 +1,84 @@
 import imaplib
-import email
 import time
 import logging
-from email.message import EmailMessage
 from typing import Optional
 
+from app.imap.protocol import (
+    HEADER_ITEMS,
+    HEADER_ITEMS_MODSEQ,
+    MESSAGE_ITEMS,
+    FetchedMessage,
+    FolderStatus,
+    uid_set_chunks,
+    quote_mailbox,
+    parse_header_fetch,
+    parse_flag_fetch,
+    parse_message_fetch,
+    parse_status,
+    parse_list,
+    parse_vanished,
+)
+
 logger = logging.getLogger(__name__)
 
 
 class IMAPClient:
-    def __init__(self, host: str, port: int, user: str, password: str):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        fetch_chunk_size: int = 200,
+    ):
         self._host = host
         self._port = port
         self._user = user
         self._password = password
+        self._fetch_chunk_size = fetch_chunk_size
         self._conn: Optional[imaplib.IMAP4_SSL] = None
         self._selected_folder: Optional[str] = None
         self._last_activity: float = 0
+        self._capabilities: set[str] = set()
+
+    def _open_connection(self) -> imaplib.IMAP4:
+        return imaplib.IMAP4_SSL(self._host, self._port)
 
     def connect(self) -> None:
         """Establish a fresh IMAP connection and login."""
         self._close_quiet()
-        self._conn = imaplib.IMAP4_SSL(self._host, self._port)
+        self._conn = self._open_connection()
         self._conn.login(self._user, self._password)
         self._selected_folder = None
+        self._load_capabilities()
         self._last_activity = time.time()
         logger.info("IMAP connected to %s as %s", self._host, self._user)
 
+    def _load_capabilities(self) -> None:
+        """Refresh capabilities after login and turn on CONDSTORE/QRESYNC if offered."""
+        typ, data = self._conn.capability()
+        caps = data[0].decode().upper().split() if data and data[0] else []
+        self._capabilities = set(caps)
+        # imaplib only knows the pre-login list; enable() checks against it
+        self._conn.capabilities = tuple(caps)
+        for extension in ("QRESYNC", "CONDSTORE"):
+            if extension in self._capabilities:
+                try:
+                    self._conn.enable(extension)
+                except imaplib.IMAP4.error as e:
+                    logger.warning("ENABLE %s failed: %s", extension, e)
+                    self._capabilities.discard(extension)
+                    continue
+                break
+
+    def has_capability(self, name: str) -> bool:
+        return name.upper() in self._capabilities
+
+    @property
+    def account(self) -> str:
+        """Stable key for this mailbox, used to partition local caches."""
+        return f"{self._user}@{self._host}"
+
     def disconnect(self) -> None:
         self._close_quiet()
 
@@ -101,15 +153,7 @@ class IMAPClient:
 
         def _do():
             typ, data = self._conn.list()
-            folders = []
-            for item in data:
-                if isinstance(item, bytes):
-                    parts = item.decode().rsplit('"', 2)
-                    if len(parts) >= 2:
-                        folder_name = parts[-2].strip().strip('"')
-                        if folder_name:
-                            folders.append(folder_name)
-            return folders
+            return parse_list(data)
 
         return self._retry(_do)
 
@@ -135,80 +179,107 @@ class IMAPClient:
 
         return self._retry(_do)
 
-    def fetch_headers(self, uids: list[bytes], limit: int = 50) -> list[dict]:
+    def fetch_headers(
+        self, uids: list[bytes], limit: int = 50, folder: Optional[str] = None
+    ) -> list[dict]:
+        """Fetch headers for the newest `limit` UIDs, newest first.
+
+        UIDs are sent as compressed sets (``1:200``, ``5,9,12``) so a page costs
+        one round-trip per chunk instead of one per message.
+        """
         self._ensure_connected()
         uids_to_fetch = uids[-limit:]
+        if not uids_to_fetch:
+            return []
 
         def _do():
+            if folder:
+                self._select_folder(folder)
+            by_uid = {}
+            for uid_set in uid_set_chunks(uids_to_fetch, self._fetch_chunk_size):
+                typ, data = self._conn.uid("fetch", uid_set, HEADER_ITEMS)
+                for row in parse_header_fetch(data):
+                    by_uid[row["uid"]] = row
             results = []
             for uid in reversed(uids_to_fetch):
-                typ, data = self._conn.uid(
-                    "fetch", uid, "(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)] FLAGS)"
-                )
-                if not data or data[0] is None:
-                    continue
-
-                raw_header = data[0][1] if isinstance(data[0], tuple) else data[0]
-                if not isinstance(raw_header, bytes):
-                    continue
-
-                msg = email.message_from_bytes(raw_header)
+                key = uid.decode() if isinstance(uid, bytes) else str(uid)
+                if key in by_uid:
+                    results.append(by_uid[key])
+            return results
 
-                flags_str = ""
-                if isinstance(data[0], tuple):
-                    flags_str = data[0][0].decode("utf-8", errors="replace")
-                if len(data) > 1 and data[1] and isinstance(data[1], bytes):
-                    flags_str += data[1].decode("utf-8", errors="replace")
+        return self._retry(_do)
 
-                is_read = "\\Seen" in flags_str
+    def folder_status(self, folder: str = "INBOX") -> FolderStatus:
+        """Cheap STATUS probe: message count, UIDNEXT, UIDVALIDITY and HIGHESTMODSEQ."""
+        self._ensure_connected()
+        items = "(MESSAGES UIDNEXT UIDVALIDITY"
+        if self.has_capability("CONDSTORE"):
+            items += " HIGHESTMODSEQ"
+        items += ")"
 
-                results.append({
-                    "uid": uid.decode() if isinstance(uid, bytes) else str(uid),
-                    "subject": _decode_header(msg.get("Subject", "(No Subject)")),
-                    "sender": _decode_header(msg.get("From", "")),
-                    "date": msg.get("Date", ""),
-                    "is_read": is_read,
-                })
-            return results
+        def _do():
+            typ, data = self._conn.status(quote_mailbox(folder), items)
+            return parse_status(data)
 
         return self._retry(_do)
 
-    def fetch_full(self, uid: str) -> EmailMessage:
+    def fetch_header_range(self, uid_set: str, folder: str = "INBOX") -> list[dict]:
+        """Fetch header rows (with flags and MODSEQ when available) for a UID set like ``101:*``."""
         self._ensure_connected()
-        uid_bytes = uid.encode() if isinstance(uid, str) else uid
+        items = HEADER_ITEMS_MODSEQ if self.has_capability("CONDSTORE") else HEADER_ITEMS
 
         def _do():
-            typ, data = self._conn.uid("fetch", uid_bytes, "(RFC822)")
-            raw = data[0][1]
-            return email.message_from_bytes(raw)
+            self._select_folder(folder)
+            typ, data = self._conn.uid("fetch", uid_set, items)
+            return parse_header_fetch(data)
 
         return self._retry(_do)
 
-    def fetch_flags(self, uid: str) -> list[str]:
+    def fetch_flag_changes(
+        self,
+        uid_set: str,
+        folder: str = "INBOX",
+        changed_since: Optional[int] = None,
+    ) -> tuple[list[dict], list[int]]:
+        """Fetch FLAGS for a UID set, optionally only those changed since a MODSEQ.
+
+        Returns (rows, vanished_uids). Vanished UIDs are only reported when
+        QRESYNC is enabled; otherwise the caller has to diff UID ranges.
+        """
         self._ensure_connected()
-        uid_bytes = uid.encode() if isinstance(uid, str) else uid
+        items = "(UID FLAGS MODSEQ)" if self.has_capability("CONDSTORE") else "(UID FLAGS)"
+        modifiers = []
+        if changed_since is not None and self.has_capability("CONDSTORE"):
+            modifier = f"CHANGEDSINCE {changed_since}"
+            if self.has_capability("QRESYNC"):
+                modifier += " VANISHED"
+            modifiers.append(f"({modifier})")
 
         def _do():
-            typ, data = self._conn.uid("fetch", uid_bytes, "(FLAGS)")
-            if data[0]:
-                resp = data[0].decode("utf-8", errors="replace")
-                start = resp.find("FLAGS (")
-                if start != -1:
-                    end = resp.find(")", start + 7)
-                    return resp[start + 7 : end].split()
-            return []
+            self._select_folder(folder)
+            self._conn.untagged_responses.pop("VANISHED", None)
+            typ, data = self._conn.uid("fetch", uid_set, items, *modifiers)
+            vanished = parse_vanished(self._conn.untagged_responses.pop("VANISHED", []))
+            rows = parse_flag_fetch(data)
+            return rows, vanished
 
         return self._retry(_do)
 
+    def fetch_raw(self, uid: str, folder: Optional[str] = None) -> FetchedMessage:
+        """Download a whole message with its flags, INTERNALDATE and size in one round-trip.
+
+        Uses BODY.PEEK[], so unlike a plain RFC822 fetch it leaves \\Seen alone.
+        """
+        self._ensure_connected()
+        uid = uid.decode() if isinstance(uid, bytes) else uid
+
+        def _do():
+            if folder:
+                self._select_folder(folder)
+            typ, data = self._conn.uid("fetch", uid, MESSAGE_ITEMS)
+            fetched = parse_message_fetch(data, uid)
+            if fetched is None:
+                raise LookupError(f"Message {uid} not found")
+            return fetched
 
-def _decode_header(value: str) -> str:
-    if not value:
-        return ""
-    decoded_parts = email.header.decode_header(value)
-    result = []
-    for part, charset in decoded_parts:
-        if isinstance(part, bytes):
-            result.append(part.decode(charset or "utf-8", errors="replace"))
-        else:
-            result.append(part)
-    return " ".join(result)
+        return self._retry(_do)
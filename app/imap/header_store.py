@@ -0,0 +1,397 @@
+import itertools
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from typing import Iterable, Optional
+
+from app.imap.cache import HeaderCache, FolderState
+
+# System flags kept as bits; other keywords are rare and kept as strings
+FLAG_BITS = {"\\Seen": 1, "\\Answered": 2, "\\Flagged": 4, "\\Deleted": 8, "\\Draft": 16}
+SEEN = FLAG_BITS["\\Seen"]
+# bytes.translate() table: flag bitmask -> 1 if not \Seen
+_UNSEEN = bytes(0 if mask & SEEN else 1 for mask in range(256))
+
+
+def _split_flags(flags: str) -> tuple[int, str]:
+    """The system flags' bitmask, and `flags` itself if it has keywords."""
+    mask = 0
+    keywords = False
+    for flag in flags.split():
+        bit = FLAG_BITS.get(flag)
+        if bit:
+            mask |= bit
+        else:
+            keywords = True
+    return mask, flags if keywords else ""
+
+
+class HeaderColumns:
+    """One folder's headers as columns, in UID order.
+
+    UIDs, dates (epoch seconds) and flag bitmasks are arrays of machine
+    ints; subjects and senders are interned, so the thousands of messages
+    from one sender or with one subject share a single string. About a
+    quarter of the memory of the same rows as dicts, and filters run as
+    one pass over a column instead of dict lookups per row.
+    """
+
+    def __init__(self):
+        self.uids = array("I")
+        self.dates = array("q")
+        self.flags = array("B")
+        self.subjects: list[str] = []
+        self.senders: list[str] = []
+        self.date_headers: list[str] = []
+        # uid -> all flags, for the few messages with keywords
+        self.keywords: dict[int, str] = {}
+        self._by_date: Optional[array] = None
+        self._distinct_senders: Optional[set[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def _changed(self) -> None:
+        self._by_date = None
+        self._distinct_senders = None
+
+    def _set(self, i: int, row: tuple) -> None:
+        uid, subject, sender, date, date_ts, flags = row
+        mask, extra = _split_flags(flags)
+        self.subjects[i] = sys.intern(subject)
+        self.senders[i] = sys.intern(sender)
+        self.date_headers[i] = date
+        self.dates[i] = date_ts
+        self.flags[i] = mask
+        self._keywords(uid, extra)
+
+    def _keywords(self, uid: int, extra: str) -> None:
+        if extra:
+            self.keywords[uid] = extra
+        else:
+            self.keywords.pop(uid, None)
+
+    def upsert(self, rows: Iterable[tuple]) -> None:
+        """Add or replace (uid, subject, sender, date, date_ts, flags) rows.
+        New mail has the highest UIDs, so this is normally an append."""
+        rows = sorted(rows, key=lambda r: r[0])
+        if rows and (not self.uids or rows[0][0] > self.uids[-1]):
+            self._append(rows)
+            self._changed()
+            return
+        for row in rows:
+            uid = row[0]
+            i = bisect_left(self.uids, uid)
+            if i < len(self.uids) and self.uids[i] == uid:
+                self._set(i, row)
+                continue
+            self.uids.insert(i, uid)
+            self.dates.insert(i, 0)
+            self.flags.insert(i, 0)
+            self.subjects.insert(i, "")
+            self.senders.insert(i, "")
+            self.date_headers.insert(i, "")
+            self._set(i, row)
+        self._changed()
+
+    def _append(self, rows: list[tuple]) -> None:
+        intern = sys.intern
+        for uid, subject, sender, date, date_ts, flags in rows:
+            mask, extra = _split_flags(flags)
+            self.uids.append(uid)
+            self.dates.append(date_ts)
+            self.flags.append(mask)
+            self.subjects.append(intern(subject))
+            self.senders.append(intern(sender))
+            self.date_headers.append(date)
+            if extra:
+                self.keywords[uid] = extra
+
+    def update_flags(self, rows: Iterable[tuple[int, str]]) -> None:
+        for uid, flags in rows:
+            i = bisect_left(self.uids, uid)
+            if i < len(self.uids) and self.uids[i] == uid:
+                mask, extra = _split_flags(flags)
+                self.flags[i] = mask
+                self._keywords(uid, extra)
+
+    def apply(self, change: str, data) -> bool:
+        """Apply one HeaderCache change notification. False for a change
+        the columns can't follow (a reset), after which they are stale."""
+        if change == "upsert":
+            self.upsert(data)
+        elif change == "flags":
+            self.update_flags(data)
+        elif change == "delete":
+            self.delete(data)
+        else:
+            return False
+        return True
+
+    def delete(self, uids: Iterable[int]) -> None:
+        gone = set(uids)
+        if not gone:
+            return
+        keep = [uid not in gone for uid in self.uids]
+        self.uids = array("I", itertools.compress(self.uids, keep))
+        self.dates = array("q", itertools.compress(self.dates, keep))
+        self.flags = array("B", itertools.compress(self.flags, keep))
+        self.subjects = list(itertools.compress(self.subjects, keep))
+        self.senders = list(itertools.compress(self.senders, keep))
+        self.date_headers = list(itertools.compress(self.date_headers, keep))
+        for uid in gone:
+            self.keywords.pop(uid, None)
+        self._changed()
+
+    def _date_order(self) -> array:
+        """Positions sorted by date, equal dates in UID order."""
+        if self._by_date is None:
+            self._by_date = array("I", sorted(range(len(self.uids)), key=self.dates.__getitem__))
+        return self._by_date
+
+    def select(
+        self,
+        unread: bool = False,
+        sender: Optional[str] = None,
+        since: Optional[int] = None,
+        before: Optional[int] = None,
+    ) -> Optional[list[int]]:
+        """Positions of the rows matching every filter, in UID order; None
+        when there are no filters (every row). `sender` matches
+        case-insensitively anywhere in the From header; `since` is
+        inclusive and `before` exclusive, as in IMAP SEARCH.
+
+        Each filter is one C-level pass: a date range is a slice of the
+        date order, unread a byte translation of the flags column, and a
+        sender a set lookup per row after testing each distinct sender once.
+        """
+        positions: Optional[list[int]] = None
+        if since is not None or before is not None:
+            order = self._date_order()
+            date_of = self.dates.__getitem__
+            lo = 0 if since is None else bisect_left(order, since, key=date_of)
+            hi = len(order) if before is None else bisect_left(order, before, key=date_of)
+            positions = sorted(order[lo:hi])
+        if unread:
+            unseen = self.flags.tobytes().translate(_UNSEEN)
+            if positions is None:
+                positions = list(itertools.compress(range(len(self.uids)), unseen))
+            else:
+                positions = list(itertools.compress(positions, map(unseen.__getitem__, positions)))
+        if sender:
+            needle = sender.casefold()
+            if self._distinct_senders is None:
+                self._distinct_senders = set(self.senders)
+            matching = {s for s in self._distinct_senders if needle in s.casefold()}
+            if positions is None:
+                positions = list(itertools.compress(range(len(self.uids)), map(matching.__contains__, self.senders)))
+            else:
+                senders = map(self.senders.__getitem__, positions)
+                positions = list(itertools.compress(positions, map(matching.__contains__, senders)))
+        return positions
+
+    def page(
+        self,
+        positions: Optional[list[int]],
+        limit: int,
+        sort: str = "uid",
+        before_uid: Optional[int] = None,
+        before_date: Optional[tuple[int, int]] = None,
+    ) -> list[int]:
+        """Newest-first positions of one page of `positions` (all rows if
+        None), with the same keyset cursors as HeaderCache.list_headers()."""
+        if sort == "date":
+            if positions is None:
+                ordered = self._date_order()
+            else:
+                # Stable sort: equal dates stay in UID order
+                ordered = sorted(positions, key=self.dates.__getitem__)
+            end = len(ordered)
+            if before_date is not None:
+                end = bisect_left(ordered, tuple(before_date), key=lambda p: (self.dates[p], self.uids[p]))
+        else:
+            ordered = range(len(self.uids)) if positions is None else positions
+            end = len(ordered)
+            if before_uid is not None:
+                end = bisect_left(ordered, before_uid, key=self.uids.__getitem__)
+        return list(ordered[max(0, end - limit):end])[::-1]
+
+    def row(self, i: int) -> dict:
+        """Row `i` shaped like HeaderCache.list_headers() output."""
+        mask = self.flags[i]
+        keywords = self.keywords.get(self.uids[i])
+        if keywords:
+            flags = keywords.split()
+        else:
+            flags = [name for name, bit in FLAG_BITS.items() if mask & bit]
+        return {
+            "uid": str(self.uids[i]),
+            "subject": self.subjects[i],
+            "sender": self.senders[i],
+            "date": self.date_headers[i],
+            "is_read": bool(mask & SEEN),
+            "flags": flags,
+            "date_ts": self.dates[i],
+        }
+
+    def nbytes(self) -> int:
+        """Approximate memory held, counting each distinct string once."""
+        size = sum(a.buffer_info()[1] * a.itemsize for a in (self.uids, self.dates, self.flags))
+        size += sum(sys.getsizeof(c) for c in (self.subjects, self.senders, self.date_headers))
+        distinct = {id(s): s for s in itertools.chain(self.subjects, self.senders)}
+        size += sum(sys.getsizeof(s) for s in distinct.values())
+        size += sum(sys.getsizeof(s) for s in self.date_headers)
+        return size + sys.getsizeof(self.keywords)
+
+
+@dataclass
+class HeaderStoreStats:
+    hits: int = 0
+    loads: int = 0
+    reloads: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class _Load:
+    """A folder being read from SQLite, and the changes notified meanwhile."""
+    done: threading.Event = field(default_factory=threading.Event)
+    changes: list[tuple[str, object]] = field(default_factory=list)
+
+
+class HeaderStore:
+    """In-memory HeaderColumns for the most recently listed folders, in
+    front of HeaderCache.
+
+    A folder is loaded from SQLite on first use and then kept current from
+    HeaderCache's change notifications. Writes from another process (the
+    broker, other API workers) don't notify; they show up as a changed
+    folder state (every sync saves one) and the folder is loaded again.
+
+    Loads run outside the lock, so notifications (which come from the
+    event loop) never wait for one. Changes notified while a folder loads
+    are logged and replayed onto it before it is swapped in; other callers
+    wanting the same folder wait for that load instead of starting their own.
+    """
+
+    def __init__(self, cache: HeaderCache, max_folders: int = 16):
+        self._cache = cache
+        self._max_folders = max_folders
+        self._folders: OrderedDict[tuple[str, str], HeaderColumns] = OrderedDict()
+        # Folder state each loaded folder is current with
+        self._stamps: dict[tuple[str, str], Optional[FolderState]] = {}
+        self._loading: dict[tuple[str, str], _Load] = {}
+        self._lock = threading.Lock()
+        self._stats = HeaderStoreStats()
+        cache.add_listener(self._apply)
+
+    def _apply(self, account: str, folder: str, change: str, data) -> None:
+        key = (account, folder)
+        with self._lock:
+            load = self._loading.get(key)
+            if load is not None:
+                load.changes.append((change, data))
+            columns = self._folders.get(key)
+            if columns is None:
+                return
+            if change == "state":
+                self._stamps[key] = data
+            elif not columns.apply(change, data):
+                self._drop(key)
+
+    def _drop(self, key: tuple[str, str]) -> None:
+        self._folders.pop(key, None)
+        self._stamps.pop(key, None)
+
+    def _columns(self, account: str, folder: str) -> HeaderColumns:
+        key = (account, folder)
+        while True:
+            state = self._cache.folder_state(account, folder)
+            with self._lock:
+                columns = self._folders.get(key)
+                if columns is not None and self._stamps.get(key) == state:
+                    self._folders.move_to_end(key)
+                    self._stats.hits += 1
+                    return columns
+                load = self._loading.get(key)
+                if load is None:
+                    load = self._loading[key] = _Load()
+                    break
+            load.done.wait()
+
+        columns = HeaderColumns()
+        try:
+            for chunk in self._cache.iter_rows(account, folder):
+                columns.upsert(chunk)
+        except BaseException:
+            with self._lock:
+                del self._loading[key]
+            load.done.set()
+            raise
+        with self._lock:
+            del self._loading[key]
+            self._install(key, columns, state, load.changes)
+        load.done.set()
+        return columns
+
+    def _install(
+        self,
+        key: tuple[str, str],
+        columns: HeaderColumns,
+        state: Optional[FolderState],
+        changes: list[tuple[str, object]],
+    ) -> None:
+        # Called with self._lock held
+        for change, data in changes:
+            if change == "state":
+                state = data
+            elif not columns.apply(change, data):
+                # Reset while loading: serve these columns once, load again next time
+                return
+        if key in self._folders:
+            self._stats.reloads += 1
+        self._stats.loads += 1
+        self._folders[key] = columns
+        self._folders.move_to_end(key)
+        self._stamps[key] = state
+        while len(self._folders) > self._max_folders:
+            old, _ = self._folders.popitem(last=False)
+            self._stamps.pop(old, None)
+            self._stats.evictions += 1
+
+    def page(
+        self,
+        account: str,
+        folder: str,
+        limit: int = 50,
+        sort: str = "uid",
+        before_uid: Optional[int] = None,
+        before_date: Optional[tuple[int, int]] = None,
+        unread: bool = False,
+        sender: Optional[str] = None,
+        since: Optional[int] = None,
+        before: Optional[int] = None,
+    ) -> tuple[list[dict], int]:
+        """One newest-first page of the folder's headers matching the
+        filters (see HeaderColumns.select), and how many match in total.
+        Only the page's rows are built."""
+        columns = self._columns(account, folder)
+        with self._lock:
+            positions = columns.select(unread=unread, sender=sender, since=since, before=before)
+            total = len(columns) if positions is None else len(positions)
+            page = columns.page(positions, limit, sort=sort, before_uid=before_uid, before_date=before_date)
+            return [columns.row(i) for i in page], total
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = asdict(self._stats)
+            data.update(
+                folders=len(self._folders),
+                max_folders=self._max_folders,
+                rows=sum(len(c) for c in self._folders.values()),
+                bytes=sum(c.nbytes() for c in self._folders.values()),
+            )
+        return data
@@ -0,0 +1,186 @@
+"""Header decoding for envelope fetches, without the email package's parser.
+
+parse_envelope() reads Subject, From and Date from a HEADER.FIELDS block
+the way email.message_from_bytes(raw).get(name) does (compat32: folded
+lines kept, only the trailing line break stripped), and decode_header()
+turns RFC 2047 encoded words into text exactly like joining
+email.header.decode_header() with spaces. Both keep the stdlib's output
+byte for byte, quirks included; anything outside the plain-ASCII header
+block they are written for (8-bit bytes, mbox "From " lines, malformed
+lines) goes to the stdlib instead.
+"""
+
+import binascii
+import email
+import email.base64mime
+import email.errors
+import email.header
+import email.quoprimime
+import re
+from functools import lru_cache
+from typing import Optional, Union
+
+# email.header.ecre: an encoded word, =?charset?q|b?text?=
+ENCODED_WORD_RE = re.compile(
+    r"=\?(?P<charset>[^?]*?)\?(?P<encoding>[qQbB])\?(?P<encoded>.*?)\?=", re.MULTILINE
+)
+# What email.feedparser accepts as a header line: a field name and colon,
+# or whitespace continuing the previous field
+FIELD_NAME_RE = re.compile(r"[\041-\071\073-\176]+:")
+LINE_RE = re.compile(r"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+")
+
+# Sender strings and subjects repeat across a folder (mailing lists,
+# notifications); encoded words repeat across values
+VALUE_CACHE_SIZE = 8192
+WORD_CACHE_SIZE = 4096
+
+
+def decode_header(value: Union[str, email.header.Header, None]) -> str:
+    """Decode RFC 2047 encoded words, joining the decoded runs with spaces."""
+    if not value:
+        return ""
+    if not isinstance(value, str):
+        # A Header object, which compat32 returns for 8-bit header values
+        return _join(email.header.decode_header(value))
+    if "=?" not in value:
+        return value
+    return _decode_encoded(value)
+
+
+def _join(parts: list) -> str:
+    result = []
+    for part, charset in parts:
+        if isinstance(part, bytes):
+            result.append(part.decode(charset or "utf-8", errors="replace"))
+        else:
+            result.append(part)
+    return " ".join(result)
+
+
+@lru_cache(maxsize=VALUE_CACHE_SIZE)
+def _decode_encoded(value: str) -> str:
+    # The steps of email.header.decode_header, minus its Header handling
+    if not ENCODED_WORD_RE.search(value):
+        return value
+    words = []
+    for line in value.splitlines():
+        parts = ENCODED_WORD_RE.split(line)
+        first = True
+        while parts:
+            unencoded = parts.pop(0)
+            if first:
+                unencoded = unencoded.lstrip()
+                first = False
+            if unencoded:
+                words.append((unencoded, None, None))
+            if parts:
+                charset = parts.pop(0).lower()
+                encoding = parts.pop(0).lower()
+                encoded = parts.pop(0)
+                words.append((encoded, encoding, charset))
+    # Whitespace between two encoded words is dropped
+    droplist = [
+        n - 1 for n, w in enumerate(words)
+        if n > 1 and w[1] and words[n - 2][1] and words[n - 1][0].isspace()
+    ]
+    for n in reversed(droplist):
+        del words[n]
+
+    # Adjacent runs in the same charset are joined: encoded words directly,
+    # unencoded text with a space
+    collapsed = []
+    last_word = last_charset = None
+    for text, encoding, charset in words:
+        word = _decode_word(text, encoding) if encoding else bytes(text, "raw-unicode-escape")
+        if last_word is None:
+            last_word, last_charset = word, charset
+        elif charset != last_charset:
+            collapsed.append((last_word, last_charset))
+            last_word, last_charset = word, charset
+        elif last_charset is None:
+            last_word += b" " + word
+        else:
+            last_word += word
+    collapsed.append((last_word, last_charset))
+    return _join(collapsed)
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _decode_word(encoded: str, encoding: str) -> bytes:
+    if encoding == "q":
+        return bytes(email.quoprimime.header_decode(encoded), "raw-unicode-escape")
+    padding = len(encoded) % 4
+    if padding:
+        encoded += "==="[: 4 - padding]
+    try:
+        return email.base64mime.decode(encoded)
+    except binascii.Error:
+        raise email.errors.HeaderParseError("Base64 decoding error")
+
+
+def header_fields(raw: bytes) -> Optional[dict[str, str]]:
+    """The first value of each field in an ASCII header block, keyed by
+    lower-cased name, as Message.get() returns it. None when the block
+    needs the full parser."""
+    if not raw.isascii():
+        return None
+    fields: dict[str, str] = {}
+    name = None
+    lines: list[str] = []
+    for line in LINE_RE.findall(raw.decode("ascii")):
+        if line[0] in " \t":
+            if name is None:
+                return None
+            lines.append(line)
+            continue
+        if name is not None:
+            fields.setdefault(name, _field_value(lines))
+            name = None
+        match = FIELD_NAME_RE.match(line)
+        if match is None:
+            if line.startswith((":", "From ")):
+                return None
+            # A blank line (or anything else) ends the header block
+            break
+        name = match.group()[:-1].lower()
+        lines = [line]
+    if name is not None:
+        fields.setdefault(name, _field_value(lines))
+    return fields
+
+
+def _field_value(lines: list[str]) -> str:
+    # email._policybase.Compat32.header_source_parse
+    value = lines[0].split(":", 1)[1]
+    return (value.lstrip(" \t") + "".join(lines[1:])).rstrip("\r\n")
+
+
+def parse_envelope(raw: bytes) -> tuple[str, str, str]:
+    """(subject, sender, date) of a SUBJECT/FROM/DATE header block,
+    decoded as parse_header_fetch always has."""
+    fields = header_fields(raw)
+    if fields is None:
+        msg = email.message_from_bytes(raw)
+        return (
+            decode_header(msg.get("Subject", "(No Subject)")),
+            decode_header(msg.get("From", "")),
+            msg.get("Date", ""),
+        )
+    return (
+        decode_header(fields.get("subject", "(No Subject)")),
+        decode_header(fields.get("from", "")),
+        fields.get("date", ""),
+    )
+
+
+def cache_stats() -> dict:
+    values = _decode_encoded.cache_info()
+    words = _decode_word.cache_info()
+    return {
+        "value_hits": values.hits,
+        "value_misses": values.misses,
+        "values": values.currsize,
+        "word_hits": words.hits,
+        "word_misses": words.misses,
+        "words": words.currsize,
+    }
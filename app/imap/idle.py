@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from app.imap.aio import AsyncIMAPClient, AsyncIMAPPool
+from app.imap.cache import HeaderCache
+from app.imap.protocol import IDLE_TIMEOUT, UID_RE, parse_flag_fetch, parse_vanished
+from app.imap.search_cache import SearchCache
+from app.imap.sync import sync_folder
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 5.0
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+@dataclass
+class WatcherStats:
+    connects: int = 0
+    idles: int = 0
+    polls: int = 0
+    events: int = 0
+    errors: int = 0
+
+
+class MailWatcher:
+    """One dedicated connection per watched folder that waits for changes.
+
+    Uses IDLE where the server supports it (re-issued every `idle_timeout`
+    seconds) and NOOP every `poll_interval` seconds otherwise. Untagged
+    FETCH (with UID) and VANISHED responses update the HeaderCache
+    directly; EXISTS, EXPUNGE and UID-less FETCH trigger an incremental
+    sync_folder on the same connection. While IDLE runs, the folder's
+    SearchCache entries are invalidated by these changes instead of being
+    checked with STATUS. Each change is published to subscribers as a dict:
+
+        {"folder", "new": [header dicts], "expunged": [uids],
+         "flags": [{"uid", "flags"}], "total"}
+    """
+
+    def __init__(
+        self,
+        pool: AsyncIMAPPool,
+        cache: HeaderCache,
+        folders: tuple[str, ...] = ("INBOX",),
+        idle_timeout: float = IDLE_TIMEOUT,
+        poll_interval: float = 30.0,
+        search_cache: Optional[SearchCache] = None,
+    ):
+        self._pool = pool
+        self._cache = cache
+        self._folders = folders
+        self._idle_timeout = idle_timeout
+        self._poll_interval = poll_interval
+        self._search_cache = search_cache
+        self._subscribers: set[asyncio.Queue] = set()
+        self._tasks: list[asyncio.Task] = []
+        self._modes: dict[str, str] = {}
+        self._stats = WatcherStats()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._watch(folder)) for folder in self._folders]
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def _publish(self, event: dict) -> None:
+        self._stats.events += 1
+        for queue in self._subscribers:
+            if queue.full():
+                # A stalled subscriber loses its oldest event, not everyone's newest
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def _watch(self, folder: str) -> None:
+        client: Optional[AsyncIMAPClient] = None
+        try:
+            while True:
+                try:
+                    if not self._pool.is_connected:
+                        if client is not None:
+                            await self._close(client, folder)
+                            client = None
+                        await asyncio.sleep(RECONNECT_DELAY)
+                        continue
+                    if client is None or not client.is_connected or client.account != self._pool.account:
+                        if client is not None:
+                            await self._close(client, folder)
+                        client = self._pool.dedicated_client()
+                        await client.connect()
+                        self._stats.connects += 1
+                        self._modes[folder] = "idle" if client.has_capability("IDLE") else "poll"
+                        # Catch up on anything that changed while disconnected
+                        await self._apply(client, folder, {}, catch_up=True)
+                        if client.has_capability("IDLE") and self._search_cache is not None:
+                            # IDLE reports every change, so cached searches need no STATUS check
+                            self._search_cache.watch(client.account, folder)
+
+                    if client.has_capability("IDLE"):
+                        untagged = await client.idle(folder, timeout=self._idle_timeout)
+                        self._stats.idles += 1
+                    else:
+                        await asyncio.sleep(self._poll_interval)
+                        untagged = await client.noop(folder)
+                        self._stats.polls += 1
+                    await self._apply(client, folder, untagged)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._stats.errors += 1
+                    logger.warning("Watching %s failed (%s), reconnecting...", folder, e)
+                    if client is not None:
+                        await self._close(client, folder)
+                        client = None
+                    await asyncio.sleep(RECONNECT_DELAY)
+        finally:
+            if client is not None:
+                await self._close(client, folder)
+
+    async def _close(self, client: AsyncIMAPClient, folder: str) -> None:
+        if self._search_cache is not None:
+            self._search_cache.unwatch(client.account, folder)
+        await client.disconnect()
+
+    async def _apply(
+        self, client: AsyncIMAPClient, folder: str, untagged: dict[str, list], catch_up: bool = False
+    ) -> None:
+        account = client.account
+        if self._search_cache is not None and any(
+            key in untagged for key in ("FETCH", "EXISTS", "EXPUNGE", "VANISHED")
+        ):
+            self._search_cache.invalidate(account, folder)
+        before_max = self._cache.max_uid(account, folder)
+
+        rows = parse_flag_fetch(untagged.get("FETCH", []))
+        # Without QRESYNC, unsolicited FETCH carries only a sequence number
+        seqs = [
+            int(d.split(b" ", 1)[0]) for d in untagged.get("FETCH", [])
+            if isinstance(d, bytes) and not UID_RE.search(d) and d.split(b" ", 1)[0].isdigit()
+        ]
+        if seqs and "EXPUNGE" not in untagged:
+            rows += await client.fetch_seq_flags(seqs, folder=folder)
+        flags = [{"uid": r["uid"], "flags": r["flags"]} for r in rows]
+        if rows:
+            self._cache.update_flags(account, folder, rows)
+        expunged = parse_vanished(untagged.get("VANISHED", []))
+        if expunged:
+            self._cache.delete_uids(account, folder, expunged)
+
+        # Sequence numbers shift under EXPUNGE, so UID-less FETCHes then need a full resync
+        resync = catch_up or "EXISTS" in untagged or "EXPUNGE" in untagged
+        if resync:
+            # EXPUNGE only carries sequence numbers; diff UIDs to report which went
+            known = set(self._cache.uids(account, folder)) if "EXPUNGE" in untagged else None
+            await sync_folder(client, self._cache, folder)
+            if known is not None:
+                expunged += sorted(known - set(self._cache.uids(account, folder)))
+
+        new = []
+        # A first fill of an empty cache is not new mail
+        if before_max and self._cache.max_uid(account, folder) > before_max:
+            new = self._cache.list_headers(account, folder, limit=1000)
+            new = [h for h in new if int(h["uid"]) > before_max]
+        if new or expunged or flags:
+            self._publish({
+                "folder": folder,
+                "new": new,
+                "expunged": [str(uid) for uid in expunged],
+                "flags": flags,
+                "total": self._cache.count(account, folder),
+            })
+
+    def stats(self) -> dict:
+        data = asdict(self._stats)
+        data.update(modes=dict(self._modes), subscribers=len(self._subscribers))
+        return data
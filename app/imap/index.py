@@ -0,0 +1,424 @@
+import asyncio
+import html
+import logging
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+from app.imap.aio import AsyncIMAPClient
+from app.imap.bodystructure import decode_part, parse_bodystructure, select_parts
+from app.imap.cache import HeaderCache, _row_to_header, open_cache_db
+from app.imap.headers import decode_header
+from app.imap.protocol import uid_set_chunks
+from app.imap.search_cache import SearchCache
+from app.imap.sync import FolderLocks, sync_folder
+from app.imap.search import (
+    SearchCriteria,
+    build_imap_search,
+    build_fts_query,
+    has_text_criteria,
+    imap_date_to_ts,
+)
+
+logger = logging.getLogger(__name__)
+
+# Only the start of each body is indexed; that is where the searchable text is
+INDEX_BODY_BYTES = 64 * 1024
+INDEX_BATCH_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS index_folders (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    PRIMARY KEY (account, folder)
+);
+
+CREATE TABLE IF NOT EXISTS index_docs (
+    id INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    UNIQUE (account, folder, uid)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS index_text USING fts5(
+    subject, sender, recipients, body,
+    tokenize = 'porter unicode61'
+);
+"""
+
+# bm25() column weights: subject, sender, recipients, body
+BM25_WEIGHTS = (8.0, 4.0, 2.0, 1.0)
+
+INDEX_STRUCTURE_ITEMS = "(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (TO CC)])"
+
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.I | re.S)
+_SPACE_RE = re.compile(r"\s+")
+
+
+@dataclass
+class IndexDocument:
+    uid: int
+    subject: str
+    sender: str
+    recipients: str
+    body: str
+
+
+@dataclass
+class SearchResult:
+    headers: list[dict]
+    total: int
+    source: str
+    imap_query: str
+    pending: int = 0
+    sources: dict[str, int] = field(default_factory=dict)
+    cached: bool = False
+
+
+class MessageIndex:
+    """SQLite FTS5 index of message text, stored next to the header cache.
+
+    Documents are keyed by (account, folder, uid) and only count for the
+    UIDVALIDITY recorded in `index_folders`. Searches join against the
+    header cache's `headers` table, so they must share its database file;
+    messages expunged from the cache drop out of results immediately.
+    """
+
+    def __init__(self, path: str):
+        self._db = open_cache_db(path, SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def uidvalidity(self, account: str, folder: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uidvalidity FROM index_folders WHERE account = ? AND folder = ?",
+                (account, folder),
+            ).fetchone()
+        return row[0] if row else None
+
+    def reset_folder(self, account: str, folder: str, uidvalidity: int) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM index_text WHERE rowid IN "
+                "(SELECT id FROM index_docs WHERE account = ? AND folder = ?)",
+                (account, folder),
+            )
+            self._db.execute(
+                "DELETE FROM index_docs WHERE account = ? AND folder = ?", (account, folder)
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO index_folders (account, folder, uidvalidity) VALUES (?, ?, ?)",
+                (account, folder, uidvalidity),
+            )
+
+    def add_documents(self, account: str, folder: str, docs: list[IndexDocument]) -> None:
+        with self._lock, self._db:
+            for doc in docs:
+                row = self._db.execute(
+                    "SELECT id FROM index_docs WHERE account = ? AND folder = ? AND uid = ?",
+                    (account, folder, doc.uid),
+                ).fetchone()
+                if row:
+                    self._db.execute("DELETE FROM index_text WHERE rowid = ?", (row[0],))
+                    doc_id = row[0]
+                else:
+                    doc_id = self._db.execute(
+                        "INSERT INTO index_docs (account, folder, uid) VALUES (?, ?, ?)",
+                        (account, folder, doc.uid),
+                    ).lastrowid
+                self._db.execute(
+                    "INSERT INTO index_text (rowid, subject, sender, recipients, body) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, doc.subject, doc.sender, doc.recipients, doc.body),
+                )
+
+    def prune(self, account: str, folder: str) -> int:
+        """Drop documents whose message is no longer in the header cache."""
+        with self._lock, self._db:
+            gone = [
+                r[0] for r in self._db.execute(
+                    "SELECT d.id FROM index_docs d WHERE d.account = ? AND d.folder = ? "
+                    "AND NOT EXISTS (SELECT 1 FROM headers h WHERE h.account = d.account "
+                    "AND h.folder = d.folder AND h.uid = d.uid)",
+                    (account, folder),
+                )
+            ]
+            self._db.executemany("DELETE FROM index_text WHERE rowid = ?", [(i,) for i in gone])
+            self._db.executemany("DELETE FROM index_docs WHERE id = ?", [(i,) for i in gone])
+        return len(gone)
+
+    def unindexed_uids(self, account: str, folder: str, limit: Optional[int] = None) -> list[int]:
+        """Cached UIDs with no index document yet, newest first."""
+        sql = (
+            "SELECT h.uid FROM headers h WHERE h.account = ? AND h.folder = ? "
+            "AND NOT EXISTS (SELECT 1 FROM index_docs d WHERE d.account = h.account "
+            "AND d.folder = h.folder AND d.uid = h.uid) ORDER BY h.uid DESC"
+        )
+        params: list = [account, folder]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [r[0] for r in self._db.execute(sql, params)]
+
+    def search(
+        self, account: str, folder: str, criteria: SearchCriteria, limit: int = 20
+    ) -> tuple[list[dict], int]:
+        """BM25-ranked matches among indexed messages, plus the total match count."""
+        where = ["index_text MATCH ?", "d.account = ?", "d.folder = ?"]
+        params: list = [build_fts_query(criteria), account, folder]
+        if criteria.since:
+            where.append("h.date_ts >= ?")
+            params.append(imap_date_to_ts(criteria.since))
+        if criteria.before:
+            where.append("h.date_ts < ?")
+            params.append(imap_date_to_ts(criteria.before))
+        flag_filters = []
+        if criteria.unseen is not None:
+            flag_filters.append(("\\Seen", not criteria.unseen))
+        if criteria.flagged is not None:
+            flag_filters.append(("\\Flagged", criteria.flagged))
+        for flag, present in flag_filters:
+            where.append(f"(' ' || h.flags || ' ') {'' if present else 'NOT '}LIKE ?")
+            params.append(f"% {flag} %")
+
+        # CROSS JOIN pins the FTS table as the outer loop; otherwise SQLite
+        # may re-run the MATCH once per candidate row
+        joins = (
+            "FROM index_text CROSS JOIN index_docs d ON d.id = index_text.rowid "
+            "CROSS JOIN headers h ON h.account = d.account AND h.folder = d.folder AND h.uid = d.uid "
+            "WHERE " + " AND ".join(where)
+        )
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) {joins}", params).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT h.uid, h.subject, h.sender, h.date, h.flags, h.modseq, h.date_ts, "
+                f"bm25(index_text, {weights}) AS score {joins} ORDER BY score LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        headers = []
+        for row in rows:
+            header = _row_to_header(row[:7])
+            header["score"] = -row[7]
+            headers.append(header)
+        return headers, total
+
+
+_index_locks = FolderLocks()
+
+
+async def index_folder(
+    imap: AsyncIMAPClient,
+    cache: HeaderCache,
+    index: MessageIndex,
+    folder: str = "INBOX",
+    batch_size: int = INDEX_BATCH_SIZE,
+    max_messages: Optional[int] = None,
+) -> int:
+    """Index cached messages that have no document yet, newest first.
+
+    Each batch costs two pipelined FETCHes: BODYSTRUCTURE plus To/Cc for
+    every message, then the first INDEX_BODY_BYTES of the chosen text part,
+    grouped by section number so most batches need only one or two
+    commands. Returns the number of messages indexed; a call while another
+    is running for the same folder returns 0 immediately.
+    """
+    account = imap.account
+    if _index_locks.locked(account, folder):
+        return 0
+    async with _index_locks.hold(account, folder):
+        state = cache.folder_state(account, folder)
+        if state is None:
+            return 0
+        if index.uidvalidity(account, folder) != state.uidvalidity:
+            await asyncio.to_thread(index.reset_folder, account, folder, state.uidvalidity)
+        else:
+            await asyncio.to_thread(index.prune, account, folder)
+
+        indexed = 0
+        while max_messages is None or indexed < max_messages:
+            limit = batch_size if max_messages is None else min(batch_size, max_messages - indexed)
+            uids = await asyncio.to_thread(index.unindexed_uids, account, folder, limit)
+            if not uids:
+                break
+            docs = await _fetch_documents(imap, cache, account, folder, uids)
+            # Messages that vanished meanwhile still get an empty document so
+            # they are not retried forever; prune() drops them later
+            found = {d.uid for d in docs}
+            docs += [IndexDocument(uid, "", "", "", "") for uid in uids if uid not in found]
+            await asyncio.to_thread(index.add_documents, account, folder, docs)
+            indexed += len(uids)
+        if indexed:
+            logger.info("Indexed %d messages in %s", indexed, folder)
+        return indexed
+
+
+async def _fetch_documents(
+    imap: AsyncIMAPClient, cache: HeaderCache, account: str, folder: str, uids: list[int]
+) -> list[IndexDocument]:
+    items = await imap.fetch_items(uids, INDEX_STRUCTURE_ITEMS, folder=folder)
+
+    # Pick the text part to index for each message: plain text, else HTML
+    chosen = {}
+    by_section: dict[str, list[int]] = {}
+    for uid, item in items.items():
+        structure = item.get("BODYSTRUCTURE")
+        if not isinstance(structure, list):
+            continue
+        plain, html_part, _ = select_parts(parse_bodystructure(structure))
+        part = plain or html_part
+        if part is not None:
+            chosen[uid] = part
+            by_section.setdefault(part.section, []).append(uid)
+
+    bodies = await asyncio.gather(*(
+        imap.fetch_items(
+            section_uids, f"(UID BODY.PEEK[{section}]<0.{INDEX_BODY_BYTES}>)", folder=folder
+        )
+        for section, section_uids in by_section.items()
+    ))
+    raw_bodies = {}
+    for section, result in zip(by_section, bodies):
+        prefix = f"BODY[{section}]"
+        for uid, item in result.items():
+            raw_bodies[uid] = next((v for k, v in item.items() if k.startswith(prefix) and v), b"")
+
+    headers = {int(h["uid"]): h for h in cache.get_headers(account, folder, list(items))}
+    docs = []
+    for uid, item in items.items():
+        part = chosen.get(uid)
+        body = ""
+        if part is not None and raw_bodies.get(uid):
+            body = decode_part(part, raw_bodies[uid])
+            if part.content_type == "text/html":
+                body = html_to_text(body)
+        recipients = decode_header(
+            (item.get("BODY[HEADER.FIELDS (TO CC)]") or b"").decode("utf-8", errors="replace")
+        )
+        header = headers.get(uid, {})
+        docs.append(IndexDocument(
+            uid=uid,
+            subject=header.get("subject", ""),
+            sender=header.get("sender", ""),
+            recipients=recipients,
+            body=_SPACE_RE.sub(" ", body).strip(),
+        ))
+    return docs
+
+
+def html_to_text(value: str) -> str:
+    return html.unescape(_TAG_RE.sub(" ", value))
+
+
+async def search_folder(
+    imap: AsyncIMAPClient,
+    cache: Optional[HeaderCache],
+    index: Optional[MessageIndex],
+    criteria: SearchCriteria,
+    folder: str = "INBOX",
+    limit: int = 20,
+    max_lag: int = 500,
+    sync_interval: float = 0,
+    search_cache: Optional[SearchCache] = None,
+) -> SearchResult:
+    """Answer a search from the local index when it covers the folder.
+
+    The index is used when the criteria contain text to match, the folder's
+    header cache has been synced (it is brought up to date here, subject to
+    `sync_interval`) and at most `max_lag` cached messages are still waiting
+    to be indexed. Those stragglers are searched on the server with a
+    UID-restricted SEARCH, so no message is skipped. Every returned header
+    carries "source": "index" or "server". Server searches go through
+    `search_cache` when given.
+
+    Index matches approximate IMAP SEARCH rather than reproduce it:
+    - text matches whole words by prefix after porter stemming, where IMAP
+      matches any substring ("port" finds "ports" and "porting" but not
+      "report");
+    - BODY only sees the first INDEX_BODY_BYTES of one text part per
+      message (plain text, else HTML), not the rest or other parts;
+    - TO also matches Cc, which is indexed in the same column;
+    - SINCE/BEFORE compare the Date header, not INTERNALDATE.
+    """
+    imap_query = build_imap_search(criteria)
+    account = imap.account
+    state = cache.folder_state(account, folder) if cache is not None else None
+    if index is not None and has_text_criteria(criteria) and state is not None and state.synced_at:
+        state = await sync_folder(imap, cache, folder, max_age=sync_interval)
+        if index.uidvalidity(account, folder) == state.uidvalidity:
+            pending = await asyncio.to_thread(index.unindexed_uids, account, folder, max_lag + 1)
+            if len(pending) <= max_lag:
+                try:
+                    return await _search_hybrid(
+                        imap, index, account, folder, criteria, imap_query, limit, pending
+                    )
+                except sqlite3.OperationalError as e:
+                    # e.g. a value FTS5 cannot turn into a query; IMAP can still try
+                    logger.info("Index search failed (%s), asking the server", e)
+
+    async def _server_search() -> SearchResult:
+        page = await imap.search_page(imap_query, folder=folder, limit=limit)
+        headers = await imap.fetch_headers(page.uids, limit=limit, folder=folder)
+        for h in headers:
+            h["source"] = "server"
+        return SearchResult(
+            headers=headers, total=page.total, source="server", imap_query=imap_query,
+            sources={"server": len(headers)},
+        )
+
+    if search_cache is None:
+        return await _server_search()
+    result, cached = await search_cache.get_or_search(
+        imap, folder, imap_query, _server_search, variant=f"limit={limit}"
+    )
+    return replace(result, cached=cached)
+
+
+async def _search_hybrid(
+    imap: AsyncIMAPClient,
+    index: MessageIndex,
+    account: str,
+    folder: str,
+    criteria: SearchCriteria,
+    imap_query: str,
+    limit: int,
+    pending: list[int],
+) -> SearchResult:
+    ranked, total = await asyncio.to_thread(index.search, account, folder, criteria, limit)
+    for h in ranked:
+        h["source"] = "index"
+
+    recent = []
+    if pending:
+        tails = await asyncio.gather(*(
+            imap.search(f"UID {uid_set} {imap_query}", folder=folder)
+            for uid_set in uid_set_chunks(pending, len(pending))
+        ))
+        tail_uids = sorted((u for uids in tails for u in uids), key=int)
+        recent = await imap.fetch_headers(tail_uids, limit=limit, folder=folder)
+        for h in recent:
+            h["source"] = "server"
+        total += len(tail_uids)
+
+    # Not-yet-indexed matches are the newest mail; they come first, unranked
+    headers = (recent + ranked)[:limit]
+    sources = {}
+    for h in headers:
+        sources[h["source"]] = sources.get(h["source"], 0) + 1
+    return SearchResult(
+        headers=headers,
+        total=total,
+        source="index" if not recent else "index+server",
+        imap_query=imap_query,
+        pending=len(pending),
+        sources=sources,
+    )
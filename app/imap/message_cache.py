@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Optional
+
+from app.imap.cache import open_cache_db
+from app.imap.parser import ParsedEmail
+
+
+def message_key(account: str, folder: str, uidvalidity: int, uid) -> str:
+    """Identity of a message's content.
+
+    IMAP messages are immutable and UIDs are never reused within a
+    UIDVALIDITY, so account/folder/UIDVALIDITY/UID always names the same bytes.
+    """
+    return f"{account}/{folder}/{uidvalidity}/{uid}"
+
+
+def message_size(parsed: ParsedEmail) -> int:
+    """Rough bytes held by a parsed message: its text plus a fixed overhead."""
+    text = parsed.body_plain, parsed.body_html, parsed.subject, parsed.sender, *parsed.to, *parsed.cc
+    return 1024 + sum(len(t) for t in text) + 200 * len(parsed.attachments)
+
+
+@dataclass
+class MessageCacheStats:
+    hits: int = 0
+    misses: int = 0
+    joined: int = 0
+    evictions: int = 0
+
+
+class MessageCache:
+    """In-memory LRU of parsed messages, shared by every route that reads one.
+
+    Keys are account/folder/UIDVALIDITY/UID refs, which always name the
+    same message content. Concurrent requests for a message that is still
+    being fetched wait on that fetch instead of starting another, so
+    opening an email and summarizing it costs one download and one parse.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, ParsedEmail] = OrderedDict()
+        self._bytes = 0
+        self._pending: dict[str, asyncio.Task] = {}
+        self._stats = MessageCacheStats()
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the cached messages (message_size)."""
+        return self._bytes
+
+    def peek(self, ref: str) -> Optional[ParsedEmail]:
+        """A cached message without counting a hit or refreshing its LRU position."""
+        return self._entries.get(ref)
+
+    def _lookup(self, ref: str) -> Optional[ParsedEmail]:
+        parsed = self._entries.get(ref)
+        if parsed is not None:
+            self._entries.move_to_end(ref)
+        return parsed
+
+    async def get(self, ref: str, load: Callable[[], Awaitable[ParsedEmail]]) -> ParsedEmail:
+        parsed = self._lookup(ref)
+        if parsed is not None:
+            self._stats.hits += 1
+            return parsed
+
+        task = self._pending.get(ref)
+        if task is None:
+            self._stats.misses += 1
+            # A task of its own, so one caller disconnecting doesn't cancel
+            # the fetch for everyone else waiting on it
+            task = asyncio.ensure_future(self._load(ref, load))
+            self._pending[ref] = task
+        else:
+            self._stats.joined += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, ref: str, load: Callable[[], Awaitable[ParsedEmail]]) -> ParsedEmail:
+        try:
+            parsed = await load()
+        finally:
+            del self._pending[ref]
+        self._put(ref, parsed)
+        return parsed
+
+    def _put(self, ref: str, parsed: ParsedEmail) -> None:
+        if self._max_entries <= 0:
+            return
+        old = self._entries.get(ref)
+        if old is not None:
+            self._bytes -= message_size(old)
+        self._entries[ref] = parsed
+        self._entries.move_to_end(ref)
+        self._bytes += message_size(parsed)
+        while len(self._entries) > self._max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= message_size(evicted)
+            self._stats.evictions += 1
+
+    def stats(self) -> dict:
+        data = asdict(self._stats)
+        data.update(size=len(self._entries), max_entries=self._max_entries, bytes=self._bytes)
+        return data
+
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_cache (
+    ref TEXT PRIMARY KEY,
+    account TEXT NOT NULL,
+    message TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS message_cache_lru ON message_cache (account, used_at);
+"""
+
+# A hit only rewrites used_at when it is older than this, so reads from
+# many processes don't all queue up for the write lock
+TOUCH_INTERVAL = 60.0
+
+
+class SharedMessageCache(MessageCache):
+    """MessageCache kept in the cache database instead of process memory,
+    so API workers and the broker (whose prefetch fills it) share parsed
+    messages. Each account keeps its `max_entries` most recently used;
+    concurrent loads are still joined within a process.
+    """
+
+    def __init__(self, path: str, max_entries: int = 128):
+        super().__init__(max_entries)
+        self._db = open_cache_db(path, SHARED_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @property
+    def nbytes(self) -> int:
+        """Nothing is held in memory."""
+        return 0
+
+    def peek(self, ref: str) -> Optional[ParsedEmail]:
+        with self._lock:
+            row = self._db.execute("SELECT message FROM message_cache WHERE ref = ?", (ref,)).fetchone()
+        return ParsedEmail(**json.loads(row[0])) if row else None
+
+    def _lookup(self, ref: str) -> Optional[ParsedEmail]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT message, used_at FROM message_cache WHERE ref = ?", (ref,)
+            ).fetchone()
+            if row and now - row[1] > TOUCH_INTERVAL:
+                with self._db:
+                    self._db.execute("UPDATE message_cache SET used_at = ? WHERE ref = ?", (now, ref))
+        return ParsedEmail(**json.loads(row[0])) if row else None
+
+    def _put(self, ref: str, parsed: ParsedEmail) -> None:
+        if self._max_entries <= 0:
+            return
+        account = ref.split("/", 1)[0]
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO message_cache (ref, account, message, used_at) VALUES (?, ?, ?, ?)",
+                (ref, account, json.dumps(asdict(parsed)), time.time()),
+            )
+            evicted = self._db.execute(
+                "DELETE FROM message_cache WHERE account = ? AND ref NOT IN ("
+                "SELECT ref FROM message_cache WHERE account = ? ORDER BY used_at DESC LIMIT ?)",
+                (account, account, self._max_entries),
+            ).rowcount
+        self._stats.evictions += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM message_cache").fetchone()[0]
+        data = asdict(self._stats)
+        data.update(size=size, max_entries=self._max_entries, shared=True)
+        return data
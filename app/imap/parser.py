@@ -1,10 +1,12 @@
 import email
-import email.header
 import email.utils
 from email.message import EmailMessage
 from dataclasses import dataclass, field
 from datetime import datetime
 
+from app.imap.bodystructure import BodyPart, select_parts, decode_part
+from app.imap.headers import decode_header
+
 
 @dataclass
 class ParsedEmail:
@@ -21,8 +23,8 @@ class ParsedEmail:
 
 
 def parse_email(uid: str, msg: EmailMessage, flags: list[str] = None) -> ParsedEmail:
-    subject = _decode_header(msg.get("Subject", "(No Subject)"))
-    sender = _decode_header(msg.get("From", ""))
+    subject = decode_header(msg.get("Subject", "(No Subject)"))
+    sender = decode_header(msg.get("From", ""))
     to = _decode_address_list(msg.get("To", ""))
     cc = _decode_address_list(msg.get("Cc", ""))
     date = _parse_date(msg.get("Date", ""))
@@ -77,23 +79,50 @@ def parse_email(uid: str, msg: EmailMessage, flags: list[str] = None) -> ParsedE
     )
 
 
-def _decode_header(value: str) -> str:
-    if not value:
-        return ""
-    decoded_parts = email.header.decode_header(value)
-    result = []
-    for part, charset in decoded_parts:
-        if isinstance(part, bytes):
-            result.append(part.decode(charset or "utf-8", errors="replace"))
-        else:
-            result.append(part)
-    return " ".join(result)
+def parse_structured_email(
+    uid: str,
+    header: bytes,
+    structure: BodyPart,
+    sections: dict[str, bytes],
+    flags: list[str] = None,
+) -> ParsedEmail:
+    """Build a ParsedEmail from the header block, BODYSTRUCTURE and fetched text parts.
+
+    `sections` maps section numbers to raw (still transfer-encoded) payloads;
+    only the parts chosen by select_parts need to be present. Attachment
+    sizes come from the structure, so attachments are never downloaded.
+    """
+    msg = email.message_from_bytes(header or b"")
+    plain, html, attachment_parts = select_parts(structure)
+    body_plain = decode_part(plain, sections[plain.section]) if plain and sections.get(plain.section) else ""
+    body_html = decode_part(html, sections[html.section]) if html and sections.get(html.section) else ""
+
+    return ParsedEmail(
+        uid=uid,
+        subject=decode_header(msg.get("Subject", "(No Subject)")),
+        sender=decode_header(msg.get("From", "")),
+        to=_decode_address_list(msg.get("To", "")),
+        cc=_decode_address_list(msg.get("Cc", "")),
+        date=_parse_date(msg.get("Date", "")),
+        body_plain=body_plain,
+        body_html=body_html,
+        attachments=[
+            {
+                "filename": part.filename,
+                "content_type": part.content_type,
+                "size": part.decoded_size,
+                "part": part.section,
+            }
+            for part in attachment_parts
+        ],
+        flags=flags or [],
+    )
 
 
 def _decode_address_list(value: str) -> list[str]:
     if not value:
         return []
-    return [_decode_header(addr.strip()) for addr in value.split(",") if addr.strip()]
+    return [decode_header(addr.strip()) for addr in value.split(",") if addr.strip()]
 
 
 def _parse_date(value: str) -> str:
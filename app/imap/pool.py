@@ -0,0 +1,210 @@
+import imaplib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Iterator, Optional
+
+from app.imap.client import IMAPClient
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout."""
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    affinity_hits: int = 0
+    waits: int = 0
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+    exhausted: int = 0
+    timeouts: int = 0
+    created: int = 0
+    discarded: int = 0
+
+    def record_wait(self, waited: float) -> None:
+        self.waits += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+
+
+class IMAPPool:
+    """Bounded pool of authenticated IMAPClient connections.
+
+    Each connection is used by one request at a time. Checkout prefers an idle
+    connection that already has the requested folder selected, so consecutive
+    requests for the same folder skip the SELECT round-trip.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        max_size: int = 4,
+        checkout_timeout: float = 30.0,
+        fetch_chunk_size: int = 200,
+        client_class: type[IMAPClient] = IMAPClient,
+    ):
+        self._host = host
+        self._port = port
+        self._user = user
+        self._password = password
+        self._max_size = max_size
+        self._checkout_timeout = checkout_timeout
+        self._fetch_chunk_size = fetch_chunk_size
+        self._client_class = client_class
+
+        self._cond = threading.Condition()
+        self._idle: list[IMAPClient] = []
+        self._in_use: set[int] = set()
+        self._size = 0
+        self._generation = 0
+        self._generations: dict[int, int] = {}
+        self._connected = False
+        self._stats = PoolStats()
+
+    @property
+    def user(self) -> str:
+        return self._user
+
+    @property
+    def account(self) -> str:
+        return f"{self._user}@{self._host}"
+
+    @property
+    def is_connected(self) -> bool:
+        """True once credentials have been verified; dead sockets are healed on checkout."""
+        return self._connected
+
+    def connect(self) -> None:
+        """Open one connection to validate credentials and keep it warm in the pool."""
+        client = self._new_client()
+        client.connect()
+        with self._cond:
+            self._size += 1
+            self._stats.created += 1
+            self._generations[id(client)] = self._generation
+            self._idle.append(client)
+            self._connected = True
+            self._cond.notify()
+
+    def reconfigure(self, host: str, port: int, user: str, password: str) -> None:
+        """Switch credentials. Idle connections close now, busy ones on checkin."""
+        with self._cond:
+            self._host, self._port, self._user, self._password = host, port, user, password
+            self._generation += 1
+            self._connected = False
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for client in idle:
+            self._generations.pop(id(client), None)
+            client.disconnect()
+
+    def close(self) -> None:
+        self.reconfigure(self._host, self._port, self._user, self._password)
+
+    def _new_client(self) -> IMAPClient:
+        return self._client_class(
+            host=self._host,
+            port=self._port,
+            user=self._user,
+            password=self._password,
+            fetch_chunk_size=self._fetch_chunk_size,
+        )
+
+    def checkout(self, folder: Optional[str] = None, timeout: Optional[float] = None) -> IMAPClient:
+        timeout = self._checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                client = self._take_idle(folder)
+                if client is not None:
+                    break
+                if self._size < self._max_size:
+                    self._size += 1
+                    self._stats.created += 1
+                    client = self._new_client()
+                    self._generations[id(client)] = self._generation
+                    break
+                if not waited:
+                    self._stats.exhausted += 1
+                    waited = True
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats.timeouts += 1
+                    raise PoolTimeout(f"No IMAP connection available after {timeout:.0f}s")
+                self._cond.wait(remaining)
+
+            self._in_use.add(id(client))
+            self._stats.checkouts += 1
+            if waited:
+                self._stats.record_wait(time.monotonic() - start)
+
+        try:
+            # Reuses the client's own staleness check: NOOP only if idle > 5 min
+            if not client.is_connected:
+                client.connect()
+        except Exception:
+            self.checkin(client, discard=True)
+            raise
+        return client
+
+    def _take_idle(self, folder: Optional[str]) -> Optional[IMAPClient]:
+        if not self._idle:
+            return None
+        if folder is not None:
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i]._selected_folder == folder:
+                    self._stats.affinity_hits += 1
+                    return self._idle.pop(i)
+        return self._idle.pop()
+
+    def checkin(self, client: IMAPClient, discard: bool = False) -> None:
+        with self._cond:
+            self._in_use.discard(id(client))
+            stale = self._generations.get(id(client)) != self._generation
+            if discard or stale:
+                self._size -= 1
+                self._stats.discarded += 1
+                self._generations.pop(id(client), None)
+            else:
+                self._idle.append(client)
+            self._cond.notify()
+        if discard or stale:
+            client.disconnect()
+
+    @contextmanager
+    def connection(self, folder: Optional[str] = None) -> Iterator[IMAPClient]:
+        client = self.checkout(folder)
+        try:
+            yield client
+        except (imaplib.IMAP4.error, OSError):
+            # The connection may be mid-response; don't hand it to someone else
+            self.checkin(client, discard=True)
+            raise
+        except BaseException:
+            self.checkin(client)
+            raise
+        else:
+            self.checkin(client)
+
+    def stats(self) -> dict:
+        with self._cond:
+            data = asdict(self._stats)
+            data.update(
+                size=self._size,
+                max_size=self._max_size,
+                idle=len(self._idle),
+                in_use=len(self._in_use),
+                wait_time_avg=(self._stats.wait_time_total / self._stats.waits) if self._stats.waits else 0.0,
+            )
+        return data
@@ -0,0 +1,390 @@
+"""IMAP response parsing shared by IMAPClient and AsyncIMAPClient.
+
+Both clients hand these helpers untagged response data in imaplib's shape:
+a list of bytes lines and (prefix, literal) tuples.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from app.imap.headers import parse_envelope
+
+HEADER_ITEMS = "(UID FLAGS BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])"
+HEADER_ITEMS_MODSEQ = "(UID FLAGS MODSEQ BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])"
+STRUCTURE_ITEMS = "(UID FLAGS BODYSTRUCTURE BODY.PEEK[HEADER])"
+# BODY.PEEK[] rather than RFC822, which would set \Seen as a side effect
+MESSAGE_ITEMS = "(UID FLAGS INTERNALDATE RFC822.SIZE BODY.PEEK[])"
+
+# Attachment downloads are fetched in pieces of this size with BODY.PEEK[n]<offset.length>
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Re-issue IDLE well before the 30-minute inactivity logout RFC 2177 allows
+IDLE_TIMEOUT = 25 * 60
+
+# Keep UID sets well under the ~8000 octet command line limit most servers enforce
+MAX_UID_SET_LENGTH = 1000
+
+UID_RE = re.compile(rb"UID (\d+)")
+FLAGS_RE = re.compile(rb"FLAGS \(([^)]*)\)")
+MODSEQ_RE = re.compile(rb"MODSEQ \((\d+)\)")
+STATUS_ITEM_RE = re.compile(rb"([A-Z]+) (\d+)")
+THREAD_TOKEN_RE = re.compile(rb"[()]|\d+")
+ESEARCH_NUM_RE = re.compile(rb"\b(COUNT|MIN|MAX) (\d+)")
+ESEARCH_ALL_RE = re.compile(rb"\bALL (\S+)")
+ESEARCH_PARTIAL_RE = re.compile(rb"\bPARTIAL \(\S+ ([^)]*)\)")
+LITERAL_MARKER_RE = re.compile(rb"\{(\d+)\}$")
+# Atoms may carry a bracketed section with spaces, e.g. BODY[HEADER.FIELDS (FROM)]<0>
+FETCH_TOKEN_RE = re.compile(
+    rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"\[]+\[[^\]]*\](?:<[\d.]+>)?|[^\s()"]+'
+)
+
+
+@dataclass
+class FolderStatus:
+    messages: int
+    uidnext: int
+    uidvalidity: int
+    highestmodseq: int = 0
+
+
+@dataclass
+class FetchedMessage:
+    """A whole message plus its metadata, from one MESSAGE_ITEMS fetch."""
+    uid: str
+    raw: bytes
+    flags: list[str]
+    internaldate: str = ""
+    size: int = 0
+
+
+@dataclass
+class SearchPage:
+    """One page of search results plus the total match count.
+
+    `uids` follows the same convention as a plain SEARCH result: oldest
+    first, so the newest message is last.
+    """
+    total: int
+    uids: list[bytes]
+    min_uid: int = 0
+    max_uid: int = 0
+
+
+def uid_set_chunks(uids: list, chunk_size: int) -> list[str]:
+    """Split UIDs into compressed UID set strings (e.g. ``1:200,305``).
+
+    Each chunk holds at most `chunk_size` UIDs and stays under
+    MAX_UID_SET_LENGTH characters.
+    """
+    numbers = sorted({int(u) for u in uids})
+    chunks = []
+    for i in range(0, len(numbers), max(chunk_size, 1)):
+        parts = []
+        length = 0
+        for start, end in _uid_runs(numbers[i : i + chunk_size]):
+            part = str(start) if start == end else f"{start}:{end}"
+            if parts and length + len(part) + 1 > MAX_UID_SET_LENGTH:
+                chunks.append(",".join(parts))
+                parts, length = [], 0
+            parts.append(part)
+            length += len(part) + 1
+        if parts:
+            chunks.append(",".join(parts))
+    return chunks
+
+
+def expand_uid_set(spec: str, keep_order: bool = False) -> list[int]:
+    """Expand a UID set like ``3:5,9`` into [3, 4, 5, 9].
+
+    With keep_order=True a descending range like ``9:7`` expands to
+    [9, 8, 7]; ESORT uses that form to return sorted results compactly.
+    """
+    uids = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            start, end = (int(p) for p in part.split(":"))
+            if not keep_order or start <= end:
+                start, end = min(start, end), max(start, end)
+                uids.extend(range(start, end + 1))
+            else:
+                uids.extend(range(start, end - 1, -1))
+        else:
+            uids.append(int(part))
+    return uids
+
+
+def quote_string(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def quote_mailbox(name: str) -> str:
+    if name.startswith('"'):
+        return name
+    return quote_string(name)
+
+
+def _uid_runs(numbers: list[int]) -> list[tuple[int, int]]:
+    """Collapse sorted UIDs into (start, end) runs of consecutive values."""
+    runs = []
+    for n in numbers:
+        if runs and n == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], n)
+        else:
+            runs.append((n, n))
+    return runs
+
+
+def split_fetch_response(data: list) -> list[tuple[bytes, bytes]]:
+    """Group an imaplib multi-message FETCH response into (metadata, literal) pairs.
+
+    imaplib returns each message as a (prefix, literal) tuple followed by a
+    bytes trailer holding whatever came after the literal (usually just ``)``,
+    sometimes ``FLAGS (...))``). Trailers are folded into the metadata; a
+    message is complete once its parentheses balance.
+    """
+    messages = []
+    depth = 0
+    for item in data or []:
+        if isinstance(item, tuple):
+            meta, literal = item[0], item[1]
+        elif isinstance(item, bytes):
+            meta, literal = item, b""
+        else:
+            continue
+        if depth > 0 and messages:
+            messages[-1][0] += meta
+            if literal:
+                messages[-1][1] += literal
+        else:
+            messages.append([meta, literal])
+            depth = 0
+        depth += _paren_depth(meta)
+    return [(meta, literal) for meta, literal in messages]
+
+
+def _paren_depth(line: bytes) -> int:
+    """Net parenthesis depth of a response line, ignoring quoted strings."""
+    depth = 0
+    in_quote = False
+    escaped = False
+    for ch in line:
+        if in_quote:
+            if escaped:
+                escaped = False
+            elif ch == 0x5C:  # backslash
+                escaped = True
+            elif ch == 0x22:  # double quote
+                in_quote = False
+        elif ch == 0x22:
+            in_quote = True
+        elif ch == 0x28:
+            depth += 1
+        elif ch == 0x29:
+            depth -= 1
+    return depth
+
+
+def parse_fetch_items(data: list) -> list[dict]:
+    """Parse a FETCH response into one {item name: value} dict per message.
+
+    Unlike split_fetch_response this keeps every literal attached to its
+    item, so a single response can carry BODYSTRUCTURE (which may itself
+    contain literals) and several BODY[section] payloads. Parenthesized
+    values become nested lists, NIL becomes None, everything else bytes.
+    """
+    messages = []
+    for pieces in _group_fetch_pieces(data):
+        tokens = []
+        for text, literal in pieces:
+            if literal is not None:
+                text = LITERAL_MARKER_RE.sub(b"", text.rstrip())
+            tokens.extend(FETCH_TOKEN_RE.findall(text))
+            if literal is not None:
+                tokens.append(_Literal(literal))
+        values = _nest_tokens(tokens)
+        # values is [seq, [NAME, value, NAME, value, ...]]
+        inner = next((v for v in values if isinstance(v, list)), [])
+        messages.append({
+            inner[i].decode().upper(): inner[i + 1]
+            for i in range(0, len(inner) - 1, 2)
+            if isinstance(inner[i], bytes)
+        })
+    return messages
+
+
+class _Literal(bytes):
+    """Marks literal payloads so they are never mistaken for parens or NIL."""
+
+
+def _group_fetch_pieces(data: list) -> list[list[tuple[bytes, Optional[bytes]]]]:
+    groups = []
+    depth = 0
+    for item in data or []:
+        if isinstance(item, tuple):
+            piece = (item[0], item[1])
+        elif isinstance(item, bytes):
+            piece = (item, None)
+        else:
+            continue
+        if depth > 0 and groups:
+            groups[-1].append(piece)
+        else:
+            groups.append([piece])
+            depth = 0
+        depth += _paren_depth(piece[0])
+    return groups
+
+
+def _nest_tokens(tokens: list[bytes]) -> list:
+    stack: list[list] = [[]]
+    for tok in tokens:
+        if isinstance(tok, _Literal):
+            stack[-1].append(bytes(tok))
+        elif tok == b"(":
+            stack.append([])
+        elif tok == b")":
+            if len(stack) > 1:
+                inner = stack.pop()
+                stack[-1].append(inner)
+        elif tok.startswith(b'"'):
+            stack[-1].append(re.sub(rb"\\(.)", rb"\1", tok[1:-1]))
+        elif tok.upper() == b"NIL":
+            stack[-1].append(None)
+        else:
+            stack[-1].append(tok)
+    while len(stack) > 1:
+        inner = stack.pop()
+        stack[-1].append(inner)
+    return stack[0]
+
+
+def parse_header_fetch(data: list) -> list[dict]:
+    rows = []
+    for meta, raw_header in split_fetch_response(data):
+        uid_match = UID_RE.search(meta)
+        if not uid_match:
+            continue
+        flags_match = FLAGS_RE.search(meta)
+        flags = flags_match.group(1).decode("utf-8", errors="replace").split() if flags_match else []
+        modseq_match = MODSEQ_RE.search(meta)
+        subject, sender, date = parse_envelope(raw_header or b"")
+        rows.append({
+            "uid": uid_match.group(1).decode(),
+            "subject": subject,
+            "sender": sender,
+            "date": date,
+            "is_read": "\\Seen" in flags,
+            "flags": flags,
+            "modseq": int(modseq_match.group(1)) if modseq_match else None,
+        })
+    return rows
+
+
+def parse_flag_fetch(data: list) -> list[dict]:
+    rows = []
+    for meta, _ in split_fetch_response(data):
+        uid_match = UID_RE.search(meta)
+        if not uid_match:
+            continue
+        flags_match = FLAGS_RE.search(meta)
+        modseq_match = MODSEQ_RE.search(meta)
+        rows.append({
+            "uid": uid_match.group(1).decode(),
+            "flags": flags_match.group(1).decode("utf-8", errors="replace").split() if flags_match else [],
+            "modseq": int(modseq_match.group(1)) if modseq_match else None,
+        })
+    return rows
+
+
+def parse_message_fetch(data: list, uid: str) -> Optional[FetchedMessage]:
+    """The MESSAGE_ITEMS response for `uid`, skipping unsolicited FETCHes for others."""
+    for item in parse_fetch_items(data):
+        if item.get("UID") != uid.encode() or item.get("BODY[]") is None:
+            continue
+        internaldate = item.get("INTERNALDATE") or b""
+        return FetchedMessage(
+            uid=uid,
+            raw=item["BODY[]"],
+            flags=[f.decode() for f in item.get("FLAGS") or [] if isinstance(f, bytes)],
+            internaldate=internaldate.decode().strip('"'),
+            size=int(item.get("RFC822.SIZE") or 0),
+        )
+    return None
+
+
+def parse_status(data: list) -> FolderStatus:
+    values = {
+        k.decode(): int(v)
+        for k, v in STATUS_ITEM_RE.findall(data[0] if data and data[0] else b"")
+    }
+    return FolderStatus(
+        messages=values.get("MESSAGES", 0),
+        uidnext=values.get("UIDNEXT", 0),
+        uidvalidity=values.get("UIDVALIDITY", 0),
+        highestmodseq=values.get("HIGHESTMODSEQ", 0),
+    )
+
+
+def parse_list(data: list) -> list[str]:
+    folders = []
+    for item in data:
+        if isinstance(item, bytes):
+            parts = item.decode().rsplit('"', 2)
+            if len(parts) >= 2:
+                folder_name = parts[-2].strip().strip('"')
+                if folder_name:
+                    folders.append(folder_name)
+    return folders
+
+
+def parse_vanished(data: list) -> list[int]:
+    vanished = []
+    for line in data or []:
+        if isinstance(line, bytes):
+            vanished.extend(expand_uid_set(line.replace(b"(EARLIER)", b"").strip().decode()))
+    return vanished
+
+
+def parse_esearch(data: list) -> dict:
+    """Parse ESEARCH/ESORT results: ``(TAG "A5") UID COUNT 42 MIN 1 MAX 90 ALL 1:5,9``."""
+    result = {"uids": []}
+    for line in data or []:
+        if not isinstance(line, bytes):
+            continue
+        for key, value in ESEARCH_NUM_RE.findall(line):
+            result[key.decode().lower()] = int(value)
+        for pattern in (ESEARCH_ALL_RE, ESEARCH_PARTIAL_RE):
+            match = pattern.search(line)
+            if match and match.group(1) != b"NIL":
+                result["uids"].extend(
+                    str(u).encode() for u in expand_uid_set(match.group(1).decode(), keep_order=True)
+                )
+    return result
+
+
+def parse_thread(data: list) -> list[list[int]]:
+    """Flatten a THREAD response into one UID list per thread.
+
+    ``(2)(3 6 (4 23)(44 7 96))`` becomes ``[[2], [3, 6, 4, 23, 44, 7, 96]]``;
+    the tree shape inside a thread is not kept.
+    """
+    threads = []
+    for line in data or []:
+        if not isinstance(line, bytes):
+            continue
+        depth = 0
+        for token in THREAD_TOKEN_RE.findall(line):
+            if token == b"(":
+                if depth == 0:
+                    threads.append([])
+                depth += 1
+            elif token == b")":
+                depth = max(depth - 1, 0)
+            elif depth:
+                threads[-1].append(int(token))
+    return threads
+
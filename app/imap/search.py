@@ -1,6 +1,9 @@
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from typing import Optional
 
+from app.imap.protocol import quote_string
+
 
 @dataclass
 class SearchCriteria:
@@ -14,17 +17,23 @@ class SearchCriteria:
     unseen: Optional[bool] = None
 
 
+def _search_string(value: str) -> str:
+    """A text criterion as an IMAP quoted string. Quoted strings can't hold
+    line breaks, so those become spaces."""
+    return quote_string(value.replace("\r", " ").replace("\n", " "))
+
+
 def build_imap_search(criteria: SearchCriteria) -> str:
     parts = []
 
     if criteria.from_addr:
-        parts.append(f'FROM "{criteria.from_addr}"')
+        parts.append(f"FROM {_search_string(criteria.from_addr)}")
     if criteria.to_addr:
-        parts.append(f'TO "{criteria.to_addr}"')
+        parts.append(f"TO {_search_string(criteria.to_addr)}")
     if criteria.subject:
-        parts.append(f'SUBJECT "{criteria.subject}"')
+        parts.append(f"SUBJECT {_search_string(criteria.subject)}")
     if criteria.body:
-        parts.append(f'BODY "{criteria.body}"')
+        parts.append(f"BODY {_search_string(criteria.body)}")
     if criteria.since:
         parts.append(f"SINCE {criteria.since}")
     if criteria.before:
@@ -41,3 +50,32 @@ def build_imap_search(criteria: SearchCriteria) -> str:
     if not parts:
         return "ALL"
     return "(" + " ".join(parts) + ")"
+
+
+def has_text_criteria(criteria: SearchCriteria) -> bool:
+    return any((criteria.from_addr, criteria.to_addr, criteria.subject, criteria.body))
+
+
+def build_fts_query(criteria: SearchCriteria) -> str:
+    """Translate the text criteria into an FTS5 MATCH expression.
+
+    Each value becomes a column-scoped phrase with a trailing prefix
+    wildcard, which approximates IMAP's substring matching ("invoice"
+    also finds "invoices") on word boundaries.
+    """
+    parts = []
+    for column, value in (
+        ("sender", criteria.from_addr),
+        ("recipients", criteria.to_addr),
+        ("subject", criteria.subject),
+        ("body", criteria.body),
+    ):
+        if value and value.strip():
+            phrase = value.strip().replace('"', '""')
+            parts.append(f'{column} : "{phrase}" *')
+    return " AND ".join(parts)
+
+
+def imap_date_to_ts(value: str) -> int:
+    """DD-Mon-YYYY -> epoch seconds at midnight UTC."""
+    return int(datetime.strptime(value, "%d-%b-%Y").replace(tzinfo=timezone.utc).timestamp())
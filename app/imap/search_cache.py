@@ -0,0 +1,136 @@
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.imap.aio import AsyncIMAPClient
+
+T = TypeVar("T")
+
+# Search keys whose matches change when flags change, not only when
+# messages arrive or are expunged
+FLAG_KEYS_RE = re.compile(
+    r"\b(UN)?(SEEN|FLAGGED|ANSWERED|DELETED|DRAFT|KEYWORD)\b|\b(NEW|OLD|RECENT)\b", re.IGNORECASE
+)
+QUOTED_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+def normalize_query(query: str) -> str:
+    """IMAP SEARCH keys and substring matches are case-insensitive, so
+    queries differing only in case or spacing share an entry."""
+    return " ".join(query.split()).casefold()
+
+
+def depends_on_flags(query: str) -> bool:
+    return bool(FLAG_KEYS_RE.search(QUOTED_RE.sub('""', query)))
+
+
+@dataclass
+class SearchCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    uncacheable: int = 0
+    invalidations: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class _Entry:
+    # (UIDVALIDITY, UIDNEXT, MESSAGES, HIGHESTMODSEQ) when stored, or None
+    # when stored while MailWatcher was reporting changes for the folder
+    state: Optional[tuple[int, int, int, int]]
+    value: object
+
+
+class SearchCache:
+    """In-memory LRU of server search results, keyed by folder and query.
+
+    An entry is only served while the folder is unchanged. Normally that
+    is checked with one STATUS (UIDVALIDITY, UIDNEXT, MESSAGES and, with
+    CONDSTORE, HIGHESTMODSEQ), which is cheaper than re-running a SEARCH
+    the server may answer by scanning every message plus the header fetch
+    behind it. Without HIGHESTMODSEQ a flag change is invisible to STATUS,
+    so queries on flags (UNSEEN, FLAGGED, ...) are not cached. While
+    MailWatcher holds an IDLE connection on the folder, its change
+    notifications invalidate entries instead and lookups skip the STATUS.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._watched: set[tuple[str, str]] = set()
+        self._stats = SearchCacheStats()
+
+    def watch(self, account: str, folder: str) -> None:
+        """Trust entries for the folder until invalidate() is called."""
+        self.invalidate(account, folder)
+        self._watched.add((account, folder))
+
+    def unwatch(self, account: str, folder: str) -> None:
+        self._watched.discard((account, folder))
+        self.invalidate(account, folder)
+
+    def invalidate(self, account: str, folder: str) -> None:
+        stale = [key for key in self._entries if key[:2] == (account, folder)]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self._stats.invalidations += 1
+
+    async def get_or_search(
+        self,
+        imap: AsyncIMAPClient,
+        folder: str,
+        query: str,
+        search: Callable[[], Awaitable[T]],
+        variant: str = "",
+    ) -> tuple[T, bool]:
+        """Return (result, cached). `variant` separates results of the same
+        query that differ otherwise, e.g. page size or cursor."""
+        if self._max_entries <= 0:
+            return await search(), False
+
+        account = imap.account
+        key = (account, folder, normalize_query(query), variant)
+        if (account, folder) in self._watched:
+            state = None
+        else:
+            status = await imap.folder_status(folder)
+            if not status.highestmodseq and depends_on_flags(query):
+                self._stats.uncacheable += 1
+                return await search(), False
+            state = (status.uidvalidity, status.uidnext, status.messages, status.highestmodseq)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.state == state:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return entry.value, True
+            self._stats.stale += 1
+        self._stats.misses += 1
+
+        value = await search()
+        # The folder may have become watched (and invalidated) while searching
+        if state is not None or (account, folder) in self._watched:
+            self._put(key, _Entry(state=state, value=value))
+        return value, False
+
+    def _put(self, key: tuple, entry: _Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._stats.evictions += 1
+
+    def stats(self) -> dict:
+        data = asdict(self._stats)
+        lookups = self._stats.hits + self._stats.misses
+        data.update(
+            size=len(self._entries),
+            max_entries=self._max_entries,
+            hit_rate=self._stats.hits / lookups if lookups else 0.0,
+            watched=sorted(folder for _, folder in self._watched),
+        )
+        return data
@@ -0,0 +1,168 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app.imap.aio import AsyncIMAPClient
+from app.imap.cache import HeaderCache, FolderState
+from app.imap.protocol import uid_set_chunks
+
+logger = logging.getLogger(__name__)
+
+# Without CONDSTORE there is no cheap way to learn which flags changed, so only
+# the newest messages (the ones the UI actually shows) get their flags refreshed.
+FLAG_RESYNC_WINDOW = 1000
+# New-message FETCH chunks in flight at once during a sync
+NEW_MESSAGES_WINDOW = 4
+
+
+class FolderLocks:
+    """One asyncio.Lock per (account, folder), dropped again once nobody
+    holds or waits for it, so the map only has the folders in use."""
+
+    def __init__(self):
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+        self._users: dict[tuple[str, str], int] = {}
+
+    def locked(self, account: str, folder: str) -> bool:
+        lock = self._locks.get((account, folder))
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, account: str, folder: str) -> AsyncIterator[None]:
+        key = (account, folder)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+
+_sync_locks = FolderLocks()
+
+
+async def sync_folder(
+    imap: AsyncIMAPClient,
+    cache: HeaderCache,
+    folder: str = "INBOX",
+    max_age: float = 0,
+) -> FolderState:
+    """Bring the cached headers for `folder` up to date with the server.
+
+    New messages are fetched by UID range above the highest cached UID.
+    Flag changes and expunges come from CHANGEDSINCE/VANISHED when the
+    server supports CONDSTORE/QRESYNC, otherwise from a FLAGS refresh of the
+    newest messages and a UID-range diff when message counts disagree.
+    Skips the round-trip entirely if the folder was synced within `max_age` seconds.
+    """
+    account = imap.account
+    state = cache.folder_state(account, folder)
+    if state and max_age and time.time() - state.synced_at < max_age:
+        return state
+
+    # Concurrent requests for the same folder share one sync instead of racing
+    async with _sync_locks.hold(account, folder):
+        state = cache.folder_state(account, folder)
+        if state and max_age and time.time() - state.synced_at < max_age:
+            return state
+        return await _sync(imap, cache, account, folder, state)
+
+
+async def _sync(
+    imap: AsyncIMAPClient,
+    cache: HeaderCache,
+    account: str,
+    folder: str,
+    state: Optional[FolderState],
+) -> FolderState:
+    status = await imap.folder_status(folder)
+    if state is None or state.uidvalidity != status.uidvalidity:
+        if state is not None:
+            logger.info("UIDVALIDITY changed for %s, dropping cached headers", folder)
+        state = cache.reset_folder(account, folder, status.uidvalidity)
+
+    last_uid = cache.max_uid(account, folder)
+    condstore = imap.has_capability("CONDSTORE") and status.highestmodseq > 0
+    qresync = condstore and imap.has_capability("QRESYNC")
+
+    # 1. Known messages: flag changes and expunges
+    if last_uid:
+        known_range = f"1:{last_uid}"
+        if condstore and state.highestmodseq:
+            if status.highestmodseq != state.highestmodseq:
+                changes, vanished = await imap.fetch_flag_changes(
+                    known_range, folder=folder, changed_since=state.highestmodseq
+                )
+                cache.update_flags(account, folder, changes)
+                if vanished:
+                    cache.delete_uids(account, folder, vanished)
+        else:
+            window_start = max(1, last_uid - FLAG_RESYNC_WINDOW + 1)
+            changes, _ = await imap.fetch_flag_changes(f"{window_start}:{last_uid}", folder=folder)
+            cache.update_flags(account, folder, changes)
+
+    # 2. New messages above the highest cached UID
+    if status.uidnext == 0 or status.uidnext > last_uid + 1:
+        await _fetch_new(imap, cache, account, folder, last_uid, status.uidnext)
+
+    # 3. Expunges the server did not report via VANISHED
+    if not qresync and last_uid and cache.count(account, folder) != status.messages:
+        server_uids = {int(u) for u in await imap.search(f"UID 1:{last_uid}", folder=folder)}
+        gone = [uid for uid in cache.uids(account, folder, max_uid=last_uid) if uid not in server_uids]
+        if gone:
+            cache.delete_uids(account, folder, gone)
+
+    state = FolderState(
+        uidvalidity=status.uidvalidity,
+        uidnext=status.uidnext,
+        highestmodseq=status.highestmodseq,
+        synced_at=time.time(),
+    )
+    cache.save_folder_state(account, folder, state)
+    return state
+
+
+async def _fetch_new(
+    imap: AsyncIMAPClient,
+    cache: HeaderCache,
+    account: str,
+    folder: str,
+    last_uid: int,
+    uidnext: int,
+) -> None:
+    """Fetch and cache the headers above `last_uid`, fetch_chunk_size UIDs
+    per FETCH, so the first sync of a big folder is never one response."""
+    chunk_size = imap.fetch_chunk_size
+    if uidnext and uidnext - last_uid - 1 <= chunk_size:
+        uid_sets = [f"{last_uid + 1}:*"]
+    else:
+        uids = await imap.search(f"UID {last_uid + 1}:*", folder=folder)
+        uid_sets = uid_set_chunks([u for u in uids if int(u) > last_uid], chunk_size)
+
+    chunks = iter(uid_sets)
+    pending: deque[asyncio.Task] = deque()
+
+    def _start(count: int) -> None:
+        for uid_set in itertools.islice(chunks, count):
+            pending.append(asyncio.create_task(imap.fetch_header_range(uid_set, folder=folder)))
+
+    _start(NEW_MESSAGES_WINDOW)
+    try:
+        while pending:
+            rows = await pending.popleft()
+            _start(1)
+            # "N:*" always matches the last message, even when it is below N
+            rows = [r for r in rows if int(r["uid"]) > last_uid]
+            # The first sync of a big folder writes a lot of rows; keep it off the event loop
+            await asyncio.to_thread(cache.upsert_headers, account, folder, rows)
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,405 @@
+import asyncio
+import email
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.imap.aio import AsyncIMAPClient
+from app.imap.cache import HeaderCache, _date_ts, open_cache_db
+from app.imap.sync import FolderLocks
+
+logger = logging.getLogger(__name__)
+
+THREAD_HEADER_ITEMS = "(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID IN-REPLY-TO REFERENCES)])"
+# Messages whose threading headers are fetched per pass; the fetch is split
+# into pipelined chunks by AsyncIMAPClient.fetch_items
+THREAD_BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thread_folders (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    PRIMARY KEY (account, folder)
+);
+
+CREATE TABLE IF NOT EXISTS thread_messages (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    message_id TEXT NOT NULL,
+    refs TEXT NOT NULL DEFAULT '',
+    base_subject TEXT NOT NULL DEFAULT '',
+    date_ts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (account, folder, uid)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS thread_messages_by_id ON thread_messages (account, folder, message_id);
+CREATE INDEX IF NOT EXISTS thread_messages_by_subject ON thread_messages (account, folder, base_subject);
+
+CREATE TABLE IF NOT EXISTS thread_links (
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    PRIMARY KEY (account, folder, message_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS thread_links_by_thread ON thread_links (account, folder, thread_id);
+"""
+
+MSGID_RE = re.compile(r"<([^<>\s]+)>")
+# "Re: ", "Fwd: ", "AW: ", "Re[2]: " and "[list-name] " prefixes, repeated
+SUBJECT_PREFIX_RE = re.compile(r"^(\s*((re|fwd?|aw|sv|wg|tr)(\[\d+\])?\s*:|\[[^\]]*\]))+\s*", re.IGNORECASE)
+REPLY_PREFIX_RE = re.compile(r"^\s*(\[[^\]]*\]\s*)*(re|aw|sv)(\[\d+\])?\s*:", re.IGNORECASE)
+
+
+@dataclass
+class ThreadHeader:
+    uid: int
+    message_id: str
+    # Ancestors, oldest first; the last one is the parent
+    references: list[str] = field(default_factory=list)
+    subject: str = ""
+    date_ts: int = 0
+
+    @property
+    def base_subject(self) -> str:
+        return " ".join(SUBJECT_PREFIX_RE.sub("", self.subject).split()).casefold()
+
+    @property
+    def is_reply(self) -> bool:
+        return bool(REPLY_PREFIX_RE.match(self.subject))
+
+
+def parse_thread_header(uid: int, raw: bytes, subject: str = "", date: str = "") -> ThreadHeader:
+    """Message-ID plus References/In-Reply-To, as RFC 5256 REFERENCES uses them.
+
+    A message without a usable Message-ID gets a local one so it can still
+    be a thread root.
+    """
+    msg = email.message_from_bytes(raw or b"")
+    ids = MSGID_RE.findall(msg.get("Message-ID", "") or "")
+    message_id = ids[0] if ids else f"uid-{uid}@local"
+    references = MSGID_RE.findall(msg.get("References", "") or "")
+    in_reply_to = MSGID_RE.findall(msg.get("In-Reply-To", "") or "")
+    if in_reply_to and (not references or references[-1] != in_reply_to[0]):
+        references.append(in_reply_to[0])
+    # Drop self-references and repeats, which would otherwise create loops
+    seen = {message_id}
+    references = [r for r in references if not (r in seen or seen.add(r))]
+    return ThreadHeader(uid, message_id, references, subject, _date_ts(date))
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: dict[str, str] = {}
+
+    def find(self, x: str) -> str:
+        parent = self.parent
+        root = parent.setdefault(x, x)
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, keep: str, other: str) -> None:
+        a, b = self.find(keep), self.find(other)
+        if a != b:
+            self.parent[b] = a
+
+
+def thread_headers(
+    headers: list[ThreadHeader], server_threads: Optional[list[list[int]]] = None
+) -> dict[str, str]:
+    """Group messages into threads; returns message-id -> thread id for every
+    Message-ID seen, including referenced messages not in the folder.
+
+    Like JWZ threading (RFC 5256 REFERENCES), a message belongs with every
+    message it references, directly or through missing intermediates, and
+    replies without references join the thread whose root has the same
+    base subject. With `server_threads` (UID groups from UID THREAD) the
+    server's grouping is used instead of the subject step. A thread's id is
+    the Message-ID of its root, or the oldest reference known for it.
+    """
+    uf = _UnionFind()
+    for h in sorted(headers, key=lambda h: (h.date_ts, h.uid)):
+        ids = h.references + [h.message_id]
+        uf.find(ids[0])
+        for other in ids[1:]:
+            uf.union(ids[0], other)
+
+    if server_threads is not None:
+        by_uid = {h.uid: h.message_id for h in headers}
+        for group in server_threads:
+            ids = [by_uid[u] for u in group if u in by_uid]
+            for other in ids[1:]:
+                uf.union(ids[0], other)
+    else:
+        roots: dict[str, str] = {}
+        for h in sorted(headers, key=lambda h: (h.date_ts, h.uid)):
+            base = h.base_subject
+            if h.references or not base:
+                continue
+            if h.is_reply and base in roots:
+                uf.union(roots[base], h.message_id)
+            else:
+                roots.setdefault(base, h.message_id)
+
+    return {message_id: uf.find(message_id) for message_id in list(uf.parent)}
+
+
+class ThreadIndex:
+    """Persistent Message-ID -> thread mapping, stored next to the header cache.
+
+    `thread_links` maps every Message-ID seen in a folder (including
+    referenced messages that aren't in it) to a thread id; `thread_messages`
+    holds each cached message's Message-ID and references. New messages are
+    linked in with a few indexed lookups, merging threads when a message
+    references two of them, so a conversation is one indexed query. Like
+    MessageIndex, rows only count for the UIDVALIDITY in `thread_folders`
+    and must share the header cache's database file.
+    """
+
+    def __init__(self, path: str):
+        self._db = open_cache_db(path, SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def uidvalidity(self, account: str, folder: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uidvalidity FROM thread_folders WHERE account = ? AND folder = ?",
+                (account, folder),
+            ).fetchone()
+        return row[0] if row else None
+
+    def reset_folder(self, account: str, folder: str, uidvalidity: int) -> None:
+        with self._lock, self._db:
+            for table in ("thread_messages", "thread_links"):
+                self._db.execute(f"DELETE FROM {table} WHERE account = ? AND folder = ?", (account, folder))
+            self._db.execute(
+                "INSERT OR REPLACE INTO thread_folders (account, folder, uidvalidity) VALUES (?, ?, ?)",
+                (account, folder, uidvalidity),
+            )
+
+    def prune(self, account: str, folder: str) -> int:
+        """Drop messages that are no longer in the header cache. Their links
+        stay, so replies to them still land in the same thread."""
+        with self._lock, self._db:
+            return self._db.execute(
+                "DELETE FROM thread_messages WHERE account = ? AND folder = ? "
+                "AND NOT EXISTS (SELECT 1 FROM headers h WHERE h.account = thread_messages.account "
+                "AND h.folder = thread_messages.folder AND h.uid = thread_messages.uid)",
+                (account, folder),
+            ).rowcount
+
+    def unthreaded_uids(self, account: str, folder: str, limit: Optional[int] = None) -> list[int]:
+        """Cached UIDs with no thread row yet, oldest first."""
+        sql = (
+            "SELECT h.uid FROM headers h WHERE h.account = ? AND h.folder = ? "
+            "AND NOT EXISTS (SELECT 1 FROM thread_messages m WHERE m.account = h.account "
+            "AND m.folder = h.folder AND m.uid = h.uid) ORDER BY h.uid"
+        )
+        params: list = [account, folder]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [r[0] for r in self._db.execute(sql, params)]
+
+    def is_empty(self, account: str, folder: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM thread_links WHERE account = ? AND folder = ? LIMIT 1", (account, folder)
+            ).fetchone()
+        return row is None
+
+    def rebuild(
+        self,
+        account: str,
+        folder: str,
+        headers: list[ThreadHeader],
+        server_threads: Optional[list[list[int]]] = None,
+    ) -> None:
+        """Thread a whole folder in memory and write it in one transaction."""
+        links = thread_headers(headers, server_threads)
+        with self._lock, self._db:
+            for table in ("thread_messages", "thread_links"):
+                self._db.execute(f"DELETE FROM {table} WHERE account = ? AND folder = ?", (account, folder))
+            self._db.executemany(
+                "INSERT INTO thread_links (account, folder, message_id, thread_id) VALUES (?, ?, ?, ?)",
+                [(account, folder, message_id, thread_id) for message_id, thread_id in links.items()],
+            )
+            self._insert_messages(account, folder, headers)
+
+    def add(self, account: str, folder: str, headers: list[ThreadHeader]) -> None:
+        """Link new messages into the existing threads."""
+        with self._lock, self._db:
+            for h in sorted(headers, key=lambda h: (h.date_ts, h.uid)):
+                ids = h.references + [h.message_id]
+                found = dict(self._db.execute(
+                    f"SELECT message_id, thread_id FROM thread_links WHERE account = ? AND folder = ? "
+                    f"AND message_id IN ({','.join('?' * len(ids))})",
+                    [account, folder, *ids],
+                ).fetchall())
+                if not found and not h.references and h.is_reply and h.base_subject:
+                    row = self._db.execute(
+                        "SELECT l.thread_id FROM thread_messages m JOIN thread_links l "
+                        "ON l.account = m.account AND l.folder = m.folder AND l.message_id = m.message_id "
+                        "WHERE m.account = ? AND m.folder = ? AND m.base_subject = ? "
+                        "ORDER BY m.date_ts LIMIT 1",
+                        (account, folder, h.base_subject),
+                    ).fetchone()
+                    if row:
+                        found = {h.message_id: row[0]}
+                # The oldest known reference decides; other threads merge into it
+                thread_id = next((found[i] for i in ids if i in found), ids[0])
+                merged = {t for t in found.values() if t != thread_id}
+                if merged:
+                    self._db.execute(
+                        f"UPDATE thread_links SET thread_id = ? WHERE account = ? AND folder = ? "
+                        f"AND thread_id IN ({','.join('?' * len(merged))})",
+                        [thread_id, account, folder, *merged],
+                    )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO thread_links (account, folder, message_id, thread_id) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(account, folder, i, thread_id) for i in ids],
+                )
+            self._insert_messages(account, folder, headers)
+
+    def _insert_messages(self, account: str, folder: str, headers: list[ThreadHeader]) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO thread_messages "
+            "(account, folder, uid, message_id, refs, base_subject, date_ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (account, folder, h.uid, h.message_id, " ".join(h.references), h.base_subject, h.date_ts)
+                for h in headers
+            ],
+        )
+
+    def conversation(self, account: str, folder: str, uid: int) -> Optional[tuple[str, list[dict]]]:
+        """(thread id, messages oldest first) for the thread containing `uid`.
+
+        Each message dict has uid, message_id, parent_uid (the nearest
+        referenced message that is in the folder) and depth.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT l.thread_id FROM thread_messages m JOIN thread_links l "
+                "ON l.account = m.account AND l.folder = m.folder AND l.message_id = m.message_id "
+                "WHERE m.account = ? AND m.folder = ? AND m.uid = ?",
+                (account, folder, uid),
+            ).fetchone()
+            if row is None:
+                return None
+            # CROSS JOIN keeps thread_links (by thread id) as the outer loop and
+            # INDEXED BY stops SQLite from walking the folder's primary key range
+            rows = self._db.execute(
+                "SELECT m.uid, m.message_id, m.refs FROM thread_links l "
+                "CROSS JOIN thread_messages m INDEXED BY thread_messages_by_id "
+                "ON m.account = l.account AND m.folder = l.folder AND m.message_id = l.message_id "
+                "WHERE l.account = ? AND l.folder = ? AND l.thread_id = ? ORDER BY m.date_ts, m.uid",
+                (account, folder, row[0]),
+            ).fetchall()
+
+        uid_of = {}
+        for member_uid, message_id, _ in rows:
+            uid_of.setdefault(message_id, member_uid)
+        parents = {}
+        for member_uid, message_id, refs in rows:
+            parent = next((uid_of[r] for r in reversed(refs.split()) if r in uid_of), None)
+            parents[member_uid] = parent if parent != member_uid else None
+
+        depths: dict[int, int] = {}
+        for member_uid, _, _ in rows:
+            chain, u = [], member_uid
+            while u is not None and u not in depths and u not in chain:
+                chain.append(u)
+                u = parents[u]
+            # A reference loop is cut where it closes
+            depth = depths[u] if u in depths else -1
+            for v in reversed(chain):
+                depth += 1
+                depths[v] = depth
+
+        return row[0], [
+            {
+                "uid": member_uid,
+                "message_id": message_id,
+                "parent_uid": parents[member_uid],
+                "depth": depths[member_uid],
+            }
+            for member_uid, message_id, _ in rows
+        ]
+
+
+_thread_locks = FolderLocks()
+
+
+async def thread_folder(
+    imap: AsyncIMAPClient,
+    cache: HeaderCache,
+    index: ThreadIndex,
+    folder: str = "INBOX",
+    batch_size: int = THREAD_BATCH_SIZE,
+) -> int:
+    """Thread cached messages that have no thread row yet.
+
+    The first pass over a folder fetches Message-ID/In-Reply-To/References
+    for every message and threads them in memory, taking the grouping from
+    UID THREAD REFERENCES when the server supports it. Later passes only
+    fetch and link the new messages. Concurrent calls for a folder wait for
+    each other, so a caller always sees the folder fully threaded. Returns
+    the number of messages threaded.
+    """
+    account = imap.account
+    async with _thread_locks.hold(account, folder):
+        state = cache.folder_state(account, folder)
+        if state is None:
+            return 0
+        if index.uidvalidity(account, folder) != state.uidvalidity:
+            await asyncio.to_thread(index.reset_folder, account, folder, state.uidvalidity)
+        else:
+            await asyncio.to_thread(index.prune, account, folder)
+
+        uids = await asyncio.to_thread(index.unthreaded_uids, account, folder)
+        if not uids:
+            return 0
+        if await asyncio.to_thread(index.is_empty, account, folder):
+            server_threads = None
+            if imap.has_capability("THREAD=REFERENCES"):
+                server_threads = await imap.thread_references(folder=folder)
+            headers = []
+            for i in range(0, len(uids), batch_size):
+                headers += await _fetch_thread_headers(imap, cache, account, folder, uids[i : i + batch_size])
+            await asyncio.to_thread(index.rebuild, account, folder, headers, server_threads)
+        else:
+            for i in range(0, len(uids), batch_size):
+                headers = await _fetch_thread_headers(imap, cache, account, folder, uids[i : i + batch_size])
+                await asyncio.to_thread(index.add, account, folder, headers)
+        logger.info("Threaded %d messages in %s", len(uids), folder)
+        return len(uids)
+
+
+async def _fetch_thread_headers(
+    imap: AsyncIMAPClient, cache: HeaderCache, account: str, folder: str, uids: list[int]
+) -> list[ThreadHeader]:
+    items = await imap.fetch_items(uids, THREAD_HEADER_ITEMS, folder=folder)
+    cached = {int(h["uid"]): h for h in cache.get_headers(account, folder, uids)}
+    headers = []
+    # Messages that vanished meanwhile still get a row so they are not
+    # fetched again; prune() drops them later
+    for uid in uids:
+        item = items.get(uid, {})
+        raw = next((v for k, v in item.items() if k.startswith("BODY[HEADER.FIELDS") and v), b"")
+        header = cached.get(uid, {})
+        headers.append(parse_thread_header(uid, raw, header.get("subject", ""), header.get("date", "")))
+    return headers
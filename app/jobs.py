@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.ai.categorize import chunk_emails, chunk_max_tokens, validate_categories
+from app.ai.claude import ClaudeClient
+from app.ai.email_tools import (
+    summarize_batch_request,
+    store_summary,
+    cached_summary,
+    categorize_batch_request,
+    cached_category,
+    store_category,
+    parse_json_array,
+)
+from app.config import Settings
+from app.imap.aio import AsyncIMAPPool
+from app.imap.cache import HeaderCache, open_cache_db
+from app.imap.message_cache import MessageCache, message_key
+from app.imap.sync import sync_folder
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ("summarize", "categorize")
+ACTIVE_STATUSES = ("preparing", "running", "canceling")
+FETCH_CONCURRENCY = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    status TEXT NOT NULL,
+    batch_id TEXT,
+    total INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    succeeded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    items TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+JOB_FIELDS = (
+    "id", "kind", "account", "folder", "status", "batch_id", "total", "skipped",
+    "succeeded", "failed", "error", "created_at", "updated_at",
+)
+
+
+class JobStore:
+    """Batch job records, kept in the cache database so a restart can pick
+    up batches that are still running at Anthropic.
+
+    `items` maps each batch request's custom_id to the messages its result
+    belongs to.
+    """
+
+    def __init__(self, path: str):
+        self._db = open_cache_db(path, SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def create(self, kind: str, account: str, folder: str) -> dict:
+        now = time.time()
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO ai_jobs (id, kind, account, folder, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'preparing', ?, ?)",
+                (job_id, kind, account, folder, now, now),
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields) -> None:
+        if "items" in fields:
+            fields["items"] = json.dumps(fields["items"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._db:
+            self._db.execute(
+                f"UPDATE ai_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM ai_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(zip(JOB_FIELDS, row)) if row else None
+
+    def items(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._db.execute("SELECT items FROM ai_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def recent(self, account: Optional[str] = None, limit: int = 50) -> list[dict]:
+        where, params = ("WHERE account = ? ", (account,)) if account is not None else ("", ())
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM ai_jobs {where}ORDER BY created_at DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [dict(zip(JOB_FIELDS, row)) for row in rows]
+
+    def active(self) -> list[dict]:
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM ai_jobs WHERE status IN ({placeholders})",
+                ACTIVE_STATUSES,
+            ).fetchall()
+        return [dict(zip(JOB_FIELDS, row)) for row in rows]
+
+
+class BatchJobRunner:
+    """Summarizes or categorizes a whole folder through the Message Batches API.
+
+    A job collects the folder's newest `batch_max_messages` messages (or
+    the given UIDs), skips those that already have a cached result, and
+    submits the rest as one batch: one request per message for summaries,
+    token-budgeted chunks for categories, built exactly like the online
+    calls. It then polls every `batch_poll_interval` seconds and writes the
+    results into the response cache, where /api/summarize and
+    /api/categorize find them. Job state lives in a JobStore, so a restart
+    resumes polling; canceling a running job keeps whatever finished.
+
+    The runner is shared by all accounts: start() takes the account's IMAP
+    pool and MessageCache, which are only needed until the batch is
+    submitted.
+    """
+
+    def __init__(
+        self,
+        header_cache: HeaderCache,
+        claude: ClaudeClient,
+        store: JobStore,
+        settings: Settings,
+    ):
+        self._cache = header_cache
+        self._claude = claude
+        self._store = store
+        self._poll_interval = settings.batch_poll_interval
+        self._max_messages = settings.batch_max_messages
+        self._chunk_tokens = settings.categorize_chunk_tokens
+        self._sync_interval = settings.cache_sync_interval
+        self._tasks: dict[str, asyncio.Task] = {}
+        # job id -> account, for jobs still collecting messages
+        self._preparing: dict[str, str] = {}
+
+    def resume(self) -> None:
+        """Pick up jobs left active by the last run."""
+        for job in self._store.active():
+            if job["status"] == "preparing":
+                self._store.update(job["id"], status="failed", error="Interrupted before submission")
+            elif job["id"] not in self._tasks:
+                self._spawn(job["id"], self._poll(job["id"]))
+
+    async def stop(self) -> None:
+        """Stop polling. Submitted batches keep running and are resumed later."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._store.get(job_id)
+
+    def jobs(self, account: str) -> list[dict]:
+        return self._store.recent(account)
+
+    def preparing(self, account: str) -> int:
+        """Jobs of `account` still reading messages from its IMAP pool."""
+        return sum(1 for a in self._preparing.values() if a == account)
+
+    async def start(
+        self,
+        pool: AsyncIMAPPool,
+        messages: MessageCache,
+        kind: str,
+        folder: str = "INBOX",
+        uids: Optional[list[str]] = None,
+    ) -> dict:
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = self._store.create(kind, pool.account, folder)
+        self._spawn(job["id"], self._run(pool, messages, job, uids))
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        job = self._store.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == "preparing":
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+            self._store.update(job_id, status="canceled")
+        elif job["status"] == "running":
+            # Results that finished before the cancel are still collected
+            await self._claude.cancel_batch(job["batch_id"])
+            self._store.update(job_id, status="canceling")
+        return self._store.get(job_id)
+
+    def _spawn(self, job_id: str, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(
+        self, pool: AsyncIMAPPool, messages: MessageCache, job: dict, uids: Optional[list[str]]
+    ) -> None:
+        self._preparing[job["id"]] = pool.account
+        try:
+            if job["kind"] == "summarize":
+                requests, items, skipped = await self._prepare_summaries(pool, messages, job["folder"], uids)
+            else:
+                requests, items, skipped = await self._prepare_categories(pool, job["folder"], uids)
+            total = sum(len(item["uids"]) for item in items.values())
+            if not requests:
+                self._store.update(job["id"], status="completed", skipped=skipped)
+                return
+            batch = await self._claude.create_batch(requests)
+            self._store.update(
+                job["id"], status="running", batch_id=batch.id, items=items,
+                total=total, skipped=skipped,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Batch job %s failed: %s", job["id"], e)
+            self._store.update(job["id"], status="failed", error=str(e))
+            return
+        finally:
+            self._preparing.pop(job["id"], None)
+        await self._poll(job["id"])
+
+    async def _headers(
+        self, pool: AsyncIMAPPool, folder: str, uids: Optional[list[str]]
+    ) -> tuple[list[dict], int]:
+        """Headers of the job's messages and the folder's UIDVALIDITY."""
+        async with pool.connection(folder) as imap:
+            state = await sync_folder(imap, self._cache, folder, max_age=self._sync_interval)
+        account = pool.account
+        if uids:
+            wanted = [int(u) for u in uids if str(u).strip().isdigit()][: self._max_messages]
+            headers = self._cache.get_headers(account, folder, wanted)
+        else:
+            headers = self._cache.list_headers(account, folder, limit=self._max_messages)
+        return headers, state.uidvalidity
+
+    async def _prepare_summaries(
+        self, pool: AsyncIMAPPool, messages: MessageCache, folder: str, uids: Optional[list[str]]
+    ) -> tuple[list, dict, int]:
+        headers, uidvalidity = await self._headers(pool, folder, uids)
+        account = pool.account
+        todo = []
+        for h in headers:
+            ref = message_key(account, folder, uidvalidity, h["uid"])
+            if cached_summary(ref, self._claude) is None:
+                todo.append((h["uid"], ref))
+
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def _request(uid: str, ref: str) -> tuple[str, dict, str]:
+            parsed = messages.peek(ref)
+            if parsed is None:
+                async with semaphore, pool.connection(folder) as imap:
+                    parsed = await imap.fetch_message(uid, folder=folder)
+            custom_id = f"uid-{uid}"
+            request, key = summarize_batch_request(custom_id, parsed, self._claude)
+            return custom_id, request, key
+
+        built = await asyncio.gather(*(_request(uid, ref) for uid, ref in todo))
+        requests = [request for _, request, _ in built]
+        items = {
+            custom_id: {"uids": [uid], "refs": [ref], "key": key}
+            for (uid, ref), (custom_id, _, key) in zip(todo, built)
+        }
+        return requests, items, len(headers) - len(todo)
+
+    async def _prepare_categories(
+        self, pool: AsyncIMAPPool, folder: str, uids: Optional[list[str]]
+    ) -> tuple[list, dict, int]:
+        headers, uidvalidity = await self._headers(pool, folder, uids)
+        account = pool.account
+        refs = {h["uid"]: message_key(account, folder, uidvalidity, h["uid"]) for h in headers}
+        todo = [h for h in headers if cached_category(refs[h["uid"]], self._claude) is None]
+
+        requests, items = [], {}
+        for i, chunk in enumerate(chunk_emails(todo, self._chunk_tokens)):
+            custom_id = f"chunk-{i}"
+            requests.append(categorize_batch_request(custom_id, chunk, self._claude, chunk_max_tokens(chunk)))
+            items[custom_id] = {
+                "uids": [h["uid"] for h in chunk],
+                "refs": [refs[h["uid"]] for h in chunk],
+            }
+        return requests, items, len(headers) - len(todo)
+
+    async def _poll(self, job_id: str) -> None:
+        while True:
+            job = self._store.get(job_id)
+            try:
+                batch = await self._claude.retrieve_batch(job["batch_id"])
+                if batch.processing_status == "ended":
+                    await self._collect(job)
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Transient API errors; the batch itself keeps running
+                logger.warning("Polling batch job %s failed: %s", job_id, e)
+            await asyncio.sleep(self._poll_interval)
+
+    async def _collect(self, job: dict) -> None:
+        items = self._store.items(job["id"])
+        succeeded = failed = 0
+        async for custom_id, text in self._claude.batch_results(job["batch_id"], f"batch_{job['kind']}"):
+            item = items.get(custom_id)
+            if item is None:
+                continue
+            if job["kind"] == "summarize":
+                if text is None:
+                    failed += 1
+                else:
+                    store_summary(item["key"], item["refs"][0], text, self._claude)
+                    succeeded += 1
+                continue
+
+            chunk = [{"uid": uid} for uid in item["uids"]]
+            categories = validate_categories(chunk, parse_json_array(text) if text else None)
+            for uid, ref in zip(item["uids"], item["refs"]):
+                category = categories.get(uid, "Unknown")
+                if category == "Unknown":
+                    failed += 1
+                else:
+                    store_category(ref, category, self._claude)
+                    succeeded += 1
+
+        status = "canceled" if self._store.get(job["id"])["status"] == "canceling" else "completed"
+        self._store.update(job["id"], status=status, succeeded=succeeded, failed=failed)
+
+    def stats(self) -> dict:
+        jobs = self._store.recent()
+        return {
+            "polling": len(self._tasks),
+            "active": sum(1 for j in jobs if j["status"] in ACTIVE_STATUSES),
+            "recent": len(jobs),
+        }
@@ -1,35 +1,113 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
+from app.accounts import AccountRegistry
+from app.broker.client import BrokerAccounts, RemoteJobs, RemoteOutbox
+from app.broker.rpc import RPCClient
 from app.config import Settings
-from app.imap.client import IMAPClient
+from app.imap.cache import HeaderCache
+from app.imap.header_store import HeaderStore
+from app.imap.index import MessageIndex
+from app.imap.message_cache import SharedMessageCache
+from app.imap.search_cache import SearchCache
+from app.imap.threads import ThreadIndex
 from app.ai.claude import ClaudeClient
-from app.api import routes_auth, routes_inbox, routes_search, routes_ai, routes_send
+from app.ai.response_cache import ResponseCache
+from app.jobs import JobStore, BatchJobRunner
+from app.smtp.outbox import OutboxStore, OutboxSender
+from app.prefetch import ActivityTracker, ActivityMiddleware
+from app.api import (
+    routes_auth, routes_inbox, routes_search, routes_ai, routes_jobs, routes_send, routes_metrics,
+)
 
 
 load_dotenv()
 
 settings = Settings.from_env()
-imap_client = IMAPClient(
-    host=settings.imap_host,
-    port=settings.imap_port,
-    user=settings.imap_user,
-    password=settings.imap_password,
+header_cache = HeaderCache(settings.cache_path)
+header_store = HeaderStore(header_cache, max_folders=settings.header_store_folders)
+message_index = MessageIndex(settings.cache_path)
+thread_index = ThreadIndex(settings.cache_path)
+response_cache = ResponseCache(
+    settings.cache_path,
+    max_entries=settings.claude_cache_max_entries,
+    ttl=settings.claude_cache_ttl,
+    disabled=settings.claude_cache_disabled,
 )
-claude_client = ClaudeClient(settings)
+claude_client = ClaudeClient(settings, cache=response_cache)
+activity = ActivityTracker(quiet_period=settings.prefetch_quiet_period)
+job_store = JobStore(settings.cache_path)
+outbox_store = OutboxStore(settings.cache_path)
+if settings.broker_socket:
+    # Stateless worker: accounts, connections and background work live in
+    # the broker (python -m app.broker); caches are shared through SQLite
+    broker = RPCClient(settings.broker_socket)
+    message_cache = SharedMessageCache(settings.cache_path, max_entries=settings.message_cache_size)
+    search_cache = SearchCache(max_entries=settings.search_cache_size)
+    batch_jobs = RemoteJobs(job_store, broker)
+    outbox_sender = RemoteOutbox(outbox_store, broker)
+    accounts = BrokerAccounts(settings, broker, message_cache, search_cache)
+else:
+    broker = None
+    message_cache = None
+    batch_jobs = BatchJobRunner(header_cache, claude_client, job_store, settings)
+    outbox_sender = OutboxSender(outbox_store, settings)
+    accounts = AccountRegistry(settings, header_cache, claude_client, activity, batch_jobs, outbox_sender)
+
 
-app = FastAPI(title="Email Assistant", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if broker is None:
+        if settings.anthropic_api_key:
+            batch_jobs.resume()
+        outbox_sender.start()
+        accounts.start()
+    yield
+    for task in list(app.state.background_tasks.values()):
+        task.cancel()
+    if broker is None:
+        await outbox_sender.stop()
+        await batch_jobs.stop()
+        await accounts.stop()
+    else:
+        await broker.close()
+        message_cache.close()
+    message_index.close()
+    thread_index.close()
+    response_cache.close()
+    job_store.close()
+    outbox_store.close()
+    header_cache.close()
+
+
+app = FastAPI(title="Email Assistant", version="0.1.0", lifespan=lifespan)
 
 # Store shared state on the app instance so routes can access it
 app.state.settings = settings
-app.state.imap = imap_client
+app.state.accounts = accounts
 app.state.claude = claude_client
+app.state.header_cache = header_cache
+app.state.header_store = header_store
+app.state.message_index = message_index
+app.state.thread_index = thread_index
+app.state.response_cache = response_cache
+app.state.jobs = batch_jobs
+app.state.outbox = outbox_sender
+app.state.broker = broker
+# (kind, account, folder) -> the sync, index or threading task running for it
+app.state.background_tasks = {}
+
+app.add_middleware(ActivityMiddleware, tracker=activity, exclude=("/api/metrics", "/api/events"))
 
 app.include_router(routes_auth.router)
 app.include_router(routes_inbox.router)
 app.include_router(routes_search.router)
 app.include_router(routes_ai.router)
+app.include_router(routes_jobs.router)
 app.include_router(routes_send.router)
+app.include_router(routes_metrics.router)
 
 app.mount("/", StaticFiles(directory="app/static", html=True), name="static")
@@ -38,10 +38,22 @@ class EmailDetail(BaseModel):
     attachments: list[dict]
 
 
+class ThreadMessage(EmailSummary):
+    parent_uid: Optional[str] = None
+    depth: int = 0
+
+
+class ThreadResponse(BaseModel):
+    folder: str
+    thread_id: str
+    messages: list[ThreadMessage]
+
+
 class InboxResponse(BaseModel):
     folder: str
     total: int
     emails: list[EmailSummary]
+    next_cursor: Optional[str] = None
 
 
 class FoldersResponse(BaseModel):
@@ -50,16 +62,27 @@ class FoldersResponse(BaseModel):
 
 class SearchRequest(BaseModel):
     query: str
+    folder: str = "INBOX"
+
+
+class SearchHit(EmailSummary):
+    source: str = "server"
+    score: Optional[float] = None
 
 
 class SearchResponse(BaseModel):
     summary: str
-    emails: list[EmailSummary]
+    emails: list[SearchHit]
     imap_query: str
+    source: str = "server"
+    path: str = "agent"
+    search_cache: Optional[dict[str, int]] = None
+    folder: str = "INBOX"
 
 
 class SummarizeRequest(BaseModel):
     uid: str
+    folder: str = "INBOX"
 
 
 class SummarizeResponse(BaseModel):
@@ -69,6 +92,7 @@ class SummarizeResponse(BaseModel):
 class DraftReplyRequest(BaseModel):
     uid: str
     instruction: str
+    folder: str = "INBOX"
 
 
 class DraftReplyResponse(BaseModel):
@@ -78,6 +102,7 @@ class DraftReplyResponse(BaseModel):
 
 class CategorizeRequest(BaseModel):
     uids: list[str]
+    folder: str = "INBOX"
 
 
 class CategoryResult(BaseModel):
@@ -92,12 +117,38 @@ class CategorizeResponse(BaseModel):
 
 class ActionItemsRequest(BaseModel):
     uid: str
+    folder: str = "INBOX"
 
 
 class ActionItemsResponse(BaseModel):
     items: list[str]
 
 
+class JobRequest(BaseModel):
+    kind: str  # "summarize" or "categorize"
+    folder: str = "INBOX"
+    uids: Optional[list[str]] = None
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    folder: str
+    status: str
+    batch_id: Optional[str] = None
+    total: int
+    skipped: int
+    succeeded: int
+    failed: int
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+class JobsResponse(BaseModel):
+    jobs: list[JobResponse]
+
+
 class SendRequest(BaseModel):
     to: str
     subject: str
@@ -108,3 +159,24 @@ class SendRequest(BaseModel):
 class SendResponse(BaseModel):
     success: bool
     message: str
+    id: Optional[str] = None  # Outbox entry, see GET /api/outbox/{id}
+
+
+class BulkSendRequest(BaseModel):
+    messages: list[SendRequest]
+
+
+class OutboxMessage(BaseModel):
+    id: str
+    recipients: str
+    subject: str
+    status: str  # "queued", "sending", "sent" or "failed"
+    attempts: int
+    next_attempt: float
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+class OutboxResponse(BaseModel):
+    messages: list[OutboxMessage]
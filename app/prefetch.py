@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+from app.ai.claude import ClaudeClient
+from app.ai.email_tools import (
+    BODY_TOKENS,
+    summarize_email,
+    cached_summary,
+    extract_action_items,
+    cached_action_items,
+)
+from app.ai.preprocess import clean_body, estimate_tokens
+from app.config import Settings
+from app.imap.aio import AsyncIMAPPool
+from app.imap.cache import HeaderCache
+from app.imap.message_cache import MessageCache, message_key
+from app.imap.parser import ParsedEmail
+from app.imap.sync import sync_folder
+
+logger = logging.getLogger(__name__)
+
+# Output budget of summarize_email / extract_action_items
+AI_MAX_TOKENS = 512
+
+
+class ActivityTracker:
+    """Counts user requests in flight so background work can stay out of their way."""
+
+    def __init__(self, quiet_period: float = 2.0):
+        self._quiet_period = quiet_period
+        self._in_flight = 0
+        self._last_active = 0.0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def begin(self) -> None:
+        self._in_flight += 1
+        self._idle.clear()
+
+    def end(self) -> None:
+        self._in_flight -= 1
+        self._last_active = time.monotonic()
+        if self._in_flight == 0:
+            self._idle.set()
+
+    async def wait_idle(self) -> float:
+        """Wait until no requests are in flight and none finished in the
+        last `quiet_period` seconds. Returns how long it waited."""
+        start = time.monotonic()
+        while True:
+            await self._idle.wait()
+            remaining = self._last_active + self._quiet_period - time.monotonic()
+            if remaining <= 0 and self._idle.is_set():
+                return time.monotonic() - start
+            await asyncio.sleep(max(remaining, 0.05))
+
+
+class ActivityMiddleware:
+    """ASGI middleware feeding /api requests into an ActivityTracker.
+
+    A request counts until its last body chunk is sent, so streamed
+    responses keep background work paused while they run. Long-lived
+    streams such as /api/events belong in `exclude`.
+    """
+
+    def __init__(self, app, tracker: ActivityTracker, exclude: tuple[str, ...] = ("/api/metrics",)):
+        self.app = app
+        self.tracker = tracker
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/") or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        self.tracker.begin()
+        done = False
+
+        async def _send(message):
+            nonlocal done
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body") and not done:
+                done = True
+                self.tracker.end()
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            if not done:
+                done = True
+                self.tracker.end()
+
+
+class TokenBudget:
+    """Estimated Claude tokens the worker may spend per rolling hour."""
+
+    def __init__(self, per_hour: int):
+        self._per_hour = per_hour
+        self._spent: list[tuple[float, int]] = []
+
+    def remaining(self) -> int:
+        cutoff = time.monotonic() - 3600
+        self._spent = [(t, n) for t, n in self._spent if t > cutoff]
+        return self._per_hour - sum(n for _, n in self._spent)
+
+    def try_spend(self, tokens: int) -> bool:
+        if tokens > self.remaining():
+            return False
+        self._spent.append((time.monotonic(), tokens))
+        return True
+
+
+@dataclass
+class PrefetchStats:
+    runs: int = 0
+    messages_fetched: int = 0
+    summaries: int = 0
+    action_items: int = 0
+    budget_skips: int = 0
+    paused_seconds: float = 0.0
+    errors: int = 0
+    last_run: float = 0.0
+
+
+class PrefetchWorker:
+    """Keeps the newest messages of each watched folder warm.
+
+    Every `interval` seconds it syncs the header cache, then downloads and
+    parses the newest `count` messages into the MessageCache, so opening
+    one doesn't wait on IMAP. With `ai` enabled it also stores summaries
+    and action items in the response cache, within `token_budget`
+    estimated tokens per hour. All work pauses while user requests are in
+    flight.
+    """
+
+    def __init__(
+        self,
+        pool: AsyncIMAPPool,
+        header_cache: HeaderCache,
+        messages: MessageCache,
+        claude: ClaudeClient,
+        settings: Settings,
+        activity: ActivityTracker,
+    ):
+        self._pool = pool
+        self._cache = header_cache
+        self._messages = messages
+        self._claude = claude
+        self._activity = activity
+        self._folders = settings.prefetch_folders
+        self._count = settings.prefetch_count
+        self._interval = settings.prefetch_interval
+        self._concurrency = max(settings.prefetch_concurrency, 1)
+        self._sync_interval = settings.cache_sync_interval
+        self._ai = settings.prefetch_ai and bool(settings.anthropic_api_key)
+        self._budget = TokenBudget(settings.prefetch_token_budget)
+        self._stats = PrefetchStats()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats.errors += 1
+                logger.warning("Prefetch pass failed: %s", e)
+            await asyncio.sleep(self._interval)
+
+    async def run_once(self) -> None:
+        if not self._pool.is_connected:
+            return
+        self._stats.runs += 1
+        for folder in self._folders:
+            await self._warm_folder(folder)
+        self._stats.last_run = time.time()
+
+    async def _idle(self) -> None:
+        self._stats.paused_seconds += await self._activity.wait_idle()
+
+    async def _warm_folder(self, folder: str) -> None:
+        await self._idle()
+        async with self._pool.connection(folder) as imap:
+            state = await sync_folder(imap, self._cache, folder, max_age=self._sync_interval)
+        account = self._pool.account
+        headers = self._cache.list_headers(account, folder, limit=self._count)
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def _warm(uid: str) -> None:
+            ref = message_key(account, folder, state.uidvalidity, uid)
+            async with semaphore:
+                await self._idle()
+                parsed = self._messages.peek(ref)
+                if parsed is None:
+                    self._stats.messages_fetched += 1
+                    parsed = await self._messages.get(ref, lambda: self._fetch(folder, uid))
+                if self._ai:
+                    await self._warm_ai(parsed, ref)
+
+        results = await asyncio.gather(*(_warm(h["uid"]) for h in headers), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self._stats.errors += 1
+                logger.warning("Prefetch of a message in %s failed: %s", folder, result)
+
+    async def _fetch(self, folder: str, uid: str) -> ParsedEmail:
+        async with self._pool.connection(folder) as imap:
+            return await imap.fetch_message(uid, folder=folder)
+
+    async def _warm_ai(self, parsed: ParsedEmail, ref: str) -> None:
+        body_tokens = estimate_tokens(clean_body(parsed))
+        for cached, compute, endpoint, counter in (
+            (cached_summary, summarize_email, "summarize", "summaries"),
+            (cached_action_items, extract_action_items, "action_items", "action_items"),
+        ):
+            cost = min(body_tokens, BODY_TOKENS[endpoint]) + AI_MAX_TOKENS
+            if cached(ref, self._claude) is not None:
+                continue
+            if not self._budget.try_spend(cost):
+                self._stats.budget_skips += 1
+                return
+            await self._idle()
+            await asyncio.to_thread(compute, parsed, self._claude, ref)
+            setattr(self._stats, counter, getattr(self._stats, counter) + 1)
+
+    def stats(self) -> dict:
+        data = asdict(self._stats)
+        data.update(
+            folders=list(self._folders),
+            count=self._count,
+            ai=self._ai,
+            token_budget_remaining=self._budget.remaining(),
+            user_requests_in_flight=self._activity.in_flight,
+        )
+        return data
@@ -1,14 +1,146 @@
+import copy
+import logging
+import re
 import smtplib
+import time
+from email.generator import BytesGenerator
+from email.message import Message
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.policy import SMTP as SMTP_POLICY
+from email.utils import formatdate, getaddresses, make_msgid
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+SMTP_TIMEOUT = 30
+DOT_RE = re.compile(rb"^\.", re.MULTILINE)
+
+
+def build_message(
+    sender: str,
+    to: str,
+    subject: str,
+    body: str,
+    in_reply_to: str | None = None,
+) -> MIMEMultipart:
+    """A plain-text message with its own Date and Message-ID, so a retried
+    send is the same message to the recipient."""
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-ID"] = make_msgid(domain=sender.rpartition("@")[2] or None)
+    if in_reply_to:
+        msg["In-Reply-To"] = in_reply_to
+        msg["References"] = in_reply_to
+
+    msg.attach(MIMEText(body, "plain"))
+    return msg
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """The session is gone (smtplib's exceptions are OSErrors too, but a
+    rejected command leaves the session usable)."""
+    return isinstance(error, smtplib.SMTPServerDisconnected) or (
+        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+    )
+
+
+def message_recipients(msg: Message) -> list[str]:
+    """Envelope recipients: every address in To, Cc and Bcc."""
+    fields = [value for name in ("To", "Cc", "Bcc") for value in msg.get_all(name, [])]
+    return [addr for _, addr in getaddresses(fields) if addr]
+
+
+def message_bytes(msg: Message) -> bytes:
+    """The message as sent: CRLF line endings, Bcc removed."""
+    if msg.get_all("Bcc"):
+        msg = copy.deepcopy(msg)
+        del msg["Bcc"]
+    out = BytesIO()
+    BytesGenerator(out, policy=SMTP_POLICY).flatten(msg)
+    return out.getvalue()
 
 
 class SMTPClient:
-    def __init__(self, host: str, port: int, user: str, password: str):
+    """One authenticated SMTP session, kept open between messages.
+
+    Messages after the first on a session start with RSET instead of a new
+    TCP connection, STARTTLS and AUTH. When the server advertises
+    PIPELINING, RSET, MAIL FROM, every RCPT TO and DATA go out in one write
+    and their replies are read together, so a message costs two round
+    trips (envelope, then data) however many recipients it has.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str, idle_timeout: float = 240.0):
         self._host = host
         self._port = port
         self._user = user
         self._password = password
+        self._idle_timeout = idle_timeout
+        self._server: smtplib.SMTP | None = None
+        self._last_activity = 0.0
+        self._reset_needed = False
+        self._data_sent = False
+        self.pipelining = False
+        self.sessions = 0
+        self.messages = 0
+
+    @property
+    def user(self) -> str:
+        return self._user
+
+    def _open_connection(self) -> smtplib.SMTP:
+        return smtplib.SMTP(self._host, self._port, timeout=SMTP_TIMEOUT)
+
+    def _starttls(self, server: smtplib.SMTP) -> None:
+        server.starttls()
+        server.ehlo()
+
+    def connect(self) -> None:
+        self._close_quiet()
+        server = self._open_connection()
+        try:
+            server.ehlo()
+            self._starttls(server)
+            server.login(self._user, self._password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._last_activity = time.time()
+        self._reset_needed = False
+        self.pipelining = server.has_extn("pipelining")
+        self.sessions += 1
+
+    @property
+    def is_connected(self) -> bool:
+        """False once the session has been idle long enough that the server
+        has probably dropped it (RFC 5321 servers wait at least 5 minutes)."""
+        if self._server is None:
+            return False
+        if time.time() - self._last_activity > self._idle_timeout:
+            self._close_quiet()
+            return False
+        return True
+
+    def disconnect(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+        self._close_quiet()
+
+    def _close_quiet(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
 
     def send(
         self,
@@ -17,19 +149,89 @@ class SMTPClient:
         body: str,
         in_reply_to: str | None = None,
     ) -> None:
-        msg = MIMEMultipart()
-        msg["From"] = self._user
-        msg["To"] = to
-        msg["Subject"] = subject
-        if in_reply_to:
-            msg["In-Reply-To"] = in_reply_to
-            msg["References"] = in_reply_to
+        self.send_message(build_message(self._user, to, subject, body, in_reply_to))
 
-        msg.attach(MIMEText(body, "plain"))
+    def send_message(self, msg: Message) -> dict:
+        return self.send_data(message_recipients(msg), message_bytes(msg))
 
-        with smtplib.SMTP(self._host, self._port) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(self._user, self._password)
-            server.send_message(msg)
+    def send_data(self, recipients: list[str], data: bytes) -> dict:
+        """Send one message; returns the recipients the server refused.
+
+        A session found dead before any message data went out is reopened
+        and the message retried once. Raises the usual smtplib exceptions.
+        """
+        fresh = not self.is_connected
+        if fresh:
+            self.connect()
+        try:
+            return self._transaction(recipients, data)
+        except Exception as e:
+            if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code == 421:
+                self._close_quiet()
+            if not is_connection_error(e):
+                raise
+            self._close_quiet()
+            if fresh or self._data_sent:
+                raise
+            logger.info("SMTP session to %s was closed, reconnecting", self._host)
+            self.connect()
+            return self._transaction(recipients, data)
+
+    def _transaction(self, recipients: list[str], data: bytes) -> dict:
+        server = self._server
+        self._data_sent = False
+        reset, self._reset_needed = self._reset_needed, True
+        if self.pipelining:
+            refused = self._pipelined(server, recipients, data, reset)
+        else:
+            if reset:
+                _expect(server, server.rset(), 250)
+            self._data_sent = True
+            refused = server.sendmail(self._user, recipients, data)
+        self._last_activity = time.time()
+        self.messages += 1
+        return refused
+
+    def _pipelined(self, server: smtplib.SMTP, recipients: list[str], data: bytes, reset: bool) -> dict:
+        commands = ["RSET"] if reset else []
+        commands.append(f"MAIL FROM:{smtplib.quoteaddr(self._user)}")
+        commands += [f"RCPT TO:{smtplib.quoteaddr(r)}" for r in recipients]
+        commands.append("DATA")
+        server.send("".join(c + "\r\n" for c in commands))
+
+        # Read every reply before acting on any, so the session stays in step
+        rset = server.getreply() if reset else (250, b"")
+        mail = server.getreply()
+        refused = {}
+        for rcpt in recipients:
+            code, resp = server.getreply()
+            if code not in (250, 251):
+                refused[rcpt] = (code, resp)
+        code, resp = server.getreply()
+
+        if rset[0] != 250 or mail[0] != 250 or len(refused) == len(recipients):
+            if code == 354:
+                # DATA was accepted anyway; end it empty so the server rejects it
+                server.send(".\r\n")
+                server.getreply()
+            if rset[0] != 250:
+                raise smtplib.SMTPResponseException(*rset)
+            if mail[0] != 250:
+                raise smtplib.SMTPSenderRefused(mail[0], mail[1], self._user)
+            raise smtplib.SMTPRecipientsRefused(refused)
+        if code != 354:
+            raise smtplib.SMTPDataError(code, resp)
+
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+        self._data_sent = True
+        server.send(DOT_RE.sub(b"..", data) + b".\r\n")
+        code, resp = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        return refused
+
+
+def _expect(server: smtplib.SMTP, reply: tuple[int, bytes], code: int) -> None:
+    if reply[0] != code:
+        raise smtplib.SMTPResponseException(reply[0], reply[1])
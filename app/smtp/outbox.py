@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from email.message import Message
+from typing import Optional
+
+from app.config import Settings
+from app.imap.cache import open_cache_db
+from app.smtp.client import is_connection_error, message_bytes, message_recipients
+from app.smtp.pool import SMTPPool
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("queued", "sending", "sent", "failed")
+# Sent messages are kept this long for GET /api/outbox, then deleted
+SENT_RETENTION = 7 * 24 * 3600
+# Longest the sender sleeps when nothing is due; enqueue() wakes it earlier
+MAX_SLEEP = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    account TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    subject TEXT NOT NULL DEFAULT '',
+    message BLOB NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, account, next_attempt);
+"""
+
+OUTBOX_FIELDS = (
+    "id", "account", "recipients", "subject", "status", "attempts", "next_attempt",
+    "error", "created_at", "updated_at",
+)
+
+
+def retry_delay(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff: base, 2*base, 4*base, ... up to cap."""
+    return min(base * 2 ** max(attempts - 1, 0), cap)
+
+
+def is_permanent(error: Exception) -> bool:
+    """5xx replies won't succeed on retry; everything else (4xx, dropped
+    connections, timeouts, a bad login that may be fixed) is retried."""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+class OutboxStore:
+    """Outgoing messages, kept in the cache database until the server has
+    accepted them, so nothing queued is lost on a restart."""
+
+    def __init__(self, path: str):
+        self._db = open_cache_db(path, SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def add(self, account: str, messages: list[Message]) -> list[str]:
+        now = time.time()
+        rows = [
+            (
+                uuid.uuid4().hex[:12], account, ", ".join(message_recipients(msg)),
+                str(msg.get("Subject", "")), message_bytes(msg), now, now, now,
+            )
+            for msg in messages
+        ]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO outbox (id, account, recipients, subject, message, status, "
+                "next_attempt, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                rows,
+            )
+        return [row[0] for row in rows]
+
+    def claim(self, account: str, limit: int, now: Optional[float] = None) -> list[dict]:
+        """Mark up to `limit` due messages as sending and return them with
+        their recipient list and raw bytes, oldest first."""
+        now = time.time() if now is None else now
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "SELECT id, recipients, message, attempts FROM outbox "
+                "WHERE status = 'queued' AND account = ? AND next_attempt <= ? "
+                "ORDER BY next_attempt, created_at LIMIT ?",
+                (account, now, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE outbox SET status = 'sending', updated_at = ? WHERE id = ?",
+                [(now, row[0]) for row in rows],
+            )
+        return [
+            {"id": id_, "recipients": recipients.split(", "), "message": message, "attempts": attempts}
+            for id_, recipients, message, attempts in rows
+        ]
+
+    def finish(self, results: list[tuple[str, str, Optional[str], int, float]]) -> None:
+        """Record (id, status, error, attempts, next_attempt) per message."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE outbox SET status = ?, error = ?, attempts = ?, next_attempt = ?, "
+                "updated_at = ? WHERE id = ?",
+                [(status, error, attempts, next_attempt, now, id_) for id_, status, error, attempts, next_attempt in results],
+            )
+
+    def requeue_interrupted(self) -> int:
+        """Messages left 'sending' by a crash go back in the queue. The
+        server may have accepted some of them already; resending is the
+        lesser harm, and they keep their Message-ID."""
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE outbox SET status = 'queued' WHERE status = 'sending'"
+            ).rowcount
+
+    def next_due(self, account: str) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(next_attempt) FROM outbox WHERE status = 'queued' AND account = ?",
+                (account,),
+            ).fetchone()
+        return row[0]
+
+    def prune(self, max_age: float = SENT_RETENTION) -> int:
+        with self._lock, self._db:
+            return self._db.execute(
+                "DELETE FROM outbox WHERE status = 'sent' AND updated_at < ?", (time.time() - max_age,)
+            ).rowcount
+
+    def get(self, message_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(OUTBOX_FIELDS)} FROM outbox WHERE id = ?", (message_id,)
+            ).fetchone()
+        return dict(zip(OUTBOX_FIELDS, row)) if row else None
+
+    def pending(self, account: str) -> int:
+        """Messages of `account` not yet sent or failed."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending') AND account = ?",
+                (account,),
+            ).fetchone()
+        return row[0]
+
+    def recent(self, account: str, limit: int = 50) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(OUTBOX_FIELDS)} FROM outbox WHERE account = ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (account, limit),
+            ).fetchall()
+        return [dict(zip(OUTBOX_FIELDS, row)) for row in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+
+@dataclass
+class OutboxStats:
+    runs: int = 0
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    last_run: float = 0.0
+
+
+class OutboxSender:
+    """Background sender for the outbox.
+
+    `enqueue` stores messages and returns at once. For every account whose
+    SMTPPool is attached (the open accounts), the sender claims due
+    messages in groups of `outbox_batch_size`, one group per pooled
+    session, and sends each group back to back on its session. Messages of
+    other accounts wait in the store until the account is opened again. Transient
+    failures are retried with exponential backoff (`outbox_retry_base`
+    doubling up to `outbox_retry_max`); 5xx rejections and messages out of
+    `outbox_max_attempts` are marked failed.
+    """
+
+    def __init__(self, store: OutboxStore, settings: Settings):
+        self._pools: dict[str, SMTPPool] = {}
+        self._store = store
+        self._batch_size = max(settings.outbox_batch_size, 1)
+        self._max_attempts = settings.outbox_max_attempts
+        self._retry_base = settings.outbox_retry_base
+        self._retry_max = settings.outbox_retry_max
+        self._stats = OutboxStats()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._store.requeue_interrupted()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def attach(self, pool: SMTPPool) -> None:
+        """Send `pool.account`'s messages through `pool`."""
+        self._pools[pool.account] = pool
+        self.wake()
+
+    def detach(self, pool: SMTPPool) -> None:
+        if self._pools.get(pool.account) is pool:
+            del self._pools[pool.account]
+
+    def enqueue(self, account: str, messages: list[Message]) -> list[dict]:
+        ids = self._store.add(account, messages)
+        self.wake()
+        return [self._store.get(id_) for id_ in ids]
+
+    def get(self, message_id: str) -> Optional[dict]:
+        return self._store.get(message_id)
+
+    def messages(self, account: str) -> list[dict]:
+        return self._store.recent(account)
+
+    def pending(self, account: str) -> int:
+        return self._store.pending(account)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.run_once():
+                    pass
+                self._store.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Outbox pass failed: %s", e)
+            due = [self._store.next_due(a) for a, pool in self._pools.items() if pool.is_configured]
+            due = [d for d in due if d is not None]
+            timeout = min(max(min(due) - time.time(), 0.0), MAX_SLEEP) if due else MAX_SLEEP
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Send what is due, up to one group per pooled session of each
+        attached account. Returns the number of messages attempted."""
+        groups = []
+        for account, pool in list(self._pools.items()):
+            if not pool.is_configured:
+                continue
+            claimed = self._store.claim(account, self._batch_size * pool.max_size)
+            groups += [
+                (pool, claimed[i : i + self._batch_size])
+                for i in range(0, len(claimed), self._batch_size)
+            ]
+        if not groups:
+            return 0
+        self._stats.runs += 1
+        results = await asyncio.gather(*(asyncio.to_thread(self._send_group, p, g) for p, g in groups))
+        rows = [row for group in results for row in group]
+        self._store.finish(rows)
+        for _, status, error, _, _ in rows:
+            if status == "sent":
+                self._stats.sent += 1
+            elif status == "failed":
+                self._stats.failed += 1
+            elif error is not None:
+                self._stats.retried += 1
+        self._stats.last_run = time.time()
+        return len(rows)
+
+    def _send_group(self, pool: SMTPPool, items: list[dict]) -> list[tuple]:
+        """Send `items` on one of `pool`'s sessions. Returns finish() rows."""
+        rows = []
+        try:
+            with pool.connection() as smtp:
+                for item in items:
+                    try:
+                        refused = smtp.send_data(item["recipients"], item["message"])
+                    except Exception as e:
+                        if is_connection_error(e):
+                            raise
+                        rows.append(self._failure(item, e))
+                        continue
+                    error = f"Refused: {', '.join(refused)}" if refused else None
+                    rows.append((item["id"], "sent", error, item["attempts"] + 1, time.time()))
+        except Exception as e:
+            # The session failed: the message it was on counts an attempt,
+            # the ones after it go back in the queue untouched
+            done = {row[0] for row in rows}
+            pending = [item for item in items if item["id"] not in done]
+            if pending:
+                rows.append(self._failure(pending[0], e))
+                rows += [(item["id"], "queued", None, item["attempts"], time.time()) for item in pending[1:]]
+        return rows
+
+    def _failure(self, item: dict, error: Exception) -> tuple:
+        attempts = item["attempts"] + 1
+        if is_permanent(error) or attempts >= self._max_attempts:
+            logger.warning("Outbox message %s failed: %s", item["id"], error)
+            return item["id"], "failed", str(error), attempts, time.time()
+        delay = retry_delay(attempts, self._retry_base, self._retry_max)
+        return item["id"], "queued", str(error), attempts, time.time() + delay
+
+    def stats(self) -> dict:
+        data = asdict(self._stats)
+        data["accounts"] = len(self._pools)
+        data["queue"] = self._store.counts()
+        return data
@@ -0,0 +1,169 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Iterator, Optional
+
+from app.imap.pool import PoolTimeout
+from app.smtp.client import SMTPClient, is_connection_error
+
+
+@dataclass
+class SMTPPoolStats:
+    checkouts: int = 0
+    waits: int = 0
+    wait_time_total: float = 0.0
+    created: int = 0
+    discarded: int = 0
+
+
+class SMTPPool:
+    """Bounded pool of SMTPClient sessions.
+
+    A session is used by one sender at a time and stays logged in between
+    checkouts, so consecutive messages skip the connect/STARTTLS/AUTH
+    round trips. Sessions idle for longer than `idle_timeout` are reopened
+    on their next checkout.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        max_size: int = 2,
+        checkout_timeout: float = 30.0,
+        idle_timeout: float = 240.0,
+        client_class: type[SMTPClient] = SMTPClient,
+    ):
+        self._host = host
+        self._port = port
+        self._user = user
+        self._password = password
+        self._max_size = max_size
+        self._checkout_timeout = checkout_timeout
+        self._idle_timeout = idle_timeout
+        self._client_class = client_class
+
+        self._cond = threading.Condition()
+        self._idle: list[SMTPClient] = []
+        self._in_use: dict[int, SMTPClient] = {}
+        self._size = 0
+        self._generation = 0
+        self._generations: dict[int, int] = {}
+        self._stats = SMTPPoolStats()
+        # Counters of sessions that have left the pool
+        self._retired_sessions = 0
+        self._retired_messages = 0
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def account(self) -> str:
+        return f"{self._user}@{self._host}"
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self._host and self._user)
+
+    def reconfigure(self, host: str, port: int, user: str, password: str) -> None:
+        """Switch server or credentials. Idle sessions close now, busy ones on checkin."""
+        with self._cond:
+            self._host, self._port, self._user, self._password = host, port, user, password
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for client in idle:
+            self._retire(client)
+
+    def close(self) -> None:
+        self.reconfigure(self._host, self._port, self._user, self._password)
+
+    def _new_client(self) -> SMTPClient:
+        return self._client_class(
+            host=self._host,
+            port=self._port,
+            user=self._user,
+            password=self._password,
+            idle_timeout=self._idle_timeout,
+        )
+
+    def checkout(self, timeout: Optional[float] = None) -> SMTPClient:
+        """An idle session if there is one, else a new (not yet connected)
+        client; SMTPClient.send_data connects on first use."""
+        timeout = self._checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    client = self._idle.pop()
+                    break
+                if self._size < self._max_size:
+                    self._size += 1
+                    self._stats.created += 1
+                    client = self._new_client()
+                    self._generations[id(client)] = self._generation
+                    break
+                waited = True
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise PoolTimeout(f"No SMTP session available after {timeout:.0f}s")
+                self._cond.wait(remaining)
+
+            self._in_use[id(client)] = client
+            self._stats.checkouts += 1
+            if waited:
+                self._stats.waits += 1
+                self._stats.wait_time_total += time.monotonic() - start
+        return client
+
+    def checkin(self, client: SMTPClient, discard: bool = False) -> None:
+        with self._cond:
+            self._in_use.pop(id(client), None)
+            stale = self._generations.get(id(client)) != self._generation
+            if discard or stale:
+                self._size -= 1
+                self._stats.discarded += 1
+                self._generations.pop(id(client), None)
+            else:
+                self._idle.append(client)
+            self._cond.notify()
+        if discard or stale:
+            self._retire(client)
+
+    def _retire(self, client: SMTPClient) -> None:
+        self._generations.pop(id(client), None)
+        self._retired_sessions += client.sessions
+        self._retired_messages += client.messages
+        client.disconnect()
+
+    @contextmanager
+    def connection(self) -> Iterator[SMTPClient]:
+        client = self.checkout()
+        try:
+            yield client
+        except BaseException as e:
+            # A dropped session mustn't be handed to the next sender
+            self.checkin(client, discard=is_connection_error(e))
+            raise
+        else:
+            self.checkin(client)
+
+    def stats(self) -> dict:
+        with self._cond:
+            clients = self._idle + list(self._in_use.values())
+            data = asdict(self._stats)
+            data.update(
+                size=self._size,
+                max_size=self._max_size,
+                idle=len(self._idle),
+                in_use=len(self._in_use),
+                sessions=self._retired_sessions + sum(c.sessions for c in clients),
+                messages=self._retired_messages + sum(c.messages for c in clients),
+            )
+        return data
@@ -21,6 +21,43 @@ const API = {
     return res.json();
   },
 
+  // POST that answers with Server-Sent Events; calls onEvent(name, data) per event
+  async stream(url, data, onEvent) {
+    const res = await fetch(url, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(data),
+    });
+    if (!res.ok) {
+      const err = await res.json().catch(() => ({ detail: res.statusText }));
+      throw new Error(err.detail || "Request failed");
+    }
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let result = null;
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split("\n\n");
+      buffer = events.pop();
+      for (const raw of events) {
+        let name = "message";
+        let payload = "";
+        for (const line of raw.split("\n")) {
+          if (line.startsWith("event: ")) name = line.slice(7);
+          else if (line.startsWith("data: ")) payload += line.slice(6);
+        }
+        const parsed = payload ? JSON.parse(payload) : {};
+        if (name === "error") throw new Error(parsed.detail || "Request failed");
+        if (name === "done") result = parsed;
+        onEvent(name, parsed);
+      }
+    }
+    return result;
+  },
+
   // Auth
   connect(data) {
     return this.post("/api/connect", data);
@@ -33,30 +70,75 @@ const API = {
   folders() {
     return this.get("/api/folders");
   },
-  inbox(folder = "INBOX", limit = 50) {
-    return this.get(`/api/inbox?folder=${encodeURIComponent(folder)}&limit=${limit}`);
+  inbox(folder = "INBOX", limit = 50, cursor = null) {
+    let url = `/api/inbox?folder=${encodeURIComponent(folder)}&limit=${limit}`;
+    if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+    return this.get(url);
   },
   email(uid, folder = "INBOX") {
     return this.get(`/api/email/${uid}?folder=${encodeURIComponent(folder)}`);
   },
 
+  thread(uid, folder = "INBOX") {
+    return this.get(`/api/thread/${uid}?folder=${encodeURIComponent(folder)}`);
+  },
+
+  attachmentUrl(uid, part, folder = "INBOX") {
+    return `/api/email/${uid}/attachments/${encodeURIComponent(part)}?folder=${encodeURIComponent(folder)}`;
+  },
+
+  events() {
+    return new EventSource("/api/events");
+  },
+
   // Search
-  search(query) {
-    return this.post("/api/search", { query });
+  search(query, folder = "INBOX") {
+    return this.post("/api/search", { query, folder });
+  },
+  searchStream(query, folder, onEvent) {
+    return this.stream("/api/search/stream", { query, folder }, onEvent);
   },
 
   // AI
-  summarize(uid) {
-    return this.post("/api/summarize", { uid });
+  summarize(uid, folder = "INBOX") {
+    return this.post("/api/summarize", { uid, folder });
   },
-  draftReply(uid, instruction) {
-    return this.post("/api/draft-reply", { uid, instruction });
+  summarizeStream(uid, folder, onEvent) {
+    return this.stream("/api/summarize/stream", { uid, folder }, onEvent);
   },
-  categorize(uids) {
-    return this.post("/api/categorize", { uids });
+  draftReply(uid, instruction, folder = "INBOX") {
+    return this.post("/api/draft-reply", { uid, instruction, folder });
+  },
+  draftReplyStream(uid, instruction, folder, onEvent) {
+    return this.stream("/api/draft-reply/stream", { uid, instruction, folder }, onEvent);
+  },
+  categorize(uids, folder = "INBOX") {
+    return this.post("/api/categorize", { uids, folder });
+  },
+  async categorizeStream(uids, folder, onChunk) {
+    const res = await fetch("/api/categorize/stream", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ uids, folder }),
+    });
+    if (!res.ok) {
+      const err = await res.json().catch(() => ({ detail: res.statusText }));
+      throw new Error(err.detail || "Request failed");
+    }
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split("\n");
+      buffer = lines.pop();
+      for (const line of lines) if (line.trim()) onChunk(JSON.parse(line));
+    }
   },
-  actionItems(uid) {
-    return this.post("/api/action-items", { uid });
+  actionItems(uid, folder = "INBOX") {
+    return this.post("/api/action-items", { uid, folder });
   },
 
   // Send
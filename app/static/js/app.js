@@ -5,7 +5,11 @@ const App = {
     folders: [],
     activeFolder: "INBOX",
     emails: [],
+    total: 0,
+    nextCursor: null,
     currentEmail: null,
+    // Folder of currentEmail; search results can come from another folder
+    emailFolder: "INBOX",
     searchMode: false,
   },
 
@@ -73,6 +77,7 @@ const App = {
   },
 
   async loadInbox() {
+    this.subscribeEvents();
     this.$header.textContent = this.state.user;
     this.$header.className = "status connected";
     document.getElementById("search-bar").hidden = false;
@@ -92,12 +97,41 @@ const App = {
     try {
       const inbox = await API.inbox(this.state.activeFolder);
       this.state.emails = inbox.emails;
+      this.state.total = inbox.total;
+      this.state.nextCursor = inbox.next_cursor;
       this.renderEmailList();
     } catch (err) {
       this.$main.innerHTML = `<div class="error-msg">Failed to load emails: ${escapeHtml(err.message)}</div>`;
     }
   },
 
+  // Live updates pushed by the server's IDLE watcher
+  subscribeEvents() {
+    if (this.events) return;
+    this.events = API.events();
+    this.events.addEventListener("mail", (e) => this.applyMailEvent(JSON.parse(e.data)));
+  },
+
+  applyMailEvent(event) {
+    if (event.folder !== this.state.activeFolder) return;
+    const gone = new Set(event.expunged);
+    const flags = new Map(event.flags.map((f) => [f.uid, f.flags]));
+    const known = new Set(this.state.emails.map((e) => e.uid));
+    const added = event.new
+      .filter((h) => !known.has(h.uid))
+      .map((h) => ({ uid: h.uid, subject: h.subject, sender: h.sender, date: h.date, is_read: h.is_read }));
+    this.state.emails = added.concat(
+      this.state.emails
+        .filter((e) => !gone.has(e.uid))
+        .map((e) => (flags.has(e.uid) ? { ...e, is_read: flags.get(e.uid).includes("\\Seen") } : e))
+    );
+    this.state.total = event.total;
+    // Only re-render if the list is what's on screen
+    if (!this.state.searchMode && this.$main.querySelector(".inbox-header")) {
+      this.renderEmailList();
+    }
+  },
+
   renderSidebar() {
     this.$sidebar.innerHTML = Components.folderList(this.state.folders, this.state.activeFolder);
 
@@ -113,28 +147,67 @@ const App = {
     this.$main.innerHTML = `
       <div class="inbox-header">
         <h2>${escapeHtml(this.state.activeFolder)}</h2>
-        <span class="email-count">${this.state.emails.length} emails</span>
+        <span class="email-count">${this.state.total || this.state.emails.length} emails</span>
       </div>
       <div class="email-list">${Components.emailList(this.state.emails)}</div>
+      ${this.state.nextCursor ? '<button class="btn btn-primary" id="btn-load-more">Load more</button>' : ""}
     `;
 
     this.$main.querySelectorAll(".email-row").forEach((el) => {
       el.addEventListener("click", () => this.openEmail(el.dataset.uid));
     });
+
+    const loadMore = document.getElementById("btn-load-more");
+    if (loadMore) {
+      loadMore.addEventListener("click", () => this.loadMore(loadMore));
+    }
   },
 
-  async openEmail(uid) {
+  async loadMore(btn) {
+    btn.disabled = true;
+    btn.textContent = "Loading...";
+    try {
+      const page = await API.inbox(this.state.activeFolder, 50, this.state.nextCursor);
+      this.state.emails = this.state.emails.concat(page.emails);
+      this.state.total = page.total;
+      this.state.nextCursor = page.next_cursor;
+      this.renderEmailList();
+    } catch (err) {
+      btn.disabled = false;
+      btn.textContent = "Load more";
+    }
+  },
+
+  async openEmail(uid, folder = this.state.activeFolder) {
     this.$main.innerHTML = Components.loading("Loading email...");
     try {
-      const email = await API.email(uid, this.state.activeFolder);
+      const email = await API.email(uid, folder);
       this.state.currentEmail = email;
-      this.$main.innerHTML = Components.emailDetail(email);
+      this.state.emailFolder = folder;
+      this.$main.innerHTML = Components.emailDetail(email, folder);
       this.bindDetailEvents(email);
+      this.loadThread(email.uid);
     } catch (err) {
       this.$main.innerHTML = `<div class="error-msg">Failed to load email: ${escapeHtml(err.message)}</div>`;
     }
   },
 
+  async loadThread(uid) {
+    let thread;
+    try {
+      thread = await API.thread(uid, this.state.emailFolder);
+    } catch (err) {
+      return; // No conversation view, the message itself is already shown
+    }
+    const el = document.getElementById("thread-view");
+    if (!el || thread.messages.length < 2 || this.state.currentEmail?.uid !== uid) return;
+    el.innerHTML = Components.threadView(thread, uid);
+    el.hidden = false;
+    el.querySelectorAll(".thread-row:not(.current)").forEach((row) => {
+      row.addEventListener("click", () => this.openEmail(row.dataset.uid, this.state.emailFolder));
+    });
+  },
+
   bindDetailEvents(email) {
     document.getElementById("btn-back").addEventListener("click", () => {
       if (this.state.searchMode) {
@@ -150,8 +223,12 @@ const App = {
       resultEl.hidden = false;
       resultEl.innerHTML = Components.loading("Summarizing...");
       try {
-        const resp = await API.summarize(email.uid);
-        resultEl.innerHTML = `<div class="ai-card"><strong>Summary:</strong><p>${escapeHtml(resp.summary)}</p></div>`;
+        let text = "";
+        await API.summarizeStream(email.uid, this.state.emailFolder, (event, data) => {
+          if (event !== "token") return;
+          text += data.text;
+          resultEl.innerHTML = `<div class="ai-card"><strong>Summary:</strong><p>${escapeHtml(text)}</p></div>`;
+        });
       } catch (err) {
         resultEl.innerHTML = `<div class="error-msg">${escapeHtml(err.message)}</div>`;
       }
@@ -162,7 +239,7 @@ const App = {
       resultEl.hidden = false;
       resultEl.innerHTML = Components.loading("Extracting action items...");
       try {
-        const resp = await API.actionItems(email.uid);
+        const resp = await API.actionItems(email.uid, this.state.emailFolder);
         const items = resp.items.length
           ? `<ul>${resp.items.map((i) => `<li>${escapeHtml(i)}</li>`).join("")}</ul>`
           : "<p>No action items found.</p>";
@@ -186,16 +263,25 @@ const App = {
       draftResult.innerHTML = Components.loading("Generating draft...");
 
       try {
-        const resp = await API.draftReply(email.uid, instruction);
-        draftResult.hidden = false;
-        draftResult.innerHTML = `
-          <h4>Draft Reply (${escapeHtml(resp.subject)})</h4>
-          <textarea id="draft-text" rows="8">${escapeHtml(resp.draft)}</textarea>
-          <div class="draft-actions">
-            <button class="btn btn-primary" id="btn-send-draft">Send Reply</button>
-          </div>
-        `;
-        document.getElementById("btn-send-draft").addEventListener("click", () => {
+        let textarea = null;
+        const resp = await API.draftReplyStream(email.uid, instruction, this.state.emailFolder, (event, data) => {
+          if (event === "subject") {
+            draftResult.innerHTML = `
+              <h4>Draft Reply (${escapeHtml(data.subject)})</h4>
+              <textarea id="draft-text" rows="8"></textarea>
+              <div class="draft-actions">
+                <button class="btn btn-primary" id="btn-send-draft" disabled>Send Reply</button>
+              </div>
+            `;
+            textarea = document.getElementById("draft-text");
+          } else if (event === "token" && textarea) {
+            textarea.value += data.text;
+          }
+        });
+        textarea.value = resp.draft;
+        const sendBtn = document.getElementById("btn-send-draft");
+        sendBtn.disabled = false;
+        sendBtn.addEventListener("click", () => {
           this.sendDraft(email, resp.subject);
         });
       } catch (err) {
@@ -208,7 +294,7 @@ const App = {
     const body = document.getElementById("draft-text").value;
     const btn = document.getElementById("btn-send-draft");
     btn.disabled = true;
-    btn.textContent = "Sending...";
+    btn.textContent = "Queuing...";
 
     try {
       await API.send({
@@ -216,7 +302,7 @@ const App = {
         subject: subject,
         body: body,
       });
-      btn.textContent = "Sent!";
+      btn.textContent = "Queued";
       btn.className = "btn btn-success";
     } catch (err) {
       btn.disabled = false;
@@ -231,12 +317,26 @@ const App = {
     this.$main.innerHTML = Components.loading("Searching with AI...");
 
     try {
-      const result = await API.search(query);
+      const steps = [];
+      let text = "";
+      const result = await API.searchStream(query, this.state.activeFolder, (event, data) => {
+        if (event === "search") {
+          text = "";
+          steps.push(`Searching: ${Object.entries(data.criteria).map(([k, v]) => `${k}=${v}`).join(", ")}`);
+        } else if (event === "results") {
+          steps.push(`${data.imap_query} -> ${data.total} found`);
+        } else if (event === "token") {
+          text += data.text;
+        } else {
+          return;
+        }
+        this.$main.innerHTML = Components.searchProgress(steps, text);
+      });
       this.$main.innerHTML = Components.searchResults(result);
 
       // Bind click on search result emails
       this.$main.querySelectorAll(".email-row").forEach((el) => {
-        el.addEventListener("click", () => this.openEmail(el.dataset.uid));
+        el.addEventListener("click", () => this.openEmail(el.dataset.uid, result.folder));
       });
     } catch (err) {
       this.$main.innerHTML = `<div class="error-msg">Search failed: ${escapeHtml(err.message)}</div>`;
@@ -69,7 +69,7 @@ const Components = {
       .join("");
   },
 
-  emailDetail(email) {
+  emailDetail(email, folder = "INBOX") {
     const body = email.body_html
       ? `<iframe class="email-body-frame" sandbox="" srcdoc="${escapeAttr(email.body_html)}"></iframe>`
       : `<pre class="email-body-plain">${escapeHtml(email.body_plain)}</pre>`;
@@ -77,7 +77,7 @@ const Components = {
     const attachments = email.attachments.length
       ? `<div class="attachments">
           <strong>Attachments:</strong>
-          ${email.attachments.map((a) => `<span class="attachment-badge">${escapeHtml(a.filename)} (${formatBytes(a.size)})</span>`).join("")}
+          ${email.attachments.map((a) => `<a class="attachment-badge" href="${escapeAttr(API.attachmentUrl(email.uid, a.part, folder))}" download>${escapeHtml(a.filename)} (${formatBytes(a.size)})</a>`).join("")}
         </div>`
       : "";
 
@@ -94,6 +94,7 @@ const Components = {
           </div>
           ${attachments}
         </div>
+        <div id="thread-view" class="thread-view" hidden></div>
         <div class="email-detail-body">${body}</div>
         <div class="ai-actions">
           <h3>AI Assistant</h3>
@@ -119,6 +120,21 @@ const Components = {
     `;
   },
 
+  threadView(thread, currentUid) {
+    const rows = thread.messages
+      .map(
+        (m) => `
+        <div class="thread-row ${m.uid === currentUid ? "current" : ""} ${m.is_read ? "read" : "unread"}"
+             data-uid="${m.uid}" style="padding-left: ${12 + Math.min(m.depth, 8) * 16}px">
+          <span class="thread-sender">${escapeHtml(m.sender)}</span>
+          <span class="thread-subject">${escapeHtml(m.subject)}</span>
+          <span class="thread-date">${formatDate(m.date)}</span>
+        </div>`
+      )
+      .join("");
+    return `<h4>Conversation (${thread.messages.length})</h4>${rows}`;
+  },
+
   searchResults(result) {
     return `
       <div class="search-results">
@@ -127,6 +143,8 @@ const Components = {
           <div class="ai-summary">${escapeHtml(result.summary)}</div>
           <div class="imap-query">
             <strong>IMAP Query:</strong> <code>${escapeHtml(result.imap_query)}</code>
+            &middot; <strong>Answered by:</strong> ${{ server: "mail server", index: "local index", mixed: "mail server and local index" }[result.source] || "mail server"}
+            ${result.path === "parser" ? "&middot; <em>parsed locally, no AI call</em>" : ""}
           </div>
         </div>
         <div class="search-email-list">
@@ -136,6 +154,18 @@ const Components = {
     `;
   },
 
+  searchProgress(steps, text) {
+    return `
+      <div class="search-results">
+        <div class="search-summary">
+          ${this.loading("Searching with AI...")}
+          ${steps.map((s) => `<div class="imap-query">${escapeHtml(s)}</div>`).join("")}
+          ${text ? `<div class="ai-summary">${escapeHtml(text)}</div>` : ""}
+        </div>
+      </div>
+    `;
+  },
+
   loading(message = "Loading...") {
     return `<div class="loading"><div class="spinner"></div><span>${message}</span></div>`;
   },
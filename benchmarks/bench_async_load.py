@@ -0,0 +1,87 @@
+"""Inbox-page throughput: threaded IMAPPool vs. pipelined AsyncIMAPPool.
+
+Each simulated request does what /api/inbox used to do against the server:
+UID SEARCH ALL followed by a header fetch of the newest page. The threaded
+path runs requests on a 40-thread executor (Starlette's default threadpool
+size); the async path runs them as coroutines sharing pipelined connections.
+
+    python -m benchmarks.bench_async_load [--rtt-ms 50] [--requests 400] [--pool-size 4]
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.imap.aio import AsyncIMAPPool
+from app.imap.pool import IMAPPool
+from benchmarks.fake_imap import FakeIMAPServer, LocalAsyncIMAPClient, LocalIMAPClient, make_messages
+
+
+def run_threaded(port: int, requests: int, pool_size: int, page: int) -> float:
+    pool = IMAPPool(
+        "127.0.0.1", port, "bench", "bench",
+        max_size=pool_size, checkout_timeout=300, client_class=LocalIMAPClient,
+    )
+    pool.connect()
+
+    def one_request(_):
+        with pool.connection("INBOX") as imap:
+            uids = imap.search("ALL", folder="INBOX")
+            return len(imap.fetch_headers(uids, limit=page))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=40) as executor:
+        results = list(executor.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - start
+    assert all(r == page for r in results)
+    pool.close()
+    return elapsed
+
+
+async def run_async(port: int, requests: int, pool_size: int, page: int, inflight: int) -> float:
+    pool = AsyncIMAPPool(
+        "127.0.0.1", port, "bench", "bench",
+        max_size=pool_size, max_inflight=inflight, checkout_timeout=300,
+        client_class=LocalAsyncIMAPClient,
+    )
+    await pool.connect()
+
+    async def one_request():
+        async with pool.connection("INBOX") as imap:
+            uids = await imap.search("ALL", folder="INBOX")
+            return len(await imap.fetch_headers(uids, limit=page, folder="INBOX"))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    assert all(r == page for r in results)
+    await pool.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, default=50.0)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--inflight", type=int, default=32)
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer({"INBOX": make_messages(2000)}, latency=args.rtt_ms / 1000).start()
+
+    threaded = run_threaded(server.port, args.requests, args.pool_size, args.page)
+    pipelined = asyncio.run(
+        run_async(server.port, args.requests, args.pool_size, args.page, args.inflight)
+    )
+    server.stop()
+
+    print(f"RTT {args.rtt_ms:.0f} ms, {args.requests} requests, {args.pool_size} connections")
+    print(f"{'path':>10} {'seconds':>9} {'req/s':>9}")
+    print(f"{'threaded':>10} {threaded:>9.2f} {args.requests / threaded:>9.1f}")
+    print(f"{'async':>10} {pipelined:>9.2f} {args.requests / pipelined:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
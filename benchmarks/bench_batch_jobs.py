@@ -0,0 +1,140 @@
+"""Batch jobs: submit, restart mid-poll, resume, re-run and cancel.
+
+Drives BatchJobRunner end to end against the fake IMAP server and the fake
+Message Batches API, with a real SDK client underneath:
+
+  * submit: a summarize and a categorize job over --messages messages, up
+    to the point both batches are running
+  * resume: the runner is stopped mid-poll and a new one (new JobStore,
+    ResponseCache and ClaudeClient on the same database, as after a
+    restart) picks the jobs up and collects the results; every message must
+    then have a cached summary and category
+  * re-run: the same two jobs again must skip every message without
+    creating a batch
+  * cancel: a summarize job on an empty cache is canceled halfway through
+    processing; what finished is kept, the rest is counted as failed
+
+    python -m benchmarks.bench_batch_jobs [--messages 500] [--rtt-ms 20] [--api-ms 50] [--processing 2]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from app.ai.email_tools import cached_category, cached_summary
+from app.ai.response_cache import ResponseCache
+from app.config import Settings
+from app.imap.aio import AsyncIMAPPool
+from app.imap.cache import HeaderCache
+from app.imap.message_cache import MessageCache, message_key
+from app.jobs import BatchJobRunner, JobStore
+from benchmarks.fake_batches import FakeBatchesServer, LocalClaudeClient
+from benchmarks.fake_imap import FakeIMAPServer, LocalAsyncIMAPClient, make_messages
+
+
+async def wait_for(runner: BatchJobRunner, job_id: str, statuses: tuple[str, ...], timeout: float = 60.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        job = runner.get(job_id)
+        if job["status"] in statuses:
+            return job
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"job {job_id} stuck: {job}")
+        await asyncio.sleep(0.02)
+
+
+def make_runner(settings: Settings, batches: FakeBatchesServer, header_cache: HeaderCache, cache_path: str):
+    claude = LocalClaudeClient(settings, batches.url, cache=ResponseCache(cache_path))
+    return BatchJobRunner(header_cache, claude, JobStore(settings.cache_path), settings), claude
+
+
+async def run(imap: FakeIMAPServer, batches: FakeBatchesServer, settings: Settings, messages: int) -> None:
+    pool = AsyncIMAPPool("127.0.0.1", imap.port, "bench", "bench", client_class=LocalAsyncIMAPClient)
+    await pool.connect()
+    header_cache = HeaderCache(settings.cache_path)
+    message_cache = MessageCache(max_entries=messages)
+    runner, _ = make_runner(settings, batches, header_cache, settings.cache_path)
+
+    jobs = []
+    for kind in ("summarize", "categorize"):
+        start = time.perf_counter()
+        job = await wait_for(runner, (await runner.start(pool, message_cache, kind))["id"], ("running",))
+        requests = len(batches.batches[job["batch_id"]].requests)
+        print(f"submit {kind}: {job['total']} messages in {requests} requests, "
+              f"running after {time.perf_counter() - start:.2f}s")
+        jobs.append(job)
+
+    await asyncio.sleep(settings.batch_poll_interval * 2)
+    await runner.stop()
+    for job in jobs:
+        batch = batches.batches[job["batch_id"]]
+        done = batches.describe(batch)["request_counts"]["succeeded"]
+        print(f"stop {job['kind']}: runner stopped with {done} of {len(batch.requests)} requests done")
+    stopped = time.perf_counter()
+    runner, claude = make_runner(settings, batches, header_cache, settings.cache_path)
+    runner.resume()
+    for job in jobs:
+        job = await wait_for(runner, job["id"], ("completed", "failed"))
+        assert job["status"] == "completed", job
+        assert job["succeeded"] == messages and job["failed"] == 0, job
+        print(f"resume {job['kind']}: {job['succeeded']} results stored "
+              f"{time.perf_counter() - stopped:.2f}s after the restart")
+    await runner.stop()
+
+    uidvalidity = header_cache.folder_state(pool.account, "INBOX").uidvalidity
+    refs = [message_key(pool.account, "INBOX", uidvalidity, str(uid)) for uid in range(1, messages + 1)]
+    assert all(cached_summary(ref, claude) is not None for ref in refs), "summary missing"
+    assert all(cached_category(ref, claude) is not None for ref in refs), "category missing"
+    print(f"cache: {messages} summaries and {messages} categories")
+
+    created = batches.calls.get("create", 0)
+    start = time.perf_counter()
+    for kind in ("summarize", "categorize"):
+        job = await wait_for(runner, (await runner.start(pool, message_cache, kind))["id"], ("completed",))
+        assert job["skipped"] == messages and job["batch_id"] is None, job
+    assert batches.calls.get("create", 0) == created
+    print(f"re-run: both jobs skipped all {messages} messages in {time.perf_counter() - start:.2f}s, no batch")
+
+    fresh_path = os.path.join(os.path.dirname(settings.cache_path), "fresh.db")
+    runner, claude = make_runner(settings, batches, header_cache, fresh_path)
+    job = await wait_for(runner, (await runner.start(pool, message_cache, "summarize"))["id"], ("running",))
+    await asyncio.sleep(batches.processing_time / 2)
+    await runner.cancel(job["id"])
+    job = await wait_for(runner, job["id"], ("canceled", "failed"))
+    kept = sum(1 for ref in refs if cached_summary(ref, claude) is not None)
+    assert job["status"] == "canceled" and job["succeeded"] == kept, job
+    assert job["succeeded"] + job["failed"] == messages, job
+    print(f"cancel halfway: {job['succeeded']} summaries kept, {job['failed']} canceled")
+    await runner.stop()
+
+    print("API calls:", ", ".join(f"{call} {count}" for call, count in sorted(batches.calls.items())))
+    await pool.close()
+    header_cache.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    parser.add_argument("--api-ms", type=float, default=50.0)
+    parser.add_argument("--processing", type=float, default=2.0, help="seconds a batch takes")
+    parser.add_argument("--poll", type=float, default=0.25, help="batch_poll_interval")
+    args = parser.parse_args()
+
+    imap = FakeIMAPServer({"INBOX": make_messages(args.messages)}, latency=args.rtt_ms / 1000).start()
+    batches = FakeBatchesServer(latency=args.api_ms / 1000, processing_time=args.processing).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = Settings(
+            cache_path=os.path.join(tmp, "cache.db"),
+            batch_poll_interval=args.poll,
+            batch_max_messages=args.messages,
+        )
+        asyncio.run(run(imap, batches, settings, args.messages))
+    batches.stop()
+    imap.stop()
+
+
+if __name__ == "__main__":
+    main()
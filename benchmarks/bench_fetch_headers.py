@@ -0,0 +1,57 @@
+"""Header fetch latency vs. page size against a local fake IMAP server.
+
+Compares the batched `IMAPClient.fetch_headers` (one UID FETCH per chunk)
+with the old one-FETCH-per-UID loop, with a simulated round-trip time.
+
+    python -m benchmarks.bench_fetch_headers [--rtt-ms 20] [--sizes 10,50,200]
+"""
+
+import argparse
+import time
+
+from app.imap.client import IMAPClient, HEADER_ITEMS
+from benchmarks.fake_imap import FakeIMAPServer, LocalIMAPClient, make_messages
+
+
+def fetch_one_by_one(client: IMAPClient, uids: list[bytes]) -> int:
+    count = 0
+    for uid in reversed(uids):
+        client._conn.uid("fetch", uid, HEADER_ITEMS)
+        count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    parser.add_argument("--sizes", default="10,50,100,200")
+    parser.add_argument("--chunk-size", type=int, default=200)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer({"INBOX": make_messages(1000)}, latency=args.rtt_ms / 1000).start()
+    client = LocalIMAPClient("127.0.0.1", server.port, "bench", "bench", fetch_chunk_size=args.chunk_size)
+    client.connect()
+    uids = client.search("ALL")
+
+    print(f"RTT {args.rtt_ms:.0f} ms, chunk size {args.chunk_size}")
+    print(f"{'page':>6} {'batched ms':>12} {'per-uid ms':>12} {'speedup':>8}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        page = uids[-size:]
+
+        t0 = time.perf_counter()
+        rows = client.fetch_headers(uids, limit=size)
+        batched = time.perf_counter() - t0
+        assert len(rows) == size
+
+        t0 = time.perf_counter()
+        fetch_one_by_one(client, page)
+        serial = time.perf_counter() - t0
+
+        print(f"{size:>6} {batched * 1000:>12.1f} {serial * 1000:>12.1f} {serial / batched:>7.1f}x")
+
+    client.disconnect()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
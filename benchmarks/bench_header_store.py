@@ -0,0 +1,153 @@
+"""Memory and latency of a large folder's headers: dict rows vs. HeaderColumns.
+
+The dict path is what holding a folder in Python looked like before: one
+HeaderCache row dict per message, filtered with comprehensions and sorted
+with sorted(). The columnar path is HeaderStore's HeaderColumns. Both
+answer the same queries (first page, unread, a sender, a date range,
+by date) and must return the same UIDs; "sqlite" is HeaderCache.list_headers
+for the unfiltered pages it supports. Times are the best of --repeat
+runs, so the columns' date order is already cached (one sort, on the first
+date query after a change).
+
+    python -m benchmarks.bench_header_store [--messages 100000] [--senders 3000]
+"""
+
+import argparse
+import calendar
+import email.utils
+import gc
+import random
+import time
+import tracemalloc
+
+from app.imap.cache import HeaderCache
+from app.imap.header_store import HeaderColumns
+
+PAGE = 50
+START = calendar.timegm((2020, 1, 1, 0, 0, 0))
+SPAN = 5 * 365 * 24 * 3600
+
+
+def make_rows(count: int, senders: int, seed: int = 1) -> list[dict]:
+    """Rows shaped like fetch_headers output. Senders are Zipf-ish (a few
+    write most of the mail); about half the subjects repeat (newsletters,
+    notifications), the rest are unique."""
+    rng = random.Random(seed)
+    people = [f'"Sender {i}" <sender{i}@example{i % 97}.com>' for i in range(senders)]
+    weights = [1 / (i + 1) for i in range(senders)]
+    common = [f"Your weekly digest #{i}" for i in range(2000)]
+    rows = []
+    ts = START
+    for uid in range(1, count + 1):
+        ts += rng.randint(0, 2 * SPAN // count)
+        subject = rng.choice(common) if rng.random() < 0.5 else f"Re: project update {uid} {rng.random():.6f}"
+        flags = ["\\Seen"] if rng.random() < 0.8 else []
+        if rng.random() < 0.05:
+            flags.append("\\Flagged")
+        rows.append({
+            "uid": str(uid),
+            "subject": subject,
+            "sender": rng.choices(people, weights)[0],
+            "date": email.utils.formatdate(ts),
+            "flags": flags,
+            "modseq": None,
+        })
+    return rows
+
+
+def _measure_memory(build) -> tuple[object, int]:
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def _dict_query(rows: list[dict], sort: str, unread=False, sender=None, since=None, before=None) -> list[str]:
+    selected = rows
+    if unread:
+        selected = [r for r in selected if not r["is_read"]]
+    if sender:
+        needle = sender.casefold()
+        selected = [r for r in selected if needle in r["sender"].casefold()]
+    if since is not None:
+        selected = [r for r in selected if r["date_ts"] >= since]
+    if before is not None:
+        selected = [r for r in selected if r["date_ts"] < before]
+    if sort == "date":
+        selected = sorted(selected, key=lambda r: (r["date_ts"], int(r["uid"])))
+    return [r["uid"] for r in selected[-PAGE:][::-1]]
+
+
+def _column_query(columns: HeaderColumns, sort: str, **filters) -> list[str]:
+    positions = columns.select(**filters)
+    return [columns.row(i)["uid"] for i in columns.page(positions, PAGE, sort=sort)]
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--senders", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cache = HeaderCache(":memory:")
+    cache.reset_folder("bench", "INBOX", 1)
+    cache.upsert_headers("bench", "INBOX", make_rows(args.messages, args.senders))
+
+    start = time.perf_counter()
+    dict_rows, dict_bytes = _measure_memory(lambda: cache.list_headers("bench", "INBOX", limit=args.messages)[::-1])
+    dict_load = time.perf_counter() - start
+
+    def _load_columns():
+        columns = HeaderColumns()
+        for chunk in cache.iter_rows("bench", "INBOX"):
+            columns.upsert(chunk)
+        return columns
+
+    start = time.perf_counter()
+    columns, column_bytes = _measure_memory(_load_columns)
+    column_load = time.perf_counter() - start
+
+    sender = dict_rows[len(dict_rows) // 2]["sender"].split("<")[1][:12]
+    middle = START + SPAN // 2
+    queries = [
+        ("newest page", "uid", {}),
+        ("by date", "date", {}),
+        ("unread", "uid", {"unread": True}),
+        ("sender", "uid", {"sender": sender}),
+        ("date range", "date", {"since": middle, "before": middle + 30 * 24 * 3600}),
+        ("unread+sender", "date", {"unread": True, "sender": sender}),
+    ]
+
+    print(f"{args.messages} messages, {args.senders} senders")
+    print(f"{'':>14} {'dict rows':>12} {'columns':>12}")
+    print(f"{'memory MB':>14} {dict_bytes / 2**20:>12.1f} {column_bytes / 2**20:>12.1f}")
+    print(f"{'load s':>14} {dict_load:>12.2f} {column_load:>12.2f}")
+    print()
+    print(f"{'query (ms)':>14} {'dict rows':>12} {'columns':>12} {'sqlite':>12}")
+    for name, sort, filters in queries:
+        expected = _dict_query(dict_rows, sort, **filters)
+        assert _column_query(columns, sort, **filters) == expected, name
+        dict_ms = _time(lambda: _dict_query(dict_rows, sort, **filters), args.repeat)
+        column_ms = _time(lambda: _column_query(columns, sort, **filters), args.repeat)
+        sqlite = ""
+        if not filters:
+            sqlite_ms = _time(lambda: cache.list_headers("bench", "INBOX", limit=PAGE, sort=sort), args.repeat)
+            sqlite = f"{sqlite_ms:.2f}"
+        print(f"{name:>14} {dict_ms:>12.2f} {column_ms:>12.2f} {sqlite:>12}")
+
+
+if __name__ == "__main__":
+    main()
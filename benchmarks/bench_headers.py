@@ -0,0 +1,165 @@
+"""Envelope header decoding: email.message_from_bytes vs. app.imap.headers.
+
+Builds a HEADER.FIELDS (SUBJECT FROM DATE) FETCH response from a corpus of
+header values as mail clients and list servers actually write them: Q and
+B encoded words in UTF-8, Latin-1, windows-1252, ISO-2022-JP, KOI8-R and
+GB2312, adjacent and folded encoded words, malformed words and plain
+ASCII, drawn with repeats the way senders and list subjects repeat in a
+folder. Raw 8-bit values are left out: both paths hand them to the email
+package, and parse_header_fetch fails on them the same way either way.
+
+"stdlib" is parse_header_fetch as it was (a Message per header block,
+email.header.decode_header per value); "cold" is the new path with empty
+caches and "warm" the same fetch again. All three must produce the same
+rows.
+
+    python -m benchmarks.bench_headers [--messages 20000] [--distinct 2000]
+"""
+
+import argparse
+import email
+import email.header
+import email.utils
+import random
+import time
+
+from app.imap import headers
+from app.imap.protocol import parse_header_fetch, split_fetch_response, UID_RE, FLAGS_RE, MODSEQ_RE
+
+SUBJECTS = [
+    "Weekly status report",
+    "Re: [dev] Release checklist for 2.4",
+    "=?UTF-8?Q?R=C3=A9union_d=27=C3=A9quipe_=E2=80=93_jeudi?=",
+    "=?utf-8?B?0J/RgNC40LPQu9Cw0YjQtdC90LjQtSDQvdCwINCy0YHRgtGA0LXRh9GD?=",
+    "=?iso-8859-1?Q?Ihre_Bestellung_wurde_versandt_=28Gr=F6=DFe_M=29?=",
+    "=?windows-1252?Q?Invoice_=96_=80120.00_due?=",
+    "=?ISO-2022-JP?B?GyRCJDMkcyRLJEEkTxsoQg==?=",
+    "=?koi8-r?B?8NLJ18XUIMnaIO3P08vX2Q==?=",
+    "=?gb2312?B?xOO6w6OsysC957Xa?=",
+    "=?UTF-8?B?8J+OiSBZb3VyIG9yZGVyIGhhcyBzaGlwcGVkIQ==?=",
+    "Re: =?UTF-8?Q?Caf=C3=A9?= meeting moved",
+    "=?UTF-8?Q?Gr=C3=BC=C3=9Fe_aus?= =?UTF-8?Q?_M=C3=BCnchen?=",
+    "=?utf-8?q?This_is_a_long_subject_line_that_a_mail_client_has_folded?=\r\n"
+    " =?utf-8?q?_across_two_lines_=E2=9C=93?=",
+    "=?UTF-8?B?W0pJUkFdIChQUk9KLTEyMykg?=\r\n =?UTF-8?B?Q29ycmVjdGlvbiBkdSBidWc=?=",
+    "Fwd: =?iso-8859-15?Q?=A4_pricing?= update",
+    "[announce] Maintenance window\r\n tonight 22:00 UTC",
+    "=?utf-8?Q??=",
+]
+
+SENDERS = [
+    '"GitHub" <notifications@github.com>',
+    "Alice Example <alice@example.com>",
+    "=?UTF-8?Q?Fran=C3=A7ois_Dupont?= <francois@example.fr>",
+    "=?utf-8?B?5bGx55Sw5aSq6YOO?= <taro@example.jp>",
+    "=?iso-8859-1?Q?J=F6rg_M=FCller?= <joerg@example.de>",
+    "=?koi8-r?B?6dfBzs/XIOnXwc4=?= <ivan@example.ru>",
+    "=?windows-1252?Q?Zo=EB_O=92Brien?= <zoe@example.ie>",
+    '"=?UTF-8?Q?Bj=C3=B6rk?=" <bjork@example.is>',
+    "noreply@shop.example.com",
+    "=?gb2312?B?wO7L5w==?= <li@example.cn>",
+]
+
+
+def make_fetch(count: int, distinct: int, seed: int = 1) -> list:
+    """A FETCH response for `count` messages whose subject and sender
+    values come from `distinct` variants of the corpus, Zipf-weighted."""
+    rng = random.Random(seed)
+    subjects = SUBJECTS + [
+        f"{SUBJECTS[i % len(SUBJECTS)]} #{i}" for i in range(len(SUBJECTS), distinct)
+    ]
+    senders = SENDERS + [
+        SENDERS[i % len(SENDERS)].replace("@", f"+{i}@") for i in range(len(SENDERS), distinct // 10)
+    ]
+    weights = [1 / (i + 1) for i in range(distinct)]
+    sender_weights = [1 / (i + 1) for i in range(len(senders))]
+    data = []
+    for uid in range(1, count + 1):
+        subject = rng.choices(subjects, weights)[0]
+        sender = rng.choices(senders, sender_weights)[0]
+        block = (
+            f"Subject: {subject}\r\nFrom: {sender}\r\n"
+            f"Date: {email.utils.formatdate(1_600_000_000 + uid * 600)}\r\n\r\n"
+        ).encode("ascii")
+        data.append((f"{uid} (UID {uid} FLAGS (\\Seen) BODY[HEADER.FIELDS (SUBJECT FROM DATE)] {{{len(block)}}}".encode(), block))
+        data.append(b")")
+    return data
+
+
+def _stdlib_decode(value) -> str:
+    if not value:
+        return ""
+    result = []
+    for part, charset in email.header.decode_header(value):
+        if isinstance(part, bytes):
+            result.append(part.decode(charset or "utf-8", errors="replace"))
+        else:
+            result.append(part)
+    return " ".join(result)
+
+
+def stdlib_header_fetch(data: list) -> list[dict]:
+    """parse_header_fetch before app.imap.headers."""
+    rows = []
+    for meta, raw_header in split_fetch_response(data):
+        uid_match = UID_RE.search(meta)
+        if not uid_match:
+            continue
+        flags_match = FLAGS_RE.search(meta)
+        flags = flags_match.group(1).decode("utf-8", errors="replace").split() if flags_match else []
+        modseq_match = MODSEQ_RE.search(meta)
+        msg = email.message_from_bytes(raw_header or b"")
+        rows.append({
+            "uid": uid_match.group(1).decode(),
+            "subject": _stdlib_decode(msg.get("Subject", "(No Subject)")),
+            "sender": _stdlib_decode(msg.get("From", "")),
+            "date": msg.get("Date", ""),
+            "is_read": "\\Seen" in flags,
+            "flags": flags,
+            "modseq": int(modseq_match.group(1)) if modseq_match else None,
+        })
+    return rows
+
+
+def _clear_caches() -> None:
+    headers._decode_encoded.cache_clear()
+    headers._decode_word.cache_clear()
+
+
+def _time(fn, repeat: int, before=None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--distinct", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_fetch(args.messages, args.distinct)
+    expected = stdlib_header_fetch(data)
+    _clear_caches()
+    assert parse_header_fetch(data) == expected, "cold"
+    assert parse_header_fetch(data) == expected, "warm"
+
+    stdlib = _time(lambda: stdlib_header_fetch(data), args.repeat)
+    cold = _time(lambda: parse_header_fetch(data), args.repeat, before=_clear_caches)
+    warm = _time(lambda: parse_header_fetch(data), args.repeat)
+
+    print(f"{args.messages} header blocks, {args.distinct} distinct subjects")
+    print(f"{'path':>8} {'seconds':>9} {'blocks/s':>11} {'speedup':>8}")
+    for name, seconds in (("stdlib", stdlib), ("cold", cold), ("warm", warm)):
+        print(f"{name:>8} {seconds:>9.3f} {args.messages / seconds:>11.0f} {stdlib / seconds:>7.1f}x")
+    print("caches:", headers.cache_stats())
+
+
+if __name__ == "__main__":
+    main()
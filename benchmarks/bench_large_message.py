@@ -0,0 +1,94 @@
+"""Opening a message with a large attachment: full RFC822 fetch vs. BODYSTRUCTURE.
+
+"full" downloads the whole message with fetch_raw (one BODY.PEEK[] fetch)
+and runs parse_email, which decodes every attachment just to measure it. "lazy" is fetch_message:
+BODYSTRUCTURE first, then only the text parts. "stream" downloads the
+attachment itself through stream_part + decode_stream, the way
+/api/email/{uid}/attachments/{part} does. Peak client-side memory is
+measured with tracemalloc; the fake server runs in a separate process so
+its own copies of the message are not counted.
+
+    python -m benchmarks.bench_large_message [--attachment-mb 40] [--rtt-ms 20]
+"""
+
+import argparse
+import asyncio
+import email
+import multiprocessing
+import time
+import tracemalloc
+
+from app.imap.bodystructure import decode_stream
+from app.imap.parser import parse_email
+from benchmarks.fake_imap import FakeIMAPServer, LocalAsyncIMAPClient, make_attachment_message
+
+
+async def measure(operation) -> tuple[float, float, object]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = await operation()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20, result
+
+
+async def run(port: int) -> None:
+    imap = LocalAsyncIMAPClient("127.0.0.1", port, "bench", "bench")
+    await imap.connect()
+
+    async def full():
+        fetched = await imap.fetch_raw("1", folder="INBOX")
+        return parse_email("1", email.message_from_bytes(fetched.raw), fetched.flags)
+
+    async def lazy():
+        return await imap.fetch_message("1", folder="INBOX")
+
+    async def stream():
+        parsed = await imap.fetch_message("1", folder="INBOX")
+        part = parsed.attachments[0]["part"]
+        total = 0
+        async for data in decode_stream(imap.stream_part("1", part, folder="INBOX"), "base64"):
+            total += len(data)
+        return total
+
+    print(f"{'path':>8} {'seconds':>9} {'peak MB':>9}")
+    for name, operation in (("full", full), ("lazy", lazy), ("stream", stream)):
+        elapsed, peak, _ = await measure(operation)
+        print(f"{name:>8} {elapsed:>9.3f} {peak:>9.1f}")
+
+    await imap.disconnect()
+
+
+def serve(attachment_size: int, latency: float, ports: multiprocessing.Queue, stop) -> None:
+    message = make_attachment_message(1, attachment_size)
+    server = FakeIMAPServer({"INBOX": [message]}, latency=latency).start()
+    ports.put((server.port, len(message.raw)))
+    stop.wait()
+    server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attachment-mb", type=float, default=40.0)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=serve,
+        args=(int(args.attachment_mb * 2 ** 20), args.rtt_ms / 1000, ports, stop),
+    )
+    server.start()
+    port, raw_size = ports.get()
+    print(f"RTT {args.rtt_ms:.0f} ms, message {raw_size / 2 ** 20:.1f} MB")
+    try:
+        asyncio.run(run(port))
+    finally:
+        stop.set()
+        server.join()
+
+
+if __name__ == "__main__":
+    main()
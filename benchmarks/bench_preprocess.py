@@ -0,0 +1,216 @@
+"""Prompt body size: fixed body[:3000] vs. preprocess.prepare_body.
+
+Builds a fixture corpus of typical mail shapes: plain-text and HTML-only
+replies with quoted history (Gmail, Outlook, Apple Mail), newsletters with
+style blocks and layout tables, short notes and long reports. For each
+shape it reports the estimated input tokens of the summarize prompt body
+before and after preprocessing, and how much of the text the sender
+actually wrote in this message survives ("new text kept"), i.e. what the
+tokens are spent on. Also times prepare_body per message.
+
+    python -m benchmarks.bench_preprocess [--messages 600] [--seed 1]
+"""
+
+import argparse
+import random
+import re
+import statistics
+import time
+
+from app.ai.email_tools import BODY_TOKENS
+from app.ai.preprocess import estimate_tokens, prepare_body
+from app.imap.parser import ParsedEmail
+
+WORDS = (
+    "budget review meeting roadmap invoice contract launch customer quarter report "
+    "deadline proposal design feedback schedule release migration vendor hiring "
+    "travel approval renewal forecast metrics onboarding security audit offsite"
+).split()
+# The text written in this message uses its own words, so "kept" can tell
+# it apart from quoted history and boilerplate
+NEW_WORDS = (
+    "please confirm tomorrow attached revised numbers agreed blocker owner shipping "
+    "priority estimate question answer update plan risk decision draft follow sign"
+).split()
+NAMES = ["Alice Chen", "Bob Martin", "Carol Diaz", "Dan Okafor", "Erin Walsh"]
+WORD_RE = re.compile(r"[a-z]+")
+
+
+def sentence(rng: random.Random, vocab: list[str] = WORDS) -> str:
+    words = [rng.choice(vocab) for _ in range(rng.randint(8, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng: random.Random, sentences: int, vocab: list[str] = WORDS) -> str:
+    return " ".join(sentence(rng, vocab) for _ in range(sentences))
+
+
+def fresh_text(rng: random.Random, paragraphs: int, vocab: list[str] = WORDS) -> str:
+    return "\n\n".join(paragraph(rng, rng.randint(2, 4), vocab) for _ in range(paragraphs))
+
+
+def signature(rng: random.Random) -> str:
+    name = rng.choice(NAMES)
+    return f"-- \n{name}\nSenior Manager, Example Corp\n+1 555 0100 | www.example.com\nSent from my iPhone"
+
+
+def plain_reply(rng: random.Random) -> tuple[ParsedEmail, str]:
+    new = fresh_text(rng, rng.randint(1, 2), NEW_WORDS)
+    body = f"{new}\n\n{signature(rng)}\n"
+    quoted = ""
+    for depth in range(rng.randint(3, 6)):
+        name = rng.choice(NAMES)
+        block = f"On Mon, Jan {depth + 3}, 2025 at 9:1{depth} AM {name} <{name.split()[0].lower()}@example.com> wrote:\n"
+        block += "\n".join("> " + line for line in (fresh_text(rng, 2) + "\n" + quoted).split("\n"))
+        quoted = block
+    return _email(body + "\n" + quoted, ""), new
+
+
+def gmail_html_reply(rng: random.Random) -> tuple[ParsedEmail, str]:
+    new = fresh_text(rng, rng.randint(1, 2), NEW_WORDS)
+    history = ""
+    for depth in range(rng.randint(3, 5)):
+        name = rng.choice(NAMES)
+        history = (
+            f'<div class="gmail_quote"><div dir="ltr" class="gmail_attr">On Tue, Feb {depth + 1}, 2025 at '
+            f'10:0{depth} AM {name} &lt;{name.split()[0].lower()}@example.com&gt; wrote:<br></div>'
+            '<blockquote class="gmail_quote" style="margin:0px 0px 0px 0.8ex;border-left:1px solid '
+            f'rgb(204,204,204);padding-left:1ex"><div dir="ltr">{_html_paragraphs(fresh_text(rng, 2))}'
+            f"{history}</div></blockquote></div>"
+        )
+    html = f'<div dir="ltr">{_html_paragraphs(new)}<br clear="all"><div>--<br>{rng.choice(NAMES)}</div></div><br>{history}'
+    return _email("", html), new
+
+
+def outlook_html_reply(rng: random.Random) -> tuple[ParsedEmail, str]:
+    new = fresh_text(rng, rng.randint(1, 2), NEW_WORDS)
+    style = "<style><!-- @font-face {font-family:Calibri;} p.MsoNormal {margin:0cm;font-size:11.0pt;" \
+            "font-family:\"Calibri\",sans-serif;} div.WordSection1 {page:WordSection1;} --></style>"
+    history = ""
+    for depth in range(rng.randint(2, 4)):
+        name = rng.choice(NAMES)
+        history += (
+            '<div id="divRplyFwdMsg" dir="ltr"><hr style="display:inline-block;width:98%">'
+            f'<font face="Calibri" style="font-size:11pt"><b>From:</b> {name} &lt;x@example.com&gt;<br>'
+            f"<b>Sent:</b> Wednesday, March {depth + 4}, 2025 2:15 PM<br><b>To:</b> Team<br>"
+            f"<b>Subject:</b> RE: {rng.choice(WORDS)}</font></div>"
+            f'<div class="WordSection1">{_html_paragraphs(fresh_text(rng, 2), css="MsoNormal")}</div>'
+        )
+    html = (
+        f'<html><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8">{style}</head>'
+        f'<body lang="EN-US"><div class="WordSection1">{_html_paragraphs(new, css="MsoNormal")}'
+        f'<p class="MsoNormal">&nbsp;</p></div>{history}</body></html>'
+    )
+    return _email("", html), new
+
+
+def newsletter(rng: random.Random) -> tuple[ParsedEmail, str]:
+    items = [fresh_text(rng, 1, NEW_WORDS) for _ in range(rng.randint(3, 6))]
+    rows = "".join(
+        '<tr><td style="padding:24px 32px;font-family:Helvetica,Arial,sans-serif;font-size:16px;'
+        f'line-height:24px;color:#333333" class="content-block"><h2 style="margin:0 0 8px">'
+        f"{rng.choice(WORDS).title()}</h2><p style=\"margin:0\">{item}</p>"
+        '<table role="presentation" cellpadding="0" cellspacing="0"><tr><td bgcolor="#0066cc" '
+        'style="border-radius:4px"><a href="https://example.com/track?id=123456789&amp;utm_source=newsletter" '
+        'style="color:#ffffff;padding:10px 18px;display:inline-block">Read more</a></td></tr></table></td></tr>'
+        for item in items
+    )
+    html = (
+        "<!DOCTYPE html><html><head><style>body{margin:0;padding:0} table{border-collapse:collapse} "
+        "@media only screen and (max-width:600px){.content-block{padding:12px!important}}</style></head>"
+        '<body><div style="display:none;max-height:0;overflow:hidden">Your weekly digest is here '
+        + "&zwnj;&nbsp;" * 60 + '</div><table width="100%" cellpadding="0" cellspacing="0" role="presentation">'
+        f"{rows}</table><p style=\"font-size:11px;color:#999\">You are receiving this because you subscribed. "
+        '<a href="https://example.com/unsubscribe">Unsubscribe</a></p></body></html>'
+    )
+    return _email("", html), "\n\n".join(items)
+
+
+def short_note(rng: random.Random) -> tuple[ParsedEmail, str]:
+    new = sentence(rng, NEW_WORDS) + " " + sentence(rng, NEW_WORDS)
+    return _email(f"{new}\n\nThanks,\n{rng.choice(NAMES).split()[0]}\n", ""), new
+
+
+def long_report(rng: random.Random) -> tuple[ParsedEmail, str]:
+    new = fresh_text(rng, rng.randint(12, 20), NEW_WORDS)
+    return _email(new, ""), new
+
+
+SHAPES = {
+    "plain reply + history": plain_reply,
+    "gmail html reply": gmail_html_reply,
+    "outlook html reply": outlook_html_reply,
+    "newsletter html": newsletter,
+    "short note": short_note,
+    "long report": long_report,
+}
+
+
+def _html_paragraphs(text: str, css: str = "") -> str:
+    attr = f' class="{css}"' if css else ""
+    return "".join(f"<p{attr}>{p}</p>" for p in text.split("\n\n"))
+
+
+def _email(plain: str, html: str) -> ParsedEmail:
+    return ParsedEmail(
+        uid="1", subject="Re: update", sender="Alice Chen <alice@example.com>", to=[], cc=[],
+        date="2025-03-01 10:00", body_plain=plain, body_html=html,
+    )
+
+
+def old_body(email: ParsedEmail) -> str:
+    return (email.body_plain or email.body_html or "(empty)")[:3000]
+
+
+def kept(body: str, new: str) -> float:
+    """Share of the sender's new words that made it into the prompt."""
+    want = WORD_RE.findall(new.lower())
+    have = WORD_RE.findall(body.lower())
+    # Multiset overlap, so a repeated word only counts as often as it appears
+    counts: dict[str, int] = {}
+    for word in have:
+        counts[word] = counts.get(word, 0) + 1
+    hit = 0
+    for word in want:
+        if counts.get(word, 0) > 0:
+            counts[word] -= 1
+            hit += 1
+    return hit / len(want) if want else 1.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    budget = BODY_TOKENS["summarize"]
+    per_shape = max(args.messages // len(SHAPES), 1)
+
+    print(f"summarize body, {per_shape} messages per shape, budget {budget} tokens\n")
+    print(f"{'shape':<24} {'old tok':>8} {'new tok':>8} {'saved':>7} {'old kept':>9} {'new kept':>9} {'us/msg':>8}")
+    old_total = new_total = 0
+    for name, make in SHAPES.items():
+        corpus = [make(rng) for _ in range(per_shape)]
+        start = time.perf_counter()
+        bodies = [prepare_body(email, budget) for email, _ in corpus]
+        elapsed_us = (time.perf_counter() - start) / len(corpus) * 1e6
+
+        old_tokens = [estimate_tokens(old_body(email)) for email, _ in corpus]
+        new_tokens = [estimate_tokens(body) for body in bodies]
+        old_kept = statistics.mean(kept(old_body(email), new) for email, new in corpus)
+        new_kept = statistics.mean(kept(body, new) for body, (_, new) in zip(bodies, corpus))
+        old_total += sum(old_tokens)
+        new_total += sum(new_tokens)
+        saved = 1 - sum(new_tokens) / sum(old_tokens)
+        print(
+            f"{name:<24} {statistics.mean(old_tokens):>8.0f} {statistics.mean(new_tokens):>8.0f} "
+            f"{saved:>6.0%} {old_kept:>9.0%} {new_kept:>9.0%} {elapsed_us:>8.0f}"
+        )
+
+    print(f"\ninput tokens: {old_total} -> {new_total} ({1 - new_total / old_total:.0%} fewer)")
+
+
+if __name__ == "__main__":
+    main()
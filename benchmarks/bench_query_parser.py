@@ -0,0 +1,117 @@
+"""Search latency: local query parser vs. the Claude search agent.
+
+Runs a corpus of representative natural-language queries through
+search_agent_events twice, once with the parser fast path and once
+without. Claude is simulated: each turn waits --llm-ms and then asks for
+the search the parser would have built, followed by a summary turn, so the
+agent path costs two model round trips on top of the same IMAP work.
+Queries the parser leaves to the agent are listed separately.
+
+    python -m benchmarks.bench_query_parser [--messages 2000] [--rtt-ms 20] [--llm-ms 1200]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+from app.ai.query_parser import parse_query
+from app.ai.search_agent import search_agent_events
+from app.imap.aio import AsyncIMAPPool
+from benchmarks.bench_search_index import make_corpus
+from benchmarks.fake_imap import FakeIMAPServer, LocalAsyncIMAPClient
+
+QUERIES = [
+    "unread from person3",
+    "emails from person7@example.com yesterday",
+    "flagged emails about invoice",
+    "unread messages since last week",
+    "from person12 this month",
+    "show me starred messages",
+    "emails to team2@example.com in january",
+    'subject "budget review"',
+    "is:unread from:person4",
+    "containing payroll in the last 30 days",
+    "messages from person9 before 2025-01-02",
+    "emails in the inbox about roadmap",
+    # Left to the agent
+    "invoices from person3",
+    "what did person5 say about the offsite",
+    "anything urgent I haven't answered",
+]
+
+
+class SimulatedClaude:
+    """Answers like a model that gets the search right on the first try."""
+
+    def __init__(self, latency: float):
+        self._latency = latency
+
+    async def stream_with_tools(self, system, messages, tools, max_tokens=2048):
+        await asyncio.sleep(self._latency)
+        if len(messages) > 1:
+            yield SimpleNamespace(content=[SimpleNamespace(type="text", text="Here is what I found.")])
+            return
+        parsed = parse_query(messages[0]["content"])
+        criteria = parsed.criteria if parsed is not None else SimpleNamespace(subject="invoice")
+        params = {k: v for k, v in vars(criteria).items() if v is not None}
+        yield SimpleNamespace(content=[SimpleNamespace(type="tool_use", id="call_1", input=params)])
+
+
+async def timed(query: str, pool: AsyncIMAPPool, claude, fast_path: bool) -> tuple[float, str]:
+    start = time.perf_counter()
+    async for event, data in search_agent_events(query, pool, claude, fast_path=fast_path):
+        if event == "done":
+            return (time.perf_counter() - start) * 1000, data["path"]
+    raise RuntimeError("search produced no result")
+
+
+async def run(port: int, llm_latency: float, repeats: int) -> None:
+    pool = AsyncIMAPPool("127.0.0.1", port, "bench", "bench", client_class=LocalAsyncIMAPClient)
+    await pool.connect()
+    claude = SimulatedClaude(llm_latency)
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        for query in QUERIES:
+            parse_query(query)
+    parse_us = (time.perf_counter() - start) / (1000 * len(QUERIES)) * 1e6
+    print(f"parse_query: {parse_us:.1f} us per query\n")
+
+    print(f"{'query':<44} {'path':>7} {'fast ms':>9} {'agent ms':>9}")
+    fast_all, agent_all = [], []
+    for query in QUERIES:
+        fast, agent = [], []
+        for _ in range(repeats):
+            ms, path = await timed(query, pool, claude, fast_path=True)
+            fast.append(ms)
+            agent.append((await timed(query, pool, claude, fast_path=False))[0])
+        fast_ms, agent_ms = statistics.median(fast), statistics.median(agent)
+        if path == "parser":
+            fast_all.append(fast_ms)
+            agent_all.append(agent_ms)
+        print(f"{query[:44]:<44} {path:>7} {fast_ms:>9.1f} {agent_ms:>9.1f}")
+
+    print(
+        f"\nparser answered {len(fast_all)}/{len(QUERIES)} queries: "
+        f"median {statistics.median(fast_all):.1f} ms vs {statistics.median(agent_all):.1f} ms through the agent"
+    )
+    await pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    parser.add_argument("--llm-ms", type=float, default=1200.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer({"INBOX": make_corpus(args.messages)}, latency=args.rtt_ms / 1000).start()
+    asyncio.run(run(server.port, args.llm_ms / 1000, args.repeats))
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
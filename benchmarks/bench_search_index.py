@@ -0,0 +1,112 @@
+"""Text search: IMAP SEARCH on the server vs. the local FTS5 index.
+
+Builds a mailbox of generated messages, syncs it into a HeaderCache,
+indexes it with index_folder and then runs the same criteria both ways.
+The fake server answers text searches by scanning every message, as most
+servers without a search index do; --scan-us adds a per-message cost to
+model servers reading bodies from disk. The index path syncs at most every
+--sync-interval seconds (CACHE_SYNC_INTERVAL) and otherwise costs only the
+SQLite query.
+
+    python -m benchmarks.bench_search_index [--messages 5000] [--rtt-ms 20] [--scan-us 100]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from app.imap.cache import HeaderCache
+from app.imap.index import MessageIndex, index_folder, search_folder
+from app.imap.search import SearchCriteria
+from app.imap.sync import sync_folder
+from benchmarks.fake_imap import FakeIMAPServer, FakeMessage, LocalAsyncIMAPClient
+
+WORDS = (
+    "budget invoice meeting travel project deadline report quarterly offsite launch "
+    "review contract roadmap hiring feedback customer release incident payroll design"
+).split()
+
+QUERIES = [
+    SearchCriteria(subject="invoice"),
+    SearchCriteria(body="offsite"),
+    SearchCriteria(body="payroll incident"),
+    SearchCriteria(from_addr="person3", subject="roadmap"),
+]
+
+
+def make_corpus(count: int, body_words: int = 300) -> list[FakeMessage]:
+    rnd = random.Random(42)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for i in range(1, count + 1):
+        date = start + timedelta(minutes=i)
+        body = " ".join(rnd.choice(WORDS) for _ in range(body_words))
+        raw = (
+            f"From: Person{i % 50} <person{i % 50}@example.com>\r\n"
+            f"To: team{i % 5}@example.com\r\n"
+            f"Subject: {rnd.choice(WORDS)} {rnd.choice(WORDS)} {i}\r\n"
+            f"Date: {format_datetime(date)}\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\n"
+            f"\r\n{body}\r\n"
+        ).encode()
+        messages.append(FakeMessage(uid=i, raw=raw, internaldate=date))
+    return messages
+
+
+async def run(port: int, path: str, repeats: int, sync_interval: float) -> None:
+    cache = HeaderCache(path)
+    index = MessageIndex(path)
+    imap = LocalAsyncIMAPClient("127.0.0.1", port, "bench", "bench")
+    await imap.connect()
+
+    await sync_folder(imap, cache, "INBOX")
+    start = time.perf_counter()
+    indexed = await index_folder(imap, cache, index, "INBOX")
+    print(f"indexed {indexed} messages in {time.perf_counter() - start:.2f}s")
+
+    print(f"{'query':<32} {'server ms':>10} {'index ms':>10} {'matches':>8}")
+    for criteria in QUERIES:
+        timings = {}
+        for name, idx in (("server", None), ("index", index)):
+            samples = []
+            for _ in range(repeats):
+                t = time.perf_counter()
+                result = await search_folder(
+                    imap, cache, idx, criteria, limit=20, sync_interval=sync_interval
+                )
+                samples.append((time.perf_counter() - t) * 1000)
+            assert result.source == name
+            timings[name] = statistics.median(samples)
+        label = " ".join(f"{k}={v}" for k, v in vars(criteria).items() if v)
+        print(f"{label:<32} {timings['server']:>10.1f} {timings['index']:>10.1f} {result.total:>8}")
+
+    await imap.disconnect()
+    index.close()
+    cache.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    parser.add_argument("--scan-us", type=float, default=0.0)
+    parser.add_argument("--sync-interval", type=float, default=10.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer({"INBOX": make_corpus(args.messages)}, latency=args.rtt_ms / 1000).start()
+    server.capabilities = ["IMAP4rev1", "ESEARCH"]
+    server.scan_cost = args.scan_us / 1e6
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(server.port, os.path.join(tmp, "bench.db"), args.repeats, args.sync_interval))
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
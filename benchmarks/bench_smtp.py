@@ -0,0 +1,233 @@
+"""Sending mail: a new SMTP session per message vs. pooled sessions and the outbox.
+
+Sends --messages messages (--recipients each) to the fake SMTP server
+four ways:
+
+  * per message: connect, EHLO, STARTTLS, EHLO, AUTH, send, QUIT for every
+    message, which is what /api/send used to do
+  * one session: a kept-open SMTPClient, RSET between messages, once
+    without and once with PIPELINING
+  * outbox: OutboxSender with --pool sessions, timing both how long
+    enqueueing takes (what /api/send now waits for) and how long until the
+    server has everything
+
+STARTTLS is simulated: its reply costs two extra round trips for the
+handshake, nothing is encrypted.
+
+It then checks what the outbox records when sending fails: a 4xx is
+retried with doubling backoff until `outbox_max_attempts`, a 5xx fails at
+once, a session dropped mid-group puts the rest of the group back in the
+queue untouched, and messages left sending by a crash are requeued on
+restart.
+
+    python -m benchmarks.bench_smtp [--messages 100] [--rtt-ms 50] [--pool 2]
+"""
+
+import argparse
+import asyncio
+import os
+import smtplib
+import tempfile
+import time
+
+from app.config import Settings
+from app.smtp.client import SMTPClient, build_message
+from app.smtp.outbox import OutboxSender, OutboxStore
+from app.smtp.pool import SMTPPool
+from benchmarks.fake_smtp import FakeSMTPServer
+
+
+class LocalSMTPClient(SMTPClient):
+    def _starttls(self, server: smtplib.SMTP) -> None:
+        server.docmd("STARTTLS")
+        server.ehlo()
+
+
+def make_messages(count: int, recipients: int) -> list:
+    to = ", ".join(f"person{i}@example.com" for i in range(recipients))
+    return [
+        build_message("bench@example.com", to, f"Message {i}", f"Hello number {i}.\n\n.leading dot\n")
+        for i in range(count)
+    ]
+
+
+def per_message(server: FakeSMTPServer, messages: list) -> float:
+    start = time.perf_counter()
+    for msg in messages:
+        client = LocalSMTPClient("127.0.0.1", server.port, "bench@example.com", "pw")
+        client.send_message(msg)
+        client.disconnect()
+    return time.perf_counter() - start
+
+
+def one_session(server: FakeSMTPServer, messages: list) -> float:
+    client = LocalSMTPClient("127.0.0.1", server.port, "bench@example.com", "pw")
+    start = time.perf_counter()
+    for msg in messages:
+        client.send_message(msg)
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+    return elapsed
+
+
+async def outbox(server: FakeSMTPServer, messages: list, pool_size: int, path: str) -> tuple[float, float]:
+    settings = Settings(smtp_pool_size=pool_size)
+    pool = SMTPPool(
+        "127.0.0.1", server.port, "bench@example.com", "pw",
+        max_size=pool_size, client_class=LocalSMTPClient,
+    )
+    store = OutboxStore(path)
+    sender = OutboxSender(store, settings)
+    sender.attach(pool)
+    before = len(server.messages)
+
+    start = time.perf_counter()
+    sender.start()
+    for msg in messages:
+        sender.enqueue(pool.account, [msg])
+    enqueued = time.perf_counter() - start
+    while len(server.messages) - before < len(messages):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    await sender.stop()
+    pool.close()
+    store.close()
+    return enqueued, elapsed
+
+
+def assert_row(
+    store: OutboxStore, message_id: str, status: str, attempts: int,
+    window: tuple[float, float] | None = None, delay: float = 0.0,
+) -> dict:
+    """The row has `status` and `attempts` and, given the `window` its pass
+    ran in, a next attempt `delay` seconds after some point of it."""
+    row = store.get(message_id)
+    assert row["status"] == status and row["attempts"] == attempts, row
+    if window is not None:
+        assert window[0] + delay <= row["next_attempt"] <= window[1] + delay, row
+    return row
+
+
+async def timed_run(sender: OutboxSender, store: OutboxStore, account: str) -> tuple[int, tuple[float, float]]:
+    """Wait until the next queued message is due, then send what is.
+    Returns the number attempted and when the pass started and ended."""
+    due = store.next_due(account)
+    if due is not None:
+        await asyncio.sleep(max(due - time.time(), 0.0))
+    start = time.time()
+    count = await sender.run_once()
+    return count, (start, time.time())
+
+
+async def failures(server: FakeSMTPServer, path: str) -> None:
+    # Well over one pass, so a retry never comes due within the pass after
+    base = max(0.2, 20 * server.latency)
+    settings = Settings(smtp_pool_size=1, outbox_max_attempts=3, outbox_retry_base=base)
+    pool = SMTPPool(
+        "127.0.0.1", server.port, "bench@example.com", "pw",
+        max_size=1, client_class=LocalSMTPClient,
+    )
+    store = OutboxStore(path)
+    sender = OutboxSender(store, settings)
+    sender.attach(pool)
+    server.defer.add("busy@example.com")
+    server.reject.add("nobody@example.com")
+    server.drop.add("crash@example.com")
+
+    def enqueue(to: str) -> str:
+        return sender.enqueue(pool.account, [build_message("bench@example.com", to, to, "Hello.\n")])[0]["id"]
+
+    # One group: a 4xx and a 5xx between two that go through
+    ok, busy, nobody, ok2 = map(enqueue, ["a@example.com", "busy@example.com", "nobody@example.com", "b@example.com"])
+    count, window = await timed_run(sender, store, pool.account)
+    assert count == 4
+    assert_row(store, ok, "sent", 1)
+    assert_row(store, ok2, "sent", 1)
+    assert_row(store, nobody, "failed", 1)
+    assert_row(store, busy, "queued", 1, window, base)
+    assert await sender.run_once() == 0
+    count, window = await timed_run(sender, store, pool.account)
+    assert count == 1
+    assert_row(store, busy, "queued", 2, window, base * 2)
+    count, _ = await timed_run(sender, store, pool.account)
+    assert count == 1
+    assert_row(store, busy, "failed", 3)
+    print(f"4xx: retried after {base:.1f}s and {base * 2:.1f}s, failed at attempt 3; 5xx failed at once")
+
+    # The session drops on the second message of a group
+    sessions = server.sessions
+    ids = list(map(enqueue, ["c@example.com", "crash@example.com", "d@example.com", "e@example.com"]))
+    count, window = await timed_run(sender, store, pool.account)
+    assert count == 4
+    assert_row(store, ids[0], "sent", 1)
+    assert_row(store, ids[1], "queued", 1, window, base)
+    for message_id in ids[2:]:
+        row = assert_row(store, message_id, "queued", 0, window)
+        assert row["error"] is None, row
+    assert await sender.run_once() == 2
+    for message_id in ids[2:]:
+        assert_row(store, message_id, "sent", 1)
+    assert server.sessions == sessions + 1
+    server.drop.clear()
+    count, _ = await timed_run(sender, store, pool.account)
+    assert count == 1
+    assert_row(store, ids[1], "sent", 2)
+    print("dropped session: the 2 messages after it requeued and sent on a new session, its own retried")
+
+    # A crash between claim and finish
+    lost = enqueue("f@example.com")
+    assert [item["id"] for item in store.claim(pool.account, 10)] == [lost]
+    store.close()
+    store = OutboxStore(path)
+    assert store.requeue_interrupted() == 1
+    assert_row(store, lost, "queued", 0)
+    sender = OutboxSender(store, settings)
+    sender.attach(pool)
+    assert await sender.run_once() == 1
+    assert_row(store, lost, "sent", 1)
+    print("restart: 1 message left sending requeued and sent")
+
+    server.defer.clear()
+    server.reject.clear()
+    pool.close()
+    store.close()
+
+
+def report(label: str, elapsed: float, count: int) -> None:
+    print(f"{label:<32} {elapsed:>7.2f}s  {elapsed / count * 1000:>7.1f} ms/message")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--recipients", type=int, default=3)
+    parser.add_argument("--rtt-ms", type=float, default=50.0)
+    parser.add_argument("--pool", type=int, default=2)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.recipients)
+    print(f"{args.messages} messages, {args.recipients} recipients each, RTT {args.rtt_ms:.0f} ms\n")
+
+    server = FakeSMTPServer(latency=args.rtt_ms / 1000, pipelining=False).start()
+    report("per message (old /api/send)", per_message(server, messages), args.messages)
+    report("one session, RSET", one_session(server, messages), args.messages)
+    server.pipelining = True
+    report("one session, RSET + PIPELINING", one_session(server, messages), args.messages)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        enqueued, elapsed = asyncio.run(outbox(server, messages, args.pool, os.path.join(tmp, "outbox.db")))
+    report(f"outbox, {args.pool} sessions", elapsed, args.messages)
+    print(f"{'  enqueue (request latency)':<32} {enqueued * 1000 / args.messages:>16.2f} ms/message")
+
+    received = server.messages[-1]
+    assert b"\r\n.leading dot" in received.data and len(received.recipients) == args.recipients
+
+    print()
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(failures(server, os.path.join(tmp, "outbox.db")))
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Conversation threading: first build, incremental updates and lookups.
+
+Builds a folder of --messages messages grouped into conversations with
+References/In-Reply-To chains, some replies whose parent is missing from
+the folder, and some "Re:" replies that carry no references at all. Then:
+
+  * build: thread_folder on an empty ThreadIndex (fetch Message-ID and
+    References for every message, thread in memory, write), once with the
+    server's THREAD=REFERENCES and once with the local threader only
+  * thread_headers: the in-memory threading step alone
+  * add: 200 new replies arrive, synced and linked incrementally
+  * lookup: ThreadIndex.conversation for random messages, vs. what a
+    conversation view without an index costs (re-fetching every message's
+    threading headers and threading them per request)
+
+    python -m benchmarks.bench_threads [--messages 50000] [--rtt-ms 20]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from app.imap.cache import HeaderCache
+from app.imap.sync import sync_folder
+from app.imap.threads import ThreadIndex, _fetch_thread_headers, thread_folder, thread_headers
+from benchmarks.fake_imap import FakeIMAPServer, FakeMessage, LocalAsyncIMAPClient
+
+TOPICS = "budget roadmap invoice offsite hiring launch contract review migration audit".split()
+
+
+def make_conversations(count: int, seed: int = 7, start_uid: int = 1) -> list[FakeMessage]:
+    rnd = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    messages: list[FakeMessage] = []
+    threads: list[tuple[str, list[str]]] = []  # (subject, message ids)
+    for i in range(start_uid, start_uid + count):
+        message_id = f"<m{i}.{seed}@example.com>"
+        extra = ""
+        if threads and rnd.random() < 0.7:
+            subject, ids = rnd.choice(threads[-200:])
+            parent = rnd.choice(ids)
+            chain = ids[: ids.index(parent) + 1]
+            if rnd.random() < 0.05:
+                # Parent never arrived in this folder
+                chain = chain + [f"<lost{i}@example.com>"]
+            if rnd.random() < 0.03:
+                extra = ""  # A client that drops References and In-Reply-To
+            else:
+                extra = f"In-Reply-To: {chain[-1]}\r\nReferences: {' '.join(chain[-10:])}\r\n"
+            ids.append(message_id)
+            subject = f"Re: {subject}"
+        else:
+            subject = f"{rnd.choice(TOPICS)} {rnd.choice(TOPICS)} {i}"
+            threads.append((subject, [message_id]))
+        date = start + timedelta(minutes=i)
+        raw = (
+            f"From: Person{i % 50} <person{i % 50}@example.com>\r\n"
+            f"Subject: {subject}\r\n"
+            f"Date: {format_datetime(date)}\r\n"
+            f"Message-ID: {message_id}\r\n{extra}"
+            f"Content-Type: text/plain; charset=utf-8\r\n\r\nbody {i}\r\n"
+        ).encode()
+        messages.append(FakeMessage(uid=i, raw=raw, internaldate=date))
+    return messages
+
+
+async def build(server: FakeIMAPServer, path: str, capabilities: list[str]) -> tuple[float, int]:
+    server.capabilities = capabilities
+    imap = LocalAsyncIMAPClient("127.0.0.1", server.port, "bench", "bench")
+    await imap.connect()
+    cache, index = HeaderCache(path), ThreadIndex(path)
+    await sync_folder(imap, cache, "INBOX")
+    index.reset_folder(imap.account, "INBOX", cache.folder_state(imap.account, "INBOX").uidvalidity)
+    start = time.perf_counter()
+    threaded = await thread_folder(imap, cache, index, "INBOX")
+    elapsed = time.perf_counter() - start
+    await imap.disconnect()
+    cache.close()
+    index.close()
+    return elapsed, threaded
+
+
+async def run(server: FakeIMAPServer, path: str, messages: int, lookups: int) -> None:
+    for label, caps in (("server THREAD", ["IMAP4rev1", "THREAD=REFERENCES"]), ("local", ["IMAP4rev1"])):
+        elapsed, threaded = await build(server, path, caps)
+        print(f"build ({label}): {threaded} messages in {elapsed:.2f}s")
+
+    imap = LocalAsyncIMAPClient("127.0.0.1", server.port, "bench", "bench")
+    await imap.connect()
+    cache, index = HeaderCache(path), ThreadIndex(path)
+    account = imap.account
+    uids = cache.uids(account, "INBOX")
+
+    headers = await _fetch_thread_headers(imap, cache, account, "INBOX", uids)
+    start = time.perf_counter()
+    links = thread_headers(headers)
+    print(
+        f"thread_headers: {len(headers)} messages -> {len(set(links.values()))} threads "
+        f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+    )
+
+    server.folders["INBOX"] += make_conversations(200, seed=8, start_uid=messages + 1)
+    start = time.perf_counter()
+    await sync_folder(imap, cache, "INBOX")
+    added = await thread_folder(imap, cache, index, "INBOX")
+    print(f"add: sync + link {added} new messages in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    rnd = random.Random(1)
+    sample = rnd.sample(uids, min(lookups, len(uids)))
+    timings, sizes = [], []
+    for uid in sample:
+        start = time.perf_counter()
+        _, members = index.conversation(account, "INBOX", uid)
+        timings.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(members))
+    print(
+        f"lookup: median {statistics.median(timings):.2f} ms, p95 "
+        f"{sorted(timings)[int(len(timings) * 0.95)]:.2f} ms, median thread size {statistics.median(sizes):.0f}"
+    )
+
+    start = time.perf_counter()
+    rescanned = await _fetch_thread_headers(imap, cache, account, "INBOX", cache.uids(account, "INBOX"))
+    thread_headers(rescanned)
+    print(f"rescan per request (no index): {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    await imap.disconnect()
+    cache.close()
+    index.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer({"INBOX": make_conversations(args.messages)}, latency=args.rtt_ms / 1000).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(server, os.path.join(tmp, "threads.db"), args.messages, args.lookups))
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Inbox throughput: one API process vs. stateless workers behind the broker.
+
+Each simulated request does what /api/inbox followed by opening a message
+does: look up the session, run sync_folder (skipped when the folder was
+synced within CACHE_SYNC_INTERVAL), read a page from the header cache,
+load one message of it through the message cache and serialize the
+result. "single" runs them in one process that owns the IMAP pool;
+"workers" runs the broker in one process and spreads the same requests
+over --workers processes that reach IMAP through it and share the SQLite
+caches. Extra workers only pay off with a CPU core each, so compare the
+req/s column with the core count printed in the header.
+
+    python -m benchmarks.bench_workers [--workers 1,2,4] [--requests 800] [--rtt-ms 20]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import statistics
+import tempfile
+import time
+
+from app.accounts import AccountRegistry
+from app.broker.client import BrokerAccounts
+from app.broker.rpc import RPCClient
+from app.broker.server import serve
+from app.config import Settings
+from app.imap.cache import HeaderCache
+from app.imap.message_cache import SharedMessageCache, message_key
+from app.imap.search_cache import SearchCache
+from app.imap.sync import sync_folder
+from app.jobs import JobStore, BatchJobRunner
+from app.prefetch import ActivityTracker
+from app.smtp.outbox import OutboxStore, OutboxSender
+from benchmarks.fake_imap import FakeIMAPServer, LocalAsyncIMAPClient, make_messages
+
+PAGE = 50
+FOLDER = "INBOX"
+
+
+def _credentials(port: int) -> dict:
+    return dict(
+        imap_host="127.0.0.1", imap_port=port, imap_user="bench", imap_password="bench",
+        smtp_host="127.0.0.1", smtp_user="bench",
+    )
+
+
+async def _inbox_request(accounts, token: str, header_cache: HeaderCache, settings: Settings) -> int:
+    account = await accounts.get(token)
+    async with account.imap_pool.connection(FOLDER) as imap:
+        await sync_folder(imap, header_cache, FOLDER, max_age=settings.cache_sync_interval)
+    headers = header_cache.list_headers(account.key, FOLDER, limit=PAGE)
+    uid = random.choice(headers)["uid"]
+    state = header_cache.folder_state(account.key, FOLDER)
+
+    async def _fetch():
+        async with account.imap_pool.connection(FOLDER) as imap:
+            return await imap.fetch_message(str(uid), folder=FOLDER)
+
+    message = await account.message_cache.get(message_key(account.key, FOLDER, state.uidvalidity, uid), _fetch)
+    body = json.dumps({"emails": headers, "open": {"subject": message.subject, "body": message.body_plain}})
+    return len(body)
+
+
+async def _run_requests(accounts, token, header_cache, settings, requests: int, concurrency: int) -> list[float]:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await _inbox_request(accounts, token, header_cache, settings)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+def _single(settings: Settings, port: int, requests: int, concurrency: int, ready, go, results) -> None:
+    async def run():
+        header_cache = HeaderCache(settings.cache_path)
+        job_store, outbox_store = JobStore(settings.cache_path), OutboxStore(settings.cache_path)
+        registry = AccountRegistry(
+            settings, header_cache, None, ActivityTracker(),
+            BatchJobRunner(header_cache, None, job_store, settings), OutboxSender(outbox_store, settings),
+            client_class=LocalAsyncIMAPClient,
+        )
+        token, _ = await registry.login(registry.account_settings(**_credentials(port)))
+        await _run_requests(registry, token, header_cache, settings, 20, concurrency)
+        ready.set()
+        go.wait()
+        results.put(await _run_requests(registry, token, header_cache, settings, requests, concurrency))
+        await registry.stop()
+
+    asyncio.run(run())
+
+
+def _worker(settings: Settings, token: str, requests: int, concurrency: int, ready, go, results) -> None:
+    async def run():
+        header_cache = HeaderCache(settings.cache_path)
+        rpc = RPCClient(settings.broker_socket)
+        messages = SharedMessageCache(settings.cache_path, max_entries=settings.message_cache_size)
+        accounts = BrokerAccounts(settings, rpc, messages, SearchCache())
+        await _run_requests(accounts, token, header_cache, settings, 20, concurrency)
+        ready.set()
+        go.wait()
+        results.put(await _run_requests(accounts, token, header_cache, settings, requests, concurrency))
+        await rpc.close()
+
+    asyncio.run(run())
+
+
+def _broker(settings: Settings) -> None:
+    asyncio.run(serve(settings, client_class=LocalAsyncIMAPClient))
+
+
+async def _login(settings: Settings, port: int) -> str:
+    rpc = RPCClient(settings.broker_socket)
+    for _ in range(100):
+        if os.path.exists(settings.broker_socket):
+            break
+        await asyncio.sleep(0.05)
+    info = await rpc.call("login", credentials=_credentials(port))
+    await rpc.close()
+    return info["token"]
+
+
+def _measure(ctx, target, args_per_process: list[tuple]) -> tuple[float, list[float]]:
+    ready = [ctx.Event() for _ in args_per_process]
+    go = ctx.Event()
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=target, args=(*args, ready[i], go, results))
+        for i, args in enumerate(args_per_process)
+    ]
+    for p in processes:
+        p.start()
+    for event in ready:
+        event.wait()
+    start = time.perf_counter()
+    go.set()
+    latencies = []
+    for _ in processes:
+        latencies.extend(results.get())
+    elapsed = time.perf_counter() - start
+    for p in processes:
+        p.join()
+    return elapsed, latencies
+
+
+def _row(name: str, requests: int, elapsed: float, latencies: list[float]) -> str:
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    return (
+        f"{name:>10} {elapsed:>9.2f} {requests / elapsed:>9.1f} "
+        f"{statistics.median(latencies) * 1000:>9.1f} {p95 * 1000:>9.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=800)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+
+    server = FakeIMAPServer({FOLDER: make_messages(args.messages)}, latency=args.rtt_ms / 1000).start()
+    tmp = tempfile.mkdtemp()
+    base = Settings(
+        cache_path=os.path.join(tmp, "cache.db"),
+        broker_socket=os.path.join(tmp, "broker.sock"),
+        prefetch_enabled=False,
+        idle_enabled=False,
+    )
+    ctx = multiprocessing.get_context("spawn")
+
+    print(
+        f"RTT {args.rtt_ms:.0f} ms, {args.requests} requests, concurrency {args.concurrency}, "
+        f"{os.cpu_count()} CPU core(s)"
+    )
+    print(f"{'setup':>10} {'seconds':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+
+    single = (base, server.port, args.requests, args.concurrency)
+    elapsed, latencies = _measure(ctx, _single, [single])
+    print(_row("single", args.requests, elapsed, latencies))
+
+    broker = ctx.Process(target=_broker, args=(base,))
+    broker.start()
+    token = asyncio.run(_login(base, server.port))
+    for count in (int(n) for n in args.workers.split(",")):
+        per_worker = args.requests // count
+        worker = (base, token, per_worker, max(1, args.concurrency // count))
+        elapsed, latencies = _measure(ctx, _worker, [worker] * count)
+        print(_row(f"{count} worker", per_worker * count, elapsed, latencies))
+    os.kill(broker.pid, signal.SIGTERM)
+    broker.join()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
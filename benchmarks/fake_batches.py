@@ -0,0 +1,263 @@
+"""A small in-process Message Batches API for benchmarks.
+
+Serves the batch endpoints the app uses (create, retrieve, cancel and
+results) over plain HTTP, in the shapes the Anthropic SDK parses, so
+ClaudeClient's batch methods run unchanged against it. Each request of a
+batch finishes at a random point within `processing_time` seconds of
+submission; a canceled batch ends at once, with the requests that had not
+finished reported as canceled. Replies come from `respond(params)`: the
+default answers categorize prompts with a JSON array covering every
+"- UID n:" line and anything else with a one-line summary; returning None
+makes the request errored. Every response is held back `latency` seconds.
+LocalClaudeClient is ClaudeClient pointed at it.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+import anthropic
+
+from app.ai.categorize import CATEGORIES
+from app.ai.claude import ClaudeClient
+from app.ai.response_cache import ResponseCache
+from app.config import Settings
+
+UID_LINE_RE = re.compile(r"^- UID (\d+):", re.MULTILINE)
+SUBJECT_RE = re.compile(r"^Subject: (.*)$", re.MULTILINE)
+BATCH_PATH_RE = re.compile(r"^/v1/messages/batches(?:/([\w-]+)(?:/(cancel|results))?)?$")
+
+
+def default_response(params: dict) -> Optional[str]:
+    prompt = params["messages"][-1]["content"]
+    uids = UID_LINE_RE.findall(prompt)
+    if uids:
+        return json.dumps([
+            {"uid": uid, "category": CATEGORIES[int(uid) % len(CATEGORIES)]} for uid in uids
+        ])
+    subject = SUBJECT_RE.search(prompt)
+    return f"Summary of {subject.group(1) if subject else 'the message'}."
+
+
+@dataclass
+class FakeBatch:
+    id: str
+    requests: list[dict]
+    # custom_id -> monotonic time the request finishes
+    due: dict[str, float]
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    canceled_at: Optional[float] = None
+
+    def finished(self, custom_id: str, now: float) -> bool:
+        end = now if self.canceled_at is None else min(now, self.canceled_at)
+        return self.due[custom_id] <= end
+
+    def ended(self, now: float) -> bool:
+        return self.canceled_at is not None or max(self.due.values(), default=0) <= now
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    return dt.isoformat().replace("+00:00", "Z") if dt else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeBatchesServer"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def _dispatch(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        time.sleep(self.server.latency)
+        match = BATCH_PATH_RE.match(self.path.split("?", 1)[0])
+        if match is None:
+            return self._error(404, "not_found_error", f"{method} {self.path}")
+        batch_id, action = match.groups()
+        if batch_id is None:
+            if method != "POST":
+                return self._error(405, "invalid_request_error", "list is not supported")
+            return self._json(self.server.create(body["requests"]))
+        batch = self.server.batches.get(batch_id)
+        if batch is None:
+            return self._error(404, "not_found_error", f"No batch {batch_id}")
+        if action is None and method == "GET":
+            self.server.count("retrieve")
+            return self._json(self.server.describe(batch))
+        if action == "cancel" and method == "POST":
+            return self._json(self.server.cancel(batch))
+        if action == "results" and method == "GET":
+            if not batch.ended(time.monotonic()):
+                return self._error(400, "invalid_request_error", "Batch is still processing")
+            self.server.count("results")
+            lines = (json.dumps(entry) for entry in self.server.results(batch))
+            return self._send(200, "application/binary", "\n".join(lines).encode() + b"\n")
+        return self._error(405, "invalid_request_error", f"{method} {self.path}")
+
+    def _json(self, data: dict, status: int = 200):
+        self._send(status, "application/json", json.dumps(data).encode())
+
+    def _error(self, status: int, kind: str, message: str):
+        self._json({"type": "error", "error": {"type": kind, "message": message}}, status)
+
+    def _send(self, status: int, content_type: str, payload: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeBatchesServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        processing_time: float = 1.0,
+        respond: Callable[[dict], Optional[str]] = default_response,
+        seed: int = 1,
+    ):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+        self.processing_time = processing_time
+        self.respond = respond
+        self.batches: dict[str, FakeBatch] = {}
+        self.calls: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def count(self, call: str) -> None:
+        with self.lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+
+    def create(self, requests: list[dict]) -> dict:
+        self.count("create")
+        now = time.monotonic()
+        with self.lock:
+            due = {r["custom_id"]: now + self._rng.uniform(0, self.processing_time) for r in requests}
+            batch = FakeBatch(id=f"msgbatch_{uuid.uuid4().hex[:24]}", requests=requests, due=due)
+            self.batches[batch.id] = batch
+        return self.describe(batch)
+
+    def cancel(self, batch: FakeBatch) -> dict:
+        self.count("cancel")
+        now = time.monotonic()
+        with self.lock:
+            canceling = not batch.ended(now)
+            if canceling:
+                batch.canceled_at = now
+        data = self.describe(batch)
+        if canceling:
+            # The next retrieve reports it ended
+            data["processing_status"] = "canceling"
+        return data
+
+    def describe(self, batch: FakeBatch) -> dict:
+        now = time.monotonic()
+        finished = sum(1 for cid in batch.due if batch.finished(cid, now))
+        ended = batch.ended(now)
+        ended_at = None
+        if ended:
+            end = batch.canceled_at or max(batch.due.values(), default=now)
+            ended_at = datetime.now(timezone.utc) - timedelta(seconds=now - end)
+        return {
+            "id": batch.id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else len(batch.due) - finished,
+                "succeeded": finished,
+                "errored": 0,
+                "canceled": len(batch.due) - finished if ended else 0,
+                "expired": 0,
+            },
+            "created_at": _iso(batch.created_at),
+            "expires_at": _iso(batch.created_at + timedelta(days=1)),
+            "ended_at": _iso(ended_at),
+            "cancel_initiated_at": _iso(ended_at) if batch.canceled_at else None,
+            "archived_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch.id}/results" if ended else None,
+        }
+
+    def results(self, batch: FakeBatch) -> list[dict]:
+        now = time.monotonic()
+        entries = []
+        for request in batch.requests:
+            custom_id, params = request["custom_id"], request["params"]
+            if not batch.finished(custom_id, now):
+                entries.append({"custom_id": custom_id, "result": {"type": "canceled"}})
+                continue
+            text = self.respond(params)
+            if text is None:
+                entries.append({"custom_id": custom_id, "result": {
+                    "type": "errored",
+                    "error": {"type": "error", "error": {"type": "api_error", "message": "Internal error"}},
+                }})
+                continue
+            prompt = json.dumps(params["messages"]) + json.dumps(params.get("system", ""))
+            entries.append({"custom_id": custom_id, "result": {"type": "succeeded", "message": {
+                "id": f"msg_{uuid.uuid4().hex[:24]}",
+                "type": "message",
+                "role": "assistant",
+                "model": params["model"],
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {
+                    "input_tokens": len(prompt) // 4,
+                    "output_tokens": len(text) // 4 + 1,
+                    "cache_creation_input_tokens": 0,
+                    "cache_read_input_tokens": 0,
+                },
+            }}})
+        return entries
+
+    def start(self) -> "FakeBatchesServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class LocalClaudeClient(ClaudeClient):
+    """ClaudeClient whose async SDK client talks to the fake server."""
+
+    def __init__(self, settings: Settings, base_url: str, cache: Optional[ResponseCache] = None):
+        super().__init__(settings, cache=cache)
+        self._base_url = base_url
+
+    def _get_async_client(self) -> anthropic.AsyncAnthropic:
+        if self._async_client is None:
+            self._async_client = anthropic.AsyncAnthropic(
+                api_key=self._api_key or "fake", base_url=self._base_url
+            )
+        return self._async_client
@@ -0,0 +1,649 @@
+"""A small in-process IMAP server for benchmarks.
+
+Speaks just enough IMAP4rev1 (plain TCP, no TLS) for IMAPClient to log in,
+select a folder, search and fetch. Each response is held back for `latency`
+seconds before it is written, so round-trip costs show up the way they would
+against a remote server while pipelined commands still overlap.
+LocalIMAPClient and LocalAsyncIMAPClient are the app's clients without TLS,
+for connecting to it.
+"""
+
+import asyncio
+import base64
+import email
+import imaplib
+import queue
+import re
+import socketserver
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from email.message import Message
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+from app.imap.aio import MAX_LINE_LENGTH, AsyncIMAPClient
+from app.imap.client import IMAPClient
+
+
+@dataclass
+class FakeMessage:
+    uid: int
+    raw: bytes
+    flags: list[str] = field(default_factory=list)
+    internaldate: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    modseq: int = 1
+
+    @cached_property
+    def message(self) -> Message:
+        return email.message_from_bytes(self.raw)
+
+
+def make_messages(count: int, body_size: int = 2000) -> list[FakeMessage]:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for i in range(1, count + 1):
+        date = start + timedelta(minutes=i)
+        raw = (
+            f"From: Sender {i % 37} <sender{i % 37}@example.com>\r\n"
+            f"To: me@example.com\r\n"
+            f"Subject: Message number {i}\r\n"
+            f"Date: {format_datetime(date)}\r\n"
+            f"Message-ID: <msg{i}@example.com>\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\n"
+            f"\r\n"
+            + ("lorem ipsum " * (body_size // 12))
+            + "\r\n"
+        ).encode()
+        flags = ["\\Seen"] if i % 3 else []
+        messages.append(FakeMessage(uid=i, raw=raw, flags=flags, internaldate=date))
+    return messages
+
+
+def make_attachment_message(uid: int, attachment_size: int, body_size: int = 2000) -> FakeMessage:
+    """A multipart/mixed message: text and HTML alternatives plus one base64 attachment."""
+    date = datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=uid)
+    boundary, alt = f"mixed-{uid}", f"alt-{uid}"
+    data = (bytes(range(256)) * (attachment_size // 256 + 1))[:attachment_size]
+    payload = base64.encodebytes(data).replace(b"\n", b"\r\n")
+    raw = (
+        f"From: Sender <sender@example.com>\r\n"
+        f"To: me@example.com\r\n"
+        f"Subject: Report {uid}\r\n"
+        f"Date: {format_datetime(date)}\r\n"
+        f"Message-ID: <att{uid}@example.com>\r\n"
+        f"MIME-Version: 1.0\r\n"
+        f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n'
+        f"\r\n"
+        f"--{boundary}\r\n"
+        f'Content-Type: multipart/alternative; boundary="{alt}"\r\n'
+        f"\r\n"
+        f"--{alt}\r\n"
+        f"Content-Type: text/plain; charset=utf-8\r\n"
+        f"\r\n"
+        + ("lorem ipsum " * (body_size // 12)) + "\r\n"
+        f"--{alt}\r\n"
+        f"Content-Type: text/html; charset=utf-8\r\n"
+        f"\r\n"
+        f"<p>{'lorem ipsum ' * (body_size // 12)}</p>\r\n"
+        f"--{alt}--\r\n"
+        f"--{boundary}\r\n"
+        f'Content-Type: application/octet-stream; name="report-{uid}.bin"\r\n'
+        f"Content-Transfer-Encoding: base64\r\n"
+        f'Content-Disposition: attachment; filename="report-{uid}.bin"\r\n'
+        f"\r\n"
+    ).encode() + payload + f"--{boundary}--\r\n".encode()
+    return FakeMessage(uid=uid, raw=raw, internaldate=date)
+
+
+def _payload_bytes(part: Message) -> bytes:
+    return part.get_payload().encode("ascii", "surrogateescape")
+
+
+def _quoted(value) -> str:
+    if value is None:
+        return "NIL"
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _param_list(pairs: list) -> str:
+    if not pairs:
+        return "NIL"
+    return "(" + " ".join(f"{_quoted(k)} {_quoted(v)}" for k, v in pairs) + ")"
+
+
+def _bodystructure(part: Message) -> str:
+    disposition = part.get_content_disposition()
+    disp = "NIL"
+    if disposition:
+        filename = part.get_param("filename", header="content-disposition")
+        disp = f"({_quoted(disposition)} {_param_list([('filename', filename)] if filename else [])})"
+    if part.is_multipart():
+        children = "".join(_bodystructure(p) for p in part.get_payload())
+        boundary = [("boundary", part.get_boundary())] if part.get_boundary() else []
+        return f"({children} {_quoted(part.get_content_subtype())} {_param_list(boundary)} {disp} NIL NIL)"
+    params = [(k, v) for k, v in (part.get_params() or [])[1:]]
+    payload = _payload_bytes(part)
+    fields = [
+        _quoted(part.get_content_maintype()),
+        _quoted(part.get_content_subtype()),
+        _param_list(params),
+        "NIL",
+        "NIL",
+        _quoted(part.get("Content-Transfer-Encoding", "7bit")),
+        str(len(payload)),
+    ]
+    if part.get_content_maintype() == "text":
+        fields.append(str(payload.count(b"\n")))
+    fields += ["NIL", disp, "NIL", "NIL"]
+    return "(" + " ".join(fields) + ")"
+
+
+def _section(msg: Message, section: str) -> bytes:
+    part = msg
+    for index in section.split("."):
+        if part.is_multipart():
+            part = part.get_payload()[int(index) - 1]
+        elif index != "1":
+            return b""
+    return _payload_bytes(part)
+
+
+def _tokenize(line: str) -> list:
+    """Parse an IMAP argument string into nested lists of atoms/strings."""
+    tokens = re.findall(r'"(?:[^"\\]|\\.)*"|\(|\)|[^\s()"]+\[[^\]]*\](?:<[^>]*>)?|[^\s()"]+', line)
+    stack = [[]]
+    for tok in tokens:
+        if tok == "(":
+            stack.append([])
+        elif tok == ")":
+            inner = stack.pop()
+            stack[-1].append(inner)
+        elif tok.startswith('"'):
+            stack[-1].append(tok[1:-1].replace('\\"', '"'))
+        else:
+            stack[-1].append(tok)
+    return stack[0]
+
+
+def _flatten(tokens: list) -> list:
+    flat = []
+    for tok in tokens:
+        if isinstance(tok, list):
+            flat.extend(_flatten(tok))
+        else:
+            flat.append(tok)
+    return flat
+
+
+def _search_text(msg: FakeMessage, key: str) -> bytes:
+    head, _, body = msg.raw.partition(b"\r\n\r\n")
+    if key == "BODY":
+        return body.lower()
+    if key == "TEXT":
+        return msg.raw.lower()
+    name = {"FROM": "From", "TO": "To", "SUBJECT": "Subject"}[key]
+    return (msg.message.get(name) or "").lower().encode()
+
+
+def _parse_uid_set(spec: str, max_uid: int) -> set[int]:
+    uids = set()
+    for part in spec.split(","):
+        if ":" in part:
+            a, b = part.split(":")
+            a = max_uid if a == "*" else int(a)
+            b = max_uid if b == "*" else int(b)
+            lo, hi = min(a, b), max(a, b)
+            uids.update(range(lo, hi + 1))
+        else:
+            uids.add(max_uid if part == "*" else int(part))
+    return uids
+
+
+# Commands only valid in the selected state
+SELECTED_COMMANDS = {"IDLE", "FETCH", "UID FETCH", "UID SEARCH", "UID SORT", "UID THREAD"}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "FakeIMAPServer"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.selected = None
+        self.changes: list[bytes] = []
+        with self.server.lock:
+            self.server.handlers.add(self)
+        self._pending = []
+        self._outbox = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def finish(self):
+        with self.server.lock:
+            self.server.handlers.discard(self)
+        self._outbox.put(None)
+        self._writer.join()
+        super().finish()
+
+    def send(self, data: bytes):
+        self._pending.append(data)
+
+    def _flush(self):
+        """Queue this command's response for delivery `latency` seconds from now."""
+        if self._pending:
+            self._outbox.put((time.monotonic() + self.server.latency, b"".join(self._pending)))
+            self._pending = []
+
+    def _write_loop(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                return
+            due, data = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.wfile.write(data)
+            except OSError:
+                return
+
+    def handle(self):
+        self.send(b"* OK [CAPABILITY IMAP4rev1] fake server ready\r\n")
+        self._flush()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            if not line:
+                continue
+            tag, _, rest = line.partition(" ")
+            cmd, _, args = rest.partition(" ")
+            cmd = cmd.upper()
+            if cmd == "UID":
+                sub, _, args = args.partition(" ")
+                cmd = "UID " + sub.upper()
+            self.server.commands.append(cmd)
+            handler = getattr(self, "cmd_" + cmd.replace(" ", "_"), None)
+            if handler is None:
+                self.send(f"{tag} BAD unknown command\r\n".encode())
+                self._flush()
+                continue
+            if cmd in SELECTED_COMMANDS and self.selected is None:
+                self.send(f"{tag} BAD no mailbox selected\r\n".encode())
+                self._flush()
+                continue
+            done = handler(tag, args) is False
+            self._flush()
+            if done:
+                return
+
+    @property
+    def messages(self) -> list[FakeMessage]:
+        return self.server.folders.get(self.selected or "INBOX", [])
+
+    def cmd_CAPABILITY(self, tag, args):
+        self.send(b"* CAPABILITY " + " ".join(self.server.capabilities).encode() + b"\r\n")
+        self.send(f"{tag} OK CAPABILITY completed\r\n".encode())
+
+    def cmd_LOGIN(self, tag, args):
+        self.send(f"{tag} OK LOGIN completed\r\n".encode())
+
+    def cmd_LOGOUT(self, tag, args):
+        self.send(b"* BYE logging out\r\n")
+        self.send(f"{tag} OK LOGOUT completed\r\n".encode())
+        return False
+
+    def cmd_ENABLE(self, tag, args):
+        enabled = [c for c in args.upper().split() if c in self.server.capabilities]
+        self.send(b"* ENABLED " + " ".join(enabled).encode() + b"\r\n")
+        self.send(f"{tag} OK ENABLE completed\r\n".encode())
+
+    def cmd_STATUS(self, tag, args):
+        tokens = _tokenize(args)
+        name, wanted = tokens[0], [str(t).upper() for t in tokens[1]]
+        msgs = self.server.folders.get(name, [])
+        values = {
+            "MESSAGES": len(msgs),
+            "UIDNEXT": (msgs[-1].uid + 1) if msgs else 1,
+            "UIDVALIDITY": self.server.uidvalidity,
+            "UNSEEN": sum(1 for m in msgs if "\\Seen" not in m.flags),
+            "HIGHESTMODSEQ": self.server.highestmodseq(name),
+        }
+        body = " ".join(f"{k} {values[k]}" for k in wanted if k in values)
+        self.send(f'* STATUS "{name}" ({body})\r\n'.encode())
+        self.send(f"{tag} OK STATUS completed\r\n".encode())
+
+    def cmd_NOOP(self, tag, args):
+        self._send_changes()
+        self.send(f"{tag} OK NOOP completed\r\n".encode())
+
+    def cmd_IDLE(self, tag, args):
+        if "IDLE" not in self.server.capabilities:
+            self.send(f"{tag} BAD IDLE not supported\r\n".encode())
+            return
+        self.send(b"+ idling\r\n")
+        self._flush()
+        with self.server.lock:
+            self.server.idlers.add(self)
+        try:
+            self._send_changes()
+            self._flush()
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return False
+                if line.strip().upper() == b"DONE":
+                    break
+        finally:
+            with self.server.lock:
+                self.server.idlers.discard(self)
+        self.send(f"{tag} OK IDLE terminated\r\n".encode())
+
+    def _send_changes(self):
+        """Untagged EXISTS/EXPUNGE/VANISHED/FETCH for changes since the last report."""
+        with self.server.lock:
+            changes, self.changes = self.changes, []
+        for data in changes:
+            self.send(data)
+
+    def notify(self, data: bytes) -> None:
+        """Queue an unsolicited response; delivered at once while idling."""
+        with self.server.lock:
+            if self in self.server.idlers:
+                self._outbox.put((time.monotonic() + self.server.latency, data))
+            else:
+                self.changes.append(data)
+
+    def cmd_LIST(self, tag, args):
+        for name in self.server.folders:
+            self.send(f'* LIST (\\HasNoChildren) "/" "{name}"\r\n'.encode())
+        self.send(f"{tag} OK LIST completed\r\n".encode())
+
+    def cmd_SELECT(self, tag, args):
+        name = _tokenize(args)[0]
+        if name not in self.server.folders:
+            # A failed SELECT deselects the current mailbox too
+            self.selected = None
+            self.send(f"{tag} NO no such folder\r\n".encode())
+            return
+        self.selected = name
+        with self.server.lock:
+            self.changes = []
+        msgs = self.messages
+        uidnext = (msgs[-1].uid + 1) if msgs else 1
+        self.send(f"* {len(msgs)} EXISTS\r\n".encode())
+        self.send(b"* 0 RECENT\r\n")
+        self.send(f"* OK [UIDVALIDITY {self.server.uidvalidity}] UIDs valid\r\n".encode())
+        self.send(f"* OK [UIDNEXT {uidnext}] next UID\r\n".encode())
+        self.send(f"{tag} OK [READ-WRITE] SELECT completed\r\n".encode())
+
+    cmd_EXAMINE = cmd_SELECT
+
+    def cmd_UID_SEARCH(self, tag, args):
+        tokens = _tokenize(args)
+        returns = None
+        if tokens and str(tokens[0]).upper() == "RETURN":
+            returns, tokens = [str(t).upper() for t in tokens[1]], tokens[2:]
+        uids = self._match(tokens)
+        if returns is None:
+            self.send(b"* SEARCH " + " ".join(map(str, uids)).encode() + b"\r\n")
+        else:
+            self.send(self._esearch(tag, uids, returns))
+        self.send(f"{tag} OK SEARCH completed\r\n".encode())
+
+    def cmd_UID_SORT(self, tag, args):
+        tokens = _tokenize(args)
+        returns = None
+        if tokens and str(tokens[0]).upper() == "RETURN":
+            returns, tokens = [str(t).upper() for t in tokens[1]], tokens[2:]
+        keys, tokens = [str(t).upper() for t in tokens[0]], tokens[2:]
+        by_uid = {m.uid: m for m in self.messages}
+        uids = sorted(self._match(tokens), key=lambda u: (by_uid[u].internaldate, u))
+        if "REVERSE" in keys:
+            uids.reverse()
+        if returns is None:
+            self.send(b"* SORT " + " ".join(map(str, uids)).encode() + b"\r\n")
+        else:
+            self.send(self._esearch(tag, uids, returns))
+        self.send(f"{tag} OK SORT completed\r\n".encode())
+
+    def cmd_UID_THREAD(self, tag, args):
+        """REFERENCES threading, simplified: a thread is every message whose
+        References (or own Message-ID) starts with the same root."""
+        tokens = _tokenize(args)
+        by_uid = {m.uid: m for m in self.messages}
+        threads: dict[str, list[int]] = {}
+        for uid in self._match(tokens[2:]):
+            msg = by_uid[uid].message
+            refs = re.findall(r"<[^>]+>", (msg.get("References") or "") + " " + (msg.get("In-Reply-To") or ""))
+            root = refs[0] if refs else (msg.get("Message-ID") or f"uid{uid}").strip()
+            threads.setdefault(root, []).append(uid)
+        body = "".join("(" + " ".join(map(str, uids)) + ")" for uids in threads.values())
+        self.send(f"* THREAD {body}\r\n".encode())
+        self.send(f"{tag} OK THREAD completed\r\n".encode())
+
+    def _match(self, tokens: list) -> list[int]:
+        """Evaluate the subset of search keys the clients send.
+
+        Supports ALL, UID, SEEN/UNSEEN, FLAGGED/UNFLAGGED and the substring
+        keys FROM, TO, SUBJECT, BODY and TEXT; parenthesized groups are ANDed.
+        Text keys scan every message, like most servers without an index.
+        """
+        msgs = self.messages
+        max_uid = msgs[-1].uid if msgs else 0
+        tokens = _flatten(tokens)
+        selected = list(msgs)
+        i = 0
+        while i < len(tokens):
+            key = str(tokens[i]).upper()
+            if key == "UID":
+                wanted = _parse_uid_set(tokens[i + 1], max_uid)
+                selected = [m for m in selected if m.uid in wanted]
+                i += 1
+            elif key in ("SEEN", "UNSEEN"):
+                selected = [m for m in selected if ("\\Seen" in m.flags) == (key == "SEEN")]
+            elif key in ("FLAGGED", "UNFLAGGED"):
+                selected = [m for m in selected if ("\\Flagged" in m.flags) == (key == "FLAGGED")]
+            elif key in ("FROM", "TO", "SUBJECT", "BODY", "TEXT"):
+                needle = str(tokens[i + 1]).lower().encode()
+                if self.server.scan_cost:
+                    time.sleep(self.server.scan_cost * len(selected))
+                selected = [m for m in selected if needle in _search_text(m, key)]
+                i += 1
+            elif key in ("SINCE", "BEFORE", "ON"):
+                i += 1
+            i += 1
+        return [m.uid for m in selected]
+
+    def _esearch(self, tag: str, uids: list[int], returns: list[str]) -> bytes:
+        parts = [f'(TAG "{tag}") UID']
+        if "COUNT" in returns:
+            parts.append(f"COUNT {len(uids)}")
+        if uids and "MIN" in returns:
+            parts.append(f"MIN {min(uids)}")
+        if uids and "MAX" in returns:
+            parts.append(f"MAX {max(uids)}")
+        if "ALL" in returns and uids:
+            parts.append("ALL " + ",".join(map(str, uids)))
+        if "PARTIAL" in returns:
+            spec = returns[returns.index("PARTIAL") + 1]
+            lo, hi = (int(x) for x in spec.split(":"))
+            if lo < 0:
+                n = len(uids)
+                window = uids[max(n + hi, 0): n + lo + 1]
+            else:
+                window = uids[lo - 1: hi]
+            parts.append(f"PARTIAL ({spec} {','.join(map(str, window)) or 'NIL'})")
+        return ("* ESEARCH " + " ".join(parts) + "\r\n").encode()
+
+    def cmd_UID_FETCH(self, tag, args):
+        tokens = _tokenize(args)
+        msgs = self.messages
+        max_uid = msgs[-1].uid if msgs else 0
+        wanted = _parse_uid_set(tokens[0], max_uid)
+        items = tokens[1] if isinstance(tokens[1], list) else [tokens[1]]
+        modifiers = [str(t).upper() for t in tokens[2]] if len(tokens) > 2 else []
+        changed_since = None
+        if "CHANGEDSINCE" in modifiers:
+            changed_since = int(modifiers[modifiers.index("CHANGEDSINCE") + 1])
+            if "VANISHED" in modifiers:
+                gone = sorted(
+                    uid for uid, modseq in self.server.expunged.get(self.selected, [])
+                    if modseq > changed_since and uid in wanted
+                )
+                if gone:
+                    self.send(b"* VANISHED (EARLIER) " + ",".join(map(str, gone)).encode() + b"\r\n")
+        for seq, msg in enumerate(msgs, start=1):
+            if msg.uid not in wanted:
+                continue
+            if changed_since is not None and msg.modseq <= changed_since:
+                continue
+            self.send(self._fetch_response(seq, msg, items))
+        self.send(f"{tag} OK FETCH completed\r\n".encode())
+
+    def cmd_FETCH(self, tag, args):
+        tokens = _tokenize(args)
+        msgs = self.messages
+        wanted = _parse_uid_set(tokens[0], len(msgs))
+        items = tokens[1] if isinstance(tokens[1], list) else [tokens[1]]
+        for seq, msg in enumerate(msgs, start=1):
+            if seq in wanted:
+                self.send(self._fetch_response(seq, msg, items))
+        self.send(f"{tag} OK FETCH completed\r\n".encode())
+
+    def _fetch_response(self, seq: int, msg: FakeMessage, items: list) -> bytes:
+        parts = [f"UID {msg.uid}".encode()]
+        literals = []
+        for item in items:
+            item = str(item).upper()
+            if item == "FLAGS":
+                parts.append(f"FLAGS ({' '.join(msg.flags)})".encode())
+            elif item == "MODSEQ":
+                parts.append(f"MODSEQ ({msg.modseq})".encode())
+            elif item == "RFC822.SIZE":
+                parts.append(f"RFC822.SIZE {len(msg.raw)}".encode())
+            elif item == "INTERNALDATE":
+                stamp = msg.internaldate.strftime("%d-%b-%Y %H:%M:%S %z")
+                parts.append(f'INTERNALDATE "{stamp}"'.encode())
+            elif "[HEADER.FIELDS" in item:
+                fields = re.search(r"\((.*)\)", item).group(1).split()
+                header = self._header_fields(msg.raw, fields)
+                literals.append(("BODY[HEADER.FIELDS (" + " ".join(fields) + ")]", header))
+            elif item in ("RFC822", "BODY[]", "BODY.PEEK[]"):
+                literals.append(("RFC822" if item == "RFC822" else "BODY[]", msg.raw))
+            elif item == "BODYSTRUCTURE":
+                parts.append(("BODYSTRUCTURE " + _bodystructure(msg.message)).encode())
+            elif item.startswith(("BODY[", "BODY.PEEK[")):
+                match = re.match(r"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?", item)
+                section, start, length = match.groups()
+                if section == "HEADER":
+                    payload = msg.raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+                else:
+                    payload = _section(msg.message, section)
+                name = f"BODY[{section}]"
+                if start is not None:
+                    payload = payload[int(start): int(start) + int(length)]
+                    name += f"<{start}>"
+                literals.append((name, payload))
+        out = f"* {seq} FETCH (".encode() + b" ".join(parts)
+        for name, payload in literals:
+            out += f" {name} {{{len(payload)}}}\r\n".encode() + payload
+        return out + b")\r\n"
+
+    @staticmethod
+    def _header_fields(raw: bytes, fields: list[str]) -> bytes:
+        head = raw.split(b"\r\n\r\n", 1)[0]
+        lines, keep = [], False
+        for line in head.split(b"\r\n"):
+            # Folded continuation lines belong to the field above them
+            if not line.startswith((b" ", b"\t")):
+                keep = line.split(b":", 1)[0].decode().upper() in fields
+            if keep:
+                lines.append(line)
+        return b"\r\n".join(lines) + b"\r\n\r\n"
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, folders: dict[str, list[FakeMessage]], latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.folders = folders
+        self.latency = latency
+        # Extra seconds per message examined by a text search key
+        self.scan_cost = 0.0
+        self.uidvalidity = 1
+        self.capabilities = ["IMAP4rev1"]
+        self.commands: list[str] = []
+        self.expunged: dict[str, list[tuple[int, int]]] = {}
+        self.lock = threading.Lock()
+        self.handlers: set = set()
+        self.idlers: set = set()
+        self._thread = None
+
+    def _notify(self, folder: str, data: bytes) -> None:
+        with self.lock:
+            handlers = [h for h in self.handlers if h.selected == folder]
+        for handler in handlers:
+            handler.notify(data)
+
+    def highestmodseq(self, folder: str) -> int:
+        msgs = self.folders.get(folder, [])
+        expunged = self.expunged.get(folder, [])
+        return max([m.modseq for m in msgs] + [modseq for _, modseq in expunged] + [1])
+
+    def set_flags(self, folder: str, uid: int, flags: list[str]) -> None:
+        for seq, msg in enumerate(self.folders[folder], 1):
+            if msg.uid == uid:
+                msg.flags = flags
+                msg.modseq = self.highestmodseq(folder) + 1
+                uid_item = f" UID {uid}" if "QRESYNC" in self.capabilities else ""
+                self._notify(folder, f"* {seq} FETCH (FLAGS ({' '.join(flags)}){uid_item})\r\n".encode())
+
+    def expunge(self, folder: str, uid: int) -> None:
+        modseq = self.highestmodseq(folder) + 1
+        seq = next((i for i, m in enumerate(self.folders[folder], 1) if m.uid == uid), None)
+        self.folders[folder] = [m for m in self.folders[folder] if m.uid != uid]
+        self.expunged.setdefault(folder, []).append((uid, modseq))
+        if seq is not None:
+            if "QRESYNC" in self.capabilities:
+                self._notify(folder, f"* VANISHED {uid}\r\n".encode())
+            else:
+                self._notify(folder, f"* {seq} EXPUNGE\r\n".encode())
+
+    def append(self, folder: str, msg: FakeMessage) -> None:
+        msg.modseq = self.highestmodseq(folder) + 1
+        self.folders[folder].append(msg)
+        self._notify(folder, f"* {len(self.folders[folder])} EXISTS\r\n".encode())
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeIMAPServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class LocalIMAPClient(IMAPClient):
+    """IMAPClient that talks plain TCP to the fake server."""
+
+    def _open_connection(self) -> imaplib.IMAP4:
+        return imaplib.IMAP4(self._host, self._port)
+
+
+class LocalAsyncIMAPClient(AsyncIMAPClient):
+    """AsyncIMAPClient that talks plain TCP to the fake server."""
+
+    async def _open_connection(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_connection(self._host, self._port, limit=MAX_LINE_LENGTH)
@@ -0,0 +1,188 @@
+"""A small in-process SMTP server for benchmarks.
+
+Speaks enough ESMTP (plain TCP) for SMTPClient: EHLO, a pretend STARTTLS,
+AUTH PLAIN/LOGIN, RSET, MAIL, RCPT, DATA, NOOP and QUIT, with PIPELINING
+advertised when `pipelining` is set. Like fake_imap, every reply is held
+back `latency` seconds from when its command arrived, so pipelined
+commands share one round trip. STARTTLS does not encrypt; its reply is
+delayed `tls_rtts` extra round trips to stand in for the TLS handshake
+(benchmarks pair it with a client whose _starttls skips the wrap).
+RCPT to an address in `reject` gets 550 and to one in `defer` 450; a
+message to an address in `drop` is read to the end and then the session
+is closed without a reply, as a server that went away mid-send would.
+"""
+
+import queue
+import socketserver
+import threading
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ReceivedMessage:
+    sender: str
+    recipients: list[str] = field(default_factory=list)
+    data: bytes = b""
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "FakeSMTPServer"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self._outbox = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        self._envelope: ReceivedMessage | None = None
+        with self.server.lock:
+            self.server.sessions += 1
+
+    def finish(self):
+        self._outbox.put(None)
+        self._writer.join()
+        super().finish()
+
+    def reply(self, line: str, rtts: int = 1):
+        self._outbox.put((time.monotonic() + self.server.latency * rtts, line.encode() + b"\r\n"))
+
+    def _write_loop(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                return
+            due, data = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.wfile.write(data)
+            except OSError:
+                return
+
+    def handle(self):
+        # TCP handshake plus greeting
+        self.reply("220 fake.example.com ESMTP ready", rtts=2)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            cmd, _, args = line.partition(" ")
+            cmd = cmd.upper()
+            with self.server.lock:
+                self.server.commands.append(cmd)
+            handler = getattr(self, "cmd_" + cmd, None)
+            if handler is None:
+                self.reply("500 unknown command")
+            elif handler(args) is False:
+                return
+
+    def cmd_EHLO(self, args):
+        lines = ["fake.example.com", "8BITMIME", "AUTH PLAIN LOGIN", "STARTTLS"]
+        if self.server.pipelining:
+            lines.append("PIPELINING")
+        for i, item in enumerate(lines):
+            sep = " " if i == len(lines) - 1 else "-"
+            self.reply(f"250{sep}{item}")
+
+    def cmd_STARTTLS(self, args):
+        self.reply("220 ready to start TLS", rtts=1 + self.server.tls_rtts)
+
+    def cmd_AUTH(self, args):
+        mechanism, _, initial = args.partition(" ")
+        if mechanism.upper() == "LOGIN":
+            self.reply("334 VXNlcm5hbWU6")
+            self.rfile.readline()
+            self.reply("334 UGFzc3dvcmQ6")
+            self.rfile.readline()
+        elif not initial:
+            self.reply("334 ")
+            self.rfile.readline()
+        self.reply("235 authenticated")
+
+    def cmd_NOOP(self, args):
+        self.reply("250 OK")
+
+    def cmd_RSET(self, args):
+        self._envelope = None
+        self.reply("250 OK")
+
+    def cmd_MAIL(self, args):
+        self._envelope = ReceivedMessage(sender=_address(args))
+        self.reply("250 OK")
+
+    def cmd_RCPT(self, args):
+        if self._envelope is None:
+            self.reply("503 need MAIL first")
+            return
+        address = _address(args)
+        if address in self.server.reject:
+            self.reply("550 no such user")
+            return
+        if address in self.server.defer:
+            self.reply("450 mailbox busy, try again later")
+            return
+        self._envelope.recipients.append(address)
+        self.reply("250 OK")
+
+    def cmd_DATA(self, args):
+        if self._envelope is None or not self._envelope.recipients:
+            self.reply("554 no valid recipients")
+            return
+        self.reply("354 end data with <CR><LF>.<CR><LF>")
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line == b".\r\n":
+                break
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        self._envelope.data = b"".join(lines)
+        if self.server.drop.intersection(self._envelope.recipients):
+            return False
+        with self.server.lock:
+            self.server.messages.append(self._envelope)
+        self._envelope = None
+        self.reply("250 OK queued")
+
+    def cmd_QUIT(self, args):
+        self.reply("221 bye")
+        return False
+
+
+def _address(args: str) -> str:
+    start, end = args.find("<"), args.find(">")
+    return args[start + 1 : end] if start != -1 and end > start else args.partition(":")[2].strip()
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency: float = 0.0, pipelining: bool = True, tls_rtts: int = 2):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+        self.pipelining = pipelining
+        self.tls_rtts = tls_rtts
+        self.reject: set[str] = set()
+        self.defer: set[str] = set()
+        self.drop: set[str] = set()
+        self.messages: list[ReceivedMessage] = []
+        self.commands: list[str] = []
+        self.sessions = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeSMTPServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()